@@ -4,12 +4,8 @@ Created on Aug 8, 2019
 @author: lrizzi
 """
 
-# from bokeh.io import curdoc
-from bokeh.plotting import output_file, save
-from bokeh.plotting.figure import Figure
-from bokeh.models import Column
-from bokeh.plotting.figure import figure
-from bokeh.layouts import column
+# bokeh is imported by the functions that draw, so that the scripts importing
+# check_running_process do not load it
 import psutil
 # import subprocess
 import os
@@ -17,6 +13,8 @@ import os
 
 
 def bokeh_plot(plot, session):
+    from bokeh.plotting.figure import Figure
+    from bokeh.models import Column
 
     # NOT TESTED YET
 
@@ -29,6 +27,8 @@ def bokeh_plot(plot, session):
 
 
 def bokeh_clear(session):
+    from bokeh.plotting.figure import figure
+    from bokeh.layouts import column
 
     session.document.clear()
     p = figure()
@@ -56,6 +56,7 @@ def check_running_process(process=None):
 
 
 def bokeh_save(plot):
+    from bokeh.plotting import output_file, save
 
     # NOT TESTED YET
 
@@ -138,7 +138,7 @@ class Bspline(object):
 
         return
 
-    def fit(self, xdata, ydata, invvar, x2=None):
+    def fit(self, xdata, ydata, invvar, x2=None, normal=None):
         """Calculate a B-spline in the least-squares sense.
 
         Fit is based on two variables: `xdata` sorted and spans a large range
@@ -155,6 +155,12 @@ class Bspline(object):
             Inverse variance of `ydata`.
         x2 : :class:`numpy.ndarray`, optional
             Orthogonal dependent variable for 2d fits.
+        normal : :class:`dict`, optional
+            Normal equations from a previous call with the same `xdata`,
+            `ydata` and `x2`, updated in place.  If the breakpoint mask has
+            not changed since, only the points whose `invvar` changed are
+            added to or removed from the saved sums.  Pass an empty
+            :class:`dict` to start.
 
         Returns
         -------
@@ -170,28 +176,33 @@ class Bspline(object):
             yfit = np.zeros(ydata.shape, dtype='f')
             return -2, yfit
         nfull = nn * self.npoly
-        bw = self.npoly * self.nord
-        a1, lower, upper = self.action(xdata, x2=x2)
-        foo = np.tile(invvar, bw).reshape(bw, invvar.size).transpose()
-        a2 = a1 * foo
-        alpha = np.zeros((bw, nfull+bw), dtype='d')
-        beta = np.zeros((nfull+bw,), dtype='d')
-        bi = np.arange(bw, dtype='i4')
-        bo = np.arange(bw, dtype='i4')
-        for k in range(1, bw):
-            bi = np.append(bi, np.arange(bw-k, dtype='i4')+(bw+1)*k)
-            bo = np.append(bo, np.arange(bw-k, dtype='i4')+bw*k)
-        for k in range(nn-self.nord+1):
-            itop = k*self.npoly
-            ibottom = min(itop, nfull) + bw - 1
-            ict = upper[k] - lower[k] + 1
-            if ict > 0:
-                work = np.dot(a1[lower[k]:upper[k]+1, :].T,
-                              a2[lower[k]:upper[k]+1, :])
-                wb = np.dot(ydata[lower[k]:upper[k]+1],
-                            a2[lower[k]:upper[k]+1, :])
-                alpha.T.flat[bo+itop*bw] += work.flat[bi]
-                beta[itop:ibottom+1] += wb
+        nseg = nn - self.nord + 1
+        if normal and np.array_equal(normal['mask'], self.mask):
+            a1, lower, upper = normal['action']
+            alpha = normal['alpha']
+            beta = normal['beta']
+            # only the points with a new weight change the sums
+            delta = invvar - normal['invvar']
+            chg = np.nonzero(delta)[0]
+            chg = chg[normal['segment'][chg] >= 0]
+            add_normal_equations(alpha, beta, a1[chg, :],
+                                 a1[chg, :] * delta[chg, np.newaxis],
+                                 ydata[chg], normal['segment'][chg], nseg,
+                                 self.npoly)
+        else:
+            a1, lower, upper = self.action(xdata, x2=x2)
+            a2 = a1 * invvar[:, np.newaxis]
+            alpha, beta = band_normal_equations(a1, a2, ydata, lower, upper,
+                                                nseg, self.npoly, nfull)
+            if normal is not None:
+                seg, pts = segment_index(lower, upper, nseg)
+                segment = np.full(xdata.shape, -1, dtype=int)
+                segment[pts] = seg
+                normal.update(action=(a1, lower, upper), alpha=alpha,
+                              beta=beta, segment=segment,
+                              mask=self.mask.copy())
+        if normal is not None:
+            normal['invvar'] = invvar.copy()
         min_influence = 1.0e-10 * invvar.sum() / nfull
         errb = cholesky_band(alpha, mininf=min_influence)
         if isinstance(errb[0], int) and errb[0] == -1:
@@ -295,13 +306,12 @@ class Bspline(object):
         """
         gb = self.breakpoints[self.mask]
         n = gb.size - self.nord
-        indx = np.zeros((x.size,), dtype='i4')
-        ileft = self.nord - 1
-        for i in range(x.size):
-            while x[i] > gb[ileft+1] and ileft < n - 1:
-                ileft += 1
-            indx[i] = ileft
-        return indx
+        # first segment whose upper breakpoint is not below x
+        indx = np.searchsorted(gb[self.nord:n], x, side='left') + \
+            self.nord - 1
+        indx[np.isnan(x)] = self.nord - 1
+        # segments never step back, as when scanning unsorted data in order
+        return np.maximum.accumulate(indx).astype('i4')
 
     def bsplvn(self, x, ileft):
         """Calculates the value of all possibly nonzero B-splines at `x`
@@ -385,13 +395,12 @@ class Bspline(object):
             goodcoeff = self.coeff[:, coeffbk]
         else:
             goodcoeff = self.coeff[coeffbk]
-        # maskthis = np.zeros(xwork.shape,dtype=xwork.dtype)
-        for i in range(n-self.nord+1):
-            ict = upper[i] - lower[i] + 1
-            if ict > 0:
-                yfit[lower[i]:upper[i] + 1] = np.dot(
-                    action[lower[i]:upper[i] + 1, :],
-                    (goodcoeff.flatten('F'))[i * self.npoly + spot])
+        # coefficients of the segment each point falls in
+        seg, pts = segment_index(lower, upper, n - self.nord + 1)
+        if pts.size > 0:
+            cidx = seg[:, np.newaxis] * self.npoly + spot
+            yfit[pts] = np.einsum('ij,ij->i', action[pts, :],
+                                  goodcoeff.flatten('F')[cidx])
         yy = yfit.copy()
         yy[xsort] = yfit
         mask = np.ones(x.shape, dtype='bool')
@@ -491,30 +500,12 @@ class Bspline(object):
             yfit = np.zeros(ydata.shape, dtype=float)
             return -2, yfit
         nfull = nn * self.npoly
-        bw = self.npoly * self.nord
-        foo = np.sqrt(np.tile(invvar, bw).reshape(bw, invvar.size).transpose())
-        a2 = action * foo
-        # a2 = action*np.sqrt(np.outer(invvar,np.ones(bw)))
-
-        alpha = np.zeros((bw, nfull + bw), dtype='d')
-        beta = np.zeros((nfull + bw,), dtype='d')
-        bi = np.arange(bw, dtype='i4')
-        bo = np.arange(bw, dtype='i4')
-        for k in range(1, bw):
-            bi = np.append(bi, np.arange(bw - k, dtype='i4') + (bw + 1) * k)
-            bo = np.append(bo, np.arange(bw - k, dtype='i4') + bw * k)
-        for k in range(nn - self.nord + 1):
-            itop = k * self.npoly
-            ibottom = min(itop, nfull) + bw - 1
-            ict = upper[k] - lower[k] + 1
-            if ict > 0:
-                work = np.dot(a2[lower[k]:upper[k] + 1, :].T,
-                              a2[lower[k]:upper[k] + 1, :])
-                wb = np.dot(ydata[lower[k]:upper[k] + 1] * np.sqrt(
-                    invvar[lower[k]:upper[k] + 1]),
-                            a2[lower[k]:upper[k] + 1, :])
-                alpha.T.flat[bo + itop * bw] += work.flat[bi]
-                beta[itop:ibottom + 1] += wb
+        sqrtinvvar = np.sqrt(invvar)
+        a2 = action * sqrtinvvar[:, np.newaxis]
+        alpha, beta = band_normal_equations(a2, a2, ydata * sqrtinvvar,
+                                            lower, upper,
+                                            nn - self.nord + 1, self.npoly,
+                                            nfull)
         min_influence = 1.0e-10 * invvar.sum() / nfull
         # Right now we are not returning the covariance,
         # although it may arise that we should
@@ -526,18 +517,8 @@ class Bspline(object):
             yfit, foo = self.value(xdata, x2=xdata, action=action, upper=upper,
                                    lower=lower)
             return self.maskpoints(errb[0]), yfit
-        errs = cholesky_solve(a, beta)
-        if isinstance(errs[0], int) and errs[0] == -1:
-            sol = errs[1]
-        else:
-            #
-            # It is not possible for this to get called, because cholesky_solve
-            # has only one return statement, & that statement guarantees that
-            # errs[0] == -1
-            #
-            yfit, foo = self.value(xdata, x2=xdata, action=action, upper=upper,
-                                   lower=lower)
-            return self.maskpoints(errs[0]), yfit
+        # cholesky_solve returns the padded solution, as in fit
+        sol = cholesky_solve(a, beta)
         if self.coeff.ndim == 2:
             self.icoeff[:, goodbk] = np.array(
                 a[0, 0:nfull].T.reshape(self.npoly, nn, order='F'),
@@ -553,6 +534,103 @@ class Bspline(object):
         return 0, yfit
 
 
+def segment_index(lower, upper, nseg):
+    """Segment number of each data point from the action `lower`/`upper`.
+
+    Parameters
+    ----------
+    lower : :class:`numpy.ndarray`
+        First data point in each breakpoint segment.
+    upper : :class:`numpy.ndarray`
+        Last data point in each breakpoint segment, less than `lower` for
+        empty segments.
+    nseg : :class:`int`
+        Number of segments to use.
+
+    Returns
+    -------
+    :func:`tuple`
+        The segment number of each data point in the first `nseg` segments,
+        and the data point indices themselves.
+    """
+    lower = lower[:nseg]
+    upper = upper[:nseg]
+    counts = np.maximum(upper - lower + 1, 0)
+    seg = np.repeat(np.arange(nseg), counts)
+    pts = np.arange(counts.sum()) + np.repeat(lower - np.cumsum(counts) +
+                                              counts, counts)
+    return seg, pts
+
+
+def band_normal_equations(a1, a2, ydata, lower, upper, nseg, npoly, nfull):
+    """Assemble the banded normal equations of a B-spline fit.
+
+    Replaces the loop over breakpoint segments in
+    :meth:`~Bspline.fit`: each band element is summed over the points of
+    every segment at once with :func:`numpy.bincount`.
+
+    Parameters
+    ----------
+    a1, a2 : :class:`numpy.ndarray`
+        Left and right action matrices, [ndata, bandwidth]; the normal
+        matrix is ``a1.T a2`` summed over each segment.
+    ydata : :class:`numpy.ndarray`
+        Dependent variable, already weighted to match `a2`.
+    lower, upper : :class:`numpy.ndarray`
+        Data point ranges of each segment, from :meth:`~Bspline.action`.
+    nseg : :class:`int`
+        Number of segments to use.
+    npoly : :class:`int`
+        Polynomial order over the 2nd variable.
+    nfull : :class:`int`
+        Number of coefficients.
+
+    Returns
+    -------
+    :func:`tuple`
+        The normal matrix in padded *lower* band form, [bandwidth,
+        nfull + bandwidth], as used by :func:`cholesky_band`, and the padded
+        right-hand side.
+    """
+    bw = a1.shape[1]
+    alpha = np.zeros((bw, nfull + bw), dtype='d')
+    beta = np.zeros((nfull + bw,), dtype='d')
+    seg, pts = segment_index(lower, upper, nseg)
+    add_normal_equations(alpha, beta, a1[pts, :], a2[pts, :], ydata[pts], seg,
+                         nseg, npoly)
+    return alpha, beta
+
+
+def add_normal_equations(alpha, beta, a1, a2, ydata, seg, nseg, npoly):
+    """Add the contributions of data points to banded normal equations.
+
+    Parameters
+    ----------
+    alpha, beta : :class:`numpy.ndarray`
+        Padded normal matrix and right-hand side from
+        :func:`band_normal_equations`, updated in place.
+    a1, a2 : :class:`numpy.ndarray`
+        Left and right action matrices of the points, [npts, bandwidth].
+        Use negative weights in `a2` to remove points.
+    ydata : :class:`numpy.ndarray`
+        Dependent variable of the points, weighted to match `a2`.
+    seg : :class:`numpy.ndarray`
+        Segment number of each point.
+    nseg : :class:`int`
+        Number of segments.
+    npoly : :class:`int`
+        Polynomial order over the 2nd variable.
+    """
+    bw = a1.shape[1]
+    itop = np.arange(nseg) * npoly
+    for j in range(bw):
+        beta[itop + j] += np.bincount(seg, weights=ydata * a2[:, j],
+                                      minlength=nseg)
+        for d in range(bw - j):
+            alpha[d, itop + j] += np.bincount(
+                seg, weights=a1[:, j] * a2[:, j + d], minlength=nseg)
+
+
 def cholesky_band(ndl, mininf=0.0):
     """Compute *lower* Cholesky decomposition of a banded matrix.
 
@@ -642,9 +720,13 @@ def cholesky_solve(a, bb):
 
 def iterfit(xdata, ydata, invvar=None, upper=5, lower=5, x2=None,
             maxiter=10, nord=4, bkpt=None, fullbkpt=None,
-            kwargs_bspline={}, kwargs_reject={}):
+            kwargs_bspline={}, kwargs_reject={}, logger=None):
     """Iteratively fit a B-spline set to data, with rejection.
 
+    The normal equations are kept between rejection iterations: each refit
+    only adds or removes the points rejected or restored by the previous
+    iteration, unless the breakpoint mask changed.
+
     Parameters
     ----------
     xdata : :class:`numpy.ndarray`
@@ -668,6 +750,9 @@ def iterfit(xdata, ydata, invvar=None, upper=5, lower=5, x2=None,
     fullbkpt : :class:`numpy.ndarray`
     kwargs_bspline : :class:`list`
     kwargs_reject : :class:`list`
+    logger : :class:`logging.Logger`, optional
+        If set, log the number of points rejected and restored in each
+        iteration.
 
     Returns
     -------
@@ -740,6 +825,7 @@ def iterfit(xdata, ydata, invvar=None, upper=5, lower=5, x2=None,
     iiter = 0
     error = 0
     qdone = False
+    normal = {}
     while (error != 0 or qdone is False) and iiter <= maxiter:
         goodbk = sset.mask.nonzero()[0]
         if maskwork.sum() <= 1 or not sset.mask.any():
@@ -762,19 +848,27 @@ def iterfit(xdata, ydata, invvar=None, upper=5, lower=5, x2=None,
                     else:
                         sset.mask[goodbk[ileft]] = False
             error, yfit = sset.fit(xwork, ywork, invwork*maskwork,
-                                   x2=x2work)
+                                   x2=x2work, normal=normal)
         iiter += 1
         inmask = maskwork
         if error == -2:
 
             return sset, outmask
         elif error == 0:
+            prevmask = maskwork.copy()
             maskwork, qdone = djs_reject(ywork, yfit, invvar=invwork,
                                          inmask=inmask, outmask=maskwork,
                                          upper=upper, lower=lower,
                                          **kwargs_reject)
+            if logger:
+                logger.info("iterfit iteration %d: %d rejected, %d restored, "
+                            "%d good" % (iiter, (prevmask & ~maskwork).sum(),
+                                         (~prevmask & maskwork).sum(),
+                                         maskwork.sum()))
         else:
-            pass
+            if logger:
+                logger.info("iterfit iteration %d: dropped breakpoints, "
+                            "%d good breakpoints" % (iiter, sset.mask.sum()))
     outmask[xsort] = maskwork
     temp = yfit
     yfit[xsort] = temp
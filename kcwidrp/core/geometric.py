@@ -233,6 +233,75 @@ class AsymmetricPolynomialTransform(GeometricTransform):
 
         return True
 
+    @property
+    def order(self):
+        """Total polynomial order implied by the number of coefficients."""
+        u = len(self.params.ravel())
+        # number of coefficients -> u = (order + 1) * (order + 2)
+        return int((- 3 + math.sqrt(9 - 4 * (2 - u))) / 2)
+
+    def exponents(self):
+        """Return the x and y exponents of each polynomial term.
+
+        Returns
+        -------
+        px, py : (N, ) int arrays
+            Powers of x and y for each column of `params`.
+
+        """
+        order = self.order
+        px = []
+        py = []
+        for j in range(order + 1):
+            for i in range(j + 1):
+                px.append(j - i)
+                py.append(i)
+        return np.array(px), np.array(py)
+
+    def basis(self, x, y, dtype=None):
+        """Monomial basis matrix for the input coordinates.
+
+        The powers of x and y are built once as Vandermonde matrices and the
+        mixed terms are gathered from them, so no power is recomputed.
+
+        Parameters
+        ----------
+        x, y : (N, ) arrays
+            Coordinates.
+        dtype : data-type, optional
+            Precision of the basis (e.g. ``np.float32``), default float64.
+
+        Returns
+        -------
+        basis : (N, M) array
+            Value of each of the M polynomial terms at each coordinate.
+
+        """
+        if dtype is None:
+            dtype = np.float64
+        order = self.order
+        px, py = self.exponents()
+        xpow = np.vander(np.asarray(x, dtype=dtype), order + 1,
+                         increasing=True)
+        ypow = np.vander(np.asarray(y, dtype=dtype), order + 1,
+                         increasing=True)
+        return xpow[:, px] * ypow[:, py]
+
+    def coefficient_grids(self, dtype=None):
+        """Coefficients arranged as (2, order + 1, order + 1) y-by-x grids.
+
+        Element ``[k, i, j]`` multiplies ``y**i * x**j`` in output coordinate
+        k, which allows separable evaluation with two matrix products.
+
+        """
+        if dtype is None:
+            dtype = np.float64
+        order = self.order
+        px, py = self.exponents()
+        cgrid = np.zeros((2, order + 1, order + 1), dtype=dtype)
+        cgrid[:, py, px] = self.params
+        return cgrid
+
     def __call__(self, coords):
         """Apply forward transformation.
 
@@ -247,21 +316,58 @@ class AsymmetricPolynomialTransform(GeometricTransform):
             Transformed coordinates.
 
         """
-        x = coords[:, 0]
-        y = coords[:, 1]
-        u = len(self.params.ravel())
-        # number of coefficients -> u = (order + 1) * (order + 2)
-        order = int((- 3 + math.sqrt(9 - 4 * (2 - u))) / 2)
-        dst = np.zeros(coords.shape)
+        coords = np.asarray(coords)
+        basis = self.basis(coords[:, 0], coords[:, 1])
+        return np.matmul(basis, self.params.T)
 
-        pidx = 0
-        for j in range(order + 1):
-            for i in range(j + 1):
-                dst[:, 0] += self.params[0, pidx] * x ** (j - i) * y ** i
-                dst[:, 1] += self.params[1, pidx] * x ** (j - i) * y ** i
-                pidx += 1
+    def grid(self, x, y, dtype=None):
+        """Apply forward transformation on a separable grid.
 
-        return dst
+        Evaluates the transform at every (x[j], y[i]) pair.  Only the
+        one-dimensional Vandermonde matrices of x and y are built, and the
+        polynomial is reduced with two matrix products per output axis.
+
+        Parameters
+        ----------
+        x : (NX, ) array
+            Grid x coordinates.
+        y : (NY, ) array
+            Grid y coordinates.
+        dtype : data-type, optional
+            Precision of the evaluation (e.g. ``np.float32``), default
+            float64.
+
+        Returns
+        -------
+        coords : (NY, NX, 2) array
+            Transformed x and y coordinates of each grid point.
+
+        """
+        return evaluate_grid(self.coefficient_grids(dtype=dtype), x, y,
+                             dtype=dtype)
+
+    def warp_coords(self, output_shape, dtype=None):
+        """Source coordinates for skimage ``warp`` over a full output image.
+
+        The result can be passed to ``skimage.transform.warp`` as
+        ``inverse_map`` and reused for every image warped with this transform.
+
+        Parameters
+        ----------
+        output_shape : (rows, cols) tuple
+            Shape of the output image.
+        dtype : data-type, optional
+            Precision of the coordinates, default float64.
+
+        Returns
+        -------
+        coords : (2, rows, cols) array
+            Source (row, col) coordinates of each output pixel.
+
+        """
+        rows, cols = output_shape
+        xy = self.grid(np.arange(cols), np.arange(rows), dtype=dtype)
+        return np.stack((xy[:, :, 1], xy[:, :, 0]))
 
     def inverse(self, coords):
         raise Exception(
@@ -271,6 +377,69 @@ class AsymmetricPolynomialTransform(GeometricTransform):
             'then apply the forward transformation.')
 
 
+def evaluate_grid(cgrid, x, y, dtype=None):
+    """Evaluate polynomial coefficient grids on a separable x-by-y grid.
+
+    Parameters
+    ----------
+    cgrid : (K, NYP, NXP) array
+        Coefficient grids, element ``[k, i, j]`` multiplies ``y**i * x**j``
+        in output k (see `AsymmetricPolynomialTransform.coefficient_grids`).
+    x : (NX, ) array
+        Grid x coordinates.
+    y : (NY, ) array
+        Grid y coordinates.
+    dtype : data-type, optional
+        Precision of the evaluation, default float64.
+
+    Returns
+    -------
+    values : (NY, NX, K) array
+        Value of each polynomial at each grid point.
+
+    """
+    if dtype is None:
+        dtype = np.float64
+    cgrid = np.asarray(cgrid, dtype=dtype)
+    xpow = np.vander(np.asarray(x, dtype=dtype), cgrid.shape[2],
+                     increasing=True)
+    ypow = np.vander(np.asarray(y, dtype=dtype), cgrid.shape[1],
+                     increasing=True)
+    out = np.empty((len(ypow), len(xpow), cgrid.shape[0]), dtype=dtype)
+    for k in range(cgrid.shape[0]):
+        out[:, :, k] = np.matmul(np.matmul(ypow, cgrid[k]), xpow.T)
+    return out
+
+
+def derivative_grid(cgrid, axis='y'):
+    """Coefficient grids of the partial derivative of a polynomial.
+
+    Parameters
+    ----------
+    cgrid : (K, NYP, NXP) array
+        Coefficient grids as used by `evaluate_grid`.
+    axis : {'x', 'y'}
+        Variable to differentiate with respect to.
+
+    Returns
+    -------
+    dgrid : (K, NYP, NXP) array
+        Coefficient grids of the derivative, evaluable with `evaluate_grid`.
+
+    """
+    cgrid = np.asarray(cgrid, dtype=float)
+    dgrid = np.zeros_like(cgrid)
+    if axis == 'y':
+        powers = np.arange(1, cgrid.shape[1])
+        dgrid[:, :-1, :] = cgrid[:, 1:, :] * powers[None, :, None]
+    elif axis == 'x':
+        powers = np.arange(1, cgrid.shape[2])
+        dgrid[:, :, :-1] = cgrid[:, :, 1:] * powers[None, None, :]
+    else:
+        raise ValueError("axis must be 'x' or 'y'")
+    return dgrid
+
+
 TRANSFORMS = {
     'asympolynomial': AsymmetricPolynomialTransform,
 }
@@ -0,0 +1,240 @@
+"""
+Out-of-core image combination for stacking frames
+
+The input frames are memory-mapped and combined in blocks of rows, so the
+memory used is set by a budget instead of growing with the number of frames.
+The sigma clipping and combination follow ccdproc.combine as used by the
+stacking primitives: one pass of clipping about the median with a deviation
+from mad_std, then an average or median of the unclipped pixels.
+
+"""
+import os
+import warnings
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+from astropy.io import fits
+from astropy.nddata import StdDevUncertainty
+
+# scale factor converting a median absolute deviation into a sigma
+MAD_TO_STD = 1.482602218505602
+
+# default memory budget for combining in bytes
+DEFAULT_MEM_LIMIT = 2.e9
+
+# approximate number of (nframes, block) float64 arrays alive at once
+MEMORY_FACTOR = 4
+
+
+def nanmedian_axis0(stack):
+    """Median along the first axis of a stack, ignoring NaNs
+
+    When there are no NaNs this is np.median, which uses np.partition.
+    Otherwise, the stack is sorted along the first axis (which puts NaNs at
+    the end) and the middle of the valid values is taken for each pixel.
+    This is much faster than np.nanmedian for short first axes.
+
+    Args:
+        stack (ndarray): at least 2D stack of values
+
+    Returns:
+        ndarray: median with the first axis removed, NaN where all the values
+        are NaN
+
+    """
+    nans = np.isnan(stack)
+    if not nans.any():
+        return np.median(stack, axis=0)
+    ngood = stack.shape[0] - nans.sum(axis=0)
+    srt = np.sort(stack, axis=0)
+    lo = np.maximum((ngood - 1) // 2, 0)[np.newaxis]
+    hi = (ngood // 2)[np.newaxis]
+    med = 0.5 * (np.take_along_axis(srt, lo, axis=0)[0] +
+                 np.take_along_axis(srt, hi, axis=0)[0])
+    med[ngood == 0] = np.nan
+    return med
+
+
+def mad_std_axis0(stack, center=None):
+    """Median absolute deviation based sigma along the first axis"""
+    if center is None:
+        center = nanmedian_axis0(stack)
+    return MAD_TO_STD * nanmedian_axis0(np.abs(stack - center))
+
+
+def combine_block(stack, method='average', sig_low=3.0, sig_up=3.0):
+    """Sigma-clip and combine a stack of frames along the first axis
+
+    The stack is modified in place: clipped pixels are set to NaN.
+
+    Args:
+        stack (ndarray): float stack of shape (nframes, ...), NaNs are ignored
+        method (str): 'average' or 'median'
+        sig_low (float): lower sigma rejection limit, or None to skip
+        sig_up (float): upper sigma rejection limit, or None to skip
+
+    Returns:
+        (combined, uncertainty, mask): combined image, its uncertainty, and
+        a mask of pixels where every frame was rejected
+
+    """
+    with warnings.catch_warnings(), np.errstate(invalid='ignore',
+                                                divide='ignore'):
+        warnings.simplefilter('ignore', category=RuntimeWarning)
+        # one pass of sigma clipping
+        if sig_low is not None or sig_up is not None:
+            center = nanmedian_axis0(stack)
+            dev = mad_std_axis0(stack, center)
+            clip = np.zeros(stack.shape, dtype=bool)
+            if sig_up is not None:
+                clip |= stack > center + sig_up * dev
+            if sig_low is not None:
+                clip |= stack < center - sig_low * dev
+            stack[clip] = np.nan
+        ngood = stack.shape[0] - np.isnan(stack).sum(axis=0)
+        if method == 'average':
+            combined = np.nanmean(stack, axis=0)
+            uncertainty = np.nanstd(stack, axis=0)
+        elif method == 'median':
+            combined = nanmedian_axis0(stack)
+            uncertainty = mad_std_axis0(stack, combined)
+        else:
+            raise ValueError("unrecognised combine method : %s" % method)
+        uncertainty /= np.sqrt(ngood)
+    return combined, uncertainty, ngood == 0
+
+
+def block_rows(nframes, ncols, mem_limit=None, nthreads=1):
+    """Number of image rows per block that fits in the memory budget"""
+    if mem_limit is None:
+        mem_limit = DEFAULT_MEM_LIMIT
+    row_bytes = MEMORY_FACTOR * nframes * ncols * np.dtype(np.float64).itemsize
+    return max(1, int(mem_limit / max(nthreads, 1) / row_bytes))
+
+
+def combine_images(filenames, method='average', scale=None, sig_low=3.0,
+                   sig_up=3.0, mem_limit=None, nthreads=None, logger=None,
+                   use_mask=False):
+    """Combine FITS images out-of-core
+
+    The primary HDU of each file is memory-mapped and the images are
+    combined in blocks of rows on a thread pool.  The rows in each block are
+    set so that all the blocks in flight fit in mem_limit bytes.
+
+    Input masks are not used by default, like ccdproc.combine with sigma
+    clipping, but non-finite pixels are ignored.  With use_mask, the pixels
+    flagged in the MASK extension of a file (when it has one) are excluded
+    from the clipping and the combination, except where every frame is
+    masked: those pixels get the combination of the unmasked frames.  Unlike
+    ccdproc.combine, the images are scaled before they are sigma clipped.
+
+    Args:
+        filenames (list of str): FITS files to combine
+        method (str): 'average' or 'median'
+        scale (callable or list): either a function applied to each full
+            image to get its scale factor (like inv_median in StackFlats), or
+            one scale factor per image.  Images are multiplied by the scale.
+        sig_low (float): lower sigma rejection limit, or None to skip
+        sig_up (float): upper sigma rejection limit, or None to skip
+        mem_limit (float): memory budget in bytes, defaults to 2 GB
+        nthreads (int): number of threads, defaults to the number of CPUs
+        logger (logging.Logger): optional logger for progress messages
+        use_mask (bool): exclude the pixels flagged in the MASK extensions?
+            Not for flats, whose masks flag the pixels to correct later.
+
+    Returns:
+        (combined, uncertainty, mask, scaling): float64 combined image, its
+        uncertainty, mask of pixels where every frame was rejected, and the
+        scale factor used for each image
+
+    """
+    if nthreads is None or nthreads <= 0:
+        nthreads = os.cpu_count() or 1
+    hduls = [fits.open(fn, memmap=True) for fn in filenames]
+    try:
+        images = [hdul['PRIMARY'].data for hdul in hduls]
+        masks = [hdul['MASK'].data if use_mask and 'MASK' in hdul else None
+                 for hdul in hduls]
+        shape = images[0].shape
+        for fn, img in zip(filenames, images):
+            if img.shape != shape:
+                raise ValueError("image %s has shape %s, expected %s" %
+                                 (fn, str(img.shape), str(shape)))
+        nframes = len(images)
+
+        if scale is None:
+            scaling = np.ones(nframes)
+        elif callable(scale):
+            scaling = np.array([scale(np.asarray(img, dtype=np.float64))
+                                for img in images], dtype=float)
+        else:
+            scaling = np.asarray(scale, dtype=float)
+
+        combined = np.empty(shape, dtype=np.float64)
+        uncertainty = np.empty(shape, dtype=np.float64)
+        mask = np.empty(shape, dtype=bool)
+
+        nrows = block_rows(nframes, shape[1], mem_limit, nthreads)
+        if logger:
+            logger.info("Combining %d images in blocks of %d rows on %d "
+                        "threads" % (nframes, nrows, nthreads))
+
+        def do_block(r0):
+            r1 = min(r0 + nrows, shape[0])
+            stack = np.empty((nframes, r1 - r0, shape[1]), dtype=np.float64)
+            for i, img in enumerate(images):
+                stack[i] = img[r0:r1]
+                stack[i] *= scaling[i]
+            stack[~np.isfinite(stack)] = np.nan
+            everywhere = None
+            if any(msk is not None for msk in masks):
+                flagged = np.zeros(stack.shape, dtype=bool)
+                for i, msk in enumerate(masks):
+                    if msk is not None:
+                        flagged[i] = msk[r0:r1] != 0
+                # pixels masked in every frame keep the unmasked combination
+                everywhere = flagged.all(axis=0)
+                fallback = combine_block(stack[:, everywhere], method=method,
+                                         sig_low=sig_low, sig_up=sig_up)
+                stack[flagged] = np.nan
+            combined[r0:r1], uncertainty[r0:r1], mask[r0:r1] = \
+                combine_block(stack, method=method, sig_low=sig_low,
+                              sig_up=sig_up)
+            if everywhere is not None:
+                combined[r0:r1][everywhere], uncertainty[r0:r1][everywhere], \
+                    mask[r0:r1][everywhere] = fallback
+
+        with ThreadPoolExecutor(max_workers=nthreads) as executor:
+            list(executor.map(do_block, range(0, shape[0], nrows)))
+        del images, masks
+    finally:
+        for hdul in hduls:
+            hdul.close()
+
+    return combined, uncertainty, mask, scaling
+
+
+def combine_frames(template, filenames, **kwargs):
+    """Combine FITS images into a copy of a template frame
+
+    Like ccdproc.combine, the output keeps the header, unit, and other
+    components of the template (usually the first frame read with
+    kcwi_fits_reader), with the data, uncertainty, and mask replaced by the
+    combined values.
+
+    Args:
+        template (KCCDData): frame to copy for the output
+        filenames (list of str): FITS files to combine
+        **kwargs: passed on to combine_images
+
+    Returns:
+        (KCCDData, ndarray): combined frame and the scale factor used for
+        each image
+
+    """
+    data, uncertainty, mask, scaling = combine_images(filenames, **kwargs)
+    stacked = template.copy()
+    stacked.data = data
+    stacked.uncertainty = StdDevUncertainty(uncertainty)
+    stacked.mask = mask
+    return stacked, scaling
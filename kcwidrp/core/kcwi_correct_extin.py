@@ -1,11 +1,38 @@
 from astropy.io import fits as pf
 import pkg_resources
 import os
+from functools import lru_cache
 
 import numpy as np
 from scipy.interpolate import interp1d
 
 
+@lru_cache(maxsize=None)
+def read_extin(full_path):
+    """Read the extinction table once per process"""
+    with pf.open(full_path) as hdul:
+        exwl = np.array(hdul[1].data['LAMBDA'])
+        exma = np.array(hdul[1].data['EXT'])
+    return exwl, exma
+
+
+@lru_cache(maxsize=32)
+def extin_flux_ratio(full_path, w0, dw, nwave, air):
+    """Extinction flux ratio for a wavelength grid and airmass"""
+    exwl, exma = read_extin(full_path)
+    # get object wavelengths
+    owls = np.arange(nwave) * dw + w0
+    # linear interpolation
+    exint = interp1d(exwl, exma, kind='cubic', bounds_error=False,
+                     fill_value='extrapolate')
+    # resample extinction curve
+    oexma = exint(owls)
+    # convert to flux ratio
+    flxr = 10.**(oexma * air * 0.4)
+    flxr.flags.writeable = False
+    return flxr
+
+
 def kcwi_correct_extin(img, hdr, logger=None):
     """Atmospheric extinction correction"""
     # get airmass
@@ -15,26 +42,14 @@ def kcwi_correct_extin(img, hdr, logger=None):
     package = __name__.split('.')[0]
     full_path = pkg_resources.resource_filename(package, path)
     if os.path.exists(full_path):
-        hdul = pf.open(full_path)
-        exwl = hdul[1].data['LAMBDA']
-        exma = hdul[1].data['EXT']
         # get object wavelengths
         sz = img.shape
         dw = hdr['CD3_3']
         w0 = hdr['CRVAL3']
-        owls = np.arange(sz[0]) * dw + w0
-        # linear interpolation
-        exint = interp1d(exwl, exma, kind='cubic', bounds_error=False,
-                         fill_value='extrapolate')
-        # resample extinction curve
-        oexma = exint(owls)
-        # convert to flux ratio
-        flxr = 10.**(oexma * air * 0.4)
+        flxr = extin_flux_ratio(full_path, w0, dw, sz[0], air)
         if len(sz) == 3:
             # apply to cube
-            for ix in range(sz[2]):
-                for iy in range(sz[1]):
-                    img[:, iy, ix] *= flxr
+            img *= flxr[:, np.newaxis, np.newaxis]
         else:
             # apply to vector
             img *= flxr
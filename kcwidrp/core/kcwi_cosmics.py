@@ -0,0 +1,98 @@
+"""
+Tiled cosmic ray rejection
+
+Runs astroscrappy.detect_cosmics on overlapping bands of rows on a thread
+pool (the astroscrappy C core releases the GIL) and stitches the masks and
+cleaned images back together.
+
+Every step of astroscrappy is local: the Laplacian, the 5x5 noise and
+cleaning kernels, the 3x3 and 7x7 fine structure medians, and the growth of
+the mask into neighboring pixels.  If each band is padded with enough rows
+from its neighbors, the core of the band sees exactly the same pixels as a
+whole-frame run.  The padding is set from the kernel footprint and the PSF
+FWHM (see tile_margin).  The only pixels that can differ from a whole-frame
+run are those within a few pixels of a band border with a chain of cosmic
+rays or saturated pixels running across more than the padding, which was
+not seen in testing.
+
+"""
+import math
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+from astroscrappy import detect_cosmics
+
+# largest kernel half-width in one pass of astroscrappy: 7x7 fine structure
+# median of a 3x3 median, plus one pixel of mask growth
+KERNEL_FOOTPRINT = 8
+
+# do not split into bands with fewer rows than this
+MIN_TILE_ROWS = 128
+
+
+def tile_margin(psffwhm):
+    """Rows of padding on each side of a band for a given PSF FWHM"""
+    return KERNEL_FOOTPRINT + 4 * int(math.ceil(psffwhm))
+
+
+def tile_bounds(nrows, ntiles, margin):
+    """
+    Split rows into bands with padding
+
+    Args:
+        nrows (int): number of image rows
+        ntiles (int): number of bands
+        margin (int): rows of padding on each side of a band
+
+    Returns:
+        list of (r0, r1, p0, p1): band rows r0:r1 and padded rows p0:p1
+
+    """
+    edges = np.linspace(0, nrows, ntiles + 1).astype(int)
+    return [(r0, r1, max(0, r0 - margin), min(nrows, r1 + margin))
+            for r0, r1 in zip(edges[:-1], edges[1:])]
+
+
+def detect_cosmics_tiled(data, nthreads=None, ntiles=None, margin=None,
+                         **kwargs):
+    """
+    Run astroscrappy.detect_cosmics on bands of rows in parallel
+
+    Args:
+        data (2D array): image to clean
+        nthreads (int): number of threads, defaults to the number of CPUs
+        ntiles (int): number of bands, defaults to the number of threads.
+            With one band the whole frame is run in a single call.
+        margin (int): rows of padding on each side of a band, defaults to
+            tile_margin(psffwhm)
+        **kwargs: passed on to astroscrappy.detect_cosmics
+
+    Returns:
+        (mask, clean): cosmic ray mask and cleaned image, as returned by
+        astroscrappy.detect_cosmics
+
+    """
+    if nthreads is None or nthreads <= 0:
+        nthreads = os.cpu_count() or 1
+    if ntiles is None:
+        ntiles = nthreads
+    ntiles = max(1, min(ntiles, data.shape[0] // MIN_TILE_ROWS))
+    if ntiles == 1:
+        return detect_cosmics(data, **kwargs)
+    if margin is None:
+        margin = tile_margin(kwargs.get('psffwhm', 2.5))
+
+    mask = np.zeros(data.shape, dtype=bool)
+    clean = np.empty(data.shape, dtype=np.float32)
+
+    def do_tile(bounds):
+        r0, r1, p0, p1 = bounds
+        tmask, tclean = detect_cosmics(data[p0:p1], **kwargs)
+        mask[r0:r1] = tmask[r0 - p0:r1 - p0]
+        clean[r0:r1] = tclean[r0 - p0:r1 - p0]
+
+    with ThreadPoolExecutor(max_workers=nthreads) as executor:
+        list(executor.map(do_tile, tile_bounds(data.shape[0], ntiles,
+                                               margin)))
+    return mask, clean
@@ -0,0 +1,146 @@
+"""
+Wait list of frames that cannot be reduced yet
+
+In continuous and wait-for-event modes a frame whose master calibrations are
+missing used to be rescheduled at once, so it went around the event queue,
+re-read and re-checked, until the calibrations were made.  Instead, the
+ingestion primitive parks it here under the signatures of the calibrations
+it lacks, e.g. ('BLUE', 'MBIAS', 2211) for a master bias of CCD
+configuration 2211, or ('BLUE', 'MARC', <STATEID>) for a master arc of its
+instrument state.  The proc table wakes it only when rows matching all of
+them have been added.
+
+"""
+import threading
+
+# master calibrations each image type needs, as groups of alternatives
+REQUIRED_CALS = {
+    'OBJECT': (('MBIAS',), ('MARC',), ('MFLAT', 'MDOME', 'MTWIF')),
+    'ARCLAMP': (('MCBARS',),),
+    'FLATLAMP': (('MBIAS',), ('MARC',)),
+    'TWIFLAT': (('MBIAS',), ('MARC',)),
+    'DOMEFLAT': (('MBIAS',), ('MARC',)),
+}
+
+
+def cal_signature(cal_type, camera, ccdcfg, stateid):
+    """
+    Signature of the calibrations of type cal_type that match a frame
+
+    Biases match the CCD configuration, the other masters the state ID, as
+    in Proctab.search_proctab.
+
+    Args:
+        cal_type (str): proc table type of the master calibration
+        camera (str): CAMERA of the frame
+        ccdcfg (int or str): CCDCFG of the frame
+        stateid (str): STATEID of the frame
+
+    Returns:
+        tuple: (camera, cal_type, CCD configuration or state ID)
+
+    """
+    if 'BIAS' in cal_type:
+        key = int(ccdcfg)
+    else:
+        key = str(stateid).strip()
+        if key == '0':
+            key = 'NONE'
+    return str(camera).upper().strip(), cal_type, key
+
+
+def row_signature(row):
+    """Signature a proc table row satisfies, see cal_signature"""
+    return cal_signature(row['TYPE'], row['CAM'], row['DID'], row['CID'])
+
+
+class DeferredFrames:
+    """
+    Frames waiting for calibrations
+
+    Args:
+        requeue (callable): called with the name of a frame to queue it again
+        logger (logging.Logger): optional logger
+
+    """
+
+    def __init__(self, requeue, logger=None):
+        self.requeue = requeue
+        self.log = logger
+        self.lock = threading.Lock()
+        # frame name -> list of groups of alternative signatures still missing
+        self.waiting = {}
+        # signature -> names of the frames waiting for it
+        self.by_signature = {}
+
+    def __len__(self):
+        return len(self.waiting)
+
+    def defer(self, name, missing):
+        """
+        Park a frame until its missing calibrations are added
+
+        Args:
+            name (str): frame to queue again
+            missing (list of list of tuple): for each missing calibration,
+                the signatures of the masters that would satisfy it
+
+        """
+        with self.lock:
+            self._discard(name)
+            self.waiting[name] = [list(group) for group in missing]
+            for group in missing:
+                for sig in group:
+                    self.by_signature.setdefault(sig, set()).add(name)
+        if self.log:
+            self.log.info("Deferred %s until %s are reduced" % (
+                name, ", ".join(" or ".join("%s %s" % (s[1], s[2])
+                                            for s in group)
+                                for group in missing)))
+
+    def _unindex(self, name, sigs):
+        for sig in sigs:
+            names = self.by_signature.get(sig)
+            if names is not None:
+                names.discard(name)
+                if not names:
+                    del self.by_signature[sig]
+
+    def _discard(self, name):
+        for group in self.waiting.pop(name, ()):
+            self._unindex(name, group)
+
+    def wake(self, row):
+        """
+        Proc table listener: queue the frames whose last missing
+        calibration a new row provides
+
+        Args:
+            row (dict): proc table row that was added
+
+        """
+        try:
+            sig = row_signature(row)
+        except (KeyError, TypeError, ValueError):
+            return
+        ready = []
+        with self.lock:
+            for name in sorted(self.by_signature.pop(sig, ())):
+                groups = []
+                for group in self.waiting[name]:
+                    if sig in group:
+                        # the alternatives of a satisfied group are not
+                        # needed anymore
+                        self._unindex(name, group)
+                    else:
+                        groups.append(group)
+                if groups:
+                    self.waiting[name] = groups
+                else:
+                    del self.waiting[name]
+                    ready.append(name)
+        for name in ready:
+            if self.log:
+                self.log.info("%s %s added, queueing %s again" %
+                              (sig[1], sig[2], name))
+            self.requeue(name)
@@ -0,0 +1,232 @@
+"""
+Parallel FITS header scanning with a per-directory cache
+
+Reads only the primary header of each file (no data) on a thread pool and
+keeps the headers in a cache file in each directory, keyed by file name and
+checked against the file size and modification time.  Scanning a night
+directory again after a few new frames only reads the new files.
+
+Also holds the header fixes and the CCD configuration used by the pipeline
+(fix_header, ccd_config), so that the header tools do not have to import the
+primitives.
+
+"""
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+from astropy.io import fits
+
+# cache file written in each scanned directory
+HEADER_CACHE_NAME = '.kcwi_headers.json'
+
+# default number of threads, scanning is limited by file access, not CPU
+DEFAULT_SCAN_THREADS = 16
+
+red_amp_dict = {'L1': 0, 'L2': 1, 'U1': 2, 'U2': 3}
+# gains for slow readout, high gain
+red_amp_gain = {'L1': 1.54, 'L2': 1.551, 'U1': 1.61, 'U2': 1.526}
+
+# gains for slow readout gainmul by ampid
+blue_amp_gain = {1:  {0: 1.570, 1: 1.600, 2: 1.610, 3: 1.600},
+                 2:  {0: 0.785, 1: 0.800, 2: 0.805, 3: 0.800},
+                 5:  {0: 0.314, 1: 0.320, 2: 0.325, 3: 0.319},
+                 10: {0: 0.157, 1: 0.160, 2: 0.158, 3: 0.158}}
+
+
+def read_primary_header(path):
+    """Read the primary header of a FITS file without reading any data"""
+    return fits.Header.fromfile(path)
+
+
+def file_key(path):
+    """(size, mtime) used to check that a cached header is still valid"""
+    st = os.stat(path)
+    return [st.st_size, st.st_mtime]
+
+
+def load_header_cache(directory):
+    """Read the header cache of a directory, empty if missing or corrupt"""
+    try:
+        with open(os.path.join(directory, HEADER_CACHE_NAME)) as cache_file:
+            cache = json.load(cache_file)
+    except (OSError, ValueError):
+        return {}
+    return cache if isinstance(cache, dict) else {}
+
+
+def save_header_cache(directory, cache):
+    """Write the header cache of a directory, ignored if not writable"""
+    cache_path = os.path.join(directory, HEADER_CACHE_NAME)
+    tmp_path = cache_path + '.%d.tmp' % os.getpid()
+    try:
+        with open(tmp_path, 'w') as cache_file:
+            json.dump(cache, cache_file)
+        os.replace(tmp_path, cache_path)
+    except OSError:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+def scan_headers(paths, nthreads=None, use_cache=True):
+    """
+    Read the primary headers of a list of FITS files
+
+    Args:
+        paths (list of str): FITS files to scan
+        nthreads (int): number of threads, defaults to DEFAULT_SCAN_THREADS
+        use_cache (bool): read and update the per-directory header cache
+
+    Returns:
+        list of astropy.io.fits.Header: the primary header of each file, in
+        the order of `paths`, or None where the file could not be read.  Each
+        call returns new Header objects, so they can be modified.
+
+    """
+    if nthreads is None or nthreads <= 0:
+        nthreads = DEFAULT_SCAN_THREADS
+    caches = {}
+    keys = []
+    cards = [None] * len(paths)
+    todo = []
+    for i, path in enumerate(paths):
+        directory, name = os.path.split(os.path.abspath(path))
+        try:
+            key = file_key(path)
+        except OSError:
+            key = None
+        keys.append((directory, name, key))
+        if use_cache and key is not None:
+            if directory not in caches:
+                caches[directory] = load_header_cache(directory)
+            entry = caches[directory].get(name)
+            if entry is not None and entry.get('key') == key:
+                cards[i] = entry['header']
+                continue
+        todo.append(i)
+
+    def do_file(i):
+        try:
+            return read_primary_header(paths[i]).tostring()
+        except (OSError, ValueError):
+            return None
+
+    if todo:
+        with ThreadPoolExecutor(max_workers=nthreads) as executor:
+            for i, hdr_str in zip(todo, executor.map(do_file, todo)):
+                cards[i] = hdr_str
+                directory, name, key = keys[i]
+                if use_cache and hdr_str is not None and key is not None:
+                    caches[directory][name] = {'key': key, 'header': hdr_str}
+        if use_cache:
+            for directory in {keys[i][0] for i in todo}:
+                if directory in caches:
+                    save_header_cache(directory, caches[directory])
+
+    return [fits.Header.fromstring(c) if c is not None else None
+            for c in cards]
+
+
+def ccd_config(header):
+    """
+    CCD configuration string (binning, mode, gain multiplier, amp mode).
+
+    This is the CCDCFG keyword used to match biases and darks, for headers
+    that have been through fix_header.
+
+    Args:
+        header (FITS header): image header
+
+    Returns:
+        (str): CCDCFG value, for example '2x2' binning in mode 1 with gainmul
+        10 and amp mode 9 is '221109'
+
+    """
+    ccdcfg = header['CCDSUM'].replace(" ", "")
+    ccdcfg += "%1d" % header['CCDMODE']
+    ccdcfg += "%02d" % header['GAINMUL']
+    ccdcfg += "%02d" % header['AMPMNUM']
+    return ccdcfg
+
+
+def fix_header(ccddata):
+    """
+    Fix header keywords for DRP use.
+
+    Update GAINn keywords for Blue channel.
+
+    Add FITS header keywords to Red channel data to make compatible with DRP.
+
+    Adds the following keywords that are not present in raw images:
+
+    * MJD - Modified Julian Day (only for AIT data)
+    * NVIDINP - from TAPLINES keyword
+    * GAINMUL - set to 1
+    * CCDMODE - from CDSSPEED keyword
+    * AMPNUM - based on AMPMODE
+    * GAINn - from red_amp_gain dictionary
+
+    """
+    # are we blue?
+    if 'BLUE' in ccddata.header['CAMERA'].upper():
+        gainmul = ccddata.header['GAINMUL']
+        namps = ccddata.header['NVIDINP']
+        for ia in range(namps):
+            ampid = ccddata.header['AMPID%d' % (ia+1)]
+            gain = blue_amp_gain[gainmul][ampid]
+            ccddata.header['GAIN%d' % (ia+1)] = gain
+    # are we red?
+    elif 'RED' in ccddata.header['CAMERA'].upper():
+        # Fix red headers during Caltech AIT
+        if 'TELESCOP' not in ccddata.header:
+            # Add DCS keywords
+            ccddata.header['TARGNAME'] = ccddata.header['OBJECT']
+            dateend = ccddata.header['DATE-END']
+            de = datetime.fromisoformat(dateend)
+            day_frac = de.hour / 24. + de.minute / 1440. + de.second / 86400.
+            jd = datetime.date(de).toordinal() + day_frac + 1721424.5
+            mjd = jd - 2400000.5
+            ccddata.header['MJD'] = mjd
+        # Add NVIDINP
+        ccddata.header['NVIDINP'] = ccddata.header['TAPLINES']
+        # Add GAINMUL
+        ccddata.header['GAINMUL'] = 1
+        # Add CCDMODE
+        if 'CDSSPEED' in ccddata.header:
+            ccddata.header['CCDMODE'] = ccddata.header['CDSSPEED']
+        else:
+            ccddata.header['CCDMODE'] = 0
+        # Add AMPMNUM
+        if 'AMPMODE' in ccddata.header:
+            ampmode = ccddata.header['AMPMODE']
+            if ampmode == 'L2U2L1U1':
+                ampnum = 0
+            elif ampmode == 'L2U2':
+                ampnum = 1
+            elif ampmode == 'L1U1':
+                ampnum = 2
+            elif ampmode == 'L2L1':
+                ampnum = 3
+            elif ampmode == 'U2U1':
+                ampnum = 4
+            elif ampmode == 'L2':
+                ampnum = 5
+            elif ampmode == 'U2':
+                ampnum = 6
+            elif ampmode == 'L1':
+                ampnum = 7
+            elif ampmode == 'U1':
+                ampnum = 8
+            else:
+                ampnum = 0
+            ccddata.header['AMPMNUM'] = ampnum
+
+            for amp in red_amp_dict.keys():
+                if amp in ampmode:
+                    # TODO: put in check for kw before updating
+                    gkey = 'GAIN%d' % red_amp_dict[amp]
+                    gain = red_amp_gain[amp]
+                    ccddata.header[gkey] = gain
+    else:
+        print("ERROR -- illegal CAMERA keyword: %s" % ccddata.header['CAMERA'])
@@ -0,0 +1,41 @@
+"""
+Pipeline actions imported on first use
+
+The framework looks up an action of the event_table as a method of the
+pipeline, then as a name of the pipeline module, then as a class of its own
+module in kcwidrp.primitives.  Actions that live in a shared module, like
+ingest_file in kcwi_file_primitives, used to be made visible with a star
+import in the pipeline module, which loaded astropy, scipy, and the plotting
+libraries as soon as a script imported the pipeline, before parsing its
+arguments.  A pipeline module now resolves these names with a module level
+__getattr__ (PEP 562) built here, so they are imported when the framework
+first runs the action.
+
+"""
+import importlib
+
+
+def lazy_actions(namespace, actions):
+    """
+    Module __getattr__ that imports actions on first use
+
+    Args:
+        namespace (dict): globals() of the pipeline module, resolved actions
+            are stored there so that later lookups do not come back here
+        actions (dict): action name -> name of the module defining it
+
+    Returns:
+        callable: the __getattr__ function of the pipeline module
+
+    """
+    def __getattr__(name):
+        try:
+            module_name = actions[name]
+        except KeyError:
+            raise AttributeError("module %r has no attribute %r" %
+                                 (namespace['__name__'], name)) from None
+        action = getattr(importlib.import_module(module_name), name)
+        namespace[name] = action
+        return action
+
+    return __getattr__
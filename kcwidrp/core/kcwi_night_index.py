@@ -0,0 +1,404 @@
+"""
+Night index of KCWI frames
+
+A small SQLite database of the header values used to classify frames: the
+same columns as the proc table (camera, image type, state and CCD
+configuration, group, exposure time, ...) for every raw frame of a night.
+It is filled incrementally: a frame is only read again if its size or
+modification time changed.  The command line tools (wb, wr, check_cals,
+smart_reduce_kcwi) and the ingestion primitive record frames in it, and it
+answers which frames form a calibration group and which calibrations match a
+science setup with indexed queries instead of re-reading the files.
+calibration_report counts the calibrations of every science setup of the
+night from a single grouped pass over the index.
+
+"""
+import csv
+import json
+import os
+import sqlite3
+from collections import Counter
+import threading
+from types import SimpleNamespace
+
+from kcwidrp.core.kcwi_headers import scan_headers, file_key, fix_header, \
+    ccd_config
+
+# default night index file, in the reduction directory like kcwi.proc
+NIGHT_INDEX_NAME = 'kcwi_night.db'
+
+# columns after path, size and mtime, named as in the proc table
+INDEX_COLUMNS = (('FRAMENO', 'INTEGER'), ('CID', 'TEXT'), ('DID', 'INTEGER'),
+                 ('TYPE', 'TEXT'), ('GRPID', 'TEXT'), ('TTIME', 'REAL'),
+                 ('CAM', 'TEXT'), ('IFU', 'TEXT'), ('GRAT', 'TEXT'),
+                 ('GANG', 'REAL'), ('CWAVE', 'REAL'), ('BIN', 'TEXT'),
+                 ('FILT', 'TEXT'), ('MJD', 'REAL'), ('OFNAME', 'TEXT'),
+                 ('TARGNAME', 'TEXT'), ('OBJECT', 'TEXT'))
+
+# OBJECT values of frames that are never reduced
+SKIP_OBJECTS = ('focus', 'Clearing ccd')
+
+# calibrations checked by calibration_report, with their configuration keys
+REPORT_CAL_TYPES = (('BIAS', 'bias_min_nframes'),
+                    ('CONTBARS', 'contbars_min_nframes'),
+                    ('ARCLAMP', 'arc_min_nframes'),
+                    ('FLATLAMP', 'flat_min_nframes'))
+
+
+def match_columns(cal_type):
+    """
+    Columns a calibration must share with a frame, besides camera and type
+
+    Same rules as Proctab.search_proctab: biases match the CCD
+    configuration, darks the CCD configuration and exposure time, objects
+    only the group, and everything else the state ID.
+
+    """
+    if 'BIAS' in cal_type or cal_type == 'MDARK':
+        return ('DID',)
+    if cal_type == 'DARK':
+        return ('DID', 'TTIME')
+    if cal_type == 'OBJECT':
+        return ()
+    return ('CID',)
+
+
+def frame_record(header):
+    """
+    Proc table values of a raw frame from its primary header
+
+    Follows the conventions of Proctab.update_proctab for frames read with
+    kcwi_fits_reader.
+
+    Args:
+        header (FITS header): primary header, not modified
+
+    Returns:
+        dict: column values, or None if the camera is not BLUE or RED
+
+    """
+    hdr = header.copy()
+    cam = str(hdr.get('CAMERA', '')).upper().strip()
+    if 'BLUE' not in cam and 'RED' not in cam:
+        return None
+    try:
+        fix_header(SimpleNamespace(header=hdr))
+    except KeyError:
+        pass
+    if 'CCDCFG' not in hdr:
+        try:
+            hdr['CCDCFG'] = ccd_config(hdr)
+        except KeyError:
+            hdr['CCDCFG'] = '-1'
+    stateid = str(hdr.get('STATEID', 'NONE')).strip()
+    if stateid == '0':
+        stateid = 'NONE'
+    grpid = str(hdr.get('GROUPID', '')).strip()
+    if len(grpid) <= 0:
+        grpid = 'NONE'
+    if 'BLUE' in cam:
+        grat, gang, cwave, filt = (hdr.get('BGRATNAM'), hdr.get('BGRANGLE'),
+                                   hdr.get('BCWAVE'), hdr.get('BFILTNAM'))
+    else:
+        grat, gang, cwave, filt = (hdr.get('RGRATNAM'), hdr.get('RGRANGLE'),
+                                   hdr.get('RCWAVE'), None)
+    obj = str(hdr.get('OBJECT', ''))
+    trgnm = str(hdr.get('TARGNAME', '')).replace(" ", "")
+    if len(trgnm) <= 0:
+        trgnm = obj.replace(" ", "")
+    try:
+        did = int(hdr['CCDCFG'])
+    except ValueError:
+        did = -1
+    return {'FRAMENO': hdr.get('FRAMENO'), 'CID': stateid, 'DID': did,
+            'TYPE': hdr.get('IMTYPE'), 'GRPID': grpid,
+            'TTIME': hdr.get('TTIME'), 'CAM': cam, 'IFU': hdr.get('IFUNAM'),
+            'GRAT': grat, 'GANG': gang, 'CWAVE': cwave,
+            'BIN': hdr.get('BINNING'), 'FILT': filt, 'MJD': hdr.get('MJD'),
+            'OFNAME': hdr.get('OFNAME'), 'TARGNAME': trgnm, 'OBJECT': obj}
+
+
+class NightIndex:
+    """
+    SQLite index of the frames of a night
+
+    Args:
+        db_path (str): database file, ':memory:' for a temporary index
+        logger (logging.Logger): optional logger
+
+    """
+
+    def __init__(self, db_path=NIGHT_INDEX_NAME, logger=None):
+        self.db_path = db_path
+        self.log = logger
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(db_path, check_same_thread=False)
+        self.db.row_factory = sqlite3.Row
+        cols = ", ".join("%s %s" % c for c in INDEX_COLUMNS)
+        with self.db:
+            self.db.execute("CREATE TABLE IF NOT EXISTS frames (path TEXT "
+                            "PRIMARY KEY, size INTEGER, mtime REAL, %s)" %
+                            cols)
+            self.db.execute("CREATE INDEX IF NOT EXISTS frames_cid ON "
+                            "frames (CAM, TYPE, CID)")
+            self.db.execute("CREATE INDEX IF NOT EXISTS frames_did ON "
+                            "frames (CAM, TYPE, DID, TTIME)")
+            self.db.execute("CREATE INDEX IF NOT EXISTS frames_grpid ON "
+                            "frames (GRPID)")
+
+    def close(self):
+        self.db.close()
+
+    def __len__(self):
+        return self.db.execute("SELECT COUNT(*) FROM frames").fetchone()[0]
+
+    def stale(self, paths):
+        """Paths that are not in the index or changed since they were added"""
+        known = {}
+        for row in self.db.execute("SELECT path, size, mtime FROM frames"):
+            known[row['path']] = [row['size'], row['mtime']]
+        out = []
+        for path in paths:
+            try:
+                key = file_key(path)
+            except OSError:
+                continue
+            if known.get(os.path.abspath(path)) != key:
+                out.append(path)
+        return out
+
+    def update(self, paths, nthreads=None):
+        """
+        Add new or changed frames to the index
+
+        Only the primary headers of the frames not already indexed are read
+        (see scan_headers).
+
+        Args:
+            paths (list of str): raw frames
+            nthreads (int): number of threads for reading headers
+
+        Returns:
+            int: number of frames added or updated
+
+        """
+        todo = self.stale(paths)
+        if todo:
+            self.add_headers(todo, scan_headers(todo, nthreads=nthreads))
+        if self.log:
+            self.log.info("Night index %s: %d of %d frames read" %
+                          (self.db_path, len(todo), len(paths)))
+        return len(todo)
+
+    def add_headers(self, paths, headers):
+        """Record frames from headers already read (None are skipped)"""
+        rows = []
+        for path, header in zip(paths, headers):
+            if header is None:
+                continue
+            rec = frame_record(header)
+            if rec is None:
+                continue
+            try:
+                key = file_key(path)
+            except OSError:
+                key = [None, None]
+            rows.append([os.path.abspath(path)] + key +
+                        [rec[c[0]] for c in INDEX_COLUMNS])
+        if rows:
+            sql = "INSERT OR REPLACE INTO frames VALUES (%s)" % \
+                ", ".join("?" * (3 + len(INDEX_COLUMNS)))
+            with self.lock, self.db:
+                self.db.executemany(sql, rows)
+
+    def add_header(self, path, header):
+        """Record one frame from its header"""
+        self.add_headers([path], [header])
+
+    def query(self, where="", params=(), order="MJD, FRAMENO"):
+        """Rows of the index as dicts, optionally filtered by an SQL where"""
+        sql = "SELECT * FROM frames"
+        if where:
+            sql += " WHERE " + where
+        sql += " ORDER BY " + order
+        return [dict(row) for row in self.db.execute(sql, params)]
+
+    def frames(self, camera=None, imtype=None, skip_objects=SKIP_OBJECTS):
+        """
+        Frames of a camera and image type in time order
+
+        Args:
+            camera (str): 'BLUE' or 'RED', or None for both
+            imtype (str): IMTYPE, or None for all
+            skip_objects (tuple): OBJECT values to leave out
+
+        Returns:
+            list of dict: index rows
+
+        """
+        where = []
+        params = []
+        if camera is not None:
+            where.append("CAM = ?")
+            params.append(camera.upper().strip())
+        if imtype is not None:
+            where.append("TYPE = ?")
+            params.append(imtype)
+        if skip_objects:
+            where.append("OBJECT NOT IN (%s)" %
+                         ", ".join("?" * len(skip_objects)))
+            params.extend(skip_objects)
+        return self.query(" AND ".join(where), params)
+
+    def group(self, grpid):
+        """Frames that form a calibration group"""
+        return self.query("GRPID = ?", (grpid,))
+
+    def matching_cals(self, frame, cal_type, target_group=None):
+        """
+        Calibration frames that match a frame
+
+        Uses the same matching rules as Proctab.search_proctab (see
+        match_columns).
+
+        Args:
+            frame (dict): index row of the frame to match
+            cal_type (str): IMTYPE of the calibrations
+            target_group (str): optional group ID to restrict biases, darks,
+                and objects to
+
+        Returns:
+            list of dict: index rows of the matching frames
+
+        """
+        where = ["CAM = ?", "TYPE = ?"]
+        params = [frame['CAM'], cal_type]
+        for col in match_columns(cal_type):
+            where.append("%s = ?" % col)
+            params.append(frame[col])
+        if target_group is not None and cal_type != 'MDARK' and \
+                ('BIAS' in cal_type or cal_type in ('DARK', 'OBJECT')):
+            where.append("GRPID = ?")
+            params.append(target_group)
+        return self.query(" AND ".join(where), params)
+
+    def cal_counts(self):
+        """
+        Number of frames of every calibration key in one grouped query
+
+        Returns:
+            Counter: frame counts keyed by (CAM, TYPE) followed by the values
+            of match_columns(TYPE), see count_matching
+
+        """
+        counts = Counter()
+        for row in self.db.execute(
+                "SELECT CAM, TYPE, CID, DID, TTIME, COUNT(*) AS N FROM frames "
+                "GROUP BY CAM, TYPE, CID, DID, TTIME"):
+            counts[cal_key(row, row['TYPE'])] += row['N']
+        return counts
+
+    def setups(self, skip_objects=SKIP_OBJECTS):
+        """
+        Science setups of the night: OBJECT frames grouped by camera, state
+        ID, and CCD configuration, in order of their first frame
+
+        Returns:
+            list of dict: setup values with the number of frames in NOBJ
+
+        """
+        params = list(skip_objects)
+        where = "TYPE = 'OBJECT'"
+        if skip_objects:
+            where += " AND OBJECT NOT IN (%s)" % ", ".join("?" * len(params))
+        return [dict(row) for row in self.db.execute(
+            "SELECT CAM, CID, DID, IFU, GRAT, GANG, CWAVE, BIN, "
+            "COUNT(*) AS NOBJ, MIN(MJD) AS MJD FROM frames WHERE %s "
+            "GROUP BY CAM, CID, DID ORDER BY MIN(MJD)" % where, params)]
+
+
+def record_headers(paths, headers, db_path=NIGHT_INDEX_NAME):
+    """
+    Record frames in a night index, ignored if it cannot be written
+
+    Args:
+        paths (list of str): FITS files
+        headers (list): their primary headers, None for unreadable files
+        db_path (str): database file
+
+    Returns:
+        bool: True if the frames were recorded
+
+    """
+    try:
+        night_index = NightIndex(db_path)
+    except sqlite3.Error:
+        return False
+    try:
+        night_index.add_headers(paths, headers)
+    except sqlite3.Error:
+        return False
+    finally:
+        night_index.close()
+    return True
+
+
+def cal_key(frame, cal_type):
+    """Key of the calibrations of type cal_type matching frame"""
+    return (frame['CAM'], cal_type) + \
+        tuple(frame[col] for col in match_columns(cal_type))
+
+
+def count_matching(counts, frame, cal_type):
+    """Number of cal_type frames matching frame, from cal_counts"""
+    return counts.get(cal_key(frame, cal_type), 0)
+
+
+def calibration_report(night_index, minimums, skip_objects=SKIP_OBJECTS):
+    """
+    Found and required calibrations of every science setup of a night
+
+    All counts come from one grouped pass over the index, so the cost does
+    not grow with the number of setups times the size of the index.
+
+    Args:
+        night_index (NightIndex): index of the night
+        minimums (dict): minimum number of frames of each of
+            REPORT_CAL_TYPES, keyed by camera then calibration type
+        skip_objects (tuple): OBJECT values of frames that are not setups
+
+    Returns:
+        list of dict: one row per setup with its values, the found and
+        needed counts of each calibration (e.g. BIAS_FOUND, BIAS_NEEDED),
+        and CALS_PASS, True if every calibration is complete
+
+    """
+    counts = night_index.cal_counts()
+    report = []
+    for setup in night_index.setups(skip_objects=skip_objects):
+        row = dict(setup)
+        cals_pass = True
+        for cal_type, _ in REPORT_CAL_TYPES:
+            found = count_matching(counts, setup, cal_type)
+            needed = minimums[setup['CAM']][cal_type]
+            row[cal_type + '_FOUND'] = found
+            row[cal_type + '_NEEDED'] = needed
+            cals_pass = cals_pass and found >= needed
+        row['CALS_PASS'] = cals_pass
+        report.append(row)
+    return report
+
+
+def write_report(report, path):
+    """Write a calibration report as JSON if path ends in .json, else CSV"""
+    if path.lower().endswith('.json'):
+        with open(path, 'w') as report_file:
+            json.dump(report, report_file, indent=1)
+        return
+    columns = []
+    for row in report:
+        columns.extend(c for c in row if c not in columns)
+    with open(path, 'w', newline='') as report_file:
+        writer = csv.DictWriter(report_file, fieldnames=columns)
+        writer.writeheader()
+        writer.writerows(report)
@@ -0,0 +1,500 @@
+"""
+Deferred rendering of the QA plots in a worker process
+
+save_plot used to export each bokeh figure to PNG with bokeh's export_png,
+which drives a headless web browser, in the middle of the reduction.  Plots
+are now described by a PlotSpec (the data arrays of the plot and their
+style), queued, and rendered by a worker process with the Agg backend of
+matplotlib, so the reduction never waits for the rendering.  The worker
+renders everything that was queued while it was busy in one pass.  A file
+name ending in .html is written with bokeh instead, still without a browser.
+
+PlotSpec offers the drawing methods of a bokeh figure that the primitives
+use (line, circle, diamond, scatter, quad, and the x_range, y_range, xgrid,
+and ygrid attributes), so a primitive can draw a plot it only saves without
+importing bokeh, and convert it with to_bokeh when it is also displayed.
+Bokeh figures given to save_plot are converted to a spec before queueing.
+
+"""
+import atexit
+import logging
+import multiprocessing
+import os
+import queue
+from types import SimpleNamespace
+
+import numpy as np
+
+logger = logging.getLogger('KCWI')
+
+# default number of rendering processes, 0 renders in the calling process
+DEFAULT_PLOT_WORKERS = 1
+
+# bokeh marker -> matplotlib marker
+MARKERS = {'circle': 'o', 'diamond': 'D', 'square': 's', 'triangle': '^',
+           'inverted_triangle': 'v', 'cross': '+', 'x': 'x', 'asterisk': '*',
+           'dot': '.', 'hex': 'h', 'star': '*'}
+
+# bokeh named dash patterns -> matplotlib line styles
+DASHES = {'solid': '-', 'dashed': '--', 'dotted': ':', 'dotdash': '-.',
+          'dashdot': '-.'}
+
+
+def _values(values):
+    return np.asarray(values, dtype=float).ravel()
+
+
+class PlotSpec:
+    """
+    Plot described by its data arrays and style, cheap to pickle
+
+    Args:
+        title (str): plot title
+        x_axis_label (str): label of the x axis
+        y_axis_label (str): label of the y axis
+        plot_width (int): width in pixels
+        plot_height (int): height in pixels
+
+    """
+
+    def __init__(self, title='', x_axis_label='', y_axis_label='',
+                 plot_width=600, plot_height=400, **kwargs):
+        self.title = title
+        self.x_axis_label = x_axis_label
+        self.y_axis_label = y_axis_label
+        self.plot_width = plot_width
+        self.plot_height = plot_height
+        self.layers = []
+        self.x_range = SimpleNamespace(start=None, end=None)
+        self.y_range = SimpleNamespace(start=None, end=None)
+        self.xgrid = SimpleNamespace(grid_line_color='#e5e5e5')
+        self.ygrid = SimpleNamespace(grid_line_color='#e5e5e5')
+
+    def line(self, x, y, color=None, line_color=None, line_dash='solid',
+             line_width=1, legend_label=None, **kwargs):
+        self.layers.append({
+            'kind': 'line', 'x': _values(x), 'y': _values(y),
+            'color': line_color or color, 'dash': line_dash,
+            'width': line_width, 'label': legend_label})
+
+    def scatter(self, x, y, marker='circle', size=4, color=None,
+                fill_color=None, line_color=None, legend_label=None,
+                **kwargs):
+        self.layers.append({
+            'kind': 'scatter', 'x': _values(x), 'y': _values(y),
+            'marker': marker, 'size': size,
+            'color': fill_color or color or line_color,
+            'label': legend_label})
+
+    def circle(self, x, y, **kwargs):
+        self.scatter(x, y, marker='circle', **kwargs)
+
+    def diamond(self, x, y, **kwargs):
+        self.scatter(x, y, marker='diamond', **kwargs)
+
+    def quad(self, left, right, top, bottom=0., color=None, fill_color=None,
+             legend_label=None, **kwargs):
+        self.layers.append({
+            'kind': 'quad', 'left': _values(left), 'right': _values(right),
+            'top': _values(top),
+            'bottom': np.broadcast_to(_values(bottom), np.shape(
+                _values(top))).copy(),
+            'color': fill_color or color, 'label': legend_label})
+
+    def to_dict(self):
+        """Plain description of the plot, as sent to the workers"""
+        return {'title': self.title, 'x_axis_label': self.x_axis_label,
+                'y_axis_label': self.y_axis_label,
+                'width': self.plot_width, 'height': self.plot_height,
+                'x_range': (self.x_range.start, self.x_range.end),
+                'y_range': (self.y_range.start, self.y_range.end),
+                'xgrid': self.xgrid.grid_line_color is not None,
+                'ygrid': self.ygrid.grid_line_color is not None,
+                'layers': self.layers}
+
+    @classmethod
+    def from_dict(cls, spec):
+        plot = cls(spec['title'], spec['x_axis_label'], spec['y_axis_label'],
+                   spec['width'], spec['height'])
+        plot.layers = spec['layers']
+        plot.x_range.start, plot.x_range.end = spec['x_range']
+        plot.y_range.start, plot.y_range.end = spec['y_range']
+        if not spec['xgrid']:
+            plot.xgrid.grid_line_color = None
+        if not spec['ygrid']:
+            plot.ygrid.grid_line_color = None
+        return plot
+
+    def to_bokeh(self):
+        """Equivalent bokeh figure, to display the plot"""
+        from bokeh.plotting import figure
+        from bokeh.models import Range1d
+        fig = figure(title=self.title, x_axis_label=self.x_axis_label,
+                     y_axis_label=self.y_axis_label,
+                     plot_width=self.plot_width, plot_height=self.plot_height)
+        for layer in self.layers:
+            label = {} if layer['label'] is None else {
+                'legend_label': layer['label']}
+            color = {} if layer['color'] is None else {
+                'color': layer['color']}
+            if layer['kind'] == 'line':
+                fig.line(layer['x'], layer['y'], line_dash=layer['dash'],
+                         line_width=layer['width'], **color, **label)
+            elif layer['kind'] == 'scatter':
+                fig.scatter(layer['x'], layer['y'], marker=layer['marker'],
+                            size=layer['size'], **color, **label)
+            else:
+                fig.quad(left=layer['left'], right=layer['right'],
+                         top=layer['top'], bottom=layer['bottom'], **color,
+                         **label)
+        if None not in (self.x_range.start, self.x_range.end):
+            fig.x_range = Range1d(self.x_range.start, self.x_range.end)
+        if None not in (self.y_range.start, self.y_range.end):
+            fig.y_range = Range1d(self.y_range.start, self.y_range.end)
+        fig.xgrid.grid_line_color = self.xgrid.grid_line_color
+        fig.ygrid.grid_line_color = self.ygrid.grid_line_color
+        return fig
+
+
+def _glyph_values(glyph, data, name, default=None):
+    """Values of a glyph property, from its data source column if any"""
+    value = getattr(glyph, name, default)
+    if isinstance(value, str) and value in data:
+        return data[value]
+    return value
+
+
+def spec_from_bokeh(fig):
+    """
+    Plain description of a bokeh figure or layout of figures
+
+    Lines, circles, scatter markers, and quads are kept, other glyphs are
+    left out.
+
+    Args:
+        fig (PlotSpec, bokeh figure, or bokeh layout): plot to describe
+
+    Returns:
+        dict: PlotSpec.to_dict of the plot, or {'grid': [...], 'ncols': n}
+        for a layout
+
+    """
+    if isinstance(fig, PlotSpec):
+        return fig.to_dict()
+    if isinstance(fig, dict):
+        return fig
+    if not hasattr(fig, 'renderers'):
+        # grid, row, or column of figures
+        plots = []
+        ncols = 1
+        for child in getattr(fig, 'children', []):
+            if isinstance(child, tuple):
+                child, _, col = child[:3]
+                ncols = max(ncols, col + 1)
+            if hasattr(child, 'renderers') or hasattr(child, 'children'):
+                plots.append(spec_from_bokeh(child))
+        if type(fig).__name__ == 'Row':
+            ncols = len(plots)
+        return {'grid': plots, 'ncols': ncols}
+    labels = {}
+    for legend in fig.legend:
+        for item in legend.items:
+            label = item.label
+            if isinstance(label, dict):
+                label = label.get('value')
+            for renderer in item.renderers:
+                labels[renderer.id] = label
+    plot = PlotSpec(
+        title=fig.title.text if fig.title is not None else '',
+        x_axis_label=fig.xaxis[0].axis_label if fig.xaxis else '',
+        y_axis_label=fig.yaxis[0].axis_label if fig.yaxis else '',
+        plot_width=fig.plot_width or 600, plot_height=fig.plot_height or 400)
+    for renderer in fig.renderers:
+        glyph = getattr(renderer, 'glyph', None)
+        if glyph is None:
+            continue
+        data = renderer.data_source.data
+        kind = type(glyph).__name__
+        label = labels.get(renderer.id)
+        if kind == 'Line':
+            dash = list(glyph.line_dash)
+            plot.line(_glyph_values(glyph, data, 'x'),
+                      _glyph_values(glyph, data, 'y'),
+                      color=glyph.line_color, line_dash=dash or 'solid',
+                      line_width=glyph.line_width, legend_label=label)
+        elif kind in ('Circle', 'Scatter'):
+            size = _glyph_values(glyph, data, 'size', 4)
+            plot.scatter(_glyph_values(glyph, data, 'x'),
+                         _glyph_values(glyph, data, 'y'),
+                         marker=getattr(glyph, 'marker', 'circle'),
+                         size=size if np.isscalar(size) else 4,
+                         color=glyph.fill_color or glyph.line_color,
+                         legend_label=label)
+        elif kind == 'Quad':
+            plot.quad(_glyph_values(glyph, data, 'left'),
+                      _glyph_values(glyph, data, 'right'),
+                      _glyph_values(glyph, data, 'top'),
+                      _glyph_values(glyph, data, 'bottom', 0.),
+                      color=glyph.fill_color, legend_label=label)
+    for axis in ('x_range', 'y_range'):
+        rng = getattr(fig, axis)
+        setattr(plot, axis, SimpleNamespace(start=getattr(rng, 'start', None),
+                                            end=getattr(rng, 'end', None)))
+    plot.xgrid.grid_line_color = fig.xgrid[0].grid_line_color \
+        if fig.xgrid else None
+    plot.ygrid.grid_line_color = fig.ygrid[0].grid_line_color \
+        if fig.ygrid else None
+    return plot.to_dict()
+
+
+def _draw(ax, spec):
+    """Draw a plot description on matplotlib axes"""
+    for layer in spec['layers']:
+        if layer['kind'] == 'line':
+            dash = layer['dash']
+            if isinstance(dash, str):
+                style = DASHES.get(dash, '-')
+            else:
+                dash = list(dash) * (2 if len(dash) % 2 else 1)
+                style = (0, tuple(dash)) if dash else '-'
+            ax.plot(layer['x'], layer['y'], color=layer['color'],
+                    linestyle=style, linewidth=layer['width'],
+                    label=layer['label'])
+        elif layer['kind'] == 'scatter':
+            ax.scatter(layer['x'], layer['y'],
+                       marker=MARKERS.get(layer['marker'], 'o'),
+                       s=float(layer['size']) ** 2, color=layer['color'],
+                       label=layer['label'])
+        else:
+            ax.bar(layer['left'], layer['top'] - layer['bottom'],
+                   width=layer['right'] - layer['left'],
+                   bottom=layer['bottom'], align='edge',
+                   color=layer['color'], label=layer['label'])
+    ax.set_axisbelow(True)
+    ax.set_title(spec['title'], fontsize='small')
+    ax.set_xlabel(spec['x_axis_label'])
+    ax.set_ylabel(spec['y_axis_label'])
+    if None not in spec['x_range']:
+        ax.set_xlim(*spec['x_range'])
+    if None not in spec['y_range']:
+        ax.set_ylim(*spec['y_range'])
+    if spec['xgrid']:
+        ax.grid(True, axis='x', color='#e5e5e5')
+    if spec['ygrid']:
+        ax.grid(True, axis='y', color='#e5e5e5')
+    if any(layer['label'] for layer in spec['layers']):
+        ax.legend(fontsize='small')
+
+
+def render_plot(spec, path):
+    """
+    Write a plot description to a PNG (matplotlib Agg) or HTML (bokeh) file
+
+    Args:
+        spec (dict): spec_from_bokeh description of the plot
+        path (str): output file
+
+    """
+    if path.endswith('.html'):
+        from bokeh.embed import file_html
+        from bokeh.layouts import gridplot
+        from bokeh.resources import CDN
+        if 'grid' in spec:
+            obj = gridplot([PlotSpec.from_dict(s).to_bokeh()
+                            for s in spec['grid']], ncols=spec['ncols'])
+        else:
+            obj = PlotSpec.from_dict(spec).to_bokeh()
+        with open(path, 'w') as out:
+            out.write(file_html(obj, CDN, os.path.basename(path)))
+        return
+    from matplotlib.figure import Figure
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+    plots = spec['grid'] if 'grid' in spec else [spec]
+    ncols = spec.get('ncols', 1)
+    nrows = max(1, -(-len(plots) // ncols))
+    width = max(p['width'] for p in plots) if plots else 600
+    height = max(p['height'] for p in plots) if plots else 400
+    fig = Figure(figsize=(ncols * width / 100., nrows * height / 100.),
+                 dpi=100)
+    FigureCanvasAgg(fig)
+    for i, plot in enumerate(plots):
+        _draw(fig.add_subplot(nrows, ncols, i + 1), plot)
+    fig.tight_layout()
+    fig.savefig(path)
+
+
+def render_worker(jobs, done):
+    """
+    Worker process loop: render the queued plots until a None job
+
+    Everything queued while the worker was busy is rendered in one pass,
+    and the results of the pass are reported together.
+
+    """
+    while True:
+        batch = [jobs.get()]
+        while batch[-1] is not None:
+            try:
+                batch.append(jobs.get_nowait())
+            except queue.Empty:
+                break
+        results = []
+        for job in batch:
+            if job is None:
+                break
+            path, spec = job
+            try:
+                render_plot(spec, path)
+                results.append((path, None))
+            except Exception as e:
+                results.append((path, "%s: %s" % (type(e).__name__, e)))
+        done.put(results)
+        if batch[-1] is None:
+            return
+
+
+class PlotQueue:
+    """
+    Queue of plots rendered by worker processes
+
+    The workers are started on the first plot.
+
+    Args:
+        processes (int): number of worker processes, 0 to render in the
+            calling process
+        logger (logging.Logger): optional logger
+
+    """
+
+    def __init__(self, processes=DEFAULT_PLOT_WORKERS, logger=None):
+        self.processes = processes
+        self.log = logger
+        self.workers = []
+        self.jobs = None
+        self.done = None
+        self.submitted = 0
+        self.rendered = 0
+        self.failed = 0
+
+    def start(self):
+        ctx = multiprocessing.get_context('spawn')
+        self.jobs = ctx.Queue()
+        self.done = ctx.Queue()
+        for _ in range(self.processes):
+            worker = ctx.Process(target=render_worker,
+                                 args=(self.jobs, self.done), daemon=True)
+            worker.start()
+            self.workers.append(worker)
+
+    def submit(self, fig, filename):
+        """
+        Queue a plot and return at once
+
+        Args:
+            fig (PlotSpec, bokeh figure or layout): plot to render
+            filename (str): output file, .png or .html
+
+        """
+        spec = spec_from_bokeh(fig)
+        path = os.path.abspath(filename)
+        self.submitted += 1
+        if self.workers and not all(w.is_alive() for w in self.workers):
+            if self.log:
+                self.log.warning("Plot worker stopped, rendering plots in "
+                                 "the pipeline process")
+            self.stop()
+            self.processes = 0
+        if self.processes <= 0:
+            self._report([(path, self._render(spec, path))])
+            return
+        if not self.workers:
+            self.start()
+        self.jobs.put((path, spec))
+        self.check()
+
+    @staticmethod
+    def _render(spec, path):
+        try:
+            render_plot(spec, path)
+        except Exception as e:
+            return "%s: %s" % (type(e).__name__, e)
+        return None
+
+    def _report(self, results):
+        for path, error in results:
+            if error is None:
+                self.rendered += 1
+            else:
+                self.failed += 1
+                if self.log:
+                    self.log.warning("Could not render %s: %s" %
+                                     (path, error))
+
+    def check(self):
+        """Account for the plots rendered since the last check"""
+        if self.done is None:
+            return
+        while True:
+            try:
+                self._report(self.done.get_nowait())
+            except queue.Empty:
+                return
+
+    @property
+    def pending(self):
+        """Number of plots not rendered yet"""
+        self.check()
+        return self.submitted - self.rendered - self.failed
+
+    def close(self, timeout=None):
+        """Render the plots still queued and stop the workers"""
+        if not self.workers:
+            return
+        for _ in self.workers:
+            self.jobs.put(None)
+        for worker in self.workers:
+            worker.join(timeout)
+        # the results of the last passes
+        while self.pending > 0:
+            try:
+                self._report(self.done.get(timeout=1.))
+            except queue.Empty:
+                break
+        self.stop()
+
+    def stop(self):
+        """Stop the workers at once, the plots still queued are dropped"""
+        for worker in self.workers:
+            if worker.is_alive():
+                worker.terminate()
+            worker.join()
+        if self.jobs is not None:
+            # do not wait at exit for a worker to read what is left
+            self.jobs.cancel_join_thread()
+        self.workers = []
+
+
+_plot_queue = None
+
+
+def start_plot_queue(processes=DEFAULT_PLOT_WORKERS, logger=None):
+    """
+    Set up the plot queue used by save_plot
+
+    The plots still queued are rendered before the interpreter exits.
+
+    """
+    global _plot_queue
+    if _plot_queue is not None:
+        _plot_queue.close()
+    else:
+        atexit.register(lambda: _plot_queue.close())
+    _plot_queue = PlotQueue(processes=processes, logger=logger)
+    return _plot_queue
+
+
+def plot_queue():
+    """The plot queue used by save_plot, started with defaults if needed"""
+    if _plot_queue is None:
+        return start_plot_queue(logger=logger)
+    return _plot_queue
@@ -1,9 +1,10 @@
 import numpy as np
-from bokeh.io import export_png
 
 import os
 import logging
 
+from kcwidrp.core.kcwi_plot_queue import plot_queue
+
 logger = logging.getLogger('KCWI')
 
 
@@ -35,10 +36,11 @@ def set_plot_lims(fig, xlim=None, ylim=None):
 
 
 def save_plot(fig, filename=None):
+    """Queue a bokeh figure or PlotSpec for rendering, see kcwi_plot_queue"""
     if filename is None:
         fnam = os.path.join('plots', 'kcwi_drp_plot.png')
     else:
         fnam = os.path.join('plots', filename)
-    export_png(fig, filename=fnam)
+    plot_queue().submit(fig, fnam)
 
     logger.info(">>> Saving to %s" % fnam)
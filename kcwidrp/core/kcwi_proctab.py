@@ -8,6 +8,11 @@ class Proctab:
     def __init__(self, logger=None):
         self.log = logger if logger is not None else logging.getLogger('KCWI')
         self.proctab = None
+        self.listeners = []
+
+    def add_listener(self, callback):
+        """Call callback with each new row (a dict) added by update_proctab"""
+        self.listeners.append(callback)
 
     def new_proctab(self):
         cnames = ('FRAMENO', 'CID', 'DID', 'TYPE', 'GRPID', 'TTIME', 'CAM',
@@ -142,6 +147,9 @@ class Proctab:
         self.proctab.sort('FRAMENO')
         self.log.info(
             f"proctable updated with {frame.header['OFNAME']} and {filename}")
+        if new_row is not None:
+            for listener in self.listeners:
+                listener(dict(zip(self.proctab.colnames, new_row)))
 
     def search_proctab(self, frame, target_type=None, target_group=None,
                        nearest=False):
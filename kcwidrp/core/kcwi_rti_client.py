@@ -0,0 +1,233 @@
+"""
+Background client for the Keck RTI ingestion notifications
+
+SendHTTP used to call the RTI endpoint from the pipeline event loop, with a
+new connection per frame and a sleep between retries, so a slow endpoint
+stalled the reduction.  Notifications are now written to an outbox directory
+and sent by a worker thread over one persistent requests.Session
+(connection pooling and keep-alive).  Failed requests are retried with
+exponential backoff and jitter, up to a maximum delay, until the endpoint
+answers.  A notification file is only removed once the endpoint answered, so
+undelivered notifications are sent again after a restart.  Notifications
+that are ready together are sent in one pass over the same connection.
+
+"""
+import json
+import os
+import random
+import threading
+import time
+import uuid
+
+import requests
+
+# default outbox directory, in the reduction directory
+DEFAULT_OUTBOX = 'rti_outbox'
+
+# default upper limit of the retry delay, in seconds
+DEFAULT_MAX_BACKOFF = 300.
+
+
+def backoff_delay(attempt, base, cap, rand=random.random):
+    """
+    Retry delay with exponential backoff and full jitter
+
+    Args:
+        attempt (int): number of failed attempts so far, starting at 1
+        base (float): delay after the first failure, before jitter
+        cap (float): maximum delay before jitter
+
+    Returns:
+        float: random delay between 0 and min(cap, base * 2**(attempt-1))
+
+    """
+    # bounded exponent, a notification can be retried for days
+    return rand() * min(cap, base * 2. ** min(attempt - 1, 64))
+
+
+def client_from_config(config, logger=None):
+    """
+    RTIClient set up from the framework configuration
+
+    Uses the [RTI] section (config.rti) for the endpoint, credentials, and
+    retries, and puts the outbox in the reduction directory
+    (config.instrument.cwd).
+
+    """
+    rti = config.rti
+    outbox = getattr(rti, 'rti_outbox', None) or DEFAULT_OUTBOX
+    max_backoff = getattr(rti, 'rti_max_backoff', None)
+    return RTIClient(rti.rti_url, auth=(rti.rti_user, rti.rti_pass),
+                     outbox=os.path.join(config.instrument.cwd, outbox),
+                     attempts=rti.rti_attempts, retry_time=rti.rti_retry_time,
+                     max_backoff=max_backoff if max_backoff is not None else
+                     DEFAULT_MAX_BACKOFF, logger=logger)
+
+
+class RTIClient:
+    """
+    Send RTI notifications from a worker thread
+
+    Args:
+        url (str): RTI endpoint
+        auth (tuple): (user, password) for the endpoint
+        outbox (str): directory of the undelivered notifications
+        attempts (int): number of failed attempts after which an error is
+            logged, the notification is still retried
+        retry_time (float): base delay between attempts, in seconds
+        max_backoff (float): maximum delay between attempts, in seconds
+        timeout (float): request timeout, in seconds
+        logger (logging.Logger): optional logger
+
+    """
+
+    def __init__(self, url, auth=None, outbox=DEFAULT_OUTBOX, attempts=3,
+                 retry_time=5., max_backoff=DEFAULT_MAX_BACKOFF, timeout=30.,
+                 logger=None):
+        self.url = url
+        self.outbox = outbox
+        self.attempts = attempts
+        self.retry_time = retry_time
+        self.max_backoff = max_backoff
+        self.timeout = timeout
+        self.log = logger
+        self.session = requests.Session()
+        self.session.auth = auth
+        self.cond = threading.Condition()
+        self.queue = []
+        self.failures = {}
+        self.busy = False
+        self.must_stop = False
+        os.makedirs(outbox, exist_ok=True)
+        # notifications left by an earlier run
+        self.queue.extend(sorted(f for f in os.listdir(outbox)
+                                 if f.endswith('.json')))
+        self.thread = threading.Thread(target=self._loop, daemon=True)
+        self.thread.start()
+
+    def submit(self, params):
+        """
+        Queue a notification and return at once
+
+        Args:
+            params (dict): query parameters of the request
+
+        Returns:
+            str: name of the notification file in the outbox
+
+        """
+        name = "%.6f_%s.json" % (time.time(), uuid.uuid4().hex[:8])
+        tmp_path = os.path.join(self.outbox, name + '.tmp')
+        with open(tmp_path, 'w') as out:
+            json.dump(params, out)
+        os.replace(tmp_path, os.path.join(self.outbox, name))
+        with self.cond:
+            self.queue.append(name)
+            self.cond.notify()
+        return name
+
+    def pending(self):
+        """Names of the notifications not delivered yet"""
+        with self.cond:
+            return list(self.queue)
+
+    def wait(self, timeout=None):
+        """Wait until the queue is empty, returns False on timeout"""
+        end = None if timeout is None else time.monotonic() + timeout
+        with self.cond:
+            while self.queue or self.busy:
+                left = None if end is None else end - time.monotonic()
+                if left is not None and left <= 0:
+                    return False
+                self.cond.wait(left)
+        return True
+
+    def close(self):
+        """Stop the worker, undelivered notifications stay in the outbox"""
+        with self.cond:
+            self.must_stop = True
+            self.cond.notify_all()
+        self.thread.join()
+        self.session.close()
+
+    def send(self, params):
+        """
+        One request to the endpoint
+
+        Returns:
+            requests.Response or None: the response, or None if the request
+            failed or the endpoint returned a server error
+
+        """
+        try:
+            res = self.session.get(self.url, params=params,
+                                   timeout=self.timeout)
+        except requests.exceptions.RequestException as e:
+            if self.log:
+                self.log.error(f"Error caught while posting to {self.url}:")
+                self.log.error(e)
+            return None
+        if self.log:
+            self.log.info(f"Sending {res.request.url}")
+            self.log.info(f"Post returned status code {res.status_code}")
+        if res.status_code >= 500:
+            return None
+        return res
+
+    def _deliver(self, name):
+        """Send one notification, True when it left the outbox"""
+        path = os.path.join(self.outbox, name)
+        try:
+            with open(path) as notification:
+                params = json.load(notification)
+        except (OSError, ValueError) as e:
+            if self.log:
+                self.log.error(f"Dropping unreadable notification {name}: {e}")
+            return True
+        if self.send(params) is None:
+            return False
+        os.remove(path)
+        return True
+
+    def _loop(self):
+        retry_at = {}
+        while True:
+            with self.cond:
+                while not self.must_stop:
+                    now = time.monotonic()
+                    ready = [n for n in self.queue
+                             if retry_at.get(n, 0.) <= now]
+                    if ready:
+                        break
+                    waits = [retry_at[n] - now for n in self.queue]
+                    self.cond.wait(min(waits) if waits else None)
+                if self.must_stop:
+                    return
+                self.busy = True
+            # all the notifications that are ready go out in one pass
+            done = []
+            for name in ready:
+                if self._deliver(name):
+                    done.append(name)
+                    retry_at.pop(name, None)
+                    self.failures.pop(name, None)
+                    continue
+                fails = self.failures.get(name, 0) + 1
+                self.failures[name] = fails
+                delay = backoff_delay(fails, self.retry_time,
+                                      self.max_backoff)
+                if self.log:
+                    if fails == self.attempts:
+                        self.log.error(
+                            f"Post attempted {fails} times and got no "
+                            f"response. {name} stays in {self.outbox}, "
+                            f"still retrying")
+                    else:
+                        self.log.warning(f"Waiting {delay:.1f} seconds to "
+                                         f"attempt again... ({fails})")
+                retry_at[name] = time.monotonic() + delay
+            with self.cond:
+                for name in done:
+                    self.queue.remove(name)
+                self.busy = False
+                self.cond.notify_all()
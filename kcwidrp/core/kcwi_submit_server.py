@@ -0,0 +1,429 @@
+"""
+HTTP/JSON submission front end for the KCWI pipeline
+
+A small asyncio server (standard library only) that runs next to the
+framework in continuous mode.  Clients submit batches of files and get a
+job ID back, then query the status of each file of the job, with the time
+spent in every pipeline stage, or stream completion events as they happen.
+
+Endpoints:
+
+    POST /jobs              {"files": [...]} -> {"job": id, "files": [...]}
+    GET  /jobs              summary of all jobs
+    GET  /jobs/<id>         status and stage timings of the files of a job
+    GET  /events[?job=id]   completion events, one JSON object per line
+
+The client side helpers (submit_files, job_status, stream_events) are used
+by the reduce_server script.
+
+"""
+import asyncio
+import json
+import os
+import threading
+import time
+import uuid
+from urllib.parse import urlsplit, parse_qs
+
+import requests
+from keckdrpframework.models.arguments import Arguments
+
+# default port of the submission server
+DEFAULT_SUBMIT_PORT = 50102
+
+# file states that end the processing of a file, a deferred file starts
+# again when its calibrations are reduced
+FINAL_STATES = ('done', 'failed', 'deferred')
+
+
+class JobTracker:
+    """
+    Status of submitted files, updated from the framework action loop
+
+    Args:
+        submit (callable): called with the full path of each submitted file
+            to queue it, e.g. a next_file event
+
+    """
+
+    def __init__(self, submit):
+        self.submit = submit
+        self.lock = threading.Lock()
+        self.jobs = {}
+        self.file_jobs = {}
+        # file -> events queued for it and not executed yet
+        self.pending = {}
+        self.subscribers = []
+
+    def add_job(self, files):
+        """Queue a batch of files, returns the job ID"""
+        job_id = uuid.uuid4().hex[:12]
+        paths = [os.path.abspath(f) for f in files]
+        now = time.time()
+        with self.lock:
+            self.jobs[job_id] = {
+                'job': job_id, 'submitted': now,
+                'files': {p: {'status': 'queued', 'stages': []}
+                          for p in paths}}
+            for path in paths:
+                self.file_jobs[path] = job_id
+        for path in paths:
+            self.submit(path)
+        return job_id
+
+    def job(self, job_id):
+        """Copy of a job, with its overall status, or None"""
+        with self.lock:
+            job = self.jobs.get(job_id)
+            if job is None:
+                return None
+            out = json.loads(json.dumps(job))
+        states = [f['status'] for f in out['files'].values()]
+        out['status'] = 'complete' if all(s in FINAL_STATES for s in states) \
+            else 'running'
+        return out
+
+    def summary(self):
+        """Number of files in each state for every job"""
+        out = []
+        with self.lock:
+            job_ids = list(self.jobs)
+        for job_id in job_ids:
+            job = self.job(job_id)
+            counts = {}
+            for f in job['files'].values():
+                counts[f['status']] = counts.get(f['status'], 0) + 1
+            out.append({'job': job_id, 'status': job['status'],
+                        'submitted': job['submitted'], 'files': counts})
+        return out
+
+    def queued(self, name):
+        """Count an event queued for a file"""
+        path = os.path.abspath(name)
+        with self.lock:
+            if path in self.file_jobs:
+                self.pending[path] = self.pending.get(path, 0) + 1
+
+    def started(self, name):
+        """Count the start of an action on a file, the end of its event"""
+        path = os.path.abspath(name)
+        with self.lock:
+            if self.pending.get(path, 0) > 0:
+                self.pending[path] -= 1
+
+    def events_left(self, name):
+        """Number of events queued for a file"""
+        with self.lock:
+            return self.pending.get(os.path.abspath(name), 0)
+
+    def stage(self, name, stage, start, end, status):
+        """
+        Record one pipeline stage of a file
+
+        Args:
+            name (str): file the action worked on
+            stage (str): action name
+            start (float): start time
+            end (float): end time
+            status (str): file state after the action, see FINAL_STATES
+
+        """
+        path = os.path.abspath(name)
+        with self.lock:
+            job_id = self.file_jobs.get(path)
+            if job_id is None:
+                return
+            entry = self.jobs[job_id]['files'][path]
+            entry['stages'].append({'stage': stage, 'start': start,
+                                    'seconds': end - start})
+            entry['status'] = status
+            seconds = sum(s['seconds'] for s in entry['stages'])
+        if status in FINAL_STATES:
+            self.publish({'job': job_id, 'file': path, 'status': status,
+                          'seconds': seconds})
+            job = self.job(job_id)
+            if job['status'] == 'complete':
+                self.publish({'job': job_id, 'status': 'complete'})
+
+    def subscribe(self, loop, queue, job_id=None):
+        with self.lock:
+            self.subscribers.append((loop, queue, job_id))
+
+    def unsubscribe(self, queue):
+        with self.lock:
+            self.subscribers = [s for s in self.subscribers
+                                if s[1] is not queue]
+
+    def publish(self, event):
+        with self.lock:
+            subscribers = list(self.subscribers)
+        for loop, queue, job_id in subscribers:
+            if job_id is None or job_id == event['job']:
+                loop.call_soon_threadsafe(queue.put_nowait, event)
+
+
+def track_framework(framework, tracker):
+    """
+    Report the actions the framework executes to a JobTracker
+
+    Wraps framework.execute and the put method of the framework event
+    queues, to count the events queued for each file, whether they are the
+    next event of an action or pushed by the action itself (like the
+    action_planner).  A file is done when no event is left for it after an
+    action ran without error, and its event is not recurrent.  It is
+    deferred when the ingestion parked it in the deferred frames, and failed
+    when the action stopped the pipeline.
+
+    """
+    execute = framework.execute
+
+    def counted(put):
+        def counted_put(event, *args, **kwargs):
+            name = getattr(getattr(event, 'args', None), 'name', None)
+            if isinstance(name, str):
+                tracker.queued(name)
+            return put(event, *args, **kwargs)
+        return counted_put
+
+    for queue_name in ('event_queue', 'event_queue_hi'):
+        event_queue = getattr(framework, queue_name, None)
+        if event_queue is not None:
+            event_queue.put = counted(event_queue.put)
+
+    def tracked_execute(action, context):
+        name = getattr(action.args, 'name', None)
+        if isinstance(name, str):
+            tracker.started(name)
+        start = time.time()
+        execute(action, context)
+        if not isinstance(name, str):
+            return
+        deferred = getattr(context, 'deferred_frames', None)
+        # a recurrent event is queued again once the action returns
+        recurrent = getattr(getattr(action, 'event', None), '_recurrent',
+                            False)
+        if context.state == 'stop':
+            status = 'failed'
+        elif deferred is not None and name in deferred.waiting:
+            status = 'deferred'
+        elif tracker.events_left(name) == 0 and not recurrent:
+            status = 'done'
+        else:
+            status = 'running'
+        tracker.stage(name, action.name, start, time.time(), status)
+
+    framework.execute = tracked_execute
+
+
+class SubmitServer:
+    """
+    Asyncio HTTP server of a JobTracker, run in its own thread
+
+    Args:
+        tracker (JobTracker): jobs to serve
+        host (str): address to listen on
+        port (int): port, 0 for any free port
+        logger (logging.Logger): optional logger
+
+    """
+
+    def __init__(self, tracker, host='127.0.0.1', port=DEFAULT_SUBMIT_PORT,
+                 logger=None):
+        self.tracker = tracker
+        self.host = host
+        self.port = port
+        self.log = logger
+        self.loop = None
+        self.server = None
+        self.thread = None
+        self.started = threading.Event()
+
+    @property
+    def url(self):
+        return 'http://%s:%d' % (self.host, self.port)
+
+    def start(self):
+        """Start serving in a daemon thread, returns when listening"""
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+        self.started.wait()
+        if self.log:
+            self.log.info("Submission server listening on %s" % self.url)
+
+    def stop(self):
+        if self.loop is not None:
+            self.loop.call_soon_threadsafe(self.loop.stop)
+            self.thread.join()
+
+    def _run(self):
+        self.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self.loop)
+        self.server = self.loop.run_until_complete(
+            asyncio.start_server(self.handle, self.host, self.port))
+        self.port = self.server.sockets[0].getsockname()[1]
+        self.started.set()
+        try:
+            self.loop.run_forever()
+        finally:
+            self.server.close()
+            # end the open event streams
+            tasks = asyncio.all_tasks(self.loop)
+            for task in tasks:
+                task.cancel()
+            self.loop.run_until_complete(
+                asyncio.gather(*tasks, return_exceptions=True))
+            self.loop.close()
+
+    async def handle(self, reader, writer):
+        try:
+            request = (await reader.readline()).decode('latin-1').split()
+            headers = {}
+            while True:
+                line = await reader.readline()
+                if line in (b'\r\n', b'\n', b''):
+                    break
+                key, _, value = line.decode('latin-1').partition(':')
+                headers[key.strip().lower()] = value.strip()
+            body = await reader.readexactly(
+                int(headers.get('content-length', 0)))
+            if len(request) < 2:
+                await self.respond(writer, 400, {'error': 'bad request'})
+                return
+            method, target = request[:2]
+            url = urlsplit(target)
+            query = parse_qs(url.query)
+            path = url.path.rstrip('/')
+            if method == 'POST' and path == '/jobs':
+                await self.post_job(writer, body)
+            elif method == 'GET' and path == '/jobs':
+                await self.respond(writer, 200, self.tracker.summary())
+            elif method == 'GET' and path.startswith('/jobs/'):
+                job = self.tracker.job(path[len('/jobs/'):])
+                if job is None:
+                    await self.respond(writer, 404, {'error': 'no such job'})
+                else:
+                    await self.respond(writer, 200, job)
+            elif method == 'GET' and path == '/events':
+                await self.stream(writer, query.get('job', [None])[0])
+            else:
+                await self.respond(writer, 404, {'error': 'not found'})
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    async def post_job(self, writer, body):
+        try:
+            files = json.loads(body)['files']
+            if isinstance(files, str) or not all(isinstance(f, str)
+                                                 for f in files):
+                raise TypeError
+        except (ValueError, KeyError, TypeError):
+            await self.respond(writer, 400,
+                               {'error': 'expected {"files": [...]}'})
+            return
+        job_id = self.tracker.add_job(files)
+        if self.log:
+            self.log.info("Job %s: %d files submitted" % (job_id, len(files)))
+        await self.respond(writer, 202, {'job': job_id, 'files': [
+            os.path.abspath(f) for f in files]})
+
+    async def respond(self, writer, code, obj):
+        body = json.dumps(obj).encode()
+        reason = {200: 'OK', 202: 'Accepted', 400: 'Bad Request',
+                  404: 'Not Found'}[code]
+        writer.write(b'HTTP/1.1 %d %s\r\nContent-Type: application/json\r\n'
+                     b'Content-Length: %d\r\nConnection: close\r\n\r\n' %
+                     (code, reason.encode(), len(body)) + body)
+        await writer.drain()
+
+    async def send_event(self, writer, event):
+        writer.write(json.dumps(event).encode() + b'\n')
+        await writer.drain()
+
+    async def stream(self, writer, job_id):
+        """Send completion events until the job is complete"""
+        if job_id is not None and self.tracker.job(job_id) is None:
+            await self.respond(writer, 404, {'error': 'no such job'})
+            return
+        queue = asyncio.Queue()
+        self.tracker.subscribe(self.loop, queue, job_id)
+        try:
+            writer.write(b'HTTP/1.1 200 OK\r\n'
+                         b'Content-Type: application/x-ndjson\r\n'
+                         b'Connection: close\r\n\r\n')
+            await writer.drain()
+            # files of the job that finished before the subscription
+            sent = {}
+            if job_id is not None:
+                job = self.tracker.job(job_id)
+                for path, entry in job['files'].items():
+                    if entry['status'] in FINAL_STATES:
+                        sent[path] = entry['status']
+                        await self.send_event(writer, {
+                            'job': job_id, 'file': path,
+                            'status': entry['status'],
+                            'seconds': sum(s['seconds']
+                                           for s in entry['stages'])})
+                if job['status'] == 'complete':
+                    await self.send_event(writer, {'job': job_id,
+                                                   'status': 'complete'})
+                    return
+            while True:
+                event = await queue.get()
+                if 'file' in event:
+                    if sent.pop(event['file'], None) == event['status']:
+                        continue
+                await self.send_event(writer, event)
+                if job_id is not None and 'file' not in event:
+                    return
+        finally:
+            self.tracker.unsubscribe(queue)
+
+
+def start_submit_server(framework, port=DEFAULT_SUBMIT_PORT, host='127.0.0.1'):
+    """
+    Serve job submissions for a framework running in continuous mode
+
+    Submitted files are queued as next_file events, and the actions the
+    framework runs are tracked per file.
+
+    Returns:
+        SubmitServer: the started server
+
+    """
+    def submit(path):
+        framework.append_event('next_file', Arguments(name=path),
+                               recurrent=True)
+
+    tracker = JobTracker(submit)
+    track_framework(framework, tracker)
+    server = SubmitServer(tracker, host=host, port=port,
+                          logger=framework.logger)
+    server.start()
+    return server
+
+
+def submit_files(url, files, timeout=30.):
+    """Submit a batch of files to a submission server, returns the job ID"""
+    res = requests.post(url + '/jobs', json={'files': list(files)},
+                        timeout=timeout)
+    res.raise_for_status()
+    return res.json()['job']
+
+
+def job_status(url, job_id, timeout=30.):
+    """Status of a job, see JobTracker.job"""
+    res = requests.get(url + '/jobs/' + job_id, timeout=timeout)
+    res.raise_for_status()
+    return res.json()
+
+
+def stream_events(url, job_id=None):
+    """Yield the completion events of a job (or of all jobs) as dicts"""
+    params = {} if job_id is None else {'job': job_id}
+    with requests.get(url + '/events', params=params, stream=True) as res:
+        res.raise_for_status()
+        for line in res.iter_lines():
+            if line:
+                yield json.loads(line)
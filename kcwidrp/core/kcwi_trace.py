@@ -0,0 +1,112 @@
+import numpy as np
+
+
+def median_row_bands(data, rows, win):
+    """Median-collapse the row band centered on each of the input rows
+
+    Each band spans ``(row - win):(row + win + 1)`` and is collapsed along y
+    with a median, just like the per-bar windows used while tracing.
+
+    Args:
+        data (2D array): image to collapse
+        rows (1D int array): central row of each band
+        win (int): half-width of each band in rows
+
+    Returns:
+        2D array with shape (len(rows), data.shape[1])
+
+    """
+    rows = np.asarray(rows, dtype=int)
+    if rows.size == 0:
+        return np.empty((0, data.shape[1]), dtype=data.dtype)
+    offsets = np.arange(-win, win + 1)
+    return np.median(data[rows[:, None] + offsets[None, :], :], axis=1)
+
+
+def centroid_bars(band, barxi, win, thresh):
+    """Centroid all bars on one median-collapsed row band
+
+    Args:
+        band (1D array): median-collapsed row band
+        barxi (1D int array): nearest pixel to each bar
+        win (int): half-width of the centroid window in pixels
+        thresh (float): peak threshold above the window minimum
+
+    Returns:
+        (xc, good): centroids and a boolean array flagging bars that are
+        still above threshold (xc is undefined where good is False)
+
+    """
+    offsets = np.arange(-win, win + 1)
+    xs = barxi[:, None] + offsets[None, :]
+    inside = (xs[:, 0] >= 0) & (xs[:, -1] < band.shape[0])
+    ys = band[np.clip(xs, 0, band.shape[0] - 1)]
+    # fmin/fmax ignore NaNs without warning on all-NaN windows
+    ys = ys - np.fmin.reduce(ys, axis=1)[:, None]
+    ysum = np.nansum(ys, axis=1)
+    good = inside & (np.fmax.reduce(ys, axis=1) > thresh) & (ysum > 0)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        xc = np.nansum(xs * ys, axis=1) / ysum
+    return xc, good
+
+
+def trace_bars(data, middle_centers, middle_row, samp, win, thresh):
+    """Trace continuum bars from the middle row to the top and bottom
+
+    All sample row bands are median-collapsed once, then every bar is
+    centroided on each band with one array operation and its position is
+    propagated to the next band.  A bar stops tracing (in a given direction)
+    at the first band where it falls below threshold.
+
+    Args:
+        data (2D array): continuum bars image
+        middle_centers (list of floats): bar centroids on the middle row
+        middle_row (int): row where middle_centers were measured
+        samp (int): step between sample rows
+        win (int): half-width of the sample bands and centroid windows
+        thresh (float): peak threshold for a valid centroid
+
+    Returns:
+        (xi, xo, yi, barid, slid): lists of traced x positions, middle row
+        x positions, sample rows, bar ids and slice ids ordered by bar, then
+        middle row, points traced up and points traced down
+
+    """
+    ny = data.shape[0]
+    barx = np.asarray(middle_centers, dtype=float)
+    nbars = len(barx)
+    rows_up = np.arange(middle_row + samp, ny - win, samp)
+    rows_dn = np.arange(middle_row - samp, win - 1, -samp)
+    bands = median_row_bands(data, np.concatenate((rows_up, rows_dn)), win)
+    bands_up = bands[:len(rows_up)]
+    bands_dn = bands[len(rows_up):]
+
+    def propagate(direction_bands):
+        xc_out = np.full((nbars, len(direction_bands)), np.nan)
+        found = np.zeros((nbars, len(direction_bands)), dtype=bool)
+        barxi = (barx + 0.5).astype(int)
+        active = np.ones(nbars, dtype=bool)
+        for isamp, band in enumerate(direction_bands):
+            if not active.any():
+                break
+            xc, good = centroid_bars(band, barxi, win, thresh)
+            active &= good
+            found[:, isamp] = active
+            xc_out[active, isamp] = xc[active]
+            barxi[active] = xc[active].astype(int)
+        return xc_out, found
+
+    xc_up, found_up = propagate(bands_up)
+    xc_dn, found_dn = propagate(bands_dn)
+    # assemble in (bar, middle/up/down) order
+    xc_all = np.column_stack((barx, xc_up, xc_dn))
+    found_all = np.column_stack((np.ones(nbars, dtype=bool),
+                                 found_up, found_dn))
+    rows_all = np.concatenate(([middle_row], rows_up, rows_dn))
+    ib, ir = np.nonzero(found_all)
+    xi = xc_all[ib, ir].tolist()
+    xo = barx[ib].tolist()
+    yi = rows_all[ir].tolist()
+    barid = ib.tolist()
+    slid = (ib // 5).tolist()
+    return xi, xo, yi, barid, slid
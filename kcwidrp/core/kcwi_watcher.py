@@ -0,0 +1,231 @@
+"""
+Event driven monitoring of a data directory
+
+Replaces the periodic directory scan of the framework data set in continuous
+and RTI modes.  On Linux the directory is watched with inotify, and a file is
+reported when it is closed after writing (or moved into the directory).
+Elsewhere, or if inotify is not available, the directory is polled and a
+file is reported once its size and modification time have not changed for
+a settle time.  Each file is reported once.  Files found in the directory
+when the watch starts that were not already known are treated like polled
+files.
+
+"""
+import ctypes
+import ctypes.util
+import fnmatch
+import os
+import select
+import struct
+import threading
+import time
+
+# default time a polled file must stay unchanged before it is reported
+DEFAULT_SETTLE_TIME = 2.
+
+# inotify event masks, from <sys/inotify.h>
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_EVENT_HEADER = struct.Struct('iIII')
+
+
+def inotify_lib():
+    """The C library if it provides inotify, else None"""
+    if not hasattr(os, 'uname') or os.uname().sysname != 'Linux':
+        return None
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6',
+                           use_errno=True)
+        libc.inotify_init
+        libc.inotify_add_watch
+    except (OSError, AttributeError):
+        return None
+    return libc
+
+
+def parse_inotify_events(buf):
+    """
+    Split a buffer read from an inotify descriptor into events
+
+    Args:
+        buf (bytes): data read from the descriptor
+
+    Returns:
+        list of (int, str): event mask and file name of each event
+
+    """
+    events = []
+    offset = 0
+    while offset + IN_EVENT_HEADER.size <= len(buf):
+        _, mask, _, length = IN_EVENT_HEADER.unpack_from(buf, offset)
+        offset += IN_EVENT_HEADER.size
+        name = buf[offset:offset + length].rstrip(b'\0')
+        offset += length
+        events.append((mask, os.fsdecode(name)))
+    return events
+
+
+class DirectoryWatcher:
+    """
+    Report new, completely written files of a directory
+
+    Args:
+        dirname (str): directory to watch
+        callback (callable): called with the full path of each new file, from
+            the watcher thread
+        pattern (str): file name pattern, as the framework file_type
+        poll_interval (float): seconds between polls, or between checks of
+            the stop flag when using inotify
+        settle_time (float): seconds a polled file must stay unchanged
+        use_inotify (bool): set False to always poll
+        known (iterable of str): names of files not to report, by default
+            the files already in the directory
+        logger (logging.Logger): optional logger
+
+    """
+
+    def __init__(self, dirname, callback, pattern="*.fits", poll_interval=1.,
+                 settle_time=DEFAULT_SETTLE_TIME, use_inotify=True,
+                 known=None, logger=None):
+        self.dirname = dirname
+        self.callback = callback
+        self.pattern = pattern
+        self.poll_interval = poll_interval
+        self.settle_time = settle_time
+        self.log = logger
+        self.libc = inotify_lib() if use_inotify else None
+        self.seen = set(self.list_files() if known is None else known)
+        self.pending = {}
+        self.must_stop = False
+        self.thread = None
+
+    @property
+    def mode(self):
+        return 'inotify' if self.libc is not None else 'polling'
+
+    def list_files(self):
+        try:
+            return [entry.name for entry in os.scandir(self.dirname)
+                    if fnmatch.fnmatch(entry.name, self.pattern)]
+        except OSError:
+            return []
+
+    def report(self, name):
+        """Call back once for a new file"""
+        if name in self.seen or not fnmatch.fnmatch(name, self.pattern):
+            return
+        path = os.path.join(self.dirname, name)
+        if not os.path.isfile(path):
+            return
+        self.seen.add(name)
+        self.pending.pop(name, None)
+        if self.log:
+            self.log.info("New file %s" % path)
+        self.callback(path)
+
+    def poll(self, now=None):
+        """
+        Check the directory once, report the files that have settled
+
+        A new file is first remembered with its size and modification time,
+        and reported at a later poll once these have not changed for
+        settle_time seconds.
+
+        """
+        now = time.monotonic() if now is None else now
+        for name in self.list_files():
+            if name in self.seen:
+                continue
+            try:
+                st = os.stat(os.path.join(self.dirname, name))
+            except OSError:
+                continue
+            key = (st.st_size, st.st_mtime)
+            last = self.pending.get(name)
+            if last is None or last[0] != key:
+                self.pending[name] = (key, now)
+            elif now - last[1] >= self.settle_time:
+                self.report(name)
+
+    def _poll_loop(self):
+        while not self.must_stop:
+            self.poll()
+            time.sleep(self.poll_interval)
+
+    def _inotify_loop(self, fd):
+        try:
+            # unknown files already there are reported once they settle
+            self.poll()
+            while not self.must_stop:
+                ready, _, _ = select.select([fd], [], [], self.poll_interval)
+                if not ready:
+                    if self.pending:
+                        self.poll()
+                    continue
+                for mask, name in parse_inotify_events(os.read(fd, 65536)):
+                    if mask & (IN_CLOSE_WRITE | IN_MOVED_TO):
+                        self.report(name)
+        finally:
+            os.close(fd)
+
+    def start(self):
+        """Start watching in a daemon thread"""
+        target = self._poll_loop
+        args = ()
+        if self.libc is not None:
+            fd = self.libc.inotify_init()
+            wd = -1
+            if fd >= 0:
+                wd = self.libc.inotify_add_watch(
+                    fd, os.fsencode(self.dirname),
+                    IN_CLOSE_WRITE | IN_MOVED_TO)
+            if wd >= 0:
+                target = self._inotify_loop
+                args = (fd,)
+            else:
+                if fd >= 0:
+                    os.close(fd)
+                self.libc = None
+        if self.log:
+            self.log.info("Watching %s for %s files (%s)" %
+                          (self.dirname, self.pattern, self.mode))
+        self.thread = threading.Thread(target=target, args=args, daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        """Stop the watcher thread"""
+        self.must_stop = True
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
+
+
+def watch_data_set(framework, dirname):
+    """
+    Feed the new files of a directory to the framework data set
+
+    Used instead of the data set monitor thread (ingest_data with
+    monitor=True): each completely written file is appended to the data set,
+    which queues the default ingestion event for it.
+
+    Args:
+        framework (Framework): framework whose data set was ingested from
+            dirname
+        dirname (str): directory to watch
+
+    Returns:
+        DirectoryWatcher: the started watcher
+
+    """
+    settle_time = getattr(framework.config, 'monitor_settle_time', None)
+    known = [os.path.basename(name)
+             for name in framework.context.data_set.data_table.index]
+    watcher = DirectoryWatcher(
+        dirname, framework.context.data_set.append_item,
+        pattern=framework.config.file_type,
+        poll_interval=framework.config.monitor_interval,
+        settle_time=settle_time if settle_time is not None else
+        DEFAULT_SETTLE_TIME,
+        known=known, logger=framework.logger)
+    watcher.start()
+    return watcher
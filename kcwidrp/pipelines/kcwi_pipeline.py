@@ -11,8 +11,17 @@ queue in the KeckDRPFramework gets started.
 """
 
 from keckdrpframework.pipelines.base_pipeline import BasePipeline
-from keckdrpframework.models.processing_context import ProcessingContext
-from kcwidrp.primitives.kcwi_file_primitives import *
+from kcwidrp.core.kcwi_lazy_actions import lazy_actions
+from typing import TYPE_CHECKING
+if TYPE_CHECKING:
+    from keckdrpframework.models.processing_context import \
+        ProcessingContext
+
+# actions of the event_table that are not in a primitive module of their
+# own, imported when the framework first looks them up
+__getattr__ = lazy_actions(globals(), {
+    "ingest_file": "kcwidrp.primitives.kcwi_file_primitives",
+})
 
 
 class Kcwi_pipeline(BasePipeline):
@@ -322,7 +331,7 @@ class Kcwi_pipeline(BasePipeline):
 
     # event_table = kcwi_event_table
 
-    def __init__(self, context: ProcessingContext):
+    def __init__(self, context: 'ProcessingContext'):
         """
         Constructor
         """
@@ -5,11 +5,19 @@ KCWI
 """
 
 from keckdrpframework.pipelines.base_pipeline import BasePipeline
-from keckdrpframework.models.processing_context import ProcessingContext
-from kcwidrp.primitives.kcwi_file_primitives import *
-from kcwidrp.core.kcwi_proctab import Proctab
-
 from datetime import datetime
+from kcwidrp.core.kcwi_lazy_actions import lazy_actions
+from typing import TYPE_CHECKING
+if TYPE_CHECKING:
+    from keckdrpframework.models.processing_context import \
+        ProcessingContext
+
+# actions of the event_table that are not in a primitive module of their
+# own, imported when the framework first looks them up
+__getattr__ = lazy_actions(globals(), {
+    "ingest_file": "kcwidrp.primitives.kcwi_file_primitives",
+})
+
 
 class Keck_RTI_Pipeline(BasePipeline):
     """
@@ -240,6 +248,28 @@ class Keck_RTI_Pipeline(BasePipeline):
         "alert_rti":                 ("SendHTTP",
                                       "http_started",
                                       None),
+        # QUICK-LOOK OBJECT PROCESSING
+        "quicklook_object":          ("ProcessObject",
+                                      "quicklook_processing_started",
+                                      "quicklook_subtract_overscan"),
+        "quicklook_subtract_overscan": ("SubtractOverscan",
+                                        "subtract_overscan_started",
+                                        "quicklook_trim_overscan"),
+        "quicklook_trim_overscan":   ("TrimOverscan",
+                                      "trim_overscan_started",
+                                      "quicklook_correct_gain"),
+        "quicklook_correct_gain":    ("CorrectGain",
+                                      "gain_correction_started",
+                                      "quicklook_rectify_image"),
+        "quicklook_rectify_image":   ("RectifyImage",
+                                      "rectification_started",
+                                      "quicklook_make_cube"),
+        "quicklook_make_cube":       ("MakeQuickLookCube",
+                                      "making_quicklook_cube_started",
+                                      "quicklook_alert_rti"),
+        "quicklook_alert_rti":       ("SendHTTP",
+                                      "http_started",
+                                      None),
         # NOD AND SHUFFLE OBJECT PROCESSING
         "process_nandshuff":         ("ProcessObject",
                                       "nandshuff_processing_started",
@@ -288,7 +318,7 @@ class Keck_RTI_Pipeline(BasePipeline):
 
     # event_table = kcwi_event_table
 
-    def __init__(self, context: ProcessingContext):
+    def __init__(self, context: 'ProcessingContext'):
         """
         Constructor
         """
@@ -378,7 +408,16 @@ class Keck_RTI_Pipeline(BasePipeline):
             else:
                 object_args = action.args
                 object_args.new_type = "SKY"
-                context.push_event("process_object", object_args)
+                if context.config.instrument.quicklook:
+                    # preview cube first, the full reduction waits in the
+                    # low priority queue
+                    from kcwidrp.primitives.MakeQuickLookCube import \
+                        quicklook_args
+                    context.push_event("quicklook_object",
+                                       quicklook_args(object_args))
+                    context.append_event("process_object", object_args)
+                else:
+                    context.push_event("process_object", object_args)
         return True
 
 if __name__ == "__main__":
@@ -7,8 +7,64 @@ from kcwidrp.primitives.kcwi_file_primitives import plotlabel
 import time
 
 import numpy as np
-from bokeh.plotting import figure
 from scipy import signal
+from scipy.fft import rfft, irfft, next_fast_len
+
+
+def batch_xcorr_offsets(reference, arcs, edge=10, central=0.5):
+    """
+    Cross-correlate a stack of spectra against a reference with one FFT
+
+    Reproduces ``np.correlate(reference, arc, mode='full')`` for every arc
+    (excluding ``edge`` pixels at each end), restricts the peak search to the
+    central fraction of lags and refines each peak with a parabola through
+    the peak and its two neighbours.
+
+    Args:
+        reference (1D array): reference spectrum
+        arcs (2D array): spectra to align, one per row, same length as the
+            reference
+        edge (int): number of pixels to ignore at each end
+        central (float): fraction of the lags to search for the peak
+
+    Returns:
+        (offsets, int_offsets, quality): sub-pixel offsets, integer offsets
+        of the correlation maximum, and the peak of the normalized
+        cross-correlation (1 for a perfect match) for each arc.  Rolling an
+        arc by its offset aligns it with the reference.
+
+    """
+    ref = np.asarray(reference, dtype=float)[edge:-edge]
+    arcs = np.asarray(arcs, dtype=float)[:, edge:-edge]
+    nsamp = len(ref)
+    nfft = next_fast_len(2 * nsamp - 1)
+    # circular correlation of zero-padded spectra holds all linear lags
+    circ = irfft(rfft(ref, nfft)[None, :] * np.conj(rfft(arcs, nfft, axis=1)),
+                 nfft, axis=1)
+    xcorr = np.concatenate((circ[:, nfft - nsamp + 1:], circ[:, :nsamp]),
+                           axis=1)
+    lags = np.arange(1 - nsamp, nsamp)
+    # restrict to central lags
+    ncross = len(lags)
+    cr0 = int(ncross * (0.5 - central / 2.))
+    cr1 = int(ncross * (0.5 + central / 2.))
+    ipk = cr0 + np.argmax(xcorr[:, cr0:cr1], axis=1)
+    rows = np.arange(len(arcs))
+    # parabolic sub-pixel refinement
+    ylo = xcorr[rows, np.maximum(ipk - 1, 0)]
+    ypk = xcorr[rows, ipk]
+    yhi = xcorr[rows, np.minimum(ipk + 1, ncross - 1)]
+    curv = ylo - 2. * ypk + yhi
+    with np.errstate(divide='ignore', invalid='ignore'):
+        frac = np.where(curv < 0., 0.5 * (ylo - yhi) / curv, 0.)
+    frac = np.clip(frac, -0.5, 0.5)
+    int_offsets = lags[ipk]
+    offsets = int_offsets + frac
+    # normalized peak height
+    norm = np.sqrt(np.sum(ref ** 2) * np.sum(arcs ** 2, axis=1))
+    with np.errstate(divide='ignore', invalid='ignore'):
+        quality = np.where(norm > 0., ypk / norm, 0.)
+    return offsets, int_offsets, quality
 
 
 class ArcOffsets(BasePrimitive):
@@ -22,6 +78,11 @@ class ArcOffsets(BasePrimitive):
     are cross-correlated.  If a bright line near the edge is throwing off the
     cross-correlations, you can increase this parameter to lessen its impact.
 
+    All bars are cross-correlated against the reference bar in a single FFT,
+    and each correlation peak is refined to sub-pixel precision.  The offsets
+    are stored in context.bar_offsets and the normalized correlation peak
+    height of each bar in context.bar_offset_quality.
+
     See kcwidrp/configs/kcwi.cfg
 
     Arcs must be available as context.arcs.
@@ -47,37 +108,29 @@ class ArcOffsets(BasePrimitive):
         if arcs is not None:
             # Do we plot?
             do_plot = (self.config.instrument.plot_level >= 2)
+            if do_plot:
+                from bokeh.plotting import figure
             plab = plotlabel(self.action.args)
+            # Taper all arcs
+            tkwgt = signal.windows.tukey(len(arcs[0]), alpha=tkalpha)
+            arcs = np.asarray(arcs) * tkwgt[None, :]
+            self.context.arcs = list(arcs)
             # Compare with reference arc
-            reference_arc = arcs[self.config.instrument.REFBAR][:]
-            tkwgt = signal.windows.tukey(len(reference_arc), alpha=tkalpha)
-            reference_arc *= tkwgt
-            # number of cross-correlation samples (avoiding ends)
-            number_of_samples = len(reference_arc[10:-10])
-            # possible offsets
-            offsets_array = np.arange(1-number_of_samples, number_of_samples)
-            # Collect offsets
-            offsets = []
+            reference_arc = arcs[self.config.instrument.REFBAR]
+            # Cross-correlate all arcs at once, avoiding junk on the ends
+            offsets, int_offsets, quality = batch_xcorr_offsets(
+                reference_arc, arcs, edge=10)
             next_bar_to_plot = 0
             for arc_number, arc in enumerate(arcs):
-                arc *= tkwgt
-                # Cross-correlate, avoiding junk on the ends
-                cross_correlation = np.correlate(reference_arc[10:-10],
-                                                 arc[10:-10], mode='full')
-                # Calculate offset
-                ncross = len(cross_correlation)
-                cr0 = int(ncross * 0.25)
-                cr1 = int(ncross * 0.75)
-                central_cross = cross_correlation[cr0:cr1]
-                central_offs = offsets_array[cr0:cr1]
-                offset = central_offs[central_cross.argmax()]
-                offsets.append(offset)
-                self.logger.info("Arc %d Slice %d XCorr shift = %d" %
-                                 (arc_number, int(arc_number/5), offset))
+                offset = offsets[arc_number]
+                self.logger.info("Arc %d Slice %d XCorr shift = %.2f "
+                                 "(peak %.3f)" %
+                                 (arc_number, int(arc_number/5), offset,
+                                  quality[arc_number]))
                 # display if requested
                 if do_plot and arc_number == next_bar_to_plot:
                     p = figure(title=plab +
-                               "BAR OFFSET for Arc: %d Slice: %d = %d" %
+                               "BAR OFFSET for Arc: %d Slice: %d = %.2f" %
                                (arc_number, int(arc_number/5), offset),
                                x_axis_label="CCD y (px)", y_axis_label="e-",
                                plot_width=self.config.instrument.plot_width,
@@ -86,8 +139,8 @@ class ArcOffsets(BasePrimitive):
                     p.line(x, reference_arc, color='green',
                            legend_label='ref bar (%d)' %
                            self.config.instrument.REFBAR)
-                    p.line(x, np.roll(arc, offset), color='red',
-                           legend_label='bar %d' % arc_number)
+                    p.line(x, np.roll(arc, int_offsets[arc_number]),
+                           color='red', legend_label='bar %d' % arc_number)
                     bokeh_plot(p, self.context.bokeh_session)
                     q = input("Next? <int> or <cr>, q to quit: ")
                     if 'Q' in q.upper():
@@ -97,6 +150,10 @@ class ArcOffsets(BasePrimitive):
                             next_bar_to_plot = int(q)
                         except ValueError:
                             next_bar_to_plot = arc_number + 1
+            poor = np.nonzero(quality < 0.5)[0]
+            if len(poor) > 0:
+                self.logger.warning("Poor cross-correlation peak for bars: "
+                                    "%s" % ", ".join(str(b) for b in poor))
             # plot output name stub
             pfname = "arc_%05d_%s_%s_%s_ta%03d" % (
                 self.action.args.ccddata.header['FRAMENO'],
@@ -105,6 +162,7 @@ class ArcOffsets(BasePrimitive):
                 int(100 * self.config.instrument.TUKEYALPHA))
             # plot offsets
             if self.config.instrument.plot_level >= 1:
+                from bokeh.plotting import figure
                 p = figure(title=plab + "BAR OFFSETS ",
                            x_axis_label="Bar #",
                            y_axis_label="Wave offset (px)",
@@ -123,7 +181,8 @@ class ArcOffsets(BasePrimitive):
                     time.sleep(self.config.instrument.plot_pause)
                 # save offset plot
                 save_plot(p, filename=pfname + '_baroffs.png')
-            self.context.bar_offsets = offsets
+            self.context.bar_offsets = list(offsets)
+            self.context.bar_offset_quality = list(quality)
         else:
             self.logger.error("No extracted arcs found")
 
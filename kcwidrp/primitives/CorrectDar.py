@@ -6,6 +6,7 @@ from kcwidrp.primitives.kcwi_file_primitives import kcwi_fits_writer, \
 import numpy as np
 from scipy.ndimage import shift
 from astropy.nddata import CCDData
+from concurrent.futures import ThreadPoolExecutor
 import math
 import ref_index
 import os
@@ -39,14 +40,74 @@ def atm_disper(w0, w1, airmass, temperature=10.0, pressure_pa=61100.0,
     return 206265.0 * (n0 - n1) * math.tan(z)
 
 
+def dar_shifts(waves, wref, airmass, projection_angle, x_scale, y_scale):
+    """
+
+    Calculate the DAR correction shifts for every wavelength at once
+
+    Args:
+        waves (array): wavelengths of the cube planes (Angstroms)
+        wref (float): reference wavelength (Angstroms)
+        airmass (float): unitless airmass
+        projection_angle (float): IFU PA - parallactic angle (radians)
+        x_scale (float): x (slice) scale in arcsec per pixel
+        y_scale (float): y (slit) scale in arcsec per pixel
+
+    Returns:
+        (y_shift, x_shift): arrays of shifts in pixels for each plane
+
+    """
+    dispersion_correction = atm_disper(wref, np.asarray(waves, dtype=float),
+                                       airmass)
+    x_shift = dispersion_correction * math.sin(projection_angle) / x_scale
+    y_shift = dispersion_correction * math.cos(projection_angle) / y_scale
+    return y_shift, x_shift
+
+
+def shift_cube(cube, y_shift, x_shift, order=3, nthreads=None, chunk=64):
+    """
+
+    Shift each wavelength plane of a cube by its own (y, x) offset
+
+    The planes are split into wavelength chunks that are shifted on a
+    thread pool.  Use order=3 (cubic spline) for data planes and order=0
+    (nearest neighbour) for mask and flag planes, so that bit values are
+    never interpolated.
+
+    Args:
+        cube (3D array): cube to shift, wavelength along axis 0
+        y_shift (array): y shift for each plane in pixels
+        x_shift (array): x shift for each plane in pixels
+        order (int): spline order
+        nthreads (int): number of threads, defaults to the number of CPUs
+        chunk (int): number of planes per task
+
+    Returns:
+        shifted cube with the same shape and dtype as the input
+
+    """
+    output = np.empty_like(cube)
+
+    def shift_chunk(j0):
+        for j in range(j0, min(j0 + chunk, cube.shape[0])):
+            shift(cube[j, :, :], (y_shift[j], x_shift[j]), order=order,
+                  output=output[j, :, :])
+
+    with ThreadPoolExecutor(max_workers=nthreads) as executor:
+        list(executor.map(shift_chunk, range(0, cube.shape[0], chunk)))
+    return output
+
+
 class CorrectDar(BasePrimitive):
     """
     Correct for Differential Atmospheric Refraction
 
     Accounts for rotator orientation, zenith angle, and parallactic angle to
     correct input data cube into a padded, DAR corrected output cube.
-    Calculates the DAR correction for each wavelength slice and adjusts position
-    in cube using scipy.nddata.shift to implement correction.
+    Calculates the DAR correction for all wavelength slices at once and adjusts
+    their positions in the cube using scipy.ndimage.shift over a thread pool.
+    Data planes use cubic spline shifts, while mask and flag planes use
+    nearest neighbour shifts.
 
     Sets flags in padded region of output cube to a value of 128.
 
@@ -238,55 +299,24 @@ class CorrectDar(BasePrimitive):
                 output_del[:, padding_y:(padding_y + image_size[1]),
                            padding_x:(padding_x + image_size[2])] = dew.data
 
+        # Calculate correction for all wavelengths once
+        y_shift, x_shift = dar_shifts(waves, wref, airmass, projection_angle,
+                                      x_scale, y_scale)
         # Perform correction
-        for j, wl in enumerate(waves):
-            dispersion_correction = atm_disper(wref, wl, airmass)
-            x_shift = dispersion_correction * \
-                math.sin(projection_angle) / x_scale
-            y_shift = dispersion_correction * \
-                math.cos(projection_angle) / y_scale
-            output_image[j, :, :] = shift(output_image[j, :, :],
-                                          (y_shift, x_shift))
-            output_stddev[j, :, :] = shift(output_stddev[j, :, :],
-                                           (y_shift, x_shift))
-            output_mask[j, :, :] = shift(output_mask[j, :, :],
-                                         (y_shift, x_shift))
-            output_flags[j, :, :] = shift(output_flags[j, :, :],
-                                          (y_shift, x_shift))
-            if output_noskysub is not None:
-                output_noskysub[j, :, :] = shift(output_noskysub[j, :, :],
-                                                 (y_shift, x_shift))
+        output_image = shift_cube(output_image, y_shift, x_shift)
+        output_stddev = shift_cube(output_stddev, y_shift, x_shift)
+        output_mask = shift_cube(output_mask, y_shift, x_shift, order=0)
+        output_flags = shift_cube(output_flags, y_shift, x_shift, order=0)
+        if output_noskysub is not None:
+            output_noskysub = shift_cube(output_noskysub, y_shift, x_shift)
         # for obj, sky if they exist
         if output_obj is not None:
-            for j, wl in enumerate(waves):
-                dispersion_correction = atm_disper(wref, wl, airmass)
-                x_shift = dispersion_correction * \
-                    math.sin(projection_angle) / x_scale
-                y_shift = dispersion_correction * \
-                    math.cos(projection_angle) / y_scale
-                output_obj[j, :, :] = shift(output_obj[j, :, :],
-                                            (y_shift, x_shift))
-
+            output_obj = shift_cube(output_obj, y_shift, x_shift)
         if output_sky is not None:
-            for j, wl in enumerate(waves):
-                dispersion_correction = atm_disper(wref, wl, airmass)
-                x_shift = dispersion_correction * \
-                    math.sin(projection_angle) / x_scale
-                y_shift = dispersion_correction * \
-                    math.cos(projection_angle) / y_scale
-                output_sky[j, :, :] = shift(output_sky[j, :, :],
-                                            (y_shift, x_shift))
-
+            output_sky = shift_cube(output_sky, y_shift, x_shift)
         # for delta wavelength cube, if it exists
         if output_del is not None:
-            for j, wl in enumerate(waves):
-                dispersion_correction = atm_disper(wref, wl, airmass)
-                x_shift = dispersion_correction * \
-                    math.sin(projection_angle) / x_scale
-                y_shift = dispersion_correction * \
-                    math.cos(projection_angle) / y_scale
-                output_del[j, :, :] = shift(output_del[j, :, :],
-                                            (y_shift, x_shift))
+            output_del = shift_cube(output_del, y_shift, x_shift)
 
         self.action.args.ccddata.data = output_image
         self.action.args.ccddata.uncertainty.array = output_stddev
@@ -319,7 +349,9 @@ class CorrectDar(BasePrimitive):
                                             filename=self.action.args.name)
         self.context.proctab.write_proctab(tfil=self.config.instrument.procfile)
 
-        # check for sky, obj cube
+        # check for sky, obj cube, and keep them for FluxCalibrate
+        out_obj = None
+        out_sky = None
         if output_obj is not None:
             out_obj = CCDData(output_obj,
                               meta=self.action.args.ccddata.header,
@@ -336,6 +368,8 @@ class CorrectDar(BasePrimitive):
                 out_sky, output_file=self.action.args.name,
                 output_dir=self.config.instrument.output_directory,
                 suffix="scubed")
+        self.action.args.ocubed = out_obj
+        self.action.args.scubed = out_sky
 
         # check for delta wave cube
         if output_del is not None:
@@ -5,6 +5,109 @@ import numpy as np
 import pkg_resources
 import os
 import pandas as pd
+from functools import lru_cache
+
+# range of pixels on either side of a defect for calculating good value
+PIXEL_RANGE_FOR_GOOD_VALUE = 2
+
+
+@lru_cache(maxsize=16)
+def compile_defects(full_path, mtime=None):
+    """
+    Compile a defect list into index arrays
+
+    Each defect in the list covers columns X0 - X1 and rows Y0 - Y1 (one
+    biased, inclusive).  Each bad pixel is replaced with the median of the
+    good pixels in the same row within PIXEL_RANGE_FOR_GOOD_VALUE columns on
+    either side of its defect.  Sample pixels that are themselves in a defect
+    are not used.
+
+    The result is cached per defect file, so a night of frames with the same
+    ampmode, binning, and nod-and-shuffle setting only reads it once.
+
+    Args:
+        full_path (str): defect list file
+        mtime (float): modification time of the file, part of the cache key
+
+    Returns:
+        dict: index arrays 'rows' and 'cols' of the bad pixels, 'segment' of
+        the defect row each bad pixel belongs to, and 'sample_rows',
+        'sample_cols', and 'sample_ok' giving the pixels used for the
+        replacement value of each defect row
+
+    """
+    defect_table = pd.read_csv(full_path, sep=r'\s+')
+    rows = []
+    cols = []
+    segment = []
+    sample_rows = []
+    sample_cols = []
+    offsets = np.concatenate((np.arange(-PIXEL_RANGE_FOR_GOOD_VALUE, 0),
+                              np.arange(PIXEL_RANGE_FOR_GOOD_VALUE)))
+    nseg = 0
+    for index, row in defect_table.iterrows():
+        # Get coords and adjust for python zero bias
+        x0 = row['X0'] - 1
+        x1 = row['X1']
+        y0 = row['Y0'] - 1
+        y1 = row['Y1']
+        by = np.arange(y0, y1)
+        bx = np.arange(x0, x1)
+        # one segment per defect row
+        rows.append(np.repeat(by, len(bx)))
+        cols.append(np.tile(bx, len(by)))
+        segment.append(np.repeat(np.arange(nseg, nseg + len(by)), len(bx)))
+        # sample on low and high side of bad area
+        scols = np.where(offsets < 0, x0 + offsets, x1 + offsets)
+        sample_rows.append(np.repeat(by[:, np.newaxis], len(offsets), axis=1))
+        sample_cols.append(np.tile(scols, (len(by), 1)))
+        nseg += len(by)
+    defects = {
+        'rows': np.concatenate(rows) if rows else np.zeros(0, dtype=int),
+        'cols': np.concatenate(cols) if cols else np.zeros(0, dtype=int),
+        'segment': np.concatenate(segment) if segment else
+        np.zeros(0, dtype=int),
+        'sample_rows': np.concatenate(sample_rows) if sample_rows else
+        np.zeros((0, len(offsets)), dtype=int),
+        'sample_cols': np.concatenate(sample_cols) if sample_cols else
+        np.zeros((0, len(offsets)), dtype=int),
+    }
+    # do not sample other bad pixels
+    bad = set(zip(defects['rows'].tolist(), defects['cols'].tolist()))
+    defects['sample_ok'] = np.array(
+        [(r, c) not in bad for r, c in zip(defects['sample_rows'].ravel(),
+                                           defects['sample_cols'].ravel())],
+        dtype=bool).reshape(defects['sample_cols'].shape)
+    for key in defects:
+        defects[key].flags.writeable = False
+    return defects
+
+
+def correct_defects(data, flags, defects):
+    """
+    Replace bad pixels in place using compiled defect index arrays
+
+    Args:
+        data (2D array): image to clean
+        flags (2D array): flags image, incremented by 2 for each bad pixel
+        defects (dict): index arrays from compile_defects
+
+    Returns:
+        int: the number of bad pixels cleaned
+
+    """
+    ny, nx = data.shape
+    sample_ok = defects['sample_ok'] & (defects['sample_cols'] >= 0) & \
+        (defects['sample_cols'] < nx)
+    samples = data[defects['sample_rows'],
+                   np.clip(defects['sample_cols'], 0, nx - 1)].astype(float)
+    samples[~sample_ok] = np.nan
+    # get replacement values
+    good_values = np.nanmedian(samples, axis=1)
+    # Replace baddies with good_values
+    data[defects['rows'], defects['cols']] = good_values[defects['segment']]
+    np.add.at(flags, (defects['rows'], defects['cols']), 2)
+    return len(defects['rows'])
 
 
 class CorrectDefects(BasePrimitive):
@@ -12,8 +115,10 @@ class CorrectDefects(BasePrimitive):
     Remove known bad columns.
 
     Looks for a defect list file in the data directory of kcwidrp based on the
-    CCD ampmode and x and y binning.  Records the defect correction in the
-    FITS header with the following keywords:
+    CCD ampmode and x and y binning.  The defect list is compiled once into
+    index arrays, so all the bad pixels are replaced in a single vectorized
+    step.  Records the defect correction in the FITS header with the following
+    keywords:
 
         * BPFILE: the bad pixel file used to correct defects
         * NBPCLEAN: the number of bad pixels cleaned
@@ -59,30 +164,9 @@ class CorrectDefects(BasePrimitive):
         number_of_bad_pixels = 0   # count of defective pixels cleaned
         if os.path.exists(full_path):
             self.logger.info("Reading defect list in: %s" % full_path)
-            defect_table = pd.read_csv(full_path, sep=r'\s+')
-            # range of pixels for calculating good value
-            pixel_range_for_good_value = 2
-            for index, row in defect_table.iterrows():
-                # Get coords and adjust for python zero bias
-                x0 = row['X0'] - 1
-                x1 = row['X1']
-                y0 = row['Y0'] - 1
-                y1 = row['Y1']
-                # Loop over y range
-                for by in range(y0, y1):
-                    # sample on low side of bad area
-                    values = list(self.action.args.ccddata.data[by,
-                                  x0-pixel_range_for_good_value:x0])
-                    # sample on high side
-                    values.extend(self.action.args.ccddata.data[by,
-                                  x1:x1+pixel_range_for_good_value])
-                    # get replacement value
-                    good_values = np.nanmedian(np.asarray(values))
-                    # Replace baddies with good_values
-                    for bx in range(x0, x1):
-                        self.action.args.ccddata.data[by, bx] = good_values
-                        flags[by, bx] += 2
-                        number_of_bad_pixels += 1
+            defects = compile_defects(full_path, os.path.getmtime(full_path))
+            number_of_bad_pixels = correct_defects(
+                self.action.args.ccddata.data, flags, defects)
             self.action.args.ccddata.header[key] = (True, keycom)
             self.action.args.ccddata.header['BPFILE'] = (path, 'defect list')
         else:
@@ -60,7 +60,9 @@ class CorrectGain(BasePrimitive):
         self.action.args.ccddata.header['HISTORY'] = log_string
         self.logger.info(log_string)
 
-        if self.config.instrument.saveintims:
+        # quick-look frames are only written as cubes
+        quicklook = getattr(self.action.args, 'quicklook', False)
+        if self.config.instrument.saveintims and not quicklook:
             kcwi_fits_writer(self.action.args.ccddata,
                              table=self.action.args.table,
                              output_file=self.action.args.name,
@@ -8,7 +8,98 @@ from numpy.polynomial import polynomial as poly
 from scipy.signal import savgol_filter
 import os
 from skimage import transform as tf
-from bokeh.plotting import figure
+
+
+def warp_column_bands(image, tform, xcols):
+    """
+    Warp only the requested output columns of an image
+
+    Equivalent to selecting ``xcols`` from ``tf.warp(image, tform)``, but only
+    the output pixels in those columns are mapped and interpolated.
+
+    Args:
+        image (2D array): image to warp
+        tform (skimage transform): maps output to input coordinates
+        xcols (1D int array): output columns to produce
+
+    Returns:
+        2D array with shape (image.shape[0], len(xcols)), NaN for columns
+        outside the image
+
+    """
+    xcols = np.asarray(xcols, dtype=int)
+
+    def band_map(coords):
+        # coords are (col, row) in the compact output image
+        full = coords.copy()
+        full[:, 0] = xcols[coords[:, 0].astype(int)]
+        return tform(full)
+
+    warped = tf.warp(image, band_map, output_shape=(image.shape[0],
+                                                     len(xcols)))
+    outside = (xcols < 0) | (xcols >= image.shape[1])
+    warped[:, outside] = np.nan
+    return warped
+
+
+def extract_arc_bands(image, tform, xis, window):
+    """
+    Extract median arc spectra in windows around each bar
+
+    Args:
+        image (2D array): arc image
+        tform (skimage transform): bar geometry transform
+        xis (1D int array): bar positions on the middle row
+        window (int): half-width of the extraction window
+
+    Returns:
+        2D array with shape (len(xis), image.shape[0])
+
+    """
+    xis = np.asarray(xis, dtype=int)
+    offsets = np.arange(-window, window + 1)
+    xcols = (xis[:, None] + offsets[None, :]).ravel()
+    bands = warp_column_bands(image, tform, xcols)
+    # (ny, nbars * nwin) -> (nbars, ny, nwin) view
+    bands = bands.reshape(image.shape[0], len(xis), len(offsets))
+    return np.nanmedian(bands.transpose(1, 0, 2), axis=2)
+
+
+def fit_arc_backgrounds(arcs, sectors=16, deg=3):
+    """
+    Fit a polynomial to the sector minima of each arc spectrum
+
+    Each spectrum (skipping 50 px at either end) is split into ``sectors``
+    equal sectors and the minimum of each is found with a single reshape.
+    All background polynomials are then fit in one batched least-squares
+    solve over the valid (not all NaN) sectors.
+
+    Args:
+        arcs (2D array): arc spectra, one per row
+        sectors (int): number of sectors
+        deg (int): polynomial degree
+
+    Returns:
+        (bkg, bad): background models with the shape of arcs and a boolean
+        (narcs, sectors) array flagging sectors with no valid data
+
+    """
+    narcs, ny = arcs.shape
+    div = int((ny - 100) / sectors)
+    sect = arcs[:, 50:50 + sectors * div].reshape(narcs, sectors, div)
+    bad = np.all(np.isnan(sect), axis=2)
+    imin = np.argmin(np.where(np.isnan(sect), np.inf, sect), axis=2)
+    xv = imin + 50 + np.arange(sectors)[None, :] * div
+    yv = np.take_along_axis(sect, imin[:, :, None], axis=2)[:, :, 0]
+    yv = np.where(bad, 0., yv)
+    # scaled abscissa keeps the batched solve well conditioned
+    xmid = 0.5 * (ny - 1)
+    amat = np.power.outer((xv - xmid) / xmid, np.arange(deg + 1))
+    amat *= (~bad)[:, :, None]
+    coef = np.matmul(np.linalg.pinv(amat), yv[:, :, None])
+    xp = np.power.outer((np.arange(ny) - xmid) / xmid, np.arange(deg + 1))
+    bkg = np.matmul(xp[None, :, :], coef)[:, :, 0]
+    return bkg, bad
 
 
 class ExtractArcs(BasePrimitive):
@@ -62,6 +153,8 @@ class ExtractArcs(BasePrimitive):
 
     def _perform(self):
         do_plot = (self.config.instrument.plot_level >= 3)
+        if do_plot:
+            from bokeh.plotting import figure
         plab = plotlabel(self.action.args)
         self.logger.info("Extracting arc spectra")
         # Double check
@@ -158,12 +251,13 @@ class ExtractArcs(BasePrimitive):
             tform = tf.estimate_transform(
                 'polynomial', self.action.args.source_control_points,
                 self.action.args.destination_control_points, order=3)
+            arc_image = self.action.args.ccddata.data
 
-            self.logger.info("Transforming arc image")
-            warped_image = tf.warp(self.action.args.ccddata.data, tform)
             # Write warped arcs if requested
             if self.config.instrument.saveintims:
                 from kcwidrp.primitives.kcwi_file_primitives import kcwi_fits_writer
+                self.logger.info("Transforming arc image")
+                warped_image = tf.warp(arc_image, tform)
                 # write out warped image
                 self.action.args.ccddata.data = warped_image
                 kcwi_fits_writer(
@@ -174,50 +268,33 @@ class ExtractArcs(BasePrimitive):
                 self.logger.info("Transformed arcs produced")
             # extract arcs
             self.logger.info("Extracting arcs")
-            arcs = []
             bars = []
-            # sectors for bkgnd subtraction
-            sectors = 16
-            for xyi, xy in enumerate(self.action.args.source_control_points):
-                if xy[1] == middle_row:
-                    xi = int(xy[0]+0.5)
-                    arc = np.nanmedian(
-                        warped_image[:, (xi - window):(xi + window + 1)],
-                        axis=1)
-                    # divide spectrum into sectors
-                    div = int((len(arc)-100) / sectors)
-                    # get minimum for each sector
-                    xv = []
-                    yv = []
-                    for i in range(sectors):
-                        try:
-                            mi = np.nanargmin(arc[50+i*div:50+(i+1)*div])
-                            mn = np.nanmin(arc[50+i*div:50+(i+1)*div])
-                            xv.append(mi+50+i*div)
-                            yv.append(mn)
-                        except ValueError:
-                            self.logger.warning("Bad sector %d" % i)
-                    # fit minima to model background
-                    res = np.polyfit(xv, yv, 3)
-                    xp = np.arange(len(arc))
-                    bkg = np.polyval(res, xp)   # resulting model
-                    # plot if requested
-                    if do_plot:
-                        p = figure(
-                            title=plab + "ARC # %d" % len(arcs),
-                            x_axis_label="Y CCD Pixel", y_axis_label="Flux",
-                            plot_width=self.config.instrument.plot_width,
-                            plot_height=self.config.instrument.plot_height)
-                        p.line(xp, arc, legend_label='Arc', color='blue')
-                        p.line(xp, bkg, legend_label='Bkg', color='red')
-                        bokeh_plot(p, self.context.bokeh_session)
-                        q = input("Next? <cr>, q to quit: ")
-                        if 'Q' in q.upper():
-                            do_plot = False
-                    # subtract model background
-                    arc -= bkg
-                    # add to arcs list
-                    arcs.append(arc)
+            # bar positions on the middle row
+            src = np.asarray(self.action.args.source_control_points)
+            xis = (src[src[:, 1] == middle_row, 0] + 0.5).astype(int)
+            # only warp the column bands around the bars
+            arcs = extract_arc_bands(arc_image, tform, xis, window)
+            # fit sector minima to model background
+            bkgs, bad = fit_arc_backgrounds(arcs, sectors=16)
+            for ia, ib in zip(*np.nonzero(bad)):
+                self.logger.warning("Bad sector %d in arc %d" % (ib, ia))
+            # plot if requested
+            if do_plot:
+                xp = np.arange(arcs.shape[1])
+                for ia in range(len(arcs)):
+                    p = figure(
+                        title=plab + "ARC # %d" % ia,
+                        x_axis_label="Y CCD Pixel", y_axis_label="Flux",
+                        plot_width=self.config.instrument.plot_width,
+                        plot_height=self.config.instrument.plot_height)
+                    p.line(xp, arcs[ia], legend_label='Arc', color='blue')
+                    p.line(xp, bkgs[ia], legend_label='Bkg', color='red')
+                    bokeh_plot(p, self.context.bokeh_session)
+                    q = input("Next? <cr>, q to quit: ")
+                    if 'Q' in q.upper():
+                        break
+            # subtract model background
+            arcs = list(arcs - bkgs)
         # Did we get the correct number of arcs?
         if len(arcs) == self.config.instrument.NBARS:
             self.logger.info("Extracted %d arcs" % len(arcs))
@@ -4,8 +4,6 @@ from kcwidrp.primitives.kcwi_file_primitives import plotlabel
 
 import numpy as np
 import logging
-from bokeh.util.logconfig import basicConfig
-from bokeh.plotting import figure
 from scipy.signal import find_peaks
 import time
 
@@ -23,7 +21,9 @@ class FindBars(BasePrimitive):
     def __init__(self, action, context):
         BasePrimitive.__init__(self, action, context)
         self.logger = context.pipeline_logger
-        basicConfig(level=logging.ERROR)
+        if self.config.instrument.plot_level >= 1:
+            from bokeh.util.logconfig import basicConfig
+            basicConfig(level=logging.ERROR)
 
     def _pre_condition(self):
         self.logger.info("Checking for master contbars")
@@ -80,6 +80,7 @@ class FindBars(BasePrimitive):
                     peaks_vector.append(pk)
             peaks_found = len(peaks_vector)
             if self.config.instrument.plot_level >= 3:
+                from bokeh.plotting import figure
                 # plot the peak positions
                 x = np.arange(len(middle_vector))
                 p = figure(
@@ -119,6 +120,7 @@ class FindBars(BasePrimitive):
             self.logger.info("found %d bars" % peaks_found)
 
             if self.config.instrument.plot_level >= 1:
+                from bokeh.plotting import figure
                 # plot the peak positions
                 x = np.arange(len(middle_vector))
                 p = figure(
@@ -142,6 +144,7 @@ class FindBars(BasePrimitive):
 
             # Do we plot?
             if self.config.instrument.plot_level >= 3:
+                from bokeh.plotting import figure
                 do_inter = True
             else:
                 do_inter = False
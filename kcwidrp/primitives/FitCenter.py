@@ -4,7 +4,6 @@ from kcwidrp.core.kcwi_plotting import get_plot_lims, oplot_slices, \
     set_plot_lims, save_plot
 from kcwidrp.primitives.kcwi_file_primitives import plotlabel
 
-from bokeh.plotting import figure
 import numpy as np
 import math
 from scipy.interpolate import interpolate
@@ -209,7 +208,10 @@ class FitCenter(BasePrimitive):
     and rough offset between reference bar and atlas spectrum, and the
     calculated dispersion.
 
-    Uses config parameter TAPERFRAC to control cross-correlation roll-off.
+    Uses config parameter TAPERFRAC to control cross-correlation roll-off
+    and DISPDEV to set the fractional range of the dispersion scan.  With
+    sub-pixel bar offsets from ArcOffsets the starting points are accurate
+    enough that DISPDEV can usually be reduced.
 
     """
 
@@ -230,6 +232,8 @@ class FitCenter(BasePrimitive):
         self.logger.info("Finding wavelength solution for central region")
         # Are we interactive?
         do_inter = (self.config.instrument.plot_level >= 2)
+        if do_inter:
+            from bokeh.plotting import figure
         plab = plotlabel(self.action.args)
 
         # y binning
@@ -238,8 +242,13 @@ class FitCenter(BasePrimitive):
         p0 = self.action.args.cwave + np.array(self.context.bar_offsets) * \
             self.context.prelim_disp - self.action.args.offset_wave
         # next we are going to brute-force scan around the preliminary
-        # dispersion for a better solution. We will wander 5% away from it.
-        maximum_dispersion_deviation = 0.05  # fraction
+        # dispersion for a better solution. We will wander DISPDEV
+        # (default 5%) away from it.
+        maximum_dispersion_deviation = self.config.instrument.DISPDEV
+        if maximum_dispersion_deviation is None:
+            maximum_dispersion_deviation = 0.05  # fraction
+        self.logger.info("Dispersion scan range = +-%.1f%%" %
+                         (100. * maximum_dispersion_deviation))
         # we will try nn values
         self.logger.info("prelim disp = %.3f, refdisp = %.3f,"
                          " min,max rows = %d, %d" % (self.context.prelim_disp,
@@ -348,6 +357,7 @@ class FitCenter(BasePrimitive):
         self.action.args.twkcoeff = twkcoeff
         # Plot results
         if self.config.instrument.plot_level >= 1:
+            from bokeh.plotting import figure
             nbars = self.config.instrument.NBARS
             # Plot central wavelength
             p = figure(title=plab + "CENTRAL VALUES",
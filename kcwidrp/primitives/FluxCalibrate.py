@@ -4,6 +4,7 @@ from kcwidrp.primitives.kcwi_file_primitives import kcwi_fits_writer, \
 from kcwidrp.core.kcwi_correct_extin import kcwi_correct_extin
 
 import os
+from functools import lru_cache
 import numpy as np
 from scipy.interpolate import interp1d
 
@@ -12,12 +13,58 @@ from astropy import units as u
 from astropy.nddata import CCDData
 
 
+@lru_cache(maxsize=8)
+def read_invsens(full_path, mtime, w0, dw, nwave):
+    """
+    Read an inverse sensitivity curve and put it on the object wavelengths
+
+    The result is cached per invsens file (and modification time) and object
+    wavelength grid, so a night of objects only reads and resamples each
+    master standard once.
+
+    Args:
+        full_path (str): full path to the invsens file
+        mtime (float): modification time of the file, part of the cache key
+        w0 (float): first object wavelength (Angstroms)
+        dw (float): object wavelength step (Angstroms)
+        nwave (int): number of object wavelengths
+
+    Returns:
+        (mcal, msimgno, resampled): read-only calibration curve on the object
+        grid, master std image number, and True if the curve was resampled
+
+    """
+    with pf.open(full_path) as hdul:
+        mcal = np.array(hdul[0].data[1, :])
+        mchdr = hdul[0].header
+    # get dimensions
+    mcsz = mcal.shape
+    # get master std waves
+    mcw0 = mchdr['CRVAL1']
+    mcdw = mchdr['CDELT1']
+    mcwav = mcw0 + np.arange(mcsz[0]) * mcdw
+    # get master std image number
+    msimgno = mchdr['FRAMENO']
+    # get object waves
+    wav = w0 + np.arange(nwave) * dw
+    # resample onto object waves, if needed
+    resampled = (w0 != mcw0 or dw != mcdw or wav[-1] != mcwav[-1] or
+                 nwave != mcsz[0])
+    if resampled:
+        mcint = interp1d(mcwav, mcal, kind='cubic', fill_value='extrapolate')
+        mcal = mcint(wav)
+    mcal.flags.writeable = False
+    return mcal, msimgno, resampled
+
+
 class FluxCalibrate(BasePrimitive):
     """
     Perform flux calibration.
 
     Uses inverse sensitivity curve derived from MakeInvsens to flux calibrate
-    input observation.
+    input observation.  The calibration is broadcast over the intensity,
+    uncertainty, and noskysub cubes, and the obj and sky cubes from
+    CorrectDar, taken from memory when available.
 
     """
 
@@ -62,25 +109,18 @@ class FluxCalibrate(BasePrimitive):
             # read in master calibration (inverse sensitivity)
             invsname = self.action.args.invsname
             self.logger.info("Reading invsens: %s" % invsname)
-            hdul = pf.open(os.path.join(self.config.instrument.cwd,
-                                        'redux', invsname))
-            mcal = hdul[0].data[1, :]
-            mchdr = hdul[0].header
-            hdul.close()
-            # get dimensions
-            mcsz = mcal.shape
-            # get master std waves
-            mcw0 = mchdr['CRVAL1']
-            mcdw = mchdr['CDELT1']
-            mcwav = mcw0 + np.arange(mcsz[0]) * mcdw
-            # get master std image number
-            msimgno = mchdr['FRAMENO']
+            full_path = os.path.join(self.config.instrument.cwd, 'redux',
+                                     invsname)
             # get input object image dimensions
             sz = self.action.args.ccddata.data.shape
             # get object waves
             w0 = self.action.args.ccddata.header['CRVAL3']
             dw = self.action.args.ccddata.header['CD3_3']
-            wav = w0 + np.arange(sz[0]) * dw
+            mcal, msimgno, resampled = read_invsens(
+                full_path, os.path.getmtime(full_path), w0, dw, sz[0])
+            if resampled:
+                self.logger.warning("wavelength scales not identical, "
+                                    "resampling standard")
             # get exposure time
             expt = self.action.args.ccddata.header['XPOSURE']
             if expt <= 0:
@@ -90,55 +130,43 @@ class FluxCalibrate(BasePrimitive):
                     self.logger.warning("No valid exposure time found, "
                                         "using 1s")
                     expt = 1.0
-            # resample onto object waves, if needed
-            if w0 != mcw0 or dw != mcdw or wav[-1] != mcwav[-1] or \
-                    sz[0] != mcsz[0]:
-                self.logger.warning("wavelength scales not identical, "
-                                    "resampling standard")
-                print(w0, mcw0, dw, mcdw, wav[-1], mcwav[-1], sz[0], mcsz[0])
-                mcint = interp1d(mcwav, mcal, kind='cubic',
-                                 fill_value='extrapolate')
-                mscal = mcint(wav) * 1.e16 / expt
-            else:
-                mscal = mcal * 1.e16 / expt
+            mscal = mcal * 1.e16 / expt
 
             # extinction correct calibration
             kcwi_correct_extin(mscal, self.action.args.ccddata.header,
                                logger=self.logger)
-            # do calibration
-            for isl in range(sz[2]):
-                for ix in range(sz[1]):
-                    self.action.args.ccddata.data[:, ix, isl] *= mscal
-                    if self.action.args.ccddata.noskysub is not None:
-                        self.action.args.ccddata.noskysub[:, ix, isl] *= mscal
-                    self.action.args.ccddata.uncertainty.array[:, ix, isl] *= \
-                        mscal
 
             # check for obj, sky cubes
             if self.action.args.nasmask and self.action.args.numopen > 1:
                 ofn = self.action.args.name
-                # obj cube
+                # obj cube, from CorrectDar if we have it
+                obj = getattr(self.action.args, 'ocubed', None)
                 objfn = strip_fname(ofn) + '_ocubed.fits'
                 full_path = os.path.join(
                     self.config.instrument.cwd,
                     self.config.instrument.output_directory, objfn)
-                if os.path.exists(full_path):
+                if obj is None and os.path.exists(full_path):
                     obj = kcwi_fits_reader(full_path)[0]
-                    # do calibration
-                    for isl in range(sz[2]):
-                        for ix in range(sz[1]):
-                            obj.data[:, ix, isl] *= mscal
                 # sky cube
+                sky = getattr(self.action.args, 'scubed', None)
                 skyfn = strip_fname(ofn) + '_scubed.fits'
                 full_path = os.path.join(
                     self.config.instrument.cwd,
                     self.config.instrument.output_directory, skyfn)
-                if os.path.exists(full_path):
+                if sky is None and os.path.exists(full_path):
                     sky = kcwi_fits_reader(full_path)[0]
-                    # do calibration
-                    for isl in range(sz[2]):
-                        for ix in range(sz[1]):
-                            sky.data[:, ix, isl] *= mscal
+
+            # do calibration
+            cubes = [self.action.args.ccddata.data,
+                     self.action.args.ccddata.uncertainty.array]
+            if self.action.args.ccddata.noskysub is not None:
+                cubes.append(self.action.args.ccddata.noskysub)
+            if obj is not None:
+                cubes.append(obj.data)
+            if sky is not None:
+                cubes.append(sky.data)
+            for cube in cubes:
+                cube *= mscal[:, np.newaxis, np.newaxis]
 
             # units
             flam16_u = 1.e16 * u.erg / (u.angstrom * u.cm ** 2 * u.s)
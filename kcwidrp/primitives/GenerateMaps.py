@@ -1,6 +1,8 @@
 from keckdrpframework.primitives.base_primitive import BasePrimitive
 from kcwidrp.primitives.kcwi_file_primitives import kcwi_fits_writer
 
+from kcwidrp.core import geometric as tf
+
 import os
 import numpy as np
 import pickle
@@ -20,6 +22,10 @@ class GenerateMaps(BasePrimitive):
     * wave - what wavelength the pixel has
     * del - what the delta wavelength is at the pixel
 
+    The delta wavelength is the derivative of the wavelength solution along
+    the CCD rows, evaluated in closed form from the inverse transform
+    coefficients.
+
     Pixels not on any slice are given as a negative value (usually -1.)
 
     """
@@ -48,6 +54,12 @@ class GenerateMaps(BasePrimitive):
             xl0s = geom['xl0']  # lower slice pos limit
             xl1s = geom['xl1']  # upper slice pos limit
             invtf_list = geom['invtf']
+            # older geometry files lack the coefficient grids
+            if 'invcoef' in geom:
+                invcoef_list = geom['invcoef']
+            else:
+                invcoef_list = [itrf.coefficient_grids()
+                                for itrf in invtf_list]
             wave0 = geom['wave0out']
             dw = geom['dwout']
             xsize = geom['xsize']
@@ -61,26 +73,22 @@ class GenerateMaps(BasePrimitive):
             delta_map_img = np.full_like(data_img, fill_value=-1.)
             # loop over slices
             for isl in range(0, 24):
-                itrf = invtf_list[isl]
+                cgrid = invcoef_list[isl]
                 xl0 = xl0s[isl]
                 xl1 = xl1s[isl]
-                # loop over slice position
-                for ix in range(xl0, xl1):
-                    coords = np.zeros((ny, 2))
-                    # loop over wavelength pixels
-                    for iy in range(0, ny):
-                        coords[iy, 0] = ix - xl0
-                        coords[iy, 1] = iy
-                    ncoo = itrf(coords)
-                    # loop over wavelength
-                    for iy in range(0, ny):
-                        if 0 <= ncoo[iy, 0] <= xsize:
-                            slice_map_img[iy, ix] = isl
-                            xpos_map_img[iy, ix] = ncoo[iy, 0]
-                            wave_map_img[iy, ix] = ncoo[iy, 1] * dw + wave0
-                            if iy > 0:
-                                delta_map_img[iy, ix] = abs(
-                                    (ncoo[iy, 1] - ncoo[iy-1, 1]) * dw)
+                xs = np.arange(xl1 - xl0)
+                ys = np.arange(ny)
+                # transform the whole slice image grid at once
+                ncoo = tf.evaluate_grid(cgrid, xs, ys)
+                # closed form d(wave)/d(row)
+                dwdy = tf.evaluate_grid(tf.derivative_grid(cgrid, axis='y'),
+                                        xs, ys)[:, :, 1]
+                good = (ncoo[:, :, 0] >= 0) & (ncoo[:, :, 0] <= xsize)
+                slice_map_img[:, xl0:xl1][good] = isl
+                xpos_map_img[:, xl0:xl1][good] = ncoo[:, :, 0][good]
+                wave_map_img[:, xl0:xl1][good] = ncoo[:, :, 1][good] * dw + \
+                    wave0
+                delta_map_img[:, xl0:xl1][good] = np.abs(dwdy[good] * dw)
 
             # update header
             self.action.args.ccddata.header['HISTORY'] = log_string
@@ -3,8 +3,6 @@ from kcwidrp.core.bokeh_plotting import bokeh_plot
 from kcwidrp.core.kcwi_plotting import save_plot
 from kcwidrp.primitives.kcwi_file_primitives import plotlabel
 
-from bokeh.plotting import figure
-from bokeh.models import Range1d
 import numpy as np
 import scipy as sp
 from scipy.interpolate import interpolate
@@ -517,6 +515,8 @@ class GetAtlasLines(BasePrimitive):
             # plot final list of Atlas lines and show rejections
             norm_fac = np.nanmax(atspec)
             if self.config.instrument.plot_level >= 1:
+                from bokeh.plotting import figure
+                from bokeh.models import Range1d
                 p = figure(title=plotlabel(self.action.args) +
                            "ATLAS LINES Ngood = %d, Nrej = %d" % (len(refws),
                                                                   nrej),
@@ -12,7 +12,6 @@ from astropy.coordinates import SkyCoord
 from astropy import units as u
 from astropy.nddata import CCDData
 from kcwidrp.core.bokeh_plotting import bokeh_plot
-from bokeh.plotting import figure
 from multiprocessing import Pool
 
 
@@ -67,36 +66,38 @@ def make_cube_helper(argument):
         slice_del = argument['del'][:, xl0:xl1]
     else:
         slice_del = None
+    # evaluate the transform once on the output grid for all warps
+    coords = tform.warp_coords((ysize, xsize))
     # do the warping
-    warped = tf.warp(slice_img, tform, order=3,
+    warped = tf.warp(slice_img, coords, order=3,
                      output_shape=(ysize, xsize))
-    uarped = tf.warp(slice_unc, tform, order=3,
+    uarped = tf.warp(slice_unc, coords, order=3,
                      output_shape=(ysize, xsize))
-    marped = tf.warp(slice_msk, tform, order=3,
+    marped = tf.warp(slice_msk, coords, order=3,
                      output_shape=(ysize, xsize))
-    farped = tf.warp(slice_flg, tform, order=3,
+    farped = tf.warp(slice_flg, coords, order=3,
                      output_shape=(ysize, xsize), preserve_range=True)
 
     if slice_nsk is not None:
-        karped = tf.warp(slice_nsk, tform, order=3,
+        karped = tf.warp(slice_nsk, coords, order=3,
                          output_shape=(ysize, xsize))
     else:
         karped = None
 
     if slice_obj is not None:
-        oarped = tf.warp(slice_obj, tform, order=3,
+        oarped = tf.warp(slice_obj, coords, order=3,
                          output_shape=(ysize, xsize))
     else:
         oarped = None
 
     if slice_sky is not None:
-        sarped = tf.warp(slice_sky, tform, order=3,
+        sarped = tf.warp(slice_sky, coords, order=3,
                          output_shape=(ysize, xsize))
     else:
         sarped = None
 
     if slice_del is not None:
-        darped = tf.warp(slice_del, tform, order=3,
+        darped = tf.warp(slice_del, coords, order=3,
                          output_shape=(ysize, xsize), preserve_range=True)
     else:
         darped = None
@@ -105,6 +106,201 @@ def make_cube_helper(argument):
         oarped, sarped, darped
 
 
+def cube_wcs_header(header, geom, geom_file, args, rotoff, logger):
+    """
+    Update the header of a frame for its data cube.
+
+    Records the geometry and wavelength ranges of the cube and sets its
+    WCS from the telescope pointing and the rotator position.
+
+    Args:
+        header (astropy.io.fits.Header): header of the frame, updated
+        geom (dict): geometry solution, from the \*_geom.pkl file
+        geom_file (str): path of the geometry file
+        args (Arguments): action arguments of the frame (nasmask, ifunum,
+            xbinsize, ybinsize)
+        rotoff (float): rotator/IFU offset angle in degrees
+        logger (logging.Logger): pipeline logger
+
+    """
+    # Get object pointing
+    try:
+        if args.nasmask:
+            rastr = header['RABASE']
+            decstr = header['DECBASE']
+        else:
+            rastr = header['RA']
+            decstr = header['DEC']
+    except KeyError:
+        try:
+            rastr = header['TARGRA']
+            decstr = header['TARGDEC']
+        except KeyError:
+            rastr = ''
+            decstr = ''
+    if len(rastr) > 0 and len(decstr) > 0:
+        try:
+            coord = SkyCoord(rastr, decstr, unit=(u.hourangle, u.deg))
+        except ValueError:
+            coord = None
+    else:
+        coord = None
+    # Get rotator position
+    if 'ROTPOSN' in header:
+        rpos = header['ROTPOSN']
+    else:
+        rpos = 0.
+    if 'ROTREFAN' in header:
+        rref = header['ROTREFAN']
+    else:
+        rref = 0.
+    skypa = rpos + rref
+    crota = math.radians(-(skypa + rotoff))
+    cdelt1 = -geom['slscl']
+    cdelt2 = geom['pxscl']
+    if coord is None:
+        ra = 0.
+        dec = 0.
+        crota = 1
+    else:
+        ra = coord.ra.degree
+        dec = coord.dec.degree
+    cd11 = cdelt1 * math.cos(crota)
+    cd12 = abs(cdelt2) * np.sign(cdelt1) * math.sin(crota)
+    cd21 = -abs(cdelt1) * np.sign(cdelt2) * math.sin(crota)
+    cd22 = cdelt2 * math.cos(crota)
+    crpix1 = 12.
+    crpix2 = geom['xsize'] / 2.
+    crpix3 = 1.
+    porg = header['PONAME']
+    ifunum = args.ifunum
+    if 'IFU' in porg:
+        if ifunum == 1:
+            off1 = 1.0
+            off2 = 4.0
+        elif ifunum == 2:
+            off1 = 1.0
+            off2 = 5.0
+        elif ifunum == 3:
+            off1 = 0.05
+            off2 = 5.6
+        else:
+            logger.warning("Unknown IFU number: %d" % ifunum)
+            off1 = 0.
+            off2 = 0.
+        off1 = off1 / float(args.xbinsize)
+        off2 = off2 / float(args.ybinsize)
+        crpix1 += off1
+        crpix2 += off2
+    # Update header
+    # Geometry corrected?
+    header['GEOMCOR'] = (
+        True, 'Geometry corrected?')
+    #
+    # Spatial geometry
+    header['BARSEP'] = (
+        geom['barsep'], 'separation of bars (binned pix)')
+    header['BAR0'] = (
+        geom['bar0'], 'first bar pixel position')
+    # Wavelength ranges
+    if args.nasmask:
+        header['WAVALL0'] = (
+            geom['wavensall0'], 'Low inclusive wavelength')
+        header['WAVALL1'] = (
+            geom['wavensall1'], 'High inclusive wavelength')
+        header['WAVGOOD0'] = (
+            geom['wavensgood0'], 'Low good wavelength')
+        header['WAVGOOD1'] = (
+            geom['wavensgood1'], 'High good wavelength')
+        header['WAVMID'] = (
+            geom['wavensmid'], 'middle wavelength')
+    else:
+        header['WAVALL0'] = (
+            geom['waveall0'], 'Low inclusive wavelength')
+        header['WAVALL1'] = (
+            geom['waveall1'], 'High inclusive wavelength')
+        header['WAVGOOD0'] = (
+            geom['wavegood0'], 'Low good wavelength')
+        header['WAVGOOD1'] = (
+            geom['wavegood1'], 'High good wavelength')
+        header['WAVMID'] = (
+            geom['wavemid'], 'middle wavelength')
+    # Dichroic fraction
+    try:
+        dichroic_fraction = geom['dich_frac']
+    except AttributeError:
+        dichroic_fraction = 1.
+    header['DICHFRAC'] = (
+        dichroic_fraction, 'Dichroic Fraction')
+    # Wavelength fit statistics
+    header['AVWVSIG'] = (
+        geom['avwvsig'], 'Avg. bar wave sigma (Ang)')
+    header['SDWVSIG'] = (
+        geom['sdwvsig'], 'Stdev. var wave sigma (Ang)')
+    # Pixel scales
+    header['PXSCL'] = (
+        geom['pxscl'], 'Pixel scale along slice (deg)')
+    header['SLSCL'] = (
+        geom['slscl'], 'Pixel scale perp. to slices (deg)')
+    # Geometry origins
+    header['CBARSNO'] = (
+        geom['cbarsno'], 'Continuum bars image number')
+    header['CBARSFL'] = (
+        geom['cbarsfl'], 'Continuum bars image filename')
+    header['ARCNO'] = (
+        geom['arcno'], 'Arc image number')
+    header['ARCFL'] = (
+        geom['arcfl'], 'Arc image filename')
+    header['GEOMFL'] = (
+        geom_file.split('/')[-1], 'Geometry file')
+    # WCS
+    header['IFUPA'] = (
+        skypa, 'IFU position angle (degrees)')
+    header['IFUROFF'] = (
+        rotoff, 'IFU-SKYPA offset (degrees)')
+    header['WCSDIM'] = (
+        3, 'number of dimensions in WCS')
+    header['WCSNAME'] = 'KCWI'
+    header['EQUINOX'] = 2000.
+    header['RADESYS'] = 'FK5'
+    header['CTYPE1'] = 'RA---TAN'
+    header['CTYPE2'] = 'DEC--TAN'
+    header['CTYPE3'] = ('AWAV',
+                        'Air Wavelengths')
+    header['CUNIT1'] = ('deg', 'RA units')
+    header['CUNIT2'] = ('deg', 'DEC units')
+    header['CUNIT3'] = ('Angstrom',
+                        'Wavelength units')
+    header['CNAME1'] = ('KCWI RA', 'RA name')
+    header['CNAME2'] = ('KCWI DEC', 'DEC name')
+    header['CNAME3'] = ('KCWI Wavelength',
+                        'Wavelength name')
+    header['CRVAL1'] = (ra, 'RA zeropoint')
+    header['CRVAL2'] = (dec, 'DEC zeropoint')
+    header['CRVAL3'] = (geom['wave0out'],
+                        'Wavelength zeropoint')
+    header['CRPIX1'] = (crpix1,
+                        'RA reference pixel')
+    header['CRPIX2'] = (crpix2,
+                        'DEC reference pixel')
+    header['CRPIX3'] = (
+        crpix3, 'Wavelength reference pixel')
+    header['CD1_1'] = (
+        cd11, 'RA degrees per column pixel')
+    header['CD2_1'] = (
+        cd21, 'DEC degrees per column pixel')
+    header['CD1_2'] = (
+        cd12, 'RA degrees per row pixel')
+    header['CD2_2'] = (
+        cd22, 'DEC degrees per row pixel')
+    header['CD3_3'] = (
+        geom['dwout'], 'Wavelength Angstroms per pixel')
+    header['LONPOLE'] = (
+        180.0, 'Native longitude of Celestial pole')
+    header['LATPOLE'] = (
+        0.0, 'Native latitude of Celestial pole')
+
+
 class MakeCube(BasePrimitive):
     """
     Transform 2D images to 3D data cubes.
@@ -262,6 +458,7 @@ class MakeCube(BasePrimitive):
                     out_dube[:, :, slice_number] = partial_cube[8]
 
             if self.config.instrument.plot_level >= 3:
+                from bokeh.plotting import figure
                 for isl in range(0, 24):
                     warped = out_cube[:, :, isl]
                     ptitle = self.action.args.plotlabel + \
@@ -298,183 +495,9 @@ class MakeCube(BasePrimitive):
                 if dew is not None:
                     out_dube = np.rot90(out_dube, 2, (1, 2))
 
-            # Calculate some WCS parameters
-            # Get object pointing
-            try:
-                if self.action.args.nasmask:
-                    rastr = self.action.args.ccddata.header['RABASE']
-                    decstr = self.action.args.ccddata.header['DECBASE']
-                else:
-                    rastr = self.action.args.ccddata.header['RA']
-                    decstr = self.action.args.ccddata.header['DEC']
-            except KeyError:
-                try:
-                    rastr = self.action.args.ccddata.header['TARGRA']
-                    decstr = self.action.args.ccddata.header['TARGDEC']
-                except KeyError:
-                    rastr = ''
-                    decstr = ''
-            if len(rastr) > 0 and len(decstr) > 0:
-                try:
-                    coord = SkyCoord(rastr, decstr, unit=(u.hourangle, u.deg))
-                except ValueError:
-                    coord = None
-            else:
-                coord = None
-            # Get rotator position
-            if 'ROTPOSN' in self.action.args.ccddata.header:
-                rpos = self.action.args.ccddata.header['ROTPOSN']
-            else:
-                rpos = 0.
-            if 'ROTREFAN' in self.action.args.ccddata.header:
-                rref = self.action.args.ccddata.header['ROTREFAN']
-            else:
-                rref = 0.
-            skypa = rpos + rref
-            crota = math.radians(-(skypa + self.config.instrument.ROTOFF))
-            cdelt1 = -geom['slscl']
-            cdelt2 = geom['pxscl']
-            if coord is None:
-                ra = 0.
-                dec = 0.
-                crota = 1
-            else:
-                ra = coord.ra.degree
-                dec = coord.dec.degree
-            cd11 = cdelt1 * math.cos(crota)
-            cd12 = abs(cdelt2) * np.sign(cdelt1) * math.sin(crota)
-            cd21 = -abs(cdelt1) * np.sign(cdelt2) * math.sin(crota)
-            cd22 = cdelt2 * math.cos(crota)
-            crpix1 = 12.
-            crpix2 = xsize / 2.
-            crpix3 = 1.
-            porg = self.action.args.ccddata.header['PONAME']
-            ifunum = self.action.args.ifunum
-            if 'IFU' in porg:
-                if ifunum == 1:
-                    off1 = 1.0
-                    off2 = 4.0
-                elif ifunum == 2:
-                    off1 = 1.0
-                    off2 = 5.0
-                elif ifunum == 3:
-                    off1 = 0.05
-                    off2 = 5.6
-                else:
-                    self.logger.warning("Unknown IFU number: %d" % ifunum)
-                    off1 = 0.
-                    off2 = 0.
-                off1 = off1 / float(self.action.args.xbinsize)
-                off2 = off2 / float(self.action.args.ybinsize)
-                crpix1 += off1
-                crpix2 += off2
-            # Update header
-            # Geometry corrected?
-            self.action.args.ccddata.header['GEOMCOR'] = (
-                True, 'Geometry corrected?')
-            #
-            # Spatial geometry
-            self.action.args.ccddata.header['BARSEP'] = (
-                geom['barsep'], 'separation of bars (binned pix)')
-            self.action.args.ccddata.header['BAR0'] = (
-                geom['bar0'], 'first bar pixel position')
-            # Wavelength ranges
-            if self.action.args.nasmask:
-                self.action.args.ccddata.header['WAVALL0'] = (
-                    geom['wavensall0'], 'Low inclusive wavelength')
-                self.action.args.ccddata.header['WAVALL1'] = (
-                    geom['wavensall1'], 'High inclusive wavelength')
-                self.action.args.ccddata.header['WAVGOOD0'] = (
-                    geom['wavensgood0'], 'Low good wavelength')
-                self.action.args.ccddata.header['WAVGOOD1'] = (
-                    geom['wavensgood1'], 'High good wavelength')
-                self.action.args.ccddata.header['WAVMID'] = (
-                    geom['wavensmid'], 'middle wavelength')
-            else:
-                self.action.args.ccddata.header['WAVALL0'] = (
-                    geom['waveall0'], 'Low inclusive wavelength')
-                self.action.args.ccddata.header['WAVALL1'] = (
-                    geom['waveall1'], 'High inclusive wavelength')
-                self.action.args.ccddata.header['WAVGOOD0'] = (
-                    geom['wavegood0'], 'Low good wavelength')
-                self.action.args.ccddata.header['WAVGOOD1'] = (
-                    geom['wavegood1'], 'High good wavelength')
-                self.action.args.ccddata.header['WAVMID'] = (
-                    geom['wavemid'], 'middle wavelength')
-            # Dichroic fraction
-            try:
-                dichroic_fraction = geom['dich_frac']
-            except AttributeError:
-                dichroic_fraction = 1.
-            self.action.args.ccddata.header['DICHFRAC'] = (
-                dichroic_fraction, 'Dichroic Fraction')
-            # Wavelength fit statistics
-            self.action.args.ccddata.header['AVWVSIG'] = (
-                geom['avwvsig'], 'Avg. bar wave sigma (Ang)')
-            self.action.args.ccddata.header['SDWVSIG'] = (
-                geom['sdwvsig'], 'Stdev. var wave sigma (Ang)')
-            # Pixel scales
-            self.action.args.ccddata.header['PXSCL'] = (
-                geom['pxscl'], 'Pixel scale along slice (deg)')
-            self.action.args.ccddata.header['SLSCL'] = (
-                geom['slscl'], 'Pixel scale perp. to slices (deg)')
-            # Geometry origins
-            self.action.args.ccddata.header['CBARSNO'] = (
-                geom['cbarsno'], 'Continuum bars image number')
-            self.action.args.ccddata.header['CBARSFL'] = (
-                geom['cbarsfl'], 'Continuum bars image filename')
-            self.action.args.ccddata.header['ARCNO'] = (
-                geom['arcno'], 'Arc image number')
-            self.action.args.ccddata.header['ARCFL'] = (
-                geom['arcfl'], 'Arc image filename')
-            self.action.args.ccddata.header['GEOMFL'] = (
-                geom_file.split('/')[-1], 'Geometry file')
-            # WCS
-            self.action.args.ccddata.header['IFUPA'] = (
-                skypa, 'IFU position angle (degrees)')
-            self.action.args.ccddata.header['IFUROFF'] = (
-                self.config.instrument.ROTOFF, 'IFU-SKYPA offset (degrees)')
-            self.action.args.ccddata.header['WCSDIM'] = (
-                3, 'number of dimensions in WCS')
-            self.action.args.ccddata.header['WCSNAME'] = 'KCWI'
-            self.action.args.ccddata.header['EQUINOX'] = 2000.
-            self.action.args.ccddata.header['RADESYS'] = 'FK5'
-            self.action.args.ccddata.header['CTYPE1'] = 'RA---TAN'
-            self.action.args.ccddata.header['CTYPE2'] = 'DEC--TAN'
-            self.action.args.ccddata.header['CTYPE3'] = ('AWAV',
-                                                         'Air Wavelengths')
-            self.action.args.ccddata.header['CUNIT1'] = ('deg', 'RA units')
-            self.action.args.ccddata.header['CUNIT2'] = ('deg', 'DEC units')
-            self.action.args.ccddata.header['CUNIT3'] = ('Angstrom',
-                                                         'Wavelength units')
-            self.action.args.ccddata.header['CNAME1'] = ('KCWI RA', 'RA name')
-            self.action.args.ccddata.header['CNAME2'] = ('KCWI DEC', 'DEC name')
-            self.action.args.ccddata.header['CNAME3'] = ('KCWI Wavelength',
-                                                         'Wavelength name')
-            self.action.args.ccddata.header['CRVAL1'] = (ra, 'RA zeropoint')
-            self.action.args.ccddata.header['CRVAL2'] = (dec, 'DEC zeropoint')
-            self.action.args.ccddata.header['CRVAL3'] = (geom['wave0out'],
-                                                         'Wavelength zeropoint')
-            self.action.args.ccddata.header['CRPIX1'] = (crpix1,
-                                                         'RA reference pixel')
-            self.action.args.ccddata.header['CRPIX2'] = (crpix2,
-                                                         'DEC reference pixel')
-            self.action.args.ccddata.header['CRPIX3'] = (
-                crpix3, 'Wavelength reference pixel')
-            self.action.args.ccddata.header['CD1_1'] = (
-                cd11, 'RA degrees per column pixel')
-            self.action.args.ccddata.header['CD2_1'] = (
-                cd21, 'DEC degrees per column pixel')
-            self.action.args.ccddata.header['CD1_2'] = (
-                cd12, 'RA degrees per row pixel')
-            self.action.args.ccddata.header['CD2_2'] = (
-                cd22, 'DEC degrees per row pixel')
-            self.action.args.ccddata.header['CD3_3'] = (
-                geom['dwout'], 'Wavelength Angstroms per pixel')
-            self.action.args.ccddata.header['LONPOLE'] = (
-                180.0, 'Native longitude of Celestial pole')
-            self.action.args.ccddata.header['LATPOLE'] = (
-                0.0, 'Native latitude of Celestial pole')
+            cube_wcs_header(self.action.args.ccddata.header, geom,
+                            geom_file, self.action.args,
+                            self.config.instrument.ROTOFF, self.logger)
             # write out cube
             self.action.args.ccddata.header['HISTORY'] = log_string
             self.action.args.ccddata.data = out_cube
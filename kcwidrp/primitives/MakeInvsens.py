@@ -6,7 +6,6 @@ from kcwidrp.core.kcwi_plotting import set_plot_lims, save_plot
 from kcwidrp.primitives.kcwi_file_primitives import kcwi_fits_writer, \
     kcwi_fits_reader, strip_fname
 
-from bokeh.plotting import figure, ColumnDataSource
 from scipy.signal import find_peaks
 from scipy.interpolate import interp1d
 from astropy.io import fits as pf
@@ -105,6 +104,8 @@ class MakeInvsens(BasePrimitive):
         stdname = self.action.args.stdname
 
         do_plots = self.config.instrument.plot_level >= 3
+        if do_plots:
+            from bokeh.plotting import figure
 
         # get size
         sz = self.action.args.ccddata.data.shape
@@ -334,6 +335,7 @@ class MakeInvsens(BasePrimitive):
         wlm1 = wgoo1
         # interactively set wavelength limits
         if self.config.instrument.plot_level >= 1:
+            from bokeh.plotting import figure, ColumnDataSource
             print("CHECKING WAVELENGTH LIMITS")
             print("Current WL limits: %.1f - %.1f Angstroms "
                   "(blue vertical lines)" % (wlm0, wlm1))
@@ -429,6 +431,7 @@ class MakeInvsens(BasePrimitive):
                     print("bad line: %s" % lmws)
         # Now interactively identify lines if requested
         if self.config.instrument.plot_level >= 1:
+            from bokeh.plotting import figure
             yran = [np.min(obsspec[wl_good]), np.max(obsspec[wl_good])]
             # source = ColumnDataSource(data=dict(x=w, y=obsspec))
             print("MASKING SHARP FEATURES: ABSORPTION LINES/COSMIC RAYS")
@@ -555,6 +558,7 @@ class MakeInvsens(BasePrimitive):
         prsd = None
         # interactively adjust fit
         if self.config.instrument.plot_level >= 1:
+            from bokeh.plotting import figure
             done = False
             while not done:
                 yran = [np.min(100.*af/area), np.max(100.*af/area)]
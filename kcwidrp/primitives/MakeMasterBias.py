@@ -4,12 +4,10 @@ from kcwidrp.primitives.kcwi_file_primitives import kcwi_fits_reader, \
     kcwi_fits_writer, parse_imsec, strip_fname
 from kcwidrp.core.bokeh_plotting import bokeh_plot
 from kcwidrp.core.kcwi_plotting import save_plot
+from kcwidrp.core.kcwi_combine import combine_frames
 
-from bokeh.plotting import figure
-import ccdproc
 import numpy as np
 from scipy.stats import sigmaclip
-from astropy.stats import mad_std
 import time
 import os
 
@@ -24,7 +22,8 @@ class MakeMasterBias(BaseImg):
     'average' and so cosmic rays may be present, especially in RED channel data.
     A high sigma clipping of 2.0 is used to help with the CRs.
 
-    Uses the ccdproc.combine routine to perform the stacking.
+    Uses the out-of-core kcwi_combine routines to perform the stacking, within
+    the memory budget set by the instrument config parameter stack_mem_limit.
 
     Writes out a \*_mbias.fits file and records a master bias frame in the proc
     table.
@@ -69,21 +68,24 @@ class MakeMasterBias(BaseImg):
         bsec, dsec, tsec, direc, amps, aoff = self.action.args.map_ccd
 
         # loop over amps
-        stack = []
         stackf = []
+        stackp = []
         for bias in combine_list:
             inbias = bias.split('.fits')[0] + '_intb.fits'
             stackf.append(inbias)
-            # using [0] drops the table and leaves just the image
-            stack.append(kcwi_fits_reader(
-                os.path.join(self.context.config.instrument.cwd, 'redux',
-                             inbias))[0])
-
-        stacked = ccdproc.combine(stack, method=method, sigma_clip=True,
-                                  sigma_clip_low_thresh=None,
-                                  sigma_clip_high_thresh=sig_up,
-                                  sigma_clip_func=np.ma.median,
-                                  sigma_clip_dev_func=mad_std)
+            stackp.append(os.path.join(self.context.config.instrument.cwd,
+                                       'redux', inbias))
+
+        # only the first three are needed in memory: the template for the
+        # output and two biases for the read noise
+        # using [0] drops the table and leaves just the image
+        stack = [kcwi_fits_reader(fn)[0] for fn in stackp[:3]]
+
+        stacked, _ = combine_frames(
+            stack[0], stackp, method=method, sig_up=sig_up,
+            mem_limit=self.config.instrument.stack_mem_limit,
+            nthreads=self.config.instrument.stack_nthreads,
+            logger=self.logger)
         stacked.header['IMTYPE'] = self.action.args.new_type
         stacked.header['NSTACK'] = (len(combine_list),
                                     'number of images stacked')
@@ -117,6 +119,7 @@ class MakeMasterBias(BaseImg):
             stacked.header['BIASRN%d' % ia] = \
                 (float("%.3f" % bias_rn), "RN in e- from bias")
             if self.config.instrument.plot_level >= 1:
+                from bokeh.plotting import figure
                 # output filename stub
                 biasfnam = "bias_%05d_%s_amp%d_rdnoise" % \
                           (stacked.header['FRAMENO'],
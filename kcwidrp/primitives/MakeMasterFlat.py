@@ -5,8 +5,6 @@ from kcwidrp.core.kcwi_plotting import get_plot_lims
 from kcwidrp.core.bokeh_plotting import bokeh_plot
 from kcwidrp.core.kcwi_plotting import save_plot
 from kcwidrp.core.bspline import Bspline
-from bokeh.plotting import figure
-from bokeh.models import Range1d
 
 import os
 import time
@@ -257,6 +255,7 @@ class MakeMasterFlat(BaseImg):
             wslfit = np.polyval(wavelinfit, wflat-ww0)
             # plot slope fit
             if self.config.instrument.plot_level >= 1:
+                from bokeh.plotting import figure
                 p = figure(title=plab + ' WAVE SLOPE FIT',
                            x_axis_label='wave px',
                            y_axis_label='counts',
@@ -306,6 +305,8 @@ class MakeMasterFlat(BaseImg):
             xinter = -(resflat[1] - resfit[1]) / (resflat[0] - resfit[0])
             # plot slice profile and fits
             if self.config.instrument.plot_level >= 1:
+                from bokeh.plotting import figure
+                from bokeh.models import Range1d
                 p = figure(title=plab + ' Vignetting',
                            x_axis_label='Slice Pos (px)',
                            y_axis_label='Ratio',
@@ -363,6 +364,7 @@ class MakeMasterFlat(BaseImg):
             buffit = np.polyfit(xbuff, ybuff, 3)
             # plot buffer fit
             if self.config.instrument.plot_level >= 1:
+                from bokeh.plotting import figure
                 p = figure(title=plab + ' Buffer Region',
                            x_axis_label='Slice Pos (px)',
                            y_axis_label='Ratio',
@@ -438,6 +440,8 @@ class MakeMasterFlat(BaseImg):
                 peaks, _ = find_peaks(deriv, height=20)
                 self.logger.info("%d Peak(s) found" % len(peaks))
 
+                from bokeh.plotting import figure
+                from bokeh.models import Range1d
                 p = figure(title=plab +
                            ' Ledge', x_axis_label='Wavelength (A)',
                            y_axis_label='Value',
@@ -613,6 +617,7 @@ class MakeMasterFlat(BaseImg):
             nwaves = 1000
         waves = minwave + (maxwave - minwave) * np.arange(nwaves+1) / nwaves
         if self.config.instrument.plot_level >= 1:
+            from bokeh.plotting import figure
             # output filename stub
             rbfnam = "redblue_%05d_%s_%s_%s" % \
                       (stacked.header['FRAMENO'],
@@ -703,6 +708,7 @@ class MakeMasterFlat(BaseImg):
         if red_zero_cross:
             self.logger.info("Red extension zero crossing detected")
         if self.config.instrument.plot_level >= 1:
+            from bokeh.plotting import figure
             if nqb > 1:
                 # plot blue fits
                 p = figure(
@@ -845,10 +851,12 @@ class MakeMasterFlat(BaseImg):
 
         bkpt = np.min(allx) + np.arange(knots+1) * \
             (np.max(allx) - np.min(allx)) / knots
-        sftall, _ = Bspline.iterfit(allfx, ally, fullbkpt=bkpt)
+        sftall, _ = Bspline.iterfit(allfx, ally, fullbkpt=bkpt,
+                                    logger=self.logger)
         yfitall, _ = sftall.value(allx)
 
         if self.config.instrument.plot_level >= 1:
+            from bokeh.plotting import figure
             # output filename stub
             fltfnam = "flat_%05d_%s_%s_%s" % \
                       (stacked.header['FRAMENO'],
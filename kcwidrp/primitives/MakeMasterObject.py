@@ -1,11 +1,9 @@
 from keckdrpframework.primitives.base_img import BaseImg
 from kcwidrp.primitives.kcwi_file_primitives import kcwi_fits_reader, \
     kcwi_fits_writer, strip_fname  # , get_master_name
+from kcwidrp.core.kcwi_combine import combine_frames
 
 import os
-import ccdproc
-import numpy as np
-from astropy.stats import mad_std
 
 
 class MakeMasterObject(BaseImg):
@@ -19,7 +17,8 @@ class MakeMasterObject(BaseImg):
     If larger than 3, then the method 'average' will be used.  A high sigma
     clipping of 2.0 is used to help with the CRs.
 
-    Uses the ccdproc.combine routine to peform the stacking.
+    Uses the out-of-core kcwi_combine routines to peform the stacking, within
+    the memory budget set by the instrument config parameter stack_mem_limit.
 
     Writes out a \*_mobj.fits file and records a master object frame in the proc
     table, no matter how many frames are combined.
@@ -74,22 +73,21 @@ class MakeMasterObject(BaseImg):
         # get master arc output name
         maname = strip_fname(combine_list[0]) + '_' + suffix + '.fits'
         if self.action.args.min_files > 1:
-            stack = []
             stacko = []
+            stackp = []
             for obj in combine_list:
                 # get object intensity (int) image file name in redux directory
                 stackf = obj.split('.fits')[0] + '_intf.fits'
-                objfn = os.path.join(args.in_directory, stackf)
+                stackp.append(os.path.join(args.in_directory, stackf))
                 stacko.append(stackf)
-                # using [0] gets just the image data
-                stack.append(kcwi_fits_reader(objfn)[0])
-
-            stacked = ccdproc.combine(stack, method=method, sigma_clip=True,
-                                      sigma_clip_low_thresh=None,
-                                      sigma_clip_high_thresh=sig_up,
-                                      sigma_clip_func=np.ma.median,
-                                      sigma_clip_dev_func=mad_std)
-            stacked.unit = stack[0].unit
+
+            # using [0] gets just the image data
+            first_obj = kcwi_fits_reader(stackp[0])[0]
+            stacked, _ = combine_frames(
+                first_obj, stackp, method=method, sig_up=sig_up,
+                mem_limit=self.config.instrument.stack_mem_limit,
+                nthreads=self.config.instrument.stack_nthreads,
+                logger=self.logger)
             stacked.header['IMTYPE'] = args.new_type
             stacked.header['NSTACK'] = (nstack, 'number of images stacked')
             stacked.header['STCKMETH'] = (method, 'method used for stacking')
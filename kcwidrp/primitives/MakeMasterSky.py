@@ -6,14 +6,127 @@ from kcwidrp.core.kcwi_get_std import kcwi_get_std
 from kcwidrp.core.bokeh_plotting import bokeh_plot
 from kcwidrp.core.kcwi_plotting import save_plot
 from kcwidrp.core.bspline import Bspline
-from bokeh.plotting import figure
 
 import os
 import time
+from functools import lru_cache
 import numpy as np
 from scipy.optimize import curve_fit
 from astropy.io import fits
 
+# rows trimmed from each end of the red CCD for the sky fit
+RED_ROW_TRIM = 50
+
+
+@lru_cache(maxsize=4)
+def read_sky_maps(wavemap_path, slicemap_path, posmap_path, mtimes=None):
+    """
+    Read the geometry maps and sort the exposed pixels on wavelength
+
+    An exposed pixel is in a slice (0 - 23), has a non-negative position,
+    and has a wavelength within WAVALL0 - WAVALL1 of the wavelength map.  The
+    exposed pixels are sorted on wavelength once per set of maps, so every
+    frame reduced with the same geometry can select its pixels from the
+    sorted list without sorting again.
+
+    Args:
+        wavemap_path (str): wavelength map image
+        slicemap_path (str): slice map image
+        posmap_path (str): position map image
+        mtimes (tuple): modification times of the maps, part of the cache key
+
+    Returns:
+        dict: flattened 'wave', 'slice', and 'pos' maps, the image 'shape',
+        'posmax', the wavelength keywords of the wavelength map, and
+        'order', the flat indices of the exposed pixels in (stable)
+        wavelength order
+
+    """
+    wavemap = kcwi_fits_reader(wavemap_path)[0]
+    slicemap = kcwi_fits_reader(slicemap_path)[0]
+    posmap = kcwi_fits_reader(posmap_path)[0]
+    wave = np.asarray(wavemap.data, dtype=float).ravel()
+    slc = np.asarray(slicemap.data).ravel()
+    pos = np.asarray(posmap.data).ravel()
+    maps = {
+        'wave': wave, 'slice': slc, 'pos': pos,
+        'shape': posmap.data.shape,
+        'posmax': float(np.nanmax(posmap.data)),
+    }
+    for key in ('WAVGOOD0', 'WAVGOOD1', 'WAVALL0', 'WAVALL1', 'WAVMID'):
+        maps[key] = wavemap.header[key]
+    exposed = ((slc >= 0) & (slc <= 23) & (pos >= 0) &
+               (wave >= maps['WAVALL0']) & (wave <= maps['WAVALL1']))
+    idx = np.nonzero(exposed)[0]
+    maps['order'] = idx[np.argsort(wave[idx], kind='stable')]
+    for key in ('wave', 'slice', 'pos', 'order'):
+        if maps[key].base is not None:
+            maps[key] = maps[key].copy()
+        maps[key].flags.writeable = False
+    return maps
+
+
+def sky_pixels(maps, data, binary_mask, posbuf, camera, dich):
+    """
+    Select the pixels for the sky model in wavelength order
+
+    Args:
+        maps (dict): geometry maps from read_sky_maps
+        data (2D array): object image
+        binary_mask (2D bool array): pixels to leave out of the fit
+        posbuf (int): position buffer at the slice edges for the fit
+        camera (int): 0 for Blue, 1 for Red
+        dich (bool): was the dichroic in?  If so the bad dichroic region of
+            slices 21 - 23 is left out of the fit
+
+    Returns:
+        (qo, fit): flat indices of the finite exposed pixels sorted on
+        wavelength, and a boolean array of which of them are used in the fit
+
+    """
+    order = maps['order']
+    qo = order[np.isfinite(data.ravel()[order])]
+    wave = maps['wave'][qo]
+    slc = maps['slice'][qo]
+    pos = maps['pos'][qo]
+    fit = ((posbuf < pos) & (pos < (maps['posmax'] - posbuf)) &
+           ~binary_mask.ravel()[qo])
+    if dich:
+        if camera == 0:     # Blue
+            fit &= ~((slc > 20) & (wave > 5600.))
+        else:               # Red
+            fit &= ~((slc > 20) & (wave < 5600.))
+    if camera == 1:         # Red: trim junk at ends
+        ny = maps['shape'][0]
+        row = qo // maps['shape'][1]
+        fit &= (row >= RED_ROW_TRIM) & (row <= ny - RED_ROW_TRIM)
+    return qo, fit
+
+
+def sky_breakpoints(waves, nknots):
+    """Evenly spaced b-spline breakpoints over sorted wavelengths"""
+    return waves[0] + np.arange(nknots + 1) * (waves[-1] - waves[0]) / nknots
+
+
+def slice_pixels(maps, data, posbuf, wave_range):
+    """
+    Positions and fluxes of the pixels in each slice within a wavelength range
+
+    Returns:
+        list of (pos, flux) per slice, in image order
+
+    """
+    wave = maps['wave']
+    pos = maps['pos']
+    inside = ((wave_range[0] < wave) & (wave < wave_range[1]) &
+              (posbuf < pos) & (pos < (maps['posmax'] - posbuf)))
+    flat = data.ravel()
+    out = []
+    for si in range(24):
+        sq = np.nonzero(inside & (maps['slice'] == si))[0]
+        out.append((pos[sq], flat[sq]))
+    return out
+
 
 class MakeMasterSky(BaseImg):
     """
@@ -208,42 +321,23 @@ class MakeMasterSky(BaseImg):
 
         groot = strip_fname(tab['filename'][0])
 
-        # Wavelength map image
+        # Wavelength, slice, and position map images
         wmf = groot + '_wavemap.fits'
-        self.logger.info("Reading image: %s" % wmf)
-        wavemap = kcwi_fits_reader(os.path.join(
-            self.config.instrument.cwd, 'redux', wmf))[0]
-
-        # Slice map image
         slf = groot + '_slicemap.fits'
-        self.logger.info("Reading image: %s" % slf)
-        slicemap = kcwi_fits_reader(os.path.join(
-            self.config.instrument.cwd, 'redux', slf))[0]
-
-        # Position map image
         pof = groot + '_posmap.fits'
-        self.logger.info("Reading image: %s" % pof)
-        posmap = kcwi_fits_reader(os.path.join(
-            self.config.instrument.cwd, 'redux', pof))[0]
-        posmax = np.nanmax(posmap.data)
+        map_paths = tuple(os.path.join(self.config.instrument.cwd, 'redux', f)
+                          for f in (wmf, slf, pof))
+        self.logger.info("Reading images: %s, %s, %s" % (wmf, slf, pof))
+        maps = read_sky_maps(*map_paths, mtimes=tuple(
+            os.path.getmtime(f) for f in map_paths))
+        posmap = maps['pos']
+        posmax = maps['posmax']
         posbuf = int(10. / self.action.args.xbinsize)
 
-        ny = posmap.data.shape[0]
-
-        if self.action.args.camera == 1:    # Red
-            # Get ymap for trimming junk at ends
-            ymap = posmap.copy()
-            for i in range(ny):
-                ymap.data[i, :] = float(i)
-        else:
-            ymap = None
-
         # wavelength region
-        wavegood0 = wavemap.header['WAVGOOD0']
-        wavegood1 = wavemap.header['WAVGOOD1']
-        waveall0 = wavemap.header['WAVALL0']
-        waveall1 = wavemap.header['WAVALL1']
-        wavemid = wavemap.header['WAVMID']
+        wavegood0 = maps['WAVGOOD0']
+        wavegood1 = maps['WAVGOOD1']
+        wavemid = maps['WAVMID']
 
         # get image size
         sm_sz = self.action.args.ccddata.data.shape
@@ -258,7 +352,7 @@ class MakeMasterSky(BaseImg):
                 self.logger.info("Reading sky mask file: %s"
                                  % self.action.args.skymask)
                 hdul = fits.open(self.action.args.skymask)
-                binary_mask = hdul[0].data
+                binary_mask = hdul[0].data.astype(bool)
                 # verify size match
                 bm_sz = binary_mask.shape
                 if bm_sz[0] != sm_sz[0] or bm_sz[1] != sm_sz[1]:
@@ -289,12 +383,9 @@ class MakeMasterSky(BaseImg):
             std_sl_max_flx_data = None
 
             self.logger.info("Finding the std max slice")
-            for si in range(24):
-                sq = [i for i, v in enumerate(slicemap.data.flat) if v == si and
-                      std_wav_ran[0] < wavemap.data.flat[i] < std_wav_ran[1] and
-                      posbuf < posmap.data.flat[i] < (posmax - posbuf)]
-                xplt = posmap.data.flat[sq]
-                yplt = self.action.args.ccddata.data.flat[sq]
+            for si, (xplt, yplt) in enumerate(slice_pixels(
+                    maps, self.action.args.ccddata.data, posbuf,
+                    std_wav_ran)):
                 sig = float(np.nanstd(yplt))
                 self.logger.info("Slice %d - StDev = %.2f" % (si, sig))
                 if sig > std_sl_sig_max:
@@ -319,12 +410,13 @@ class MakeMasterSky(BaseImg):
             auto_cont_width = 5. * res[2]
 
             # Mask standard from sky calculation
-            for i, v in enumerate(binary_mask.flat):
-                if std_pos_mask_0 < posmap.data.flat[i] < std_pos_mask_1:
-                    binary_mask.flat[i] = True
+            binary_mask = binary_mask | ((std_pos_mask_0 < posmap) &
+                                         (posmap < std_pos_mask_1)).reshape(
+                sm_sz)
 
             # plot, if requested
             if self.config.instrument.plot_level >= 1:
+                from bokeh.plotting import figure
                 xx = np.arange(np.min(std_sl_max_pos_data),
                                np.max(std_sl_max_pos_data), 1)
                 yy = gaus(xx, res[0], res[1], res[2])
@@ -366,14 +458,9 @@ class MakeMasterSky(BaseImg):
                 self.logger.info("Finding the continuum source automatically")
                 auto_mask_type = "AutoCont"
 
-                for si in range(24):
-                    sq = [i for i, v in enumerate(slicemap.data.flat) if
-                          v == si and
-                          con_wav_ran[0] < wavemap.data.flat[i] <
-                          con_wav_ran[1] and
-                          posbuf < posmap.data.flat[i] < (posmax - posbuf)]
-                    xplt = posmap.data.flat[sq]
-                    yplt = self.action.args.ccddata.data.flat[sq]
+                for si, (xplt, yplt) in enumerate(slice_pixels(
+                        maps, self.action.args.ccddata.data, posbuf,
+                        con_wav_ran)):
                     sig = float(np.nanstd(yplt))
                     self.logger.info("Slice %d - StDev = %.2f" % (si, sig))
                     if sig > con_sl_sig_max:
@@ -407,6 +494,7 @@ class MakeMasterSky(BaseImg):
 
                 # plot, if requested
                 if self.config.instrument.plot_level >= 1:
+                    from bokeh.plotting import figure
                     xx = np.arange(np.min(con_sl_max_pos_data),
                                    np.max(con_sl_max_pos_data), 1)
                     yy = gaus(xx, res[0], res[1], res[2])
@@ -461,80 +549,38 @@ class MakeMasterSky(BaseImg):
                               con_pos_mask_1, con_pos_mask_up_1))
 
             # Mask all but local sky from sky calculation
-            for i, v in enumerate(binary_mask.flat):
-                if (0 < posmap.data.flat[i] < con_pos_mask_lo_0) or \
-                   (con_pos_mask_0 < posmap.data.flat[i] < con_pos_mask_1) or \
-                   (con_pos_mask_up_1 < posmap.data.flat[i] < posmax):
-                    binary_mask.flat[i] = True
+            binary_mask = binary_mask | (
+                ((0 < posmap) & (posmap < con_pos_mask_lo_0)) |
+                ((con_pos_mask_0 < posmap) & (posmap < con_pos_mask_1)) |
+                ((con_pos_mask_up_1 < posmap) & (posmap < posmax))).reshape(
+                sm_sz)
 
         # count masked pixels
-        tmsk = len(np.nonzero(np.where(binary_mask.flat, True, False))[0])
+        tmsk = np.count_nonzero(binary_mask)
         self.logger.info("Number of pixels masked = %d" % tmsk)
 
-        finiteflux = np.isfinite(self.action.args.ccddata.data.flat)
-
-        # get un-masked points mapped to exposed regions on CCD
-        # handle dichroic bad region
-        if self.action.args.dich:
-            if self.action.args.camera == 0:    # Blue
-                q = [i for i, v in enumerate(slicemap.data.flat)
-                     if 0 <= v <= 23 and
-                     posbuf < posmap.data.flat[i] < (posmax - posbuf) and
-                     waveall0 <= wavemap.data.flat[i] <= waveall1 and
-                     not (v > 20 and wavemap.data.flat[i] > 5600.) and
-                     finiteflux[i] and not binary_mask.flat[i]]
-            else:                               # Red
-                q = [i for i, v in enumerate(slicemap.data.flat)
-                     if 0 <= v <= 23 and
-                     posbuf < posmap.data.flat[i] < (posmax - posbuf) and
-                     waveall0 <= wavemap.data.flat[i] <= waveall1 and
-                     not (v > 20 and wavemap.data.flat[i] < 5600.) and
-                     finiteflux[i] and not binary_mask.flat[i] and
-                     50 <= ymap.data.flat[i] <= (ny - 50)]
-        else:
-            if self.action.args.camera == 0:    # Blue
-                q = [i for i, v in enumerate(slicemap.data.flat)
-                     if 0 <= v <= 23 and
-                     posbuf < posmap.data.flat[i] < (posmax - posbuf) and
-                     waveall0 <= wavemap.data.flat[i] <= waveall1 and
-                     finiteflux[i] and not binary_mask.flat[i]]
-            else:
-                q = [i for i, v in enumerate(slicemap.data.flat)
-                     if 0 <= v <= 23 and
-                     posbuf < posmap.data.flat[i] < (posmax - posbuf) and
-                     waveall0 <= wavemap.data.flat[i] <= waveall1 and
-                     finiteflux[i] and not binary_mask.flat[i] and
-                     50 <= ymap.data.flat[i] <= (ny - 50)]
-
-        # get all points mapped to exposed regions on the CCD (for output)
-        qo = [i for i, v in enumerate(slicemap.data.flat)
-              if 0 <= v <= 23 and posmap.data.flat[i] >= 0 and
-              waveall0 <= wavemap.data.flat[i] <= waveall1 and
-              finiteflux[i]]
-
-        # extract relevant image values
-        fluxes = self.action.args.ccddata.data.flat[q]
-
-        # relevant wavelengths
-        waves = wavemap.data.flat[q]
-        self.logger.info("Number of fit waves = %d" % len(waves))
+        # get all finite points mapped to exposed regions on the CCD (for
+        # output) in wavelength order, and which of them are un-masked for
+        # the fit (handles dichroic bad region and red end trim)
+        qo, fit = sky_pixels(maps, self.action.args.ccddata.data,
+                             binary_mask, posbuf, self.action.args.camera,
+                             self.action.args.dich)
 
-        # keep output wavelengths
-        owaves = wavemap.data.flat[qo]
+        # output wavelengths, already sorted
+        owaves = maps['wave'][qo]
         self.logger.info("Number of output waves = %d" % len(owaves))
 
-        # sort on wavelength
-        s = np.argsort(waves)
-        waves = waves[s]
-        fluxes = fluxes[s]
+        # fit wavelengths and image values
+        waves = owaves[fit]
+        fluxes = self.action.args.ccddata.data.ravel()[qo[fit]]
+        self.logger.info("Number of fit waves = %d" % len(waves))
 
         # knots per pixel
         knotspp = self.config.instrument.KNOTSPP
         n = int(sm_sz[0] * knotspp)
 
         # calculate break points for b splines
-        bkpt = np.min(waves) + np.arange(n+1) * \
-            (np.max(waves) - np.min(waves)) / n
+        bkpt = sky_breakpoints(waves, n)
 
         # log
         self.logger.info("Nknots = %d, min = %.2f, max = %.2f (A)" %
@@ -542,9 +588,11 @@ class MakeMasterSky(BaseImg):
 
         # do bspline fit
         sft0, gmask = Bspline.iterfit(waves, fluxes, fullbkpt=bkpt,
-                                      upper=1, lower=1)
-        gp = [i for i, v in enumerate(gmask) if v]
-        yfit1, _ = sft0.value(waves)
+                                      upper=1, lower=1, logger=self.logger)
+        gp = np.nonzero(gmask)[0]
+        # evaluate once at all output wavelengths, fit points are a subset
+        yfit, _ = sft0.value(owaves)
+        yfit1 = yfit[fit]
         self.logger.info("Number of good points = %d" % len(gp))
 
         # check result
@@ -556,21 +604,19 @@ class MakeMasterSky(BaseImg):
                 if n == 8000:
                     n = 5000
                 # calculate breakpoints
-                bkpt = np.min(waves) + np.arange(n + 1) * \
-                    (np.max(waves) - np.min(waves)) / n
+                bkpt = sky_breakpoints(waves, n)
                 # log
                 self.logger.info("Nknots = %d, min = %.2f, max = %.2f (A)" %
                                  (n, np.min(bkpt), np.max(bkpt)))
                 # do bspline fit
                 sft0, gmask = Bspline.iterfit(waves, fluxes, fullbkpt=bkpt,
-                                              upper=1, lower=1)
-                yfit1, _ = sft0.value(waves)
+                                              upper=1, lower=1,
+                                              logger=self.logger)
+                yfit, _ = sft0.value(owaves)
+                yfit1 = yfit[fit]
             if np.max(yfit1) <= 0:
                 self.logger.warning("B-spline final failure, sky is zero")
 
-        # get values at original wavelengths
-        yfit, _ = sft0.value(owaves)
-
         # for plotting
         gwaves = waves[gp]
         gfluxes = fluxes[gp]
@@ -584,6 +630,7 @@ class MakeMasterSky(BaseImg):
 
         # plot, if requested
         if self.config.instrument.plot_level >= 1:
+            from bokeh.plotting import figure
             # output filename stub
             skyfnam = "sky_%05d_%s_%s_%s" % \
                      (self.action.args.ccddata.header['FRAMENO'],
@@ -611,7 +658,7 @@ class MakeMasterSky(BaseImg):
 
         # create sky image
         sky = np.zeros(self.action.args.ccddata.data.shape, dtype=float)
-        sky.flat[qo] = yfit
+        sky.ravel()[qo] = yfit
 
         # store original data, header
         img = self.action.args.ccddata.data
@@ -0,0 +1,225 @@
+from keckdrpframework.primitives.base_primitive import BasePrimitive
+from keckdrpframework.models.arguments import Arguments
+from kcwidrp.primitives.kcwi_file_primitives import kcwi_fits_writer, \
+    strip_fname, KCCDData
+from kcwidrp.primitives.MakeCube import cube_wcs_header
+from kcwidrp.primitives.CubeImage import cube_image
+
+import os
+import pickle
+import warnings
+from datetime import datetime
+from functools import lru_cache
+import numpy as np
+from scipy.ndimage import map_coordinates
+
+# directory of the previews, in the output directory
+DEFAULT_QUICKLOOK_DIRECTORY = 'quicklook'
+
+
+def quicklook_args(args):
+    """
+    Arguments for the quick-look reduction of a frame
+
+    The quick look works on a single precision copy of the image and of its
+    header, without uncertainty, mask, or flags, so that the arguments of the
+    full reduction queued behind it are left untouched.
+
+    Args:
+        args (Arguments): arguments of the ingested frame
+
+    Returns:
+        Arguments: a copy of args, with quicklook set
+
+    """
+    ql_args = Arguments(**{key: args[key] for key in args.iter_kw()})
+    ccddata = args.ccddata
+    ql_args.ccddata = KCCDData(ccddata.data.astype(np.float32),
+                               meta=ccddata.header.copy(), unit=ccddata.unit)
+    ql_args.quicklook = True
+    return ql_args
+
+
+@lru_cache(maxsize=4)
+def quicklook_maps(geom_file, wavebin=1, mtime=None):
+    """
+    Read a geometry solution and map each spaxel of its cube on the image
+
+    The source coordinates of every spaxel of the 24 slices are evaluated
+    once per geometry file, so every frame reduced with the same geometry
+    is warped with a single interpolation.  With wavebin > 1 the cube is
+    sampled at the centers of bins of wavebin wavelength pixels.
+
+    Args:
+        geom_file (str): \\*_geom.pkl file of SolveGeom
+        wavebin (int): wavelength pixels of the full cube per preview pixel
+        mtime (float): modification time of geom_file, part of the cache key
+
+    Returns:
+        dict: the geometry solution 'geom', 'coords', the (2, ny, nx, 24)
+        row and column of each spaxel in the rectified image (outside the
+        image for spaxels that do not sample their slice), and 'valid', the
+        (ny, nx, 24) spaxels that sample their slice
+
+    """
+    with open(geom_file, 'rb') as ifile:
+        geom = pickle.load(ifile)
+    xsize = geom['xsize']
+    ny = geom['ysize'] // wavebin
+    # output rows at the centers of the wavelength bins
+    yout = np.arange(ny) * wavebin + (wavebin - 1) / 2.
+    coords = np.empty((2, ny, xsize, 24), dtype=np.float32)
+    valid = np.empty((ny, xsize, 24), dtype=bool)
+    for isl in range(24):
+        xl0 = geom['xl0'][isl]
+        xl1 = geom['xl1'][isl]
+        xy = geom['tform'][isl].grid(np.arange(xsize), yout,
+                                     dtype=np.float32)
+        valid[:, :, isl] = (xy[:, :, 0] >= 0) & (xy[:, :, 0] <= xl1 - xl0 - 1)
+        coords[0, :, :, isl] = xy[:, :, 1]
+        coords[1, :, :, isl] = np.where(valid[:, :, isl], xy[:, :, 0] + xl0,
+                                        -2.)
+    return {'geom': geom, 'coords': coords, 'valid': valid}
+
+
+def warp_quicklook(img, maps):
+    """
+    Warp a rectified image into a cube with linear interpolation
+
+    Args:
+        img (ndarray): gain corrected, rectified image
+        maps (dict): coordinate maps, see quicklook_maps
+
+    Returns:
+        ndarray: (ny, nx, 24) single precision cube
+
+    """
+    return map_coordinates(np.asarray(img, dtype=np.float32), maps['coords'],
+                           output=np.float32, order=1, mode='constant',
+                           cval=0., prefilter=False)
+
+
+def median_sky(cube, valid):
+    """
+    Sky spectrum of a cube, the median of its spaxels at each wavelength
+
+    Args:
+        cube (ndarray): (ny, nx, 24) cube
+        valid (ndarray): spaxels that sample their slice
+
+    Returns:
+        ndarray: sky spectrum, one value per wavelength
+
+    """
+    planes = np.where(valid, cube, np.nan).reshape(cube.shape[0], -1)
+    with warnings.catch_warnings():
+        # wavelengths without any spaxel on a slice have no sky
+        warnings.simplefilter('ignore', RuntimeWarning)
+        sky = np.nanmedian(planes, axis=1)
+    return np.nan_to_num(sky, copy=False)
+
+
+class MakeQuickLookCube(BasePrimitive):
+    """
+    Make a preview data cube of an object frame.
+
+    Run by the RTI pipeline on the overscan subtracted, trimmed, gain
+    corrected, and rectified frame, before the full reduction, so that a
+    cube is available seconds after readout.  Compared to MakeCube the image
+    is warped in single precision, with linear interpolation, from
+    coordinate maps that are computed once per geometry file, and
+    optionally sampled at a coarser wavelength step.  There is no bias,
+    dark, flat, or illumination correction, and the sky is the median
+    spectrum of the spaxels of the cube.
+
+    Uses the following configuration parameters:
+
+        * quicklook_wavebin: wavelength pixels per preview pixel.  Default 1.
+        * quicklook_skysub: subtract the median sky spectrum?
+        * quicklook_directory: directory of the previews, in the output
+          directory.  Default ``quicklook``.
+
+    Writes out \\*_icube.fits and \\*_icube_2d.fits in the preview directory
+    and nothing else; the proc table is not updated.
+
+    """
+
+    def __init__(self, action, context):
+        BasePrimitive.__init__(self, action, context)
+        self.logger = context.pipeline_logger
+
+    def _pre_condition(self):
+        """Checks if we have a geometry solution"""
+        tab = self.context.proctab.search_proctab(
+            frame=self.action.args.ccddata, target_type='MARC', nearest=True)
+        if not len(tab):
+            self.logger.warning("No reference geometry, "
+                                "no quick-look cube")
+            self.action.new_event = None
+            return False
+        ofn = strip_fname(tab['filename'][0]) + "_geom.pkl"
+        self.action.args.geom_file = os.path.join(
+            self.config.instrument.cwd,
+            self.config.instrument.output_directory, ofn)
+        if not os.path.exists(self.action.args.geom_file):
+            self.logger.warning("Geometry file not found: %s" %
+                                self.action.args.geom_file)
+            self.action.new_event = None
+            return False
+        return True
+
+    def _perform(self):
+        log_string = MakeQuickLookCube.__module__
+        geom_file = self.action.args.geom_file
+        wavebin = max(int(self.config.instrument.quicklook_wavebin or 1), 1)
+        maps = quicklook_maps(geom_file, wavebin, os.path.getmtime(geom_file))
+        geom = maps['geom']
+        ccddata = self.action.args.ccddata
+
+        cube = warp_quicklook(ccddata.data, maps)
+        skysub = bool(self.config.instrument.quicklook_skysub)
+        if skysub:
+            sky = median_sky(cube, maps['valid'])
+            cube -= np.where(maps['valid'], sky[:, None, None],
+                             np.float32(0.))
+        ccddata.header['SKYCOR'] = (skysub, 'sky corrected?')
+        # Rotate RED data by 180 to align with Blue
+        if 'RED' in ccddata.header['CAMERA'].upper():
+            cube = np.rot90(cube, 2, (1, 2))
+        ccddata.data = cube
+
+        cube_wcs_header(ccddata.header, geom, geom_file, self.action.args,
+                        self.config.instrument.ROTOFF, self.logger)
+        if wavebin > 1:
+            ccddata.header['CRVAL3'] = (
+                geom['wave0out'] + geom['dwout'] * (wavebin - 1) / 2.,
+                'Wavelength zeropoint')
+            ccddata.header['CD3_3'] = (geom['dwout'] * wavebin,
+                                       'Wavelength Angstroms per pixel')
+        ccddata.header['QUICKLK'] = (True, 'Quick-look preview?')
+        ccddata.header['QLWVBIN'] = (wavebin, 'Quick-look wavelength binning')
+        ccddata.header['HISTORY'] = log_string
+
+        out_dir = os.path.join(
+            self.config.instrument.cwd,
+            self.config.instrument.output_directory,
+            self.config.instrument.quicklook_directory or
+            DEFAULT_QUICKLOOK_DIRECTORY)
+        os.makedirs(out_dir, exist_ok=True)
+        kcwi_fits_writer(ccddata, output_file=self.action.args.name,
+                         output_dir=out_dir, suffix="icube")
+        kcwi_fits_writer(cube_image(ccddata, self.logger),
+                         output_file=self.action.args.name,
+                         output_dir=out_dir, suffix="icube_2d")
+        self.action.args.quicklook_directory = out_dir
+
+        ingest_time = getattr(self.action.args, 'ingest_time', None)
+        if ingest_time is not None:
+            self.logger.info("Quick-look cube of %s ready %.1f s after "
+                             "ingestion" % (strip_fname(self.action.args.name),
+                                            (datetime.utcnow() -
+                                             ingest_time).total_seconds()))
+        self.logger.info(log_string)
+
+        return self.action.args
+    # END: class MakeQuickLookCube()
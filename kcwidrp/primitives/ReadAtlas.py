@@ -3,8 +3,6 @@ from kcwidrp.core.bokeh_plotting import bokeh_plot
 from kcwidrp.core.kcwi_plotting import save_plot
 from kcwidrp.primitives.kcwi_file_primitives import plotlabel
 
-from bokeh.plotting import figure
-from bokeh.models import Range1d
 import pkg_resources
 import os
 from astropy.io import fits as pf
@@ -173,6 +171,8 @@ class ReadAtlas(BasePrimitive):
             offset_wav = calc_offset_wav
         plab = plotlabel(self.action.args)
         if self.config.instrument.plot_level >= 1:
+            from bokeh.plotting import figure
+            from bokeh.models import Range1d
             # Plot
             p = figure(title=plab + "ATLAS OFFSET = %d px" % offset_pix,
                        x_axis_label="Offset(px)", y_axis_label="X-corr",
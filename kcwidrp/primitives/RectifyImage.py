@@ -14,7 +14,8 @@ class RectifyImage(BasePrimitive):
     no geometric transformation is required.
 
     Writes out a \*_int.fits image regardless of which channel is being
-    processed and adds an entry in the proc table.
+    processed and adds an entry in the proc table, except for the quick-look
+    frames of the RTI pipeline.
 
     """
 
@@ -116,6 +117,10 @@ class RectifyImage(BasePrimitive):
         self.action.args.ccddata.header['HISTORY'] = log_string
         self.logger.info(log_string)
 
+        # quick-look frames are only written as cubes
+        if getattr(self.action.args, 'quicklook', False):
+            return self.action.args
+
         # write out int image
         kcwi_fits_writer(self.action.args.ccddata,
                          table=self.action.args.table,
@@ -2,15 +2,15 @@ from keckdrpframework.primitives.base_primitive import BasePrimitive
 from kcwidrp.primitives.kcwi_file_primitives import kcwi_fits_writer
 
 import numpy as np
-from astroscrappy import detect_cosmics
+from kcwidrp.core.kcwi_cosmics import detect_cosmics_tiled
 
 
 class RemoveCosmicRays(BasePrimitive):
     """
     Remove cosmic rays and generate a flag image recording their location.
 
-    Uses astroscrappy to detect and flag cosmic rays.  Updates the following
-    FITS header keywords:
+    Uses astroscrappy to detect and flag cosmic rays, run on overlapping bands
+    of rows in parallel.  Updates the following FITS header keywords:
 
         * CRCLEAN: set to ``True`` if operation performed.
         * NCRCLEAN: set to the number of cosmic ray pixels cleaned.
@@ -19,6 +19,7 @@ class RemoveCosmicRays(BasePrimitive):
 
         * saveintims: if set to ``True`` write out a CR cleaned version of image in \*_crr.fits.  Defaults to ``False``.
         * CRR_MINEXPTIME - exposure time below which no CR cleaning is done.
+        * CRR_NTHREADS - number of threads (and bands) for CR cleaning, 0 for all CPUs.
         * CRR\_\* - see kcwi.cfg file for parameters controlling CR cleaning.
 
     Updates image in returned arguments with CR cleaned image and adds flags
@@ -73,8 +74,10 @@ class RemoveCosmicRays(BasePrimitive):
                 if self.action.args.ccddata.header['TTIME'] < 300.:
                     sigclip = 10.
 
-            mask, clean = detect_cosmics(
-                self.action.args.ccddata.data, gain=1.0, readnoise=read_noise,
+            mask, clean = detect_cosmics_tiled(
+                self.action.args.ccddata.data,
+                nthreads=self.config.instrument.CRR_NTHREADS,
+                gain=1.0, readnoise=read_noise,
                 psffwhm=self.config.instrument.CRR_PSFFWHM,
                 sigclip=sigclip,
                 sigfrac=self.config.instrument.CRR_SIGFRAC,
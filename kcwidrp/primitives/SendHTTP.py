@@ -1,11 +1,12 @@
 import os
-import requests
-import time
 
 from keckdrpframework.primitives.base_primitive import BasePrimitive
-from kcwidrp.primitives.kcwi_file_primitives import kcwi_fits_writer, \
-                                                    kcwi_fits_reader, \
-                                                    strip_fname
+from kcwidrp.primitives.kcwi_file_primitives import strip_fname
+from kcwidrp.core.kcwi_rti_client import client_from_config
+
+# default ingest type of the quick-look previews, never the one of the full
+# reduction, so that a preview is not archived as its product
+QUICKLOOK_INGESTTYPE = 'quicklook'
 
 
 class SendHTTP(BasePrimitive):
@@ -13,7 +14,7 @@ class SendHTTP(BasePrimitive):
     def __init__(self, action, context):
         BasePrimitive.__init__(self, action, context)
         self.logger = context.pipeline_logger
-    
+
     def _pre_condition(self):
         self.user = self.config.rti.rti_user
         self.pw = self.config.rti.rti_pass
@@ -22,55 +23,59 @@ class SendHTTP(BasePrimitive):
             return False
         return True
 
+    def get_client(self):
+        """The RTI client of the context, started on first use"""
+        client = getattr(self.context, 'rti_client', None)
+        if client is None:
+            client = client_from_config(self.config, logger=self.logger)
+            self.context.rti_client = client
+        return client
+
     def _perform(self):
 
         if not self.action.args.ccddata.header['KOAID']:
             self.logger.error(f"Encountered a file with no KOA ID: {self.action.args.name}")
             return self.action.args
-        
-        data_directory = os.path.join(self.config.rti.cwd,
-                                      self.config.rti.output_directory)
-        
-        self.logger.info(f"Alerting RTI that {strip_fname(self.action.args.name)} is ready for ingestion")
 
-        url = self.config.rti.rti_url
+        koaid = self.action.args.ccddata.header['KOAID']
+        data_directory = os.path.join(self.config.instrument.cwd,
+                                      self.config.instrument.output_directory)
+        ingesttype = self.config.rti.rti_ingesttype
+        reingest = self.config.rti.rti_reingest
+        # KOA IDs with a published preview
+        previews = getattr(self.context, 'rti_previews', None)
+        if previews is None:
+            previews = self.context.rti_previews = set()
+        # previews of the quick-look reduction are in their own directory,
+        # with their own ingest type
+        if getattr(self.action.args, 'quicklook', False):
+            data_directory = getattr(self.action.args,
+                                     'quicklook_directory', None)
+            if data_directory is None:
+                self.logger.warning(f"No preview of {strip_fname(self.action.args.name)}, RTI not alerted")
+                return self.action.args
+            ingesttype = self.config.rti.rti_quicklook_ingesttype or \
+                QUICKLOOK_INGESTTYPE
+            previews.add(koaid)
+            self.logger.info(f"Alerting RTI that the preview of {strip_fname(self.action.args.name)} is ready for ingestion")
+        else:
+            # the full reduction replaces the preview
+            if koaid in previews:
+                reingest = True
+                previews.discard(koaid)
+            self.logger.info(f"Alerting RTI that {strip_fname(self.action.args.name)} is ready for ingestion")
+
         data = {
             'instrument': 'KCWI',
-            'koaid': self.action.args.ccddata.header['KOAID'],
-            'ingesttype': self.config.rti.rti_ingesttype,
+            'koaid': koaid,
+            'ingesttype': ingesttype,
             'datadir': str(data_directory),
             'start': str(self.action.args.ingest_time),
-            'reingest': self.config.rti.rti_reingest,
+            'reingest': reingest,
             'testonly': self.config.rti.rti_testonly,
             'dev': self.config.rti.rti_dev
         }
-        
-        attempts = 0
-        limit = self.config.rti.rti_attempts
-        while attempts < limit:
-            res = self.get_url(url, data)
-            if res is None:
-                t = self.config.rti.rti_retry_time
-                attempts += 1
-                self.logger.error(f"Waiting {t} seconds to attempt again... ({attempts}/{limit})")
-                time.sleep(t)
-            else:
-                self.logger.info(f"Post returned status code {res.status_code}")
-                return self.action.args
-        
-        self.logger.error(f"Post attempted {limit} times and got no response.")
-        self.logger.error("Aborting.")
+
+        # sent by the client thread, the event loop does not wait for it
+        self.get_client().submit(data)
         return self.action.args
-    
-    def get_url(self, url, data):
-        try:
-            res = requests.get(url, params = data, auth=(
-                                                        self.user,
-                                                        self.pw
-                                                        ))
-            self.logger.info(f"Sending {res.request.url}")
-        except requests.exceptions.RequestException as e:
-            self.logger.error(f"Error caught while posting to {url}:")
-            self.logger.error(e)
-            return None
-        return res
@@ -5,7 +5,6 @@ from kcwidrp.core.kcwi_plotting import set_plot_lims, save_plot
 import os
 import numpy as np
 from scipy.interpolate import interpolate
-from bokeh.plotting import figure
 from astropy.io import fits as pf
 
 
@@ -45,6 +44,8 @@ class SolveAIT(BasePrimitive):
         log_string = SolveAIT.__module__
 
         do_plot = (self.config.instrument.plot_level >= 1)
+        if do_plot:
+            from bokeh.plotting import figure
 
         # Get some geometry constraints
         goody0 = 0
@@ -2,6 +2,7 @@ from keckdrpframework.primitives.base_primitive import BasePrimitive
 from kcwidrp.core.bokeh_plotting import bokeh_plot
 from kcwidrp.core.kcwi_plotting import get_plot_lims, oplot_slices, \
     set_plot_lims, save_plot
+from kcwidrp.core.kcwi_plot_queue import PlotSpec
 from kcwidrp.primitives.GetAtlasLines import get_line_window, gaus
 from kcwidrp.primitives.kcwi_file_primitives import plotlabel
 
@@ -11,8 +12,6 @@ import scipy as sp
 from scipy.optimize import curve_fit
 from scipy.interpolate import interpolate
 from scipy.stats import sigmaclip
-from bokeh.plotting import figure
-from bokeh.models import Range1d, LinearAxis
 import time
 
 
@@ -57,6 +56,9 @@ class SolveArcs(BasePrimitive):
         # plot control booleans
         master_inter = (self.config.instrument.plot_level >= 2)
         do_inter = (self.config.instrument.plot_level >= 3)
+        if master_inter:
+            from bokeh.plotting import figure
+            from bokeh.models import Range1d, LinearAxis
         plab = plotlabel(self.action.args)
         # output control
         verbose = (self.config.instrument.verbose > 1)
@@ -477,10 +479,10 @@ class SolveArcs(BasePrimitive):
                     ptitle = plab + "COEF %d VALUES <C%d> = " \
                                     "%.2f +- %.2f" % (cn, cn, cf_av, cf_st)
                 self.logger.info(ptitle)
-                p = figure(title=ptitle, x_axis_label="Bar #",
-                           y_axis_label="Coef %d (%s)" % (cn, ylabs[ic]),
-                           plot_width=self.config.instrument.plot_width,
-                           plot_height=self.config.instrument.plot_height)
+                p = PlotSpec(title=ptitle, x_axis_label="Bar #",
+                             y_axis_label="Coef %d (%s)" % (cn, ylabs[ic]),
+                             plot_width=self.config.instrument.plot_width,
+                             plot_height=self.config.instrument.plot_height)
 
                 p.diamond(list(range(nbars)), coef, size=8)
                 xlim = [-1, nbars]
@@ -488,7 +490,7 @@ class SolveArcs(BasePrimitive):
                 p.xgrid.grid_line_color = None
                 oplot_slices(p, ylim)
                 set_plot_lims(p, xlim=xlim, ylim=ylim)
-                bokeh_plot(p, self.context.bokeh_session)
+                bokeh_plot(p.to_bokeh(), self.context.bokeh_session)
                 if self.config.instrument.plot_level >= 2:
                     input("Next? <cr>: ")
                 else:
@@ -502,10 +504,10 @@ class SolveArcs(BasePrimitive):
         ptitle = plab + \
             "FIT STATS <Nlns> = %.1f +- %.1f" % (self.action.args.av_bar_nls,
                                                  self.action.args.st_bar_nls)
-        p = figure(title=ptitle, x_axis_label="Bar #",
-                   y_axis_label="N Lines",
-                   plot_width=self.config.instrument.plot_width,
-                   plot_height=self.config.instrument.plot_height)
+        p = PlotSpec(title=ptitle, x_axis_label="Bar #",
+                     y_axis_label="N Lines",
+                     plot_width=self.config.instrument.plot_width,
+                     plot_height=self.config.instrument.plot_height)
         p.diamond(list(range(nbars)), bar_nls, size=8)
         xlim = [-1, nbars]
         ylim = get_plot_lims(bar_nls)
@@ -528,7 +530,7 @@ class SolveArcs(BasePrimitive):
         oplot_slices(p, ylim)
         set_plot_lims(p, xlim=xlim, ylim=ylim)
         if self.config.instrument.plot_level >= 1:
-            bokeh_plot(p, self.context.bokeh_session)
+            bokeh_plot(p.to_bokeh(), self.context.bokeh_session)
             if self.config.instrument.plot_level >= 2:
                 input("Next? <cr>: ")
             else:
@@ -546,9 +548,10 @@ class SolveArcs(BasePrimitive):
         ptitle = plab + \
             "FIT STATS <RMS> = %.3f +- %.3f" % (self.action.args.av_bar_sig,
                                                 self.action.args.st_bar_sig)
-        p = figure(title=ptitle, x_axis_label="Bar #", y_axis_label="RMS (A)",
-                   plot_width=self.config.instrument.plot_width,
-                   plot_height=self.config.instrument.plot_height)
+        p = PlotSpec(title=ptitle, x_axis_label="Bar #",
+                     y_axis_label="RMS (A)",
+                     plot_width=self.config.instrument.plot_width,
+                     plot_height=self.config.instrument.plot_height)
         p.diamond(list(range(nbars)), bar_sig, size=8)
         xlim = [-1, nbars]
         ylim = get_plot_lims(bar_sig)
@@ -568,7 +571,7 @@ class SolveArcs(BasePrimitive):
         oplot_slices(p, ylim)
         set_plot_lims(p, xlim=xlim, ylim=ylim)
         if self.config.instrument.plot_level >= 1:
-            bokeh_plot(p, self.context.bokeh_session)
+            bokeh_plot(p.to_bokeh(), self.context.bokeh_session)
             if self.config.instrument.plot_level >= 2:
                 input("Next? <cr>: ")
             else:
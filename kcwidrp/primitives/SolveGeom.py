@@ -22,7 +22,9 @@ class SolveGeom(BasePrimitive):
 
     Forward and inverse transforms, along with all the parameters for the
     geometric fit are written out as a python pickled dictionary in a
-    \*_geom.pkl file.
+    \*_geom.pkl file.  The inverse transform coefficients are also stored as
+    y-by-x coefficient grids, so that derivatives of the wavelength solution
+    can be evaluated in closed form (see GenerateMaps.py).
 
     """
 
@@ -142,6 +144,7 @@ class SolveGeom(BasePrimitive):
         xl1_out = []
         tform_list = []
         invtf_list = []
+        invcoef_list = []
         # Loop over 24 slices
         for isl in range(0, 24):
             # Get control points
@@ -188,6 +191,7 @@ class SolveGeom(BasePrimitive):
             # Store for output
             tform_list.append(tform)
             invtf_list.append(invtf)
+            invcoef_list.append(invtf.coefficient_grids())
         # Pixel scales
         pxscl = self.config.instrument.PIXSCALE * self.action.args.xbinsize
         ifunum = self.action.args.ifunum
@@ -239,7 +243,8 @@ class SolveGeom(BasePrimitive):
                 "avwvsig": self.action.args.av_bar_sig,                 # average bar wavelength sigma (Ang)
                 "sdwvsig": self.action.args.st_bar_sig,                 # standard deviation of bar sigmas (Ang)
                 "xl0": xl0_out, "xl1": xl1_out,                         # slice spatial limits
-                "tform": tform_list, "invtf": invtf_list                # transform and inverse transforms for each slice
+                "tform": tform_list, "invtf": invtf_list,               # transform and inverse transforms for each slice
+                "invcoef": invcoef_list                                 # inverse transform y-by-x coefficient grids
             }
             with open(self.action.args.geometry_file, 'wb') as ofile:
                 pickle.dump(geom, ofile)
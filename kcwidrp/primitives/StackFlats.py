@@ -1,11 +1,10 @@
 from keckdrpframework.primitives.base_img import BaseImg
 from kcwidrp.primitives.kcwi_file_primitives import kcwi_fits_reader, \
     kcwi_fits_writer, strip_fname
+from kcwidrp.core.kcwi_combine import combine_frames
 
 import os
-import ccdproc
 import numpy as np
-from astropy.stats import mad_std
 
 
 def inv_median(a):
@@ -27,7 +26,8 @@ class StackFlats(BaseImg):
     method 'average' will be used.  A high sigma clipping of 2.0 is used to
     help with the CRs.
 
-    Uses the ccdproc.combine routine to peform the stacking.
+    Uses the out-of-core kcwi_combine routines to peform the stacking, within
+    the memory budget set by the instrument config parameter stack_mem_limit.
 
     Writes out the following files and adds entries in the proc table depending
     on the input IMTYPE:
@@ -83,31 +83,28 @@ class StackFlats(BaseImg):
         combine_list = list(self.combine_list['filename'])
         # get flat stack output name
         stname = strip_fname(combine_list[0]) + '_' + suffix + '.fits'
-        stack = []
         stackf = []
-        fmeds = []
+        stackp = []
         for flat in combine_list:
             # get flat intensity (int) image file name in redux directory
             stackf.append(strip_fname(flat) + '_intd.fits')
-            flatfn = os.path.join(self.config.instrument.cwd,
-                                  self.config.instrument.output_directory,
-                                  stackf[-1])
-            # using [0] gets just the image data
-            f = kcwi_fits_reader(flatfn)[0]
-            # Set mask to None to prevent ccdproc.combine from masking
-            f.mask = None
-            # get scale
-            fmed = float(np.median(f))
+            stackp.append(os.path.join(self.config.instrument.cwd,
+                                       self.config.instrument.output_directory,
+                                       stackf[-1]))
+
+        # using [0] gets just the image data
+        first_flat = kcwi_fits_reader(stackp[0])[0]
+        # the flat masks are not used to reject pixels (no use_mask)
+        stacked, scales = combine_frames(
+            first_flat, stackp, method=method, scale=inv_median,
+            sig_up=sig_up, mem_limit=self.config.instrument.stack_mem_limit,
+            nthreads=self.config.instrument.stack_nthreads,
+            logger=self.logger)
+        fmeds = []
+        for flat, scale in zip(combine_list, scales):
+            fmed = 1.0/scale
             self.logger.info("%s - median: %.2f" % (flat, fmed))
             fmeds.append(fmed)
-            stack.append(f)
-
-        stacked = ccdproc.combine(stack, method=method, sigma_clip=True,
-                                  scale=inv_median,
-                                  sigma_clip_low_thresh=None,
-                                  sigma_clip_high_thresh=sig_up,
-                                  sigma_clip_func=np.ma.median,
-                                  sigma_clip_dev_func=mad_std)
 
         # re-scale stacked image
         stacked.data = stacked.data * np.median(fmeds)
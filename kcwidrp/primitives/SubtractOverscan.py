@@ -3,8 +3,6 @@ from kcwidrp.core.bokeh_plotting import bokeh_plot
 from kcwidrp.core.kcwi_plotting import save_plot
 from kcwidrp.core.bokeh_plotting import bokeh_clear
 
-from bokeh.plotting import figure
-from bokeh.layouts import gridplot
 import numpy as np
 import math
 import time
@@ -99,6 +97,7 @@ class SubtractOverscan(BasePrimitive):
                     (osval, "amp%d oscan counts (DN)" % ia)
 
                 if self.config.instrument.plot_level >= 2:
+                    from bokeh.plotting import figure
                     x = np.arange(len(osvec))
                     p = figure(title='Img # %05d OSCAN [%d:%d, %d:%d] '
                                      'amp %d, noise: %.3f e-/px' %
@@ -128,6 +127,7 @@ class SubtractOverscan(BasePrimitive):
                 self.logger.info("not enough overscan px to fit amp %d" % ia)
                 performed = False
         if self.config.instrument.plot_level >= 3 and len(plts) > 0:
+            from bokeh.layouts import gridplot
             bokeh_plot(gridplot(plts, ncols=(2 if namps > 2 else 1),
                                 plot_width=500, plot_height=300,
                                 toolbar_location=None),
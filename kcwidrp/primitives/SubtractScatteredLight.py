@@ -3,22 +3,118 @@ from kcwidrp.primitives.kcwi_file_primitives import kcwi_fits_writer
 from kcwidrp.core.bokeh_plotting import bokeh_plot
 from kcwidrp.core.kcwi_plotting import save_plot
 
-from bokeh.plotting import figure
 import numpy as np
 from scipy.signal import savgol_filter
 import time
 
 
+def gap_columns(ncols, xbinsize):
+    """Columns of the central, un-illuminated gap between the slices"""
+    x0 = int(ncols / 2 - 180 / xbinsize)
+    x1 = int(ncols / 2 + 180 / xbinsize)
+    return x0, x1
+
+
+def row_median(band):
+    """Median of each row, only paying for NaN handling when needed"""
+    if np.isnan(band).any():
+        return np.nanmedian(band, axis=1)
+    return np.median(band, axis=1)
+
+
+def fix_profile_edges(vals, camera, bright):
+    """Fix extreme edge values of a scattered light profile in place"""
+    if 'RED' in camera:
+        if bright:
+            vals[:10] = vals[10:20]
+            vals[-10:] = vals[-21:-11]
+    else:
+        vals[0] = np.nanmedian(vals[1:10])
+        vals[-1] = np.nanmedian(vals[-11:-2])
+
+
+def smooth_profile(yvals, fwin=None):
+    """
+    Smooth a scattered light profile with a Savitzky-Golay filter
+
+    If no window is given, start with 151 px and widen it to 303 or 501 px
+    for low signal to noise profiles.
+
+    Args:
+        yvals (array): profile along y
+        fwin (int): filter window, or None to choose from the signal to noise
+
+    Returns:
+        (scat, fwin, signal_to_noise): smoothed profile, window used, and
+        mean signal to noise of the profile
+
+    """
+    if fwin is not None:
+        scat = savgol_filter(yvals, fwin, 3)
+        return scat, fwin, np.mean(scat) / np.nanstd(yvals - scat)
+    fwin = 151
+    scat = savgol_filter(yvals, fwin, 3)
+    signal_to_noise = np.mean(scat) / np.nanstd(yvals - scat)
+    if signal_to_noise < 25.:
+        if signal_to_noise < 5:
+            fwin = 501
+        else:
+            fwin = 303
+        scat = savgol_filter(yvals, fwin, 3)
+        signal_to_noise = np.mean(scat) / np.nanstd(yvals - scat)
+    return scat, fwin, signal_to_noise
+
+
+def scattered_light_model(data, xbinsize, camera, model_2d=False):
+    """
+    Model the scattered light from the central gap between the slices
+
+    The 1D model is the smoothed median of each row of the gap.  The
+    optional 2D model adds an x gradient: the difference between the medians
+    of the right and left halves of the gap, smoothed with the same window,
+    per pixel of separation between the half centers.
+
+    Args:
+        data (2D array): image
+        xbinsize (int): x binning
+        camera (str): camera name, 'BLUE' or 'RED'
+        model_2d (bool): add the x gradient to the model?
+
+    Returns:
+        (yvals, scat, gradient, fwin, signal_to_noise): gap profile,
+        smoothed profile, smoothed gradient per x pixel about the image
+        center (``None`` for the 1D model), smoothing window, and mean
+        signal to noise
+
+    """
+    x0, x1 = gap_columns(data.shape[1], xbinsize)
+    band = data[:, x0:x1]
+    yvals = row_median(band)
+    bright = np.nanmax(yvals) > 100
+    fix_profile_edges(yvals, camera, bright)
+    scat, fwin, signal_to_noise = smooth_profile(yvals)
+    gradient = None
+    if model_2d:
+        half = (x1 - x0) // 2
+        diff = row_median(band[:, half:2 * half]) - row_median(band[:, :half])
+        fix_profile_edges(diff, camera, bright)
+        gradient = smooth_profile(diff, fwin)[0] / half
+    return yvals, scat, gradient, fwin, signal_to_noise
+
+
 class SubtractScatteredLight(BasePrimitive):
     """
     Subtract scattered light between slices.
 
     Uses the centeral, un-illuminated part of the image to generate a model of
-    the scattered light.  Subtract this model from the entire image.
+    the scattered light.  Subtract this model from the entire image.  The model
+    is a function of y only, unless ``scat2d`` is set, which adds an x gradient
+    measured across the same gap.
 
     Uses the following configuration parameter:
 
         * skipscat: set to ``True`` to skip scattered light subtraction. Defaults to ``False``.
+        * scat2d: set to ``True`` to use the 2D scattered light model. Defaults to ``False``.
 
     Writes out a \*_intd.fits file regardless if scattered light is subtracted
     or not.
@@ -46,47 +142,18 @@ class SubtractScatteredLight(BasePrimitive):
             self.logger.info("Skipping scattered light subtraction by request")
             self.action.args.ccddata.header[key] = (False, keycom)
         else:
-            # Binning
-            # ybin = self.action.args.ybinsize
-            # Get size of image
-            siz = self.action.args.ccddata.data.shape
-            # Get x range for scattered light
-            x0 = int(siz[1] / 2 - 180 / self.action.args.xbinsize)
-            x1 = int(siz[1] / 2 + 180 / self.action.args.xbinsize)
-            # Get y limits
-            y0 = 0
-            # y1 = int(siz[0] / 2 - 1)
-            # y2 = y1 + 1
-            y3 = siz[0]
-            # print("x limits: %d, %d, y limits: %d, %d" % (x0, x1, y0, y3))
-            # Y data values
-            yvals = np.nanmedian(self.action.args.ccddata.data[y0:y3, x0:x1],
-                                 axis=1)
-            # Fix extreme edge values
-            if 'RED' in camera:
-                if np.nanmax(yvals) > 100:
-                    yvals[:10] = yvals[10:20]
-                    yvals[-10:] = yvals[-21:-11]
-            else:
-                yvals[0] = np.nanmedian(yvals[1:10])
-                yvals[-1] = np.nanmedian(yvals[-11:-2])
+            model_2d = bool(self.config.instrument.scat2d)
+            yvals, scat, gradient, fwin, signal_to_noise = \
+                scattered_light_model(self.action.args.ccddata.data,
+                                      self.action.args.xbinsize, camera,
+                                      model_2d=model_2d)
             # X data values
-            xvals = np.arange(len(yvals), dtype=np.float)
-            # filter window
-            fwin = 151
-            scat = savgol_filter(yvals, fwin, 3)
-            signal_to_noise = np.mean(scat) / np.nanstd(yvals - scat)
-            if signal_to_noise < 25.:
-                if signal_to_noise < 5:
-                    fwin = 501
-                else:
-                    fwin = 303
-                scat = savgol_filter(yvals, fwin, 3)
-                signal_to_noise = np.mean(scat) / np.nanstd(yvals - scat)
+            xvals = np.arange(len(yvals), dtype=float)
             self.logger.info("Smoothing scattered light with window of %d px"
                              % fwin)
             self.logger.info("Mean signal to noise = %.2f" % signal_to_noise)
             if self.config.instrument.plot_level >= 1:
+                from bokeh.plotting import figure
                 # output filename stub
                 scfnam = "scat_%05d_%s_%s_%s" % \
                          (self.action.args.ccddata.header['FRAMENO'],
@@ -110,10 +177,14 @@ class SubtractScatteredLight(BasePrimitive):
                 save_plot(p, filename=scfnam+".png")
             # Subtract scattered light
             self.logger.info("Starting scattered light subtraction")
-            for ix in range(0, siz[1]):
-                self.action.args.ccddata.data[y0:y3, ix] = \
-                    self.action.args.ccddata.data[y0:y3, ix] - scat
+            data = self.action.args.ccddata.data
+            data -= scat[:, np.newaxis]
+            if gradient is not None:
+                xoff = np.arange(data.shape[1]) - (data.shape[1] - 1) / 2.
+                data -= gradient[:, np.newaxis] * xoff[np.newaxis, :]
             self.action.args.ccddata.header[key] = (True, keycom)
+            self.action.args.ccddata.header['SCATMOD'] = (
+                '2D' if model_2d else '1D', 'scattered light model')
 
         log_string = SubtractScatteredLight.__module__
         self.action.args.ccddata.header['HISTORY'] = log_string
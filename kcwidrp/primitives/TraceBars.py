@@ -3,8 +3,8 @@ from kcwidrp.primitives.kcwi_file_primitives import write_table, strip_fname,\
     plotlabel
 from kcwidrp.core.bokeh_plotting import bokeh_plot
 from kcwidrp.core.kcwi_plotting import save_plot
+from kcwidrp.core.kcwi_trace import trace_bars
 
-from bokeh.plotting import figure
 import numpy as np
 import os
 import time
@@ -40,6 +40,7 @@ class TraceBars(BasePrimitive):
     def _perform(self):
         self.logger.info("Tracing continuum bars")
         if self.config.instrument.plot_level >= 1:
+            from bokeh.plotting import figure
             do_plot = True
         else:
             do_plot = False
@@ -54,71 +55,13 @@ class TraceBars(BasePrimitive):
             win = self.action.args.window
             bar_thresh = self.action.args.bar_avg
             self.logger.info("Tracing bars with threshold of %.1f" % bar_thresh)
-            xi = []     # x input
-            xo = []     # x output
-            yi = []     # y input (and output)
-            barid = []  # bar id number
-            slid = []   # slice id number
-            # loop over bars
+            # trace all bars up and down from the middle row
+            xi, xo, yi, barid, slid = trace_bars(
+                self.action.args.ccddata.data,
+                self.action.args.middle_centers,
+                self.action.args.middle_row, samp, win, bar_thresh)
             for barn, barx in enumerate(self.action.args.middle_centers):
-                # nearest pixel to bar center
-                barxi = int(barx + 0.5)
                 self.logger.info("bar number %d is at %.3f" % (barn, barx))
-                # middle row data
-                xi.append(barx)
-                xo.append(barx)
-                yi.append(self.action.args.middle_row)
-                barid.append(barn)
-                slid.append(int(barn/5))
-                # trace up
-                samy = self.action.args.middle_row + samp
-                done = False
-                while samy < (self.action.args.ccddata.data.shape[0] - win) \
-                        and not done:
-                    ys = np.median(
-                        self.action.args.ccddata.data[(samy - win):
-                                                      (samy + win + 1),
-                                                      (barxi - win):
-                                                      (barxi + win + 1)],
-                        axis=0)
-                    ys = ys - np.nanmin(ys)
-                    if np.nanmax(ys) > bar_thresh and np.nansum(ys) > 0:
-                        xs = list(range(barxi - win, barxi + win + 1))
-                        xc = np.nansum(xs * ys) / np.nansum(ys)
-                        xi.append(xc)
-                        xo.append(barx)
-                        yi.append(samy)
-                        barid.append(barn)
-                        slid.append(int(barn/5))
-                        barxi = int(xc)
-                    else:
-                        done = True
-                    samy += samp
-                # trace down
-                # nearest pixel to bar center
-                barxi = int(barx + 0.5)
-                samy = self.action.args.middle_row - samp
-                done = False
-                while samy >= win and not done:
-                    ys = np.median(
-                        self.action.args.ccddata.data[(samy - win):
-                                                      (samy + win + 1),
-                                                      (barxi - win):
-                                                      (barxi + win + 1)],
-                        axis=0)
-                    ys = ys - np.nanmin(ys)
-                    if np.nanmax(ys) > bar_thresh and np.nansum(ys) > 0:
-                        xs = list(range(barxi - win, barxi + win + 1))
-                        xc = np.sum(xs * ys) / np.sum(ys)
-                        xi.append(xc)
-                        xo.append(barx)
-                        yi.append(samy)
-                        barid.append(barn)
-                        slid.append(int(barn / 5))
-                        barxi = int(xc)
-                    else:
-                        done = True
-                    samy -= samp
             # end loop over bars
             # create source and destination coords
             yo = yi
@@ -1,7 +1,7 @@
 import os
 
 import numpy as np
-from scipy.interpolate import interp1d
+from scipy.interpolate import make_interp_spline
 from astropy import units as u
 from astropy.coordinates import SkyCoord, EarthLocation
 
@@ -11,6 +11,40 @@ from kcwidrp.primitives.kcwi_file_primitives import kcwi_fits_writer, \
                                                     strip_fname
 
 
+def resample_cube(cube, wave_src, wave_dst, mask=False):
+    """
+    Resample all spaxels of a cube from one wavelength grid to another
+
+    Every spaxel shares the same wavelength axis, so a single cubic spline
+    is fit along axis 0 of the cube and evaluated on the new grid.  Mask
+    cubes take the maximum of the previous and next source pixels, with
+    128 outside the source grid.
+
+    Args:
+        cube (ndarray): 3D cube with wavelength along axis 0
+        wave_src (ndarray): wavelengths of the cube pixels (increasing)
+        wave_dst (ndarray): wavelengths to resample onto
+        mask (bool): Set if the cube is a mask cube.
+
+    Returns:
+        ndarray: resampled cube with the same shape and dtype as cube
+
+    """
+    if not mask:
+        spline = make_interp_spline(wave_src, cube, k=3, axis=0)
+        return spline(wave_dst, extrapolate=True).astype(cube.dtype,
+                                                         copy=False)
+
+    nwave = len(wave_src)
+    ipre = np.searchsorted(wave_src, wave_dst, side='right') - 1
+    inex = np.searchsorted(wave_src, wave_dst, side='left')
+    spec_pre = cube[np.clip(ipre, 0, nwave - 1)]
+    spec_pre[ipre < 0] = 128
+    spec_nex = cube[np.clip(inex, 0, nwave - 1)]
+    spec_nex[inex >= nwave] = 128
+    return np.maximum(spec_pre, spec_nex)
+
+
 class WavelengthCorrections(BasePrimitive):
     """
     Perform wavelength corrections
@@ -23,6 +57,9 @@ class WavelengthCorrections(BasePrimitive):
     Also, if the ``air_to_vacuum`` parameter is set to ``True`` (default),
     apply air-to-vacuum correction.
 
+    Both corrections are combined into a single resampling of the cube back
+    onto its original wavelength grid.
+
     """
 
     def __init__(self, action, context):
@@ -58,6 +95,10 @@ class WavelengthCorrections(BasePrimitive):
         suffix = 'icube'  # Can be ammended to handle ocube files
         obj = self.locate_object_file(suffix)
 
+        # wavelength of each cube pixel after all corrections
+        wave_old = self.get_wav_axis(obj.header)
+        wave_new = wave_old.copy()
+
         if "none" in correction_mode:
             self.logger.info("Skipping radial velocity correction")
             obj.header['VCORR'] = (0.0, 'km/s')
@@ -65,11 +106,29 @@ class WavelengthCorrections(BasePrimitive):
 
         else:
             self.logger.info(f"Performing {correction_mode} correction")
-            obj = self.heliocentric(obj, correction_mode)
+            vcorr, v_tot = self.get_vcorr(obj, correction_mode)
+            wave_new *= (1 + v_tot / 2.99792458e5)
+            cwave_hel = self.action.args.cwave * (1 + v_tot / 2.99792458e5)
+            self.logger.info("Vcorr for CWAVE (%.3f) gives %.3f" %
+                             (self.action.args.cwave, cwave_hel))
+            obj.header['VCORR'] = (vcorr, 'km/s')
+            obj.header['VCORRTYP'] = (correction_mode, 'Vcorr type')
 
         if self.config.instrument.air_to_vacuum:
-            self.logger.info("Performing Air to Vacuum Conversion")
-            obj = self.air2vac(obj)
+            if obj.header['CTYPE3'] == 'WAVE':
+                self.logger.warn("FITS already in vacuum wavelength.")
+            else:
+                self.logger.info("Performing Air to Vacuum Conversion")
+                wave_new = self.a2v_conversion(wave_new * u.AA).value
+                self.logger.info("Air to Vacuum for (%.3f) gives %.3f" %
+                                 (wave_old[int(wave_old.shape[0] / 2)],
+                                  wave_new[int(wave_new.shape[0] / 2)]))
+                obj.header['CTYPE3'] = ('WAVE', 'Vacuum Wavelengths')
+
+        if not np.array_equal(wave_new, wave_old):
+            self.logger.info("Resampling to uniform grid")
+            cube = np.nan_to_num(obj.data, nan=0, posinf=0, neginf=0)
+            obj.data = resample_cube(cube, wave_new, wave_old)
 
         log_string = WavelengthCorrections.__module__
         obj.header['HISTORY'] = log_string
@@ -117,43 +176,8 @@ class WavelengthCorrections(BasePrimitive):
                          (cwave_air.value, cwave_vac.value))
 
         # resample to uniform grid
-        cube_new = np.zeros_like(cube)
-        for i in range(cube.shape[2]):
-            for j in range(cube.shape[1]):
-
-                spec0 = cube[:, j, i]
-                if not mask:
-                    f_cubic = interp1d(
-                        wave_vac,
-                        spec0,
-                        kind='cubic',
-                        fill_value='extrapolate'
-                        )
-                    spec_new = f_cubic(wave_air)
-                else:
-                    f_pre = interp1d(
-                        wave_vac,
-                        spec0,
-                        kind='previous',
-                        bounds_error=False,
-                        fill_value=128
-                        )
-                    spec_pre = f_pre(wave_air)
-
-                    f_nex = interp1d(
-                        wave_vac,
-                        spec0,
-                        kind='next',
-                        bounds_error=False,
-                        fill_value=128
-                        )
-                    spec_nex = f_nex(wave_air)
-
-                    spec_new = np.zeros_like(spec0)
-                    for k in range(spec0.shape[0]):
-                        spec_new[k] = max(spec_pre[k], spec_nex[k])
-
-                cube_new[:, j, i] = spec_new
+        cube_new = resample_cube(cube, wave_vac.value, wave_air.value,
+                                 mask=mask)
 
         obj.header['CTYPE3'] = ('WAVE', 'Vacuum Wavelengths')
         obj.data = cube_new
@@ -230,11 +254,51 @@ class WavelengthCorrections(BasePrimitive):
             >>> hdu_new = heliocentric(hdu_old, resample=False)
         """
 
-        barycentric = ("barycentric" in correction_mode)
-
         cube = np.nan_to_num(obj.data,
                              nan=0, posinf=0, neginf=0)
 
+        vcorr, v_tot = self.get_vcorr(obj, correction_mode, vcorr=vcorr)
+
+        if not resample:
+            obj.header['CRVAL3'] *= (1 + v_tot / 2.99792458e5)
+            obj.header['CD3_3'] *= (1 + v_tot / 2.99792458e5)
+            obj.header['VCORR'] = (vcorr, 'km/s')
+            obj.header['VCORRTYP'] = (correction_mode, 'Vcorr type')
+            return obj
+
+        wav_old = self.get_wav_axis(obj.header)
+        wav_hel = wav_old * (1 + v_tot / 2.99792458e5)
+        cwave_hel = self.action.args.cwave * (1 + v_tot / 2.99792458e5)
+        self.logger.info("Vcorr for CWAVE (%.3f) gives %.3f" %
+                         (self.action.args.cwave, cwave_hel))
+
+        # resample to uniform grid
+        self.logger.info("Resampling to uniform grid")
+        cube_new = resample_cube(cube, wav_hel, wav_old, mask=mask)
+
+        obj.header['VCORR'] = (vcorr, 'km/s')
+        obj.header['VCORRTYP'] = (correction_mode, 'Vcorr type')
+        obj.data = cube_new
+        return obj
+
+    def get_vcorr(self, obj, correction_mode, vcorr=None):
+        """
+        Calculate the helio/barycentric correction velocity for a cube.
+
+        Any correction already recorded in the VCORR header keyword is
+        rolled back in the returned total velocity.
+
+        Args:
+            obj (astropy HDU / HDUList): Input HDU/HDUList with 3D data.
+            correction_mode (str): "barycentric" or "heliocentric"
+            vcorr (float): Use a different correction velocity.
+
+        Returns:
+            (vcorr, v_tot): correction velocity and velocity to apply in km/s
+
+        """
+        barycentric = ("barycentric" in correction_mode)
+
         v_old = 0.
         if 'VCORR' in obj.header:
             v_old = obj.header['VCORR']
@@ -267,47 +331,7 @@ class WavelengthCorrections(BasePrimitive):
 
         v_tot = vcorr-v_old
 
-        if not resample:
-            obj.header['CRVAL3'] *= (1 + v_tot / 2.99792458e5)
-            obj.header['CD3_3'] *= (1 + v_tot / 2.99792458e5)
-            obj.header['VCORR'] = (vcorr, 'km/s')
-            obj.header['VCORRTYP'] = (correction_mode, 'Vcorr type')
-            return obj
-
-        wav_old = self.get_wav_axis(obj.header)
-        wav_hel = wav_old * (1 + v_tot / 2.99792458e5)
-        cwave_hel = self.action.args.cwave * (1 + v_tot / 2.99792458e5)
-        self.logger.info("Vcorr for CWAVE (%.3f) gives %.3f" %
-                         (self.action.args.cwave, cwave_hel))
-
-        # resample to uniform grid
-        self.logger.info("Resampling to uniform grid")
-        cube_new = np.zeros_like(cube)
-        for i in range(cube.shape[2]):
-            for j in range(cube.shape[1]):
-
-                spc0 = cube[:, j, i]
-                if not mask:
-                    f_cubic = interp1d(wav_hel, spc0, kind='cubic',
-                                       fill_value='extrapolate')
-                    spec_new = f_cubic(wav_old)
-
-                else:
-                    f_pre = interp1d(wav_hel, spc0, kind='previous',
-                                     bounds_error=False, fill_value=128)
-                    spec_pre = f_pre(wav_old)
-                    f_nex = interp1d(wav_hel, spc0, kind='next',
-                                     bounds_error=False, fill_value=128)
-                    spec_nex = f_nex(wav_old)
-                    spec_new = np.zeros_like(spc0)
-                    for k in range(spc0.shape[0]):
-                        spec_new[k] = max(spec_pre[k], spec_nex[k])
-                cube_new[:, j, i] = spec_new
-
-        obj.header['VCORR'] = (vcorr, 'km/s')
-        obj.header['VCORRTYP'] = (correction_mode, 'Vcorr type')
-        obj.data = cube_new
-        return obj
+        return vcorr, v_tot
 
     def get_wav_axis(self, header):
         """Returns a NumPy array representing the wavelength axis of a cube.
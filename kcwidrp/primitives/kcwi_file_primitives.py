@@ -4,7 +4,6 @@ from astropy.nddata import CCDData
 from astropy.table import Table
 # from astropy import units as u
 import numpy as np
-from datetime import datetime
 
 from keckdrpframework.primitives.base_primitive import BasePrimitive
 import os
@@ -13,18 +12,11 @@ import pkg_resources
 import subprocess
 from pathlib import Path
 
-logger = logging.getLogger('KCWI')
-
-red_amp_dict = {'L1': 0, 'L2': 1, 'U1': 2, 'U2': 3}
-# gains for slow readout, high gain
-red_amp_gain = {'L1': 1.54, 'L2': 1.551, 'U1': 1.61, 'U2': 1.526}
-
-# gains for slow readout gainmul by ampid
-blue_amp_gain = {1:  {0: 1.570, 1: 1.600, 2: 1.610, 3: 1.600},
-                 2:  {0: 0.785, 1: 0.800, 2: 0.805, 3: 0.800},
-                 5:  {0: 0.314, 1: 0.320, 2: 0.325, 3: 0.319},
-                 10: {0: 0.157, 1: 0.160, 2: 0.158, 3: 0.158}}
+from kcwidrp.core.kcwi_deferred import REQUIRED_CALS, cal_signature
+from kcwidrp.core.kcwi_headers import fix_header, ccd_config, \
+    red_amp_dict, red_amp_gain, blue_amp_gain
 
+logger = logging.getLogger('KCWI')
 
 def parse_imsec(section=None):
     """
@@ -819,6 +811,11 @@ class ingest_file(BasePrimitive):
 
         ccddata, table = kcwi_fits_reader(self.name)
 
+        # record the frame in the night index, if one is open
+        night_index = getattr(self.context, 'night_index', None)
+        if night_index is not None:
+            night_index.add_header(self.name, ccddata.header)
+
         # Are we already in proctab?
         out_args.in_proctab = self.context.proctab.in_proctab(frame=ccddata)
         if out_args.in_proctab:
@@ -862,7 +859,17 @@ class ingest_file(BasePrimitive):
 
             if self.config.instrument.continuous or \
                     self.config.instrument.wait_for_event:
-                self.logger.warn("Input frame cannot be reduced. Rescheduling")
+                # park the frame until its missing calibrations are added
+                deferred = getattr(self.context, 'deferred_frames', None)
+                if deferred is not None:
+                    self.logger.warn("Input frame cannot be reduced. "
+                                     "Waiting for calibrations")
+                    deferred.defer(self.action.args.name,
+                                   self.missing_signatures())
+                    self.action.event._recurrent = False
+                else:
+                    self.logger.warn("Input frame cannot be reduced. "
+                                     "Rescheduling")
                 self.action.new_event = None
                 return None
             else:
@@ -959,70 +966,39 @@ class ingest_file(BasePrimitive):
         For a given image type, ensure that processing can proceed.
 
         Based on `IMTYPE` keyword, makes a call to proctab to see if
-        pre-requisite images are present.
+        pre-requisite images are present (see REQUIRED_CALS).  The groups of
+        missing master calibration types are kept in ``self.missing_cals``.
 
         Returns:
             (bool): ``True`` if processing can proceed, ``False`` if not.
 
         """
-        if imtype == 'OBJECT':
-            # bias frames
-            bias_frames = self.context.proctab.search_proctab(
-                frame=self.ccddata, target_type='MBIAS', nearest=True)
-            # arclamp
-            arclamp_frames = self.context.proctab.search_proctab(
-                frame=self.ccddata, target_type='MARC', nearest=True)
-            # master flats
-            masterflat_frames = self.context.proctab.search_proctab(
-                frame=self.ccddata, target_type='MFLAT', nearest=True)
-            masterdome_frames = self.context.proctab.search_proctab(
-                frame=self.ccddata, target_type='MDOME', nearest=True)
-            mastertwif_frames = self.context.proctab.search_proctab(
-                frame=self.ccddata, target_type='MTWIF', nearest=True)
-
-            if len(bias_frames) > 0 and len(arclamp_frames) > 0 and (
-                    len(masterflat_frames) > 0 or len(masterdome_frames) > 0 or
-                    len(mastertwif_frames) > 0):
-                return True
-            else:
-                self.logger.warn("Cannot reduce OBJECT frame. Found:")
-                self.logger.warn(f"\tMBIAS: {len(bias_frames)}")
-                self.logger.warn(f"\tMARC: {len(arclamp_frames)}")
-                self.logger.warn(f"\tMFLAT: {len(masterflat_frames)}")
-                self.logger.warn(f"\tMDOME: {len(masterdome_frames)}")
-                self.logger.warn(f"\tMTWIF: {len(mastertwif_frames)}")
-
-                return False
-
-        if imtype == 'ARCLAMP':
-            # continuum bars
-            contbars_frames = self.context.proctab.search_proctab(
-                frame=self.ccddata, target_type='MCBARS', nearest=True)
-            if len(contbars_frames) > 0:
-                return True
-            else:
-                self.logger.warn("Cannot reduce ARCLAMP frame. "
-                                 "Missing master continuum bars. ")
-                return False
-
-        if imtype in ['FLATLAMP', 'TWIFLAT', 'DOMEFLAT']:
-            # bias frames
-            bias_frames = self.context.proctab.search_proctab(
-                frame=self.ccddata, target_type='MBIAS', nearest=True)
-            arc_frames = self.context.proctab.search_proctab(
-                frame=self.ccddata, target_type='MARC', nearest=True)
-            if len(bias_frames) > 0 and len(arc_frames) > 0:
-                return True
-            else:
-                self.logger.warn(f"Cannot reduce {imtype} frame.")
-                if len(bias_frames) <= 0:
-                    self.logger.warn(f"Missing master bias.")
-                if len(arc_frames) <= 0:
-                    self.logger.warn(f"Missing master arc")
-                return False
-
+        self.missing_cals = []
+        for group in REQUIRED_CALS.get(imtype, ()):
+            found = False
+            for cal_type in group:
+                frames = self.context.proctab.search_proctab(
+                    frame=self.ccddata, target_type=cal_type, nearest=True)
+                if len(frames) > 0:
+                    found = True
+                    break
+            if not found:
+                self.missing_cals.append(group)
+
+        if self.missing_cals:
+            self.logger.warn(f"Cannot reduce {imtype} frame. Missing: " +
+                             ", ".join(" or ".join(group)
+                                       for group in self.missing_cals))
+            return False
         return True
 
+    def missing_signatures(self):
+        """Calibration signatures of ``self.missing_cals`` for deferral"""
+        return [[cal_signature(cal_type, self.get_keyword('CAMERA'),
+                               self.get_keyword('CCDCFG'),
+                               self.get_keyword('STATEID'))
+                 for cal_type in group] for group in self.missing_cals]
+
 
 def kcwi_fits_reader(file):
     """A reader for KCCDData objects.
@@ -1077,11 +1053,7 @@ def kcwi_fits_reader(file):
     fix_header(ccddata)
     # Check for CCDCFG keyword
     if 'CCDCFG' not in ccddata.header:
-        ccdcfg = ccddata.header['CCDSUM'].replace(" ", "")
-        ccdcfg += "%1d" % ccddata.header['CCDMODE']
-        ccdcfg += "%02d" % ccddata.header['GAINMUL']
-        ccdcfg += "%02d" % ccddata.header['AMPMNUM']
-        ccddata.header['CCDCFG'] = ccdcfg
+        ccddata.header['CCDCFG'] = ccd_config(ccddata.header)
 
     if ccddata:
         if 'BUNIT' in ccddata.header:
@@ -1303,85 +1275,3 @@ def master_flat_name(ccddata, target_type):
     # Delivers a name that is unique across an observing block
     name = target_type.lower() + '_' + ccddata.header['STATEID'] + '.fits'
     return name
-
-
-def fix_header(ccddata):
-    """
-    Fix header keywords for DRP use.
-
-    Update GAINn keywords for Blue channel.
-
-    Add FITS header keywords to Red channel data to make compatible with DRP.
-
-    Adds the following keywords that are not present in raw images:
-
-    * MJD - Modified Julian Day (only for AIT data)
-    * NVIDINP - from TAPLINES keyword
-    * GAINMUL - set to 1
-    * CCDMODE - from CDSSPEED keyword
-    * AMPNUM - based on AMPMODE
-    * GAINn - from red_amp_gain dictionary
-
-    """
-    # are we blue?
-    if 'BLUE' in ccddata.header['CAMERA'].upper():
-        gainmul = ccddata.header['GAINMUL']
-        namps = ccddata.header['NVIDINP']
-        for ia in range(namps):
-            ampid = ccddata.header['AMPID%d' % (ia+1)]
-            gain = blue_amp_gain[gainmul][ampid]
-            ccddata.header['GAIN%d' % (ia+1)] = gain
-    # are we red?
-    elif 'RED' in ccddata.header['CAMERA'].upper():
-        # Fix red headers during Caltech AIT
-        if 'TELESCOP' not in ccddata.header:
-            # Add DCS keywords
-            ccddata.header['TARGNAME'] = ccddata.header['OBJECT']
-            dateend = ccddata.header['DATE-END']
-            de = datetime.fromisoformat(dateend)
-            day_frac = de.hour / 24. + de.minute / 1440. + de.second / 86400.
-            jd = datetime.date(de).toordinal() + day_frac + 1721424.5
-            mjd = jd - 2400000.5
-            ccddata.header['MJD'] = mjd
-        # Add NVIDINP
-        ccddata.header['NVIDINP'] = ccddata.header['TAPLINES']
-        # Add GAINMUL
-        ccddata.header['GAINMUL'] = 1
-        # Add CCDMODE
-        if 'CDSSPEED' in ccddata.header:
-            ccddata.header['CCDMODE'] = ccddata.header['CDSSPEED']
-        else:
-            ccddata.header['CCDMODE'] = 0
-        # Add AMPMNUM
-        if 'AMPMODE' in ccddata.header:
-            ampmode = ccddata.header['AMPMODE']
-            if ampmode == 'L2U2L1U1':
-                ampnum = 0
-            elif ampmode == 'L2U2':
-                ampnum = 1
-            elif ampmode == 'L1U1':
-                ampnum = 2
-            elif ampmode == 'L2L1':
-                ampnum = 3
-            elif ampmode == 'U2U1':
-                ampnum = 4
-            elif ampmode == 'L2':
-                ampnum = 5
-            elif ampmode == 'U2':
-                ampnum = 6
-            elif ampmode == 'L1':
-                ampnum = 7
-            elif ampmode == 'U1':
-                ampnum = 8
-            else:
-                ampnum = 0
-            ccddata.header['AMPMNUM'] = ampnum
-
-            for amp in red_amp_dict.keys():
-                if amp in ampmode:
-                    # TODO: put in check for kw before updating
-                    gkey = 'GAIN%d' % red_amp_dict[amp]
-                    gain = red_amp_gain[amp]
-                    ccddata.header[gkey] = gain
-    else:
-        print("ERROR -- illegal CAMERA keyword: %s" % ccddata.header['CAMERA'])
@@ -13,6 +13,9 @@ frames found inside. It follows the following logic:
 
 #. Searches for matching standard stars for the setup
 
+The calibrations of all setups are counted in one pass over the night index,
+and the per-setup results can be written as a JSON or CSV report (-r).
+
 """
 
 from pathlib import Path
@@ -21,10 +24,10 @@ import logging
 import warnings
 import pkg_resources
 
-from astropy.nddata import CCDData
 from astropy.utils.exceptions import AstropyWarning
 
-from kcwidrp.core.kcwi_proctab import Proctab
+from kcwidrp.core.kcwi_night_index import NightIndex, NIGHT_INDEX_NAME, \
+    REPORT_CAL_TYPES, calibration_report, write_report
 from keckdrpframework.config.framework_config import ConfigClass
 from kcwidrp.core.kcwi_get_std import kcwi_get_std
 
@@ -52,25 +55,24 @@ def parse_args():
                         help="Print exhaustive information")
     parser.add_argument('-c', '--config', dest="config", type=str,
                         help="KCWI configuration file", default=None)
+    parser.add_argument('-i', '--index', dest="index", type=str,
+                        help="Night index file", default=NIGHT_INDEX_NAME)
+    parser.add_argument('-r', '--report', dest="report", type=str,
+                        help="Write a calibration report (.json or .csv)",
+                        default=None)
 
     return parser.parse_args()
 
 
-def check_cal_type(proctab, ccd_frame, setup_frame, targ_type, minimum, logger):
-    """Checks the given proctab for calibrations matching the input frame
+def check_cal_type(setup_row, targ_type, logger):
+    """Checks the calibration report row of a setup for one calibration type
 
     Parameters
     ----------
-    proctab : Proctab
-        Proccessing table instance to search through
-    ccd_frame : CCDData
-        Astropy CCDData (or kcwidrp KCCDData) object we want to match cals to
-    setup_frame : astropy.Table row
-        Proctab row corresponding to an OBJECT setup we are looking for
+    setup_row : dict
+        Calibration report row of an OBJECT setup (see calibration_report)
     targ_type : str
         Type of calibration being looked for
-    minimum : int
-        Minimum number of this type of cal required
     logger : logging.Logger
         Logger for debuging
 
@@ -82,12 +84,13 @@ def check_cal_type(proctab, ccd_frame, setup_frame, targ_type, minimum, logger):
     :meta private:
     """
 
-    found_list = proctab.search_proctab(frame=ccd_frame, target_type=targ_type) #target_group=setup_frame['GRPID']
-    logger.debug(f"For setup {setup_frame['CID']}, found {len(found_list)} {targ_type} frames, need {minimum}")
-    if len(found_list) >= minimum:
+    found = setup_row[targ_type + '_FOUND']
+    minimum = setup_row[targ_type + '_NEEDED']
+    logger.debug(f"For setup {setup_row['CID']}, found {found} {targ_type} frames, need {minimum}")
+    if found >= minimum:
         return "PASSED"
     else:
-        return f"FAILED: found {len(found_list): <3}, needed {minimum: <3}"
+        return f"FAILED: found {found: <3}, needed {minimum: <3}"
 
 def main():
 
@@ -124,37 +127,31 @@ def main():
     logger.info(f"Found {len(files)} files to inspect")
 
 
-    # Set up proc table. Use a dummy logger, since we don't want its messages
+    # Add the headers of new files to the night index. Use a dummy logger,
+    # since we don't want its messages
     dummy_logger = logging.getLogger("dummy_logger")
-    proctab = Proctab(dummy_logger)
-    proctab.read_proctab("temp.proc")
-
-
-    # Load all files into the proctable
-    frames = {}
+    night_index = NightIndex(args.index, logger=logger)
     for file in files:
-        try:
-            frame = CCDData.read(file, unit='adu')
-        except FileNotFoundError as e:
+        if not file.exists():
             logger.error(f"Failed to open {file}")
-        proctab.update_proctab(frame, filename=file.name)
-        frames[Path(file).name] = frame
+    night_index.update([str(file) for file in files if file.exists()])
+
+    # Get all the OBJECT frames:
+    objects = night_index.frames(imtype="OBJECT", skip_objects=())
+    for obj in objects:
+        obj['filename'] = Path(obj['path']).name
 
-    # Get all the unique OBJECT setups:
-    objects = proctab.proctab[proctab.proctab["TYPE"] == "OBJECT"]
+    # Count the cals of every setup in one pass over the night index
+    minimums = {}
+    for cam in ('BLUE', 'RED'):
+        minimums[cam] = {cal_type: int(config[cam][key])
+                         for cal_type, key in REPORT_CAL_TYPES}
+    unique_setups = calibration_report(night_index, minimums,
+                                       skip_objects=())
 
+    # While we're here, compile a dict with all standard stars ordered by CID for later
     standards = {}
-    CIDs = set()
-    DIDs = set()
-    unique_setups = []
     for obj in objects:
-        # See if the setup is unique
-        if obj["CID"] not in CIDs or obj["DID"] not in DIDs:
-            CIDs.add(obj["CID"])
-            DIDs.add(obj["DID"])
-            unique_setups.append(obj)
-        
-        # While we're here, compile a dict with all standard stars ordered by CID for later
         stdfile, _ = kcwi_get_std(obj["TARGNAME"], logger=dummy_logger)
         if stdfile is not None:
             CID = standards.get(obj["CID"], None)
@@ -180,15 +177,6 @@ def main():
     # Check cals for each setup:
     report = {}
     for setup_frame in unique_setups:
-        frame_config = config[setup_frame['CAM']]
-
-        bias_min_frames = int(frame_config['bias_min_nframes'])
-        cont_min_frames = int(frame_config['contbars_min_nframes'])
-        arc_min_frames = int(frame_config['arc_min_nframes'])
-        flat_min_frames = int(frame_config['flat_min_nframes'])
-
-
-        ccd_frame = frames[setup_frame['filename']]
         results = {
             "BIAS" : "UNCHECKED",
             "CONTBARS" : "UNCHECKED",
@@ -197,10 +185,10 @@ def main():
             "all_pass": False,
             "STANDARDS" : "UNCHECKED"
         }
-        results["BIAS"] = check_cal_type(proctab, ccd_frame, setup_frame, "BIAS", bias_min_frames, logger)
-        results["CONTBARS"] = check_cal_type(proctab, ccd_frame, setup_frame, "CONTBARS", cont_min_frames, logger)
-        results["ARCS"] = check_cal_type(proctab, ccd_frame, setup_frame, "ARCLAMP", arc_min_frames, logger)
-        results["FLATS"] = check_cal_type(proctab, ccd_frame, setup_frame, "FLATLAMP", flat_min_frames, logger)
+        results["BIAS"] = check_cal_type(setup_frame, "BIAS", logger)
+        results["CONTBARS"] = check_cal_type(setup_frame, "CONTBARS", logger)
+        results["ARCS"] = check_cal_type(setup_frame, "ARCLAMP", logger)
+        results["FLATS"] = check_cal_type(setup_frame, "FLATLAMP", logger)
         
         # Check the standards list from earlier for matching setups
         matching_standards = standards.get(setup_frame["CID"], None)
@@ -222,14 +210,18 @@ def main():
             standards_result = False
         
         # Collate a final "are we good here" boolean for the report
-        results["all_pass"] = bool(results["BIAS"] == "PASSED" and 
-                            results["CONTBARS"] == "PASSED" and
-                            results["ARCS"] == "PASSED" and
-                            results["FLATS"] == "PASSED" and
+        results["all_pass"] = bool(setup_frame["CALS_PASS"] and
                             standards_result)
+        setup_frame["STANDARDS"] = results["STANDARDS"]
+        setup_frame["ALL_PASS"] = results["all_pass"]
         
         report[setup_frame['CID']] = results
 
+    # Write the machine readable report
+    if args.report is not None:
+        write_report(unique_setups, args.report)
+        logger.info(f"Wrote calibration report to {args.report}")
+
 
     # Print results, passes then fails
     passes = []
@@ -261,7 +253,9 @@ def main():
                 if key == "all_pass" : continue
                 logger.info(f"\t{key: <10}\t{report[fail][key]: <20}")
             logger.info("\n\tThis effects the following OBJECT frames:")
-            logger.info('\t' + str(objects[objects["CID"] == fail]['filename', 'TARGNAME']).replace('\n', '\n\t'))
+            for obj in objects:
+                if obj["CID"] == fail:
+                    logger.info(f"\t{obj['filename']: <25}{obj['TARGNAME']}")
     else:
         logger.info("\033[32mNo failures to report.\033[0m")
 
@@ -4,12 +4,10 @@ Created on May 05, 2021
 @author: skwok, mbrodheim
 """
 
-from keckdrpframework.core.framework import Framework
 from keckdrpframework.config.framework_config import ConfigClass
 from keckdrpframework.models.arguments import Arguments
 from keckdrpframework.utils.drpf_logger import getLogger
 from kcwidrp.core.bokeh_plotting import check_running_process
-from kcwidrp.core.kcwi_get_std import is_file_kcwi_std
 
 import subprocess
 import time
@@ -17,10 +15,13 @@ import argparse
 import sys
 import traceback
 import os
-import pkg_resources
 
 from kcwidrp.pipelines.keck_rti_pipeline import Keck_RTI_Pipeline
-from kcwidrp.core.kcwi_proctab import Proctab
+from kcwidrp.core.kcwi_watcher import watch_data_set
+from kcwidrp.core.kcwi_deferred import DeferredFrames
+from kcwidrp.core.kcwi_plot_queue import start_plot_queue, \
+    DEFAULT_PLOT_WORKERS
+from kcwidrp.core.kcwi_rti_client import client_from_config
 import logging.config
 
 
@@ -102,6 +103,13 @@ def main():
 
     args = _parse_arguments(sys.argv)
 
+    # the framework and the astropy based modules are imported once the
+    # arguments are parsed, so that --help and usage errors are quick
+    import pkg_resources
+    from keckdrpframework.core.framework import Framework
+    from kcwidrp.core.kcwi_get_std import is_file_kcwi_std
+    from kcwidrp.core.kcwi_proctab import Proctab
+
     # START HANDLING OF CONFIGURATION FILES ##########
     pkg = 'kcwidrp'
 
@@ -155,6 +163,12 @@ def main():
     framework.logger = getLogger(framework_logcfg_fullpath,
                                  name="DRPF")
 
+    # saved plots are rendered by background processes
+    plot_workers = getattr(framework.config.instrument, 'plot_workers', None)
+    start_plot_queue(processes=DEFAULT_PLOT_WORKERS if plot_workers is None
+                     else plot_workers,
+                     logger=framework.context.pipeline_logger)
+
     if args.infiles is not None:
         framework.config.file_type = args.infiles
 
@@ -189,9 +203,24 @@ def main():
     framework.context.proctab = Proctab()
     framework.context.proctab.read_proctab(tfil=args.proctab)
 
+    # frames missing calibrations wait until a master calibration is added
+    framework.context.deferred_frames = DeferredFrames(
+        lambda name: framework.append_event('next_file',
+                                            Arguments(name=name),
+                                            recurrent=True),
+        logger=framework.logger)
+    framework.context.proctab.add_listener(
+        framework.context.deferred_frames.wake)
+
     framework.logger.info("Framework initialized")
     framework.logger.info(f"RTI url is {framework.config.rti.rti_url}")
 
+    # start the RTI client now to send notifications left by an earlier run
+    if framework.config.rti.rti_user != '' and \
+            framework.config.rti.rti_pass != '':
+        framework.context.rti_client = client_from_config(
+            framework.config, logger=framework.context.pipeline_logger)
+
     # add a start_bokeh event to the processing queue,
     # if requested by the configuration parameters
     if framework.config.instrument.enable_bokeh:
@@ -235,7 +264,9 @@ def main():
     # optionally continue to monitor if -m is specified
     elif args.dirname is not None:
 
-        framework.ingest_data(args.dirname, None, args.monitor)
+        framework.ingest_data(args.dirname, None, False)
+        if args.monitor:
+            watch_data_set(framework, args.dirname)
 
     # implement the group mode
     if args.group_mode is True:
@@ -268,6 +299,9 @@ def main():
             else:
                 process_subset(subset)
 
+    framework.config.instrument.wait_for_event = args.wait_for_event
+    framework.config.instrument.continuous = args.continuous
+
     framework.start(args.queue_manager_only, args.ingest_data_only,
                     args.wait_for_event, args.continuous)
 
@@ -1,7 +1,6 @@
 #!/usr/bin/env python
 """Modify FITS header keyword"""
 
-from astropy.io import fits
 import argparse
 import sys
 import os
@@ -28,6 +27,8 @@ def _parse_arguments(in_args: list) -> argparse.Namespace:
 
 def main():
     args = _parse_arguments(sys.argv)
+    # astropy is only needed once the arguments are valid
+    from astropy.io import fits
 
     if args.safe:
         safe_file = args.infile + '~'
@@ -4,12 +4,10 @@ Reduce KCWI data using the KCWI DRP running on the KeckDRPFramework
 @author: skwok
 """
 
-from keckdrpframework.core.framework import Framework
 from keckdrpframework.config.framework_config import ConfigClass
 from keckdrpframework.models.arguments import Arguments
 from keckdrpframework.utils.drpf_logger import getLogger
 from kcwidrp.core.bokeh_plotting import check_running_process
-from kcwidrp.core.kcwi_get_std import is_file_kcwi_std
 
 import subprocess
 import time
@@ -18,12 +16,16 @@ import argparse
 import sys
 import traceback
 import os
-import pkg_resources
 import psutil
 import shutil
 
 from kcwidrp.pipelines.kcwi_pipeline import Kcwi_pipeline
-from kcwidrp.core.kcwi_proctab import Proctab
+from kcwidrp.core.kcwi_watcher import watch_data_set
+from kcwidrp.core.kcwi_deferred import DeferredFrames
+from kcwidrp.core.kcwi_plot_queue import start_plot_queue, \
+    DEFAULT_PLOT_WORKERS
+from kcwidrp.core.kcwi_submit_server import start_submit_server, \
+    DEFAULT_SUBMIT_PORT
 import logging.config
 
 
@@ -94,6 +96,12 @@ def _parse_arguments(in_args: list) -> argparse.Namespace:
     parser.add_argument("-s", "--start_queue_manager_only",
                         dest="queue_manager_only", action="store_true",
                         help="Starts queue manager only, no processing",)
+    parser.add_argument("-S", "--submit_server", dest="submit_port",
+                        type=int, nargs='?', const=DEFAULT_SUBMIT_PORT,
+                        default=None,
+                        help="Accept file submissions over HTTP on this "
+                             "port (default %d), use with -W" %
+                             DEFAULT_SUBMIT_PORT)
 
     # kcwi specific parameters
     parser.add_argument("-p", "--proctab", dest='proctab', help='Proctab file',
@@ -123,6 +131,14 @@ def main():
     # get arguments
     args = _parse_arguments(sys.argv)
 
+    # the framework and the astropy based modules are imported once the
+    # arguments are parsed, so that --help and usage errors are quick
+    import pkg_resources
+    from keckdrpframework.core.framework import Framework
+    from kcwidrp.core.kcwi_get_std import is_file_kcwi_std
+    from kcwidrp.core.kcwi_proctab import Proctab
+    from kcwidrp.core.kcwi_night_index import NightIndex
+
     if args.write_config:
         dest = os.path.join(os.getcwd(), 'kcwi.cfg')
         if os.path.exists(dest):
@@ -220,6 +236,12 @@ def main():
                                                   name="KCWI")
     framework.logger = getLogger(framework_logcfg_fullpath, name="DRPF")
 
+    # saved plots are rendered by background processes
+    plot_workers = getattr(framework.config.instrument, 'plot_workers', None)
+    start_plot_queue(processes=DEFAULT_PLOT_WORKERS if plot_workers is None
+                     else plot_workers,
+                     logger=framework.context.pipeline_logger)
+
     if args.infiles is not None:
         framework.config.file_type = args.infiles
 
@@ -375,6 +397,19 @@ def main():
     framework.context.proctab = Proctab()
     framework.context.proctab.read_proctab(framework.config.instrument.procfile)
 
+    # open the night index, ingested frames are recorded in it
+    framework.context.night_index = NightIndex(
+        logger=framework.context.pipeline_logger)
+
+    # frames missing calibrations wait until a master calibration is added
+    framework.context.deferred_frames = DeferredFrames(
+        lambda name: framework.append_event('next_file',
+                                            Arguments(name=name),
+                                            recurrent=True),
+        logger=framework.logger)
+    framework.context.proctab.add_listener(
+        framework.context.deferred_frames.wake)
+
     framework.logger.info("Framework initialized")
 
     # add a start_bokeh event to the processing queue,
@@ -454,7 +489,9 @@ def main():
     # optionally continue to monitor if -m is specified
     elif args.dirname is not None:
 
-        framework.ingest_data(args.dirname, None, args.monitor)
+        framework.ingest_data(args.dirname, None, False)
+        if args.monitor:
+            watch_data_set(framework, args.dirname)
 
     # implement the group mode
     if args.group_mode is True:
@@ -491,6 +528,10 @@ def main():
     framework.config.instrument.wait_for_event = args.wait_for_event
     framework.config.instrument.continuous = args.continuous
 
+    # accept batches of files from reduce_server and report their progress
+    if args.submit_port is not None:
+        start_submit_server(framework, port=args.submit_port)
+
     framework.start(args.queue_manager_only, args.ingest_data_only,
                     args.wait_for_event, args.continuous)
 
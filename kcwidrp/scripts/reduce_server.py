@@ -1,54 +1,62 @@
 """
 Created on Jul 19, 2019
 
-Test Fits to PNG pipeline with HTTP server.
+Submit files to a KCWI pipeline running with a submission server
+(reduce_kcwi -W -S), and optionally follow their reduction.
 
 @author: skwok
 """
-import json
-import socket
-
-from keckdrpframework.utils.easyHTTP import EasyHTTPHandler, EasyHTTPServer, EasyHTTPServerThreaded
-# from utils.try_wrapper import tryEx
-
-import traceback
-
+import argparse
 import sys
-# sys.path.append('/Users/lrizzi/Python_Projects/Framework/prototype')
-import os.path
-import glob
-
-from keckdrpframework.core.framework import Framework
-from keckdrpframework.config.framework_config import ConfigClass
-from keckdrpframework import config
-from keckdrpframework.pipelines.kcwi_pipeline import Kcwi_pipeline
-from keckdrpframework.models.arguments import Arguments
-import subprocess
-import time
 
-import argparse
-import requests
-import os
+from kcwidrp.core.kcwi_submit_server import DEFAULT_SUBMIT_PORT, \
+    submit_files, job_status, stream_events
 
 
-def reduce(file_name):
+def reduce(file_names, url='http://127.0.0.1:%d' % DEFAULT_SUBMIT_PORT):
+    """Submit a batch of files in one request, returns the job ID"""
+    return submit_files(url, file_names)
 
-    dirname = os.path.dirname(file_name)
-    if dirname == '':
-        cwd = os.getcwd()
-        file_name = os.path.join(cwd, file_name)
-    r = requests.get('http://127.0.0.1:50100/add_next_file_event?file_name=%s'
-                     % file_name)
-    
 
 def main():
 
-    parser = argparse.ArgumentParser(description='Process a single file.')
-    parser.add_argument('frame', nargs=1, type=str, help='input image file')
+    parser = argparse.ArgumentParser(description='Submit files to a running '
+                                                 'KCWI pipeline.')
+    parser.add_argument('frames', nargs='*', type=str,
+                        help='input image files')
+    parser.add_argument('-u', '--url', dest='url', type=str,
+                        default='http://127.0.0.1:%d' % DEFAULT_SUBMIT_PORT,
+                        help='Submission server URL')
+    parser.add_argument('-w', '--wait', dest='wait', action='store_true',
+                        help='Wait for the files to be reduced')
+    parser.add_argument('-j', '--job', dest='job', type=str, default=None,
+                        help='Print the status of a job instead')
 
     args = parser.parse_args()
 
-    reduce(args.frame[0])
+    if args.job is not None:
+        job = job_status(args.url, args.job)
+        print("Job %s: %s" % (job['job'], job['status']))
+        for name, entry in job['files'].items():
+            stages = ", ".join("%s %.1fs" % (s['stage'], s['seconds'])
+                               for s in entry['stages'])
+            print("  %s: %s  %s" % (name, entry['status'], stages))
+        return
+
+    if not args.frames:
+        parser.error("no files to submit")
+    job_id = reduce(args.frames, url=args.url)
+    print("Job %s: %d files submitted" % (job_id, len(args.frames)))
+
+    if args.wait:
+        status = 0
+        for event in stream_events(args.url, job_id):
+            if 'file' in event:
+                print("  %s: %s in %.1fs" % (event['file'], event['status'],
+                                             event['seconds']))
+                if event['status'] == 'failed':
+                    status = 1
+        sys.exit(status)
 
 
 if __name__ == "__main__":
@@ -22,6 +22,7 @@ import pkg_resources
 
 from kcwidrp.pipelines.kcwi_pipeline import Kcwi_pipeline
 from kcwidrp.core.kcwi_proctab import Proctab
+from kcwidrp.core.kcwi_night_index import NightIndex
 import logging.config
 
 
@@ -56,8 +57,8 @@ def check_directory(directory):
 def main():
 
     def process(subset):
-        for frame in subset.index:
-            arguments = Arguments(name=frame)
+        for frame in subset:
+            arguments = Arguments(name=frame['path'])
             framework.append_event('next_file', arguments)
 
     args = _parse_arguments(sys.argv)
@@ -115,6 +116,10 @@ def main():
     framework.context.proctab = Proctab()
     framework.context.proctab.read_proctab(tfil=args.proctab)
 
+    # open the night index, ingested frames are recorded in it
+    framework.context.night_index = NightIndex(
+        logger=framework.context.pipeline_logger)
+
     framework.logger.info("Framework initialized")
 
     # add a start_bokeh event to the processing queue, if requested by the configuration parameters
@@ -125,31 +130,28 @@ def main():
     framework.config.default_ingestion_event = "no_event"
 
     # single frame processing
+    frames = []
     if args.frames:
-        framework.ingest_data(None, args.frames, False)
+        frames = args.frames
 
     # processing of a list of files contained in a file
     elif args.file_list:
-        frames = []
         with open(args.file_list) as file_list:
             for frame in file_list:
                 if "#" not in frame:
                     frames.append(frame.strip('\n'))
-        framework.ingest_data(None, frames, False)
-
-    data_set = framework.context.data_set
 
-    # remove focus images and ccd clearing images from the dataset
-    focus_frames = data_set.data_table[data_set.data_table.OBJECT == "focus"].index
-    ccdclear_frames = data_set.data_table[data_set.data_table.OBJECT == "Clearing ccd"].index
-    data_set.data_table.drop(focus_frames, inplace=True)
-    data_set.data_table.drop(ccdclear_frames, inplace=True)
+    # classify the frames from the night index, only new frames are read
+    night_index = framework.context.night_index
+    night_index.update(frames)
+    requested = {os.path.abspath(frame) for frame in frames}
 
-    # processing
+    # processing, focus images and ccd clearing images are left out
     imtypes = ['BIAS', 'CONTBARS', 'ARCLAMP', 'FLATLAMP', 'OBJECT']
 
     for imtype in imtypes:
-        subset = data_set.data_table[framework.context.data_set.data_table.IMTYPE == imtype]
+        subset = [row for row in night_index.frames(imtype=imtype)
+                  if row['path'] in requested]
         process(subset)
 
     framework.start(False, False, True, True)
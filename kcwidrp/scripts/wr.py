@@ -4,6 +4,8 @@ if sys.version_info[0] > 2:
     from astropy.io import fits as pf
 else:
     import pyfits as pf
+from kcwidrp.core.kcwi_headers import scan_headers
+from kcwidrp.core.kcwi_night_index import record_headers
 
 
 def wr_main():
@@ -58,8 +60,13 @@ def wr_main():
     else:
         configs = []
         fnames = {"allr": []}
-        for ifl in sys.argv[1:]:
-            logstr, cfgstr, lsfn = get_log_string(ifl, batch=True)
+        # read all the headers up front, in parallel and from the cache
+        headers = scan_headers(sys.argv[1:])
+        # and record them in the night index for the other tools, unless
+        # the directory is not writable
+        record_headers(sys.argv[1:], headers)
+        for ifl, hdr in zip(sys.argv[1:], headers):
+            logstr, cfgstr, lsfn = get_log_string(ifl, batch=True, header=hdr)
             print(logstr)
             fnames['allr'].append(ifl)
             if lsfn:
@@ -141,7 +148,7 @@ def get_cal_list_file(hdr):
     return lfname
 
 
-def get_log_string(ifile, batch=False):
+def get_log_string(ifile, batch=False, header=None):
     """
     Generate log entry from RED FITS header keywords.
 
@@ -151,6 +158,8 @@ def get_log_string(ifile, batch=False):
     Args:
         ifile (str): filename of FITS image to summarize
         batch (bool): set to ``True`` for an abreviated record.  Defaults to ``False``.
+        header (FITS header): primary header of `ifile` if already read (it
+            is modified).  Defaults to reading it from `ifile`.
 
     :returns:
         (str): Configuration summary string for the input FITS image file.
@@ -158,13 +167,13 @@ def get_log_string(ifile, batch=False):
     :meta private:
     """
 
-    try:
-        ff = pf.open(ifile)
-    except IOError:
-        print("***ERROR*** empty or corrupt fits file: %s" % ifile)
-        return None, None
+    if header is None:
+        try:
+            header = pf.getheader(ifile)
+        except IOError:
+            print("***ERROR*** empty or corrupt fits file: %s" % ifile)
+            return None, None, None
 
-    header = ff[0].header
     header['FNAME'] = ifile
     if 'CAMERA' in header:
         if 'RED' in header['CAMERA'].upper():
@@ -0,0 +1,57 @@
+import numpy as np
+from scipy import signal
+
+from kcwidrp.primitives.ArcOffsets import batch_xcorr_offsets
+
+
+def make_arcs(nbars=120, ny=2056, seed=4):
+    """Arc spectra with known sub-pixel shifts relative to bar 0"""
+    rng = np.random.default_rng(seed)
+    lines = rng.uniform(100, ny - 100, 40)
+    amps = rng.uniform(200., 5000., 40)
+    shifts = rng.uniform(-15., 15., nbars)
+    shifts[0] = 0.
+    yy = np.arange(ny)
+    arcs = np.zeros((nbars, ny))
+    for ib in range(nbars):
+        for ln, amp in zip(lines, amps):
+            arcs[ib] += amp * np.exp(-0.5 * ((yy - ln - shifts[ib]) / 1.8) ** 2)
+        arcs[ib] += rng.normal(0., 5., ny)
+    tkwgt = signal.windows.tukey(ny, alpha=0.2)
+    return arcs * tkwgt[None, :], shifts
+
+
+def legacy_offsets(reference_arc, arcs):
+    """Reference: the original direct-correlation loop of ArcOffsets"""
+    number_of_samples = len(reference_arc[10:-10])
+    offsets_array = np.arange(1 - number_of_samples, number_of_samples)
+    offsets = []
+    for arc in arcs:
+        cross_correlation = np.correlate(reference_arc[10:-10], arc[10:-10],
+                                         mode='full')
+        ncross = len(cross_correlation)
+        cr0 = int(ncross * 0.25)
+        cr1 = int(ncross * 0.75)
+        central_cross = cross_correlation[cr0:cr1]
+        central_offs = offsets_array[cr0:cr1]
+        offsets.append(central_offs[central_cross.argmax()])
+    return np.array(offsets)
+
+
+def test_batch_xcorr_matches_legacy():
+    arcs, shifts = make_arcs()
+    ref = legacy_offsets(arcs[0], arcs)
+    offsets, int_offsets, quality = batch_xcorr_offsets(arcs[0], arcs)
+
+    np.testing.assert_array_equal(int_offsets, ref)
+    # rolling by the offset aligns the arc with the reference
+    np.testing.assert_allclose(offsets, -shifts, atol=0.1)
+    assert np.all(np.abs(offsets - int_offsets) <= 0.5)
+    assert np.all(quality > 0.9) and quality[0] > 0.999
+
+
+def test_batch_xcorr_quality_flags_mismatch():
+    arcs, shifts = make_arcs(nbars=2)
+    arcs[1] = np.random.default_rng(5).normal(0., 1., arcs.shape[1])
+    offsets, int_offsets, quality = batch_xcorr_offsets(arcs[0], arcs)
+    assert quality[1] < 0.2
@@ -0,0 +1,167 @@
+import logging
+
+import numpy as np
+import pytest
+
+from kcwidrp.core.bspline import Bspline
+from kcwidrp.core.bspline.Bspline import band_normal_equations
+
+
+def make_data(npts=200000, nknots=1000, seed=8):
+    """Sorted sky-like spectrum with outliers and evenly spaced knots"""
+    rng = np.random.default_rng(seed)
+    x = np.sort(rng.uniform(3500., 5500., npts))
+    y = 100. + 20. * np.sin(x / 15.) + \
+        500. * np.exp(-0.5 * ((x - 4500.) / 2.) ** 2) + \
+        rng.normal(0., 2., npts)
+    y[rng.uniform(size=npts) < 0.01] += 300.
+    bkpt = x[0] + np.arange(nknots + 1) * (x[-1] - x[0]) / nknots
+    return x, y, bkpt
+
+
+def legacy_intrv(sset, x):
+    """Reference: the original per-point breakpoint search"""
+    gb = sset.breakpoints[sset.mask]
+    n = gb.size - sset.nord
+    indx = np.zeros((x.size,), dtype='i4')
+    ileft = sset.nord - 1
+    for i in range(x.size):
+        while x[i] > gb[ileft+1] and ileft < n - 1:
+            ileft += 1
+        indx[i] = ileft
+    return indx
+
+
+def legacy_normal_equations(sset, a1, a2, ydata, lower, upper):
+    """Reference: the original per-segment assembly from Bspline.fit"""
+    nn = sset.mask[sset.nord:].sum()
+    nfull = nn * sset.npoly
+    bw = sset.npoly * sset.nord
+    alpha = np.zeros((bw, nfull+bw), dtype='d')
+    beta = np.zeros((nfull+bw,), dtype='d')
+    bi = np.arange(bw, dtype='i4')
+    bo = np.arange(bw, dtype='i4')
+    for k in range(1, bw):
+        bi = np.append(bi, np.arange(bw-k, dtype='i4')+(bw+1)*k)
+        bo = np.append(bo, np.arange(bw-k, dtype='i4')+bw*k)
+    for k in range(nn-sset.nord+1):
+        itop = k*sset.npoly
+        ibottom = min(itop, nfull) + bw - 1
+        ict = upper[k] - lower[k] + 1
+        if ict > 0:
+            work = np.dot(a1[lower[k]:upper[k]+1, :].T,
+                          a2[lower[k]:upper[k]+1, :])
+            wb = np.dot(ydata[lower[k]:upper[k]+1],
+                        a2[lower[k]:upper[k]+1, :])
+            alpha.T.flat[bo+itop*bw] += work.flat[bi]
+            beta[itop:ibottom+1] += wb
+    return alpha, beta
+
+
+def legacy_value(sset, action, lower, upper):
+    """Reference: the original per-segment evaluation on sorted data"""
+    yfit = np.zeros(action.shape[0])
+    spot = np.arange(sset.npoly * sset.nord, dtype='i4')
+    coeffbk = sset.mask[sset.nord:].nonzero()[0]
+    n = sset.mask.sum() - sset.nord
+    if sset.npoly > 1:
+        goodcoeff = sset.coeff[:, coeffbk]
+    else:
+        goodcoeff = sset.coeff[coeffbk]
+    for i in range(n-sset.nord+1):
+        ict = upper[i] - lower[i] + 1
+        if ict > 0:
+            yfit[lower[i]:upper[i] + 1] = np.dot(
+                action[lower[i]:upper[i] + 1, :],
+                (goodcoeff.flatten('F'))[i * sset.npoly + spot])
+    return yfit
+
+
+def test_intrv_matches_legacy():
+    x, y, bkpt = make_data(npts=20000)
+    sset = Bspline.Bspline(x, fullbkpt=bkpt)
+    np.testing.assert_array_equal(sset.intrv(x), legacy_intrv(sset, x))
+    # unsorted data and NaNs follow the same one-way scan
+    xr = np.random.default_rng(9).permutation(x)
+    xr[::13] = np.nan
+    np.testing.assert_array_equal(sset.intrv(xr), legacy_intrv(sset, xr))
+
+
+@pytest.mark.parametrize('npoly', [1, 3])
+def test_normal_equations_match_legacy(npoly):
+    x, y, bkpt = make_data()
+    rng = np.random.default_rng(10)
+    x2 = rng.uniform(0., 1., x.size)
+    invvar = rng.uniform(0.5, 1.5, x.size)
+    invvar[rng.uniform(size=x.size) < 0.05] = 0.
+    sset = Bspline.Bspline(x, fullbkpt=bkpt[::4], npoly=npoly)
+    a1, lower, upper = sset.action(x, x2=x2 if npoly > 1 else None)
+    a2 = a1 * invvar[:, np.newaxis]
+
+    ref = legacy_normal_equations(sset, a1, a2, y, lower, upper)
+    nn = sset.mask[sset.nord:].sum()
+    new = band_normal_equations(a1, a2, y, lower, upper, nn - sset.nord + 1,
+                                npoly, nn * npoly)
+
+    np.testing.assert_allclose(new[0], ref[0], rtol=1.e-10, atol=1.e-8)
+    np.testing.assert_allclose(new[1], ref[1], rtol=1.e-10, atol=1.e-8)
+
+
+def test_iterfit_and_value_match_legacy():
+    x, y, bkpt = make_data()
+    sset, outmask = Bspline.iterfit(x, y, fullbkpt=bkpt, upper=1, lower=1)
+    yfit, _ = sset.value(x)
+
+    action, lower, upper = sset.action(x)
+    np.testing.assert_allclose(yfit, legacy_value(sset, action, lower, upper),
+                               rtol=1.e-12, atol=1.e-10)
+    # the outliers are rejected and the model follows the spectrum
+    assert 0.9 * x.size < outmask.sum() < 0.99 * x.size
+    model = 100. + 20. * np.sin(x / 15.) + \
+        500. * np.exp(-0.5 * ((x - 4500.) / 2.) ** 2)
+    assert np.median(np.abs(yfit - model)) < 0.5
+
+
+def test_workit_matches_fit():
+    x, y, bkpt = make_data(npts=50000, nknots=200)
+    invvar = np.full(x.size, 0.25)
+    sset = Bspline.Bspline(x, fullbkpt=bkpt)
+    err, yfit = sset.fit(x, y, invvar)
+    wset = Bspline.Bspline(x, fullbkpt=bkpt)
+    action, lower, upper = wset.action(x)
+    werr, wfit = wset.workit(x, y, invvar, action, lower, upper)
+    assert err == 0 and werr == 0
+    np.testing.assert_allclose(wset.coeff, sset.coeff, rtol=1.e-8,
+                               atol=1.e-8)
+
+
+def test_incremental_fit_matches_rebuild():
+    x, y, bkpt = make_data(npts=100000, nknots=500)
+    rng = np.random.default_rng(11)
+    invvar = np.full(x.size, 0.25)
+    normal = {}
+    sset = Bspline.Bspline(x, fullbkpt=bkpt)
+    sset.fit(x, y, invvar, normal=normal)
+    # reject some points, then restore part of them
+    for frac in (0.02, 0.005):
+        invvar = invvar.copy()
+        invvar[rng.uniform(size=x.size) < frac] = 0.
+        invvar[rng.uniform(size=x.size) < frac / 2.] = 0.25
+        err, yfit = sset.fit(x, y, invvar, normal=normal)
+        full = Bspline.Bspline(x, fullbkpt=bkpt)
+        ferr, ffit = full.fit(x, y, invvar)
+        assert err == 0 and ferr == 0
+        np.testing.assert_allclose(sset.coeff, full.coeff, rtol=1.e-9,
+                                   atol=1.e-9)
+        np.testing.assert_allclose(yfit, ffit, rtol=1.e-9, atol=1.e-9)
+
+
+def test_iterfit_logs_convergence(caplog):
+    x, y, bkpt = make_data(npts=50000, nknots=200)
+    logger = logging.getLogger('test_bspline')
+    with caplog.at_level(logging.INFO, logger='test_bspline'):
+        sset, outmask = Bspline.iterfit(x, y, fullbkpt=bkpt, upper=1,
+                                        lower=1, logger=logger)
+    lines = [r.getMessage() for r in caplog.records]
+    assert lines[0].startswith('iterfit iteration 1:')
+    assert lines[-1].endswith('%d good' % outmask.sum())
@@ -0,0 +1,160 @@
+import ccdproc
+import numpy as np
+import pytest
+from astropy.io import fits
+from astropy.nddata import CCDData
+from astropy.stats import mad_std
+
+from kcwidrp.core.kcwi_combine import combine_frames, combine_images, \
+    nanmedian_axis0
+
+
+def inv_median(a):
+    return 1.0/np.median(a)
+
+
+def nan_mad_std(a, axis=None):
+    return mad_std(a, axis=axis, ignore_nan=True)
+
+
+def make_frames(path, nframes=7, shape=(300, 200), seed=8):
+    """Flat-like frames with varying levels and cosmic ray hits"""
+    rng = np.random.default_rng(seed)
+    yy, xx = np.mgrid[0:shape[0], 0:shape[1]]
+    model = 1000. + 200. * np.sin(xx / 30.) + 0.5 * yy
+    fnames = []
+    for i in range(nframes):
+        img = model * (1. + 0.1 * i) + rng.normal(0., 10., shape)
+        hits = rng.integers(0, img.size, 200)
+        img.flat[hits] += rng.uniform(500., 5000., hits.size)
+        fname = str(path / ('frame%d.fits' % i))
+        fits.PrimaryHDU(img.astype(np.float32)).writeto(fname)
+        fnames.append(fname)
+    return fnames
+
+
+@pytest.mark.parametrize('method,scale', [('average', inv_median),
+                                          ('median', None)])
+def test_combine_images_matches_ccdproc(tmp_path, method, scale):
+    fnames = make_frames(tmp_path)
+    # ccdproc clips the unscaled data, so give it pre-scaled frames
+    stack = []
+    for fn in fnames:
+        img = fits.getdata(fn).astype(np.float64)
+        if scale is not None:
+            img *= scale(img)
+        stack.append(CCDData(img, unit='adu'))
+    ref = ccdproc.combine(stack, method=method, sigma_clip=True,
+                          sigma_clip_low_thresh=None,
+                          sigma_clip_high_thresh=2.0,
+                          sigma_clip_func=np.ma.median,
+                          sigma_clip_dev_func=mad_std)
+    # a small budget forces many row blocks
+    data, unc, mask, scaling = combine_images(fnames, method=method,
+                                              scale=scale, sig_up=2.0,
+                                              mem_limit=1.e6)
+
+    np.testing.assert_allclose(data, ref.data, rtol=1.e-12)
+    np.testing.assert_allclose(unc, ref.uncertainty.array, rtol=1.e-9)
+    np.testing.assert_array_equal(mask, ref.mask)
+    if scale is not None:
+        np.testing.assert_allclose(
+            scaling, [inv_median(fits.getdata(fn).astype(np.float64))
+                      for fn in fnames])
+
+
+def write_masked_frames(path):
+    """Frames with a MASK extension, returns the files and the frames"""
+    rng = np.random.default_rng(10)
+    frames = []
+    fnames = []
+    for i, fn in enumerate(make_frames(path)):
+        ccd = CCDData(fits.getdata(fn).astype(np.float64), unit='adu',
+                      mask=rng.random((300, 200)) < 0.2)
+        # masked in every frame
+        ccd.mask[5, :] = True
+        # a masked defect that would bias the combination
+        if i < 3:
+            ccd.data[100:110, 50] = 1.e5
+            ccd.mask[100:110, 50] = True
+        fname = str(path / ('masked%d.fits' % i))
+        ccd.to_hdu().writeto(fname)
+        fnames.append(fname)
+        frames.append(ccd)
+    return fnames, frames
+
+
+def ccdproc_reference(frames, method):
+    return ccdproc.combine(frames, method=method, sigma_clip=True,
+                           sigma_clip_low_thresh=None,
+                           sigma_clip_high_thresh=2.0,
+                           sigma_clip_func=np.nanmedian,
+                           sigma_clip_dev_func=nan_mad_std)
+
+
+@pytest.mark.parametrize('method', ['average', 'median'])
+def test_combine_images_ignores_masks(tmp_path, method):
+    fnames, frames = write_masked_frames(tmp_path)
+    # ccdproc sigma clipping drops the input masks
+    ref = ccdproc_reference(frames, method)
+    data, unc, mask, scaling = combine_images(fnames, method=method,
+                                              sig_up=2.0, mem_limit=1.e6)
+    assert np.isfinite(data).all() and not mask.any()
+    np.testing.assert_allclose(data, ref.data, rtol=1.e-12)
+    np.testing.assert_allclose(unc, ref.uncertainty.array, rtol=1.e-9)
+
+
+@pytest.mark.parametrize('method', ['average', 'median'])
+def test_combine_images_excludes_masked(tmp_path, method):
+    fnames, frames = write_masked_frames(tmp_path)
+    unmasked = ccdproc_reference(frames, method)
+    # flag the masked pixels with NaN for ccdproc
+    ref = ccdproc_reference([CCDData(np.where(ccd.mask, np.nan, ccd.data),
+                                     unit='adu') for ccd in frames], method)
+    data, unc, mask, scaling = combine_images(fnames, method=method,
+                                              sig_up=2.0, mem_limit=1.e6,
+                                              use_mask=True)
+
+    assert np.isfinite(data).all() and not mask.any()
+    assert data[100:110, 50].max() < 2.e3
+    # pixels masked in every frame get the unmasked combination
+    everywhere = np.logical_and.reduce([ccd.mask for ccd in frames])
+    assert everywhere[5].all()
+    np.testing.assert_allclose(data[everywhere], unmasked.data[everywhere],
+                               rtol=1.e-12)
+    np.testing.assert_allclose(unc[everywhere],
+                               unmasked.uncertainty.array[everywhere],
+                               rtol=1.e-9)
+    good = ~everywhere
+    np.testing.assert_allclose(data[good], ref.data[good], rtol=1.e-12)
+    np.testing.assert_allclose(unc[good], ref.uncertainty.array[good],
+                               rtol=1.e-9)
+
+
+def test_nanmedian_axis0():
+    rng = np.random.default_rng(9)
+    stack = rng.normal(0., 1., (6, 40, 30))
+    np.testing.assert_allclose(nanmedian_axis0(stack),
+                               np.median(stack, axis=0))
+    stack[rng.random(stack.shape) < 0.3] = np.nan
+    stack[:, 0, 0] = np.nan
+    with pytest.warns(RuntimeWarning):
+        ref = np.nanmedian(stack, axis=0)
+    np.testing.assert_allclose(nanmedian_axis0(stack), ref)
+
+
+def test_combine_frames_keeps_template(tmp_path):
+    from kcwidrp.primitives.kcwi_file_primitives import KCCDData
+    fnames = make_frames(tmp_path, nframes=3, shape=(40, 30))
+    template = KCCDData(fits.getdata(fnames[0]).astype(np.float64),
+                        unit='electron', meta={'IMTYPE': 'BIAS'})
+    template.flags = np.zeros((40, 30), dtype=np.uint8)
+    stacked, scaling = combine_frames(template, fnames, method='average',
+                                      sig_up=2.0, nthreads=2)
+    assert isinstance(stacked, KCCDData)
+    assert stacked.header['IMTYPE'] == 'BIAS'
+    assert stacked.unit == template.unit
+    assert stacked.flags is not None
+    assert stacked.uncertainty.array.shape == (40, 30)
+    np.testing.assert_array_equal(scaling, 1.)
+    assert not np.shares_memory(stacked.data, template.data)
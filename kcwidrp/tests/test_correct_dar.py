@@ -0,0 +1,41 @@
+import math
+
+import numpy as np
+from scipy.ndimage import shift
+
+from kcwidrp.primitives.CorrectDar import atm_disper, dar_shifts, shift_cube
+
+
+def test_dar_shifts_match_per_wavelength():
+    waves = np.linspace(3500., 5600., 50)
+    wref = 4500.
+    y_shift, x_shift = dar_shifts(waves, wref, 1.4, 0.3, 0.68, 0.29)
+    for j, wl in enumerate(waves):
+        disp = atm_disper(wref, wl, 1.4)
+        assert math.isclose(x_shift[j], disp * math.sin(0.3) / 0.68,
+                            rel_tol=1.e-12, abs_tol=1.e-12)
+        assert math.isclose(y_shift[j], disp * math.cos(0.3) / 0.29,
+                            rel_tol=1.e-12, abs_tol=1.e-12)
+
+
+def test_shift_cube_matches_plane_loop():
+    rng = np.random.default_rng(6)
+    nw, ny, nx = 300, 100, 30
+    cube = rng.normal(10., 1., (nw, ny, nx))
+    flags = rng.integers(0, 4, (nw, ny, nx)).astype(np.uint8)
+    y_shift = np.linspace(-3.2, 2.7, nw)
+    x_shift = np.linspace(1.1, -0.8, nw)
+
+    ref = np.empty_like(cube)
+    for j in range(nw):
+        ref[j] = shift(cube[j], (y_shift[j], x_shift[j]))
+    new = shift_cube(cube, y_shift, x_shift, chunk=32)
+    np.testing.assert_array_equal(new, ref)
+
+    # flag bits are moved, never interpolated
+    nflags = shift_cube(flags, y_shift, x_shift, order=0)
+    assert nflags.dtype == np.uint8
+    assert set(np.unique(nflags)) <= {0, 1, 2, 3}
+    for j in (0, nw // 2, nw - 1):
+        np.testing.assert_array_equal(
+            nflags[j], shift(flags[j], (y_shift[j], x_shift[j]), order=0))
@@ -0,0 +1,56 @@
+import glob
+import os
+
+import numpy as np
+import pandas as pd
+import pkg_resources
+import pytest
+
+from kcwidrp.primitives.CorrectDefects import compile_defects, \
+    correct_defects
+
+DEFECT_FILES = sorted(glob.glob(os.path.join(
+    pkg_resources.resource_filename('kcwidrp', 'data'), 'defect_*.dat')))
+
+
+def legacy_correct(data, flags, full_path):
+    """Reference: the original per-pixel loop from CorrectDefects"""
+    defect_table = pd.read_csv(full_path, sep=r'\s+')
+    pixel_range_for_good_value = 2
+    number_of_bad_pixels = 0
+    for index, row in defect_table.iterrows():
+        x0 = row['X0'] - 1
+        x1 = row['X1']
+        y0 = row['Y0'] - 1
+        y1 = row['Y1']
+        for by in range(y0, y1):
+            values = list(data[by, x0-pixel_range_for_good_value:x0])
+            values.extend(data[by, x1:x1+pixel_range_for_good_value])
+            good_values = np.nanmedian(np.asarray(values))
+            for bx in range(x0, x1):
+                data[by, bx] = good_values
+                flags[by, bx] += 2
+                number_of_bad_pixels += 1
+    return number_of_bad_pixels
+
+
+@pytest.mark.parametrize('full_path', DEFECT_FILES,
+                         ids=[os.path.basename(f) for f in DEFECT_FILES])
+def test_correct_defects_matches_legacy(full_path):
+    shape = (4128, 4096) if '1x1' in full_path else (2064, 2048)
+    rng = np.random.default_rng(10)
+    img = rng.normal(100., 5., shape)
+
+    ref = img.copy()
+    ref_flags = np.zeros(shape, dtype=np.uint8)
+    nref = legacy_correct(ref, ref_flags, full_path)
+
+    new = img.copy()
+    new_flags = np.zeros(shape, dtype=np.uint8)
+    defects = compile_defects(full_path)
+    nnew = correct_defects(new, new_flags, defects)
+
+    assert nnew == nref
+    np.testing.assert_array_equal(new, ref)
+    np.testing.assert_array_equal(new_flags, ref_flags)
+    assert compile_defects(full_path) is defects
@@ -0,0 +1,39 @@
+import numpy as np
+
+from astroscrappy import detect_cosmics
+from kcwidrp.core.kcwi_cosmics import detect_cosmics_tiled, tile_bounds
+
+
+def make_frame(ny=512, nx=256, seed=12):
+    """Slice-like continuum traces with cosmic ray hits"""
+    rng = np.random.default_rng(seed)
+    yy, xx = np.mgrid[0:ny, 0:nx]
+    img = rng.normal(100., 5., (ny, nx))
+    for x0 in range(20, nx, 40):
+        img += 2000. * np.exp(-0.5 * ((xx - x0) / 1.5) ** 2) * \
+            (1. + 0.3 * np.sin(yy / 50.))
+    hits = rng.integers(0, img.size, 400)
+    img.flat[hits] += rng.uniform(200., 5000., hits.size)
+    # a few longer tracks crossing the band borders
+    for y0 in (120, 250, 380):
+        img[y0:y0 + 12, 60 + y0 // 10] += 3000.
+    return img
+
+
+def test_tiled_cosmics_match_whole_frame():
+    img = make_frame()
+    kwargs = dict(gain=1.0, readnoise=5.0, psffwhm=2.5, sigclip=4.5,
+                  sigfrac=0.3, objlim=4., fsmode='median', psfmodel='gauss',
+                  sepmed=False, cleantype='meanmask')
+    ref_mask, ref_clean = detect_cosmics(img, **kwargs)
+    mask, clean = detect_cosmics_tiled(img, nthreads=2, ntiles=4, **kwargs)
+    assert ref_mask.sum() > 400
+    np.testing.assert_array_equal(mask, ref_mask)
+    np.testing.assert_array_equal(clean, ref_clean)
+
+
+def test_tile_bounds_cover_rows():
+    bounds = tile_bounds(1000, 3, 20)
+    assert bounds[0][:2] == (0, 333) and bounds[-1][1] == 1000
+    assert all(b0[1] == b1[0] for b0, b1 in zip(bounds[:-1], bounds[1:]))
+    assert bounds[1][2:] == (313, 686)
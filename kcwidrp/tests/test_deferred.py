@@ -0,0 +1,141 @@
+import logging
+from types import SimpleNamespace
+
+from astropy.io import fits
+
+from kcwidrp.core.kcwi_deferred import DeferredFrames, cal_signature, \
+    row_signature
+from kcwidrp.core.kcwi_proctab import Proctab
+from kcwidrp.primitives.kcwi_file_primitives import ingest_file
+
+
+def proctab_frame(imtype, camera='BLUE', frameno=1, stateid='abc',
+                  ccdcfg='2211'):
+    hdr = fits.Header()
+    for key, val in dict(FRAMENO=frameno, STATEID=stateid, CCDCFG=ccdcfg,
+                         IMTYPE=imtype, TTIME=0., CAMERA=camera,
+                         STATENAM='state', IFUNAM='Medium', BGRATNAM='BL',
+                         BGRANGLE=10., BCWAVE=4500., BFILTNAM='KBlue',
+                         RGRATNAM='RL', RGRANGLE=10., RCWAVE=7000.,
+                         BINNING='2,2', MJD=60000. + frameno,
+                         OFNAME='f%d.fits' % frameno, TARGNAME='t').items():
+        hdr[key] = val
+    return SimpleNamespace(header=hdr)
+
+
+def new_proctab():
+    proctab = Proctab(logger=logging.getLogger('test_deferred'))
+    proctab.new_proctab()
+    return proctab
+
+
+def add_master(proctab, imtype, frameno, **keys):
+    proctab.update_proctab(proctab_frame(imtype, frameno=frameno, **keys),
+                           suffix=imtype.lower(), filename='m%d' % frameno)
+
+
+def make_ingest(proctab, frame):
+    context = SimpleNamespace(logger=logging.getLogger('test_deferred'),
+                              pipeline_logger=logging.getLogger(
+                                  'test_deferred'),
+                              config=None, proctab=proctab)
+    primitive = ingest_file(SimpleNamespace(args=None), context)
+    primitive.ccddata = frame
+    return primitive
+
+
+def test_signatures():
+    assert cal_signature('MBIAS', 'blue ', '2211', 'x') == \
+        ('BLUE', 'MBIAS', 2211)
+    assert cal_signature('MARC', 'BLUE', '2211', '0') == \
+        ('BLUE', 'MARC', 'NONE')
+    row = dict(TYPE='MARC', CAM='BLUE', DID=2211, CID='abc')
+    assert row_signature(row) == cal_signature('MARC', 'BLUE', 2211, 'abc')
+
+
+def test_missing_calibrations():
+    proctab = new_proctab()
+    obj = make_ingest(proctab, proctab_frame('OBJECT', frameno=50))
+    assert obj.check_if_file_can_be_processed('OBJECT') is False
+    assert obj.missing_cals == [('MBIAS',), ('MARC',),
+                                ('MFLAT', 'MDOME', 'MTWIF')]
+    add_master(proctab, 'MBIAS', 1, stateid='0')
+    add_master(proctab, 'MTWIF', 2)
+    assert obj.check_if_file_can_be_processed('OBJECT') is False
+    assert obj.missing_cals == [('MARC',)]
+    assert obj.missing_signatures() == [[('BLUE', 'MARC', 'abc')]]
+    add_master(proctab, 'MARC', 3)
+    assert obj.check_if_file_can_be_processed('OBJECT') is True
+    assert obj.check_if_file_can_be_processed('BIAS') is True
+
+
+def test_wait_list_wakes_on_matching_rows():
+    queued = []
+    deferred = DeferredFrames(queued.append)
+    proctab = new_proctab()
+    proctab.add_listener(deferred.wake)
+
+    obj = make_ingest(proctab, proctab_frame('OBJECT', frameno=50))
+    obj.check_if_file_can_be_processed('OBJECT')
+    deferred.defer('kb_00050.fits', obj.missing_signatures())
+    arc = make_ingest(proctab, proctab_frame('ARCLAMP', frameno=40,
+                                             stateid='other'))
+    arc.check_if_file_can_be_processed('ARCLAMP')
+    deferred.defer('kb_00040.fits', arc.missing_signatures())
+    assert len(deferred) == 2
+
+    # rows of another CCD configuration, state or camera do not wake
+    add_master(proctab, 'MBIAS', 1, ccdcfg='1211')
+    add_master(proctab, 'MARC', 2, stateid='other')
+    add_master(proctab, 'MFLAT', 3, camera='RED')
+    add_master(proctab, 'CONTBARS', 4, stateid='other')
+    assert queued == []
+
+    add_master(proctab, 'MCBARS', 5, stateid='other')
+    assert queued == ['kb_00040.fits']
+    add_master(proctab, 'MBIAS', 6)
+    add_master(proctab, 'MDOME', 7)
+    assert queued == ['kb_00040.fits']
+    # any of the flats satisfies the frame, the others no longer wake it
+    add_master(proctab, 'MARC', 8)
+    assert queued == ['kb_00040.fits', 'kb_00050.fits']
+    assert len(deferred) == 0 and deferred.by_signature == {}
+    add_master(proctab, 'MFLAT', 9)
+    assert len(queued) == 2
+
+
+class RecordingDict(dict):
+    """dict that records the keys read or written"""
+
+    def __init__(self, *args):
+        super().__init__(*args)
+        self.touched = set()
+
+    def __getitem__(self, key):
+        self.touched.add(key)
+        return super().__getitem__(key)
+
+    def __setitem__(self, key, value):
+        self.touched.add(key)
+        super().__setitem__(key, value)
+
+    def __delitem__(self, key):
+        self.touched.add(key)
+        super().__delitem__(key)
+
+
+def test_wait_list_checks_per_row():
+    """Waiting frames are only looked at for rows they wait for"""
+    deferred = DeferredFrames(lambda name: None)
+    for i in range(400):
+        deferred.defer('kb_%05d.fits' % i,
+                       [[('BLUE', 'MARC', 'state%d' % (i % 20))]])
+    deferred.waiting = RecordingDict(deferred.waiting)
+
+    for _ in range(200):
+        deferred.wake(dict(TYPE='MBIAS', CAM='BLUE', DID=2211, CID='NONE'))
+    assert deferred.waiting.touched == set()
+    deferred.wake(dict(TYPE='MARC', CAM='BLUE', DID=2211, CID='state3'))
+    assert deferred.waiting.touched == {'kb_%05d.fits' % i
+                                        for i in range(3, 400, 20)}
+    assert len(deferred) == 380
@@ -0,0 +1,81 @@
+import numpy as np
+from skimage import transform as tf
+
+from kcwidrp.primitives.ExtractArcs import extract_arc_bands, \
+    fit_arc_backgrounds
+
+
+def make_arc_problem(ny=1024, nx=1024, nbars=60, window=5, seed=1):
+    """Synthetic arc image with tilted bars and a known geometry"""
+    rng = np.random.default_rng(seed)
+    mid = 40. + np.arange(nbars) * 15.5
+    middle_row = ny // 2
+    rows = np.arange(32, ny, 64)
+    src = []
+    dst = []
+    for x0 in mid:
+        for yr in rows:
+            src.append((x0, yr))
+            dst.append((x0 + 0.003 * (yr - middle_row), yr))
+    for x0 in mid:
+        src.append((x0, middle_row))
+        dst.append((x0, middle_row))
+    src = np.asarray(src)
+    dst = np.asarray(dst)
+    yy = np.arange(ny)[:, None]
+    img = 50. + 0.02 * yy + rng.normal(0., 1., (ny, nx))
+    lines = rng.uniform(60, ny - 60, 25)
+    spec = np.zeros(ny)
+    for ln in lines:
+        spec += 1000. * np.exp(-0.5 * ((np.arange(ny) - ln) / 2.) ** 2)
+    img += spec[:, None]
+    tform = tf.estimate_transform('polynomial', src, dst, order=3)
+    return img, tform, src, middle_row, window
+
+
+def legacy_extract(img, tform, src, middle_row, window, sectors=16):
+    """Reference: full-frame warp and the original per-arc loop"""
+    warped_image = tf.warp(img, tform)
+    arcs = []
+    for xy in src:
+        if xy[1] == middle_row:
+            xi = int(xy[0] + 0.5)
+            arc = np.nanmedian(
+                warped_image[:, (xi - window):(xi + window + 1)], axis=1)
+            div = int((len(arc) - 100) / sectors)
+            xv = []
+            yv = []
+            for i in range(sectors):
+                mi = np.nanargmin(arc[50 + i * div:50 + (i + 1) * div])
+                mn = np.nanmin(arc[50 + i * div:50 + (i + 1) * div])
+                xv.append(mi + 50 + i * div)
+                yv.append(mn)
+            res = np.polyfit(xv, yv, 3)
+            arc -= np.polyval(res, np.arange(len(arc)))
+            arcs.append(arc)
+    return np.asarray(arcs)
+
+
+def test_extract_arcs_matches_legacy():
+    img, tform, src, middle_row, window = make_arc_problem()
+
+    ref = legacy_extract(img, tform, src, middle_row, window)
+    xis = (src[src[:, 1] == middle_row, 0] + 0.5).astype(int)
+    arcs = extract_arc_bands(img, tform, xis, window)
+    bkg, bad = fit_arc_backgrounds(arcs)
+    new = arcs - bkg
+
+    assert not bad.any()
+    assert new.shape == ref.shape
+    np.testing.assert_allclose(new, ref, rtol=0., atol=1.e-6)
+
+
+def test_fit_arc_backgrounds_skips_bad_sectors():
+    ny = 1124
+    xp = np.arange(ny)
+    arcs = np.tile(1.e-5 * (xp - 300.) ** 2 + 3., (2, 1))
+    arcs[1, 50:114] = np.nan
+    bkg, bad = fit_arc_backgrounds(arcs)
+    assert bad[1, 0] and bad.sum() == 1
+    np.testing.assert_allclose(bkg[:, 200:900], arcs[:1, 200:900].repeat(
+        2, axis=0), rtol=1.e-3)
@@ -0,0 +1,55 @@
+import numpy as np
+from astropy.io import fits as pf
+
+from kcwidrp.core.kcwi_correct_extin import kcwi_correct_extin, \
+    extin_flux_ratio
+from kcwidrp.primitives.FluxCalibrate import read_invsens
+
+
+def make_header(air=1.3):
+    hdr = pf.Header()
+    hdr['AIRMASS'] = air
+    hdr['CRVAL3'] = 3600.
+    hdr['CD3_3'] = 0.5
+    return hdr
+
+
+def test_extinction_cube_matches_spectrum():
+    hdr = make_header()
+    spec = np.ones(500)
+    kcwi_correct_extin(spec, hdr)
+    cube = np.ones((500, 4, 3))
+    kcwi_correct_extin(cube, make_header())
+    np.testing.assert_array_equal(cube, np.broadcast_to(spec[:, None, None],
+                                                        cube.shape))
+    assert hdr['EXTCOR'] and hdr['AVEXCOR'] > 1.
+    # the same grid and airmass reuse the cached ratio
+    ninfo = extin_flux_ratio.cache_info().hits
+    kcwi_correct_extin(np.ones(500), make_header())
+    assert extin_flux_ratio.cache_info().hits == ninfo + 1
+
+
+def test_read_invsens_resamples_and_caches(tmp_path):
+    nwave = 400
+    mcwav = 3500. + np.arange(nwave) * 0.5
+    curve = 1.e-3 * (mcwav / 4000.) ** 2
+    hdu = pf.PrimaryHDU(np.vstack((curve * 2., curve)))
+    hdu.header['CRVAL1'] = 3500.
+    hdu.header['CDELT1'] = 0.5
+    hdu.header['FRAMENO'] = 42
+    fname = str(tmp_path / 'std_invsens.fits')
+    hdu.writeto(fname)
+
+    mcal, msimgno, resampled = read_invsens(fname, 1., 3500., 0.5, nwave)
+    assert msimgno == 42 and not resampled
+    np.testing.assert_allclose(mcal, curve)
+    assert not mcal.flags.writeable
+
+    mcal, msimgno, resampled = read_invsens(fname, 1., 3550., 0.25, 300)
+    assert resampled
+    np.testing.assert_allclose(
+        mcal, 1.e-3 * ((3550. + np.arange(300) * 0.25) / 4000.) ** 2,
+        rtol=1.e-8)
+    hits = read_invsens.cache_info().hits
+    read_invsens(fname, 1., 3550., 0.25, 300)
+    assert read_invsens.cache_info().hits == hits + 1
@@ -0,0 +1,172 @@
+import math
+import time
+
+import numpy as np
+import pytest
+from skimage import transform as sktf
+
+from kcwidrp.core import geometric as tf
+
+# (binning, slice input width, output xsize, output ysize, ccd rows)
+GRIDS = {
+    '2x2': (2, 100, 81, 2000, 2056),
+    '1x1': (1, 200, 161, 4000, 4112),
+}
+
+
+def make_slice_transform(xsize, ysize, ny, seed=2):
+    """Slice geometry fit like SolveGeom: output (x, wave) -> input (x, y)"""
+    rng = np.random.default_rng(seed)
+    barsep = (xsize - 1) / 5.
+    xw = []
+    yw = []
+    xi = []
+    yi = []
+    for ib in range(5):
+        x0 = 10. + ib * barsep * 1.05
+        for yr in np.linspace(20, ny - 20, 40):
+            xi.append(x0 + 1.e-3 * yr + rng.normal(0., 0.05))
+            yi.append(yr)
+            xw.append(int(barsep / 2.) + 1 + ib * barsep)
+            yw.append((yr - 30.) * ysize / ny + 2.e-6 * yr ** 2)
+    src = np.column_stack((xw, yw))
+    dst = np.column_stack((xi, yi))
+    tform = tf.estimate_transform('asympolynomial', src, dst, order=(2, 4))
+    invtf = tf.estimate_transform('asympolynomial', dst, src, order=(2, 4))
+    return tform, invtf
+
+
+def legacy_call(tform, coords):
+    """Reference: the original term-by-term forward transformation"""
+    x = coords[:, 0]
+    y = coords[:, 1]
+    u = len(tform.params.ravel())
+    order = int((- 3 + math.sqrt(9 - 4 * (2 - u))) / 2)
+    dst = np.zeros(coords.shape)
+    pidx = 0
+    for j in range(order + 1):
+        for i in range(j + 1):
+            dst[:, 0] += tform.params[0, pidx] * x ** (j - i) * y ** i
+            dst[:, 1] += tform.params[1, pidx] * x ** (j - i) * y ** i
+            pidx += 1
+    return dst
+
+
+def grid_coords(nx, ny):
+    yy, xx = np.mgrid[0:ny, 0:nx]
+    return np.column_stack((xx.ravel(), yy.ravel())).astype(float)
+
+
+@pytest.mark.parametrize('grid', sorted(GRIDS))
+def test_forward_transform_matches_legacy(grid):
+    binning, width, xsize, ysize, ny = GRIDS[grid]
+    tform, invtf = make_slice_transform(xsize, ysize, ny)
+    coords = grid_coords(xsize, ysize)
+
+    ref = legacy_call(tform, coords)
+    new = tform(coords)
+    grd = tform.grid(np.arange(xsize), np.arange(ysize))
+    g32 = tform.grid(np.arange(xsize), np.arange(ysize), dtype=np.float32)
+
+    np.testing.assert_allclose(new, ref, rtol=1.e-12, atol=1.e-8)
+    np.testing.assert_allclose(grd.reshape(-1, 2), ref, rtol=1.e-12,
+                               atol=1.e-8)
+    # single precision is good to a small fraction of a pixel
+    assert g32.dtype == np.float32
+    np.testing.assert_allclose(g32.reshape(-1, 2), ref, rtol=0., atol=0.05)
+
+
+@pytest.mark.parametrize('grid', sorted(GRIDS))
+def test_inverse_grid_matches_legacy(grid):
+    binning, width, xsize, ysize, ny = GRIDS[grid]
+    tform, invtf = make_slice_transform(xsize, ysize, ny)
+    coords = grid_coords(width, ny)
+
+    ref = legacy_call(invtf, coords)
+    grd = invtf.grid(np.arange(width), np.arange(ny))
+
+    np.testing.assert_allclose(grd.reshape(-1, 2), ref, rtol=1.e-12,
+                               atol=1.e-8)
+
+
+@pytest.mark.parametrize('grid', sorted(GRIDS))
+def test_warp_coords_matches_callable(grid):
+    binning, width, xsize, ysize, ny = GRIDS[grid]
+    tform, invtf = make_slice_transform(xsize, ysize, ny)
+    rng = np.random.default_rng(3)
+    img = rng.normal(100., 10., (ny, width))
+
+    ref = sktf.warp(img, tform, order=3, output_shape=(ysize, xsize))
+    coords = tform.warp_coords((ysize, xsize))
+    new = sktf.warp(img, coords, order=3, output_shape=(ysize, xsize))
+
+    np.testing.assert_allclose(new, ref, rtol=1.e-9, atol=1.e-9)
+
+
+def test_default_transform_is_identity():
+    tform = tf.AsymmetricPolynomialTransform()
+    coords = np.array([[0., 0.], [3., 4.], [10., -2.]])
+    np.testing.assert_allclose(tform(coords), coords)
+    np.testing.assert_allclose(tform.grid([0., 3.], [4.]),
+                               [[[0., 4.], [3., 4.]]])
+
+
+def test_derivative_grid_matches_finite_difference():
+    binning, width, xsize, ysize, ny = GRIDS['2x2']
+    tform, invtf = make_slice_transform(xsize, ysize, ny)
+    xs = np.arange(width)
+    ys = np.arange(ny)
+    cgrid = invtf.coefficient_grids()
+    ncoo = tf.evaluate_grid(cgrid, xs, ys)
+    np.testing.assert_allclose(ncoo, invtf.grid(xs, ys))
+    dwdy = tf.evaluate_grid(tf.derivative_grid(cgrid, axis='y'), xs, ys)
+    dwdx = tf.evaluate_grid(tf.derivative_grid(cgrid, axis='x'), xs, ys)
+    # central differences are exact to second order for smooth solutions
+    fdy = 0.5 * (ncoo[2:, :, :] - ncoo[:-2, :, :])
+    fdx = 0.5 * (ncoo[:, 2:, :] - ncoo[:, :-2, :])
+    np.testing.assert_allclose(dwdy[1:-1], fdy, rtol=1.e-4, atol=1.e-6)
+    np.testing.assert_allclose(dwdx[:, 1:-1], fdx, rtol=1.e-4, atol=1.e-6)
+
+
+def timeit(func, *args, **kwargs):
+    t0 = time.perf_counter()
+    out = func(*args, **kwargs)
+    return out, time.perf_counter() - t0
+
+
+def benchmark():
+    """Time the legacy and the grid evaluations on the 2x2 and 1x1 grids"""
+    for grid in sorted(GRIDS):
+        binning, width, xsize, ysize, ny = GRIDS[grid]
+        tform, invtf = make_slice_transform(xsize, ysize, ny)
+
+        coords = grid_coords(xsize, ysize)
+        _, t_legacy = timeit(legacy_call, tform, coords)
+        _, t_call = timeit(tform, coords)
+        _, t_grid = timeit(tform.grid, np.arange(xsize), np.arange(ysize))
+        _, t_g32 = timeit(tform.grid, np.arange(xsize), np.arange(ysize),
+                          dtype=np.float32)
+        print("%s forward (%d x %d): legacy %.4f s, basis %.4f s, "
+              "grid %.4f s, grid32 %.4f s" % (grid, ysize, xsize, t_legacy,
+                                              t_call, t_grid, t_g32))
+
+        coords = grid_coords(width, ny)
+        _, t_legacy = timeit(legacy_call, invtf, coords)
+        _, t_grid = timeit(invtf.grid, np.arange(width), np.arange(ny))
+        print("%s inverse map (%d x %d): legacy %.4f s, grid %.4f s" %
+              (grid, ny, width, t_legacy, t_grid))
+
+        img = np.random.default_rng(3).normal(100., 10., (ny, width))
+        _, t_legacy = timeit(sktf.warp, img, tform, order=3,
+                             output_shape=(ysize, xsize))
+        coords, t_coords = timeit(tform.warp_coords, (ysize, xsize))
+        _, t_warp = timeit(sktf.warp, img, coords, order=3,
+                           output_shape=(ysize, xsize))
+        print("%s warp (%d x %d): callable %.4f s, coords %.4f s + "
+              "warp %.4f s" % (grid, ysize, xsize, t_legacy, t_coords,
+                               t_warp))
+
+
+if __name__ == '__main__':
+    # python -m kcwidrp.tests.test_geometric
+    benchmark()
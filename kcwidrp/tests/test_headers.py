@@ -0,0 +1,93 @@
+import os
+
+import numpy as np
+from astropy.io import fits
+
+from kcwidrp.core import kcwi_headers
+from kcwidrp.core.kcwi_headers import scan_headers, HEADER_CACHE_NAME
+from kcwidrp.scripts.wb import get_log_string
+
+
+def write_frame(path, frameno, imtype='OBJECT'):
+    hdu = fits.PrimaryHDU(np.zeros((64, 64), dtype=np.uint16))
+    hdu.header['CAMERA'] = 'BLUE'
+    hdu.header['OFNAME'] = os.path.basename(str(path))
+    hdu.header['FRAMENO'] = frameno
+    hdu.header['IMTYPE'] = imtype
+    hdu.header['STATEID'] = '0123abcd'
+    hdu.header['BINNING'] = '2,2'
+    hdu.header['IFUNAM'] = 'Medium'
+    hdu.header['BFILTNAM'] = 'KBlue'
+    hdu.header['BGRATNAM'] = 'BL'
+    hdu.header['BCWAVE'] = 4500.
+    hdu.header['XPOSURE'] = 300.
+    hdu.header['TARGNAME'] = 'target'
+    hdu.header['CALTYPE'] = 'object'
+    hdu.writeto(str(path))
+    return str(path)
+
+
+def make_night(tmp_path, nframes=12):
+    return [write_frame(tmp_path / ('kb230925_%05d.fits' % i), i)
+            for i in range(1, nframes + 1)]
+
+
+def count_reads(monkeypatch):
+    calls = []
+    read = kcwi_headers.read_primary_header
+
+    def counting_read(path):
+        calls.append(path)
+        return read(path)
+
+    monkeypatch.setattr(kcwi_headers, 'read_primary_header', counting_read)
+    return calls
+
+
+def test_scan_matches_getheader(tmp_path):
+    paths = make_night(tmp_path)
+    headers = scan_headers(paths, nthreads=4)
+    assert len(headers) == len(paths)
+    for path, hdr in zip(paths, headers):
+        ref = fits.getheader(path)
+        assert hdr['FRAMENO'] == ref['FRAMENO']
+        assert list(hdr.keys()) == list(ref.keys())
+
+
+def test_scan_uses_cache(tmp_path, monkeypatch):
+    paths = make_night(tmp_path)
+    calls = count_reads(monkeypatch)
+    scan_headers(paths)
+    assert len(calls) == len(paths)
+    assert os.path.exists(tmp_path / HEADER_CACHE_NAME)
+
+    # a new frame and a rewritten one are the only files read again
+    paths.append(write_frame(tmp_path / 'kb230925_00099.fits', 99))
+    os.remove(paths[3])
+    write_frame(paths[3], 4, imtype='ARCLAMP')
+    os.utime(paths[3], (1.e9, 1.e9))
+    del calls[:]
+    headers = scan_headers(paths)
+    assert sorted(calls) == sorted([paths[3], paths[-1]])
+    assert headers[3]['IMTYPE'] == 'ARCLAMP'
+    assert headers[-1]['FRAMENO'] == 99
+
+    # returned headers are copies
+    headers[0]['IMTYPE'] = 'changed'
+    assert scan_headers(paths)[0]['IMTYPE'] == 'OBJECT'
+
+
+def test_scan_bad_files(tmp_path):
+    paths = make_night(tmp_path, nframes=2)
+    bad = tmp_path / 'kb230925_00003.fits'
+    bad.write_bytes(b'not a fits file')
+    headers = scan_headers(paths + [str(bad), str(tmp_path / 'missing.fits')])
+    assert headers[0] is not None and headers[1] is not None
+    assert headers[2] is None and headers[3] is None
+
+
+def test_log_string_from_scanned_header(tmp_path):
+    paths = make_night(tmp_path, nframes=3)
+    for path, hdr in zip(paths, scan_headers(paths)):
+        assert get_log_string(path, batch=True, header=hdr) == \
+            get_log_string(path, batch=True)
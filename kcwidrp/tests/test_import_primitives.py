@@ -92,6 +92,10 @@ def test_import_MakeMasterSky():
     import kcwidrp.primitives.MakeMasterSky
 
 
+def test_import_MakeQuickLookCube():
+    import kcwidrp.primitives.MakeQuickLookCube
+
+
 def test_import_NandshuffSubtractSky():
     import kcwidrp.primitives.NandshuffSubtractSky
 
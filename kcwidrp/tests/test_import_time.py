@@ -0,0 +1,77 @@
+import os
+import subprocess
+import sys
+import types
+
+import pytest
+
+from kcwidrp.core.kcwi_lazy_actions import lazy_actions
+
+# modules that are slow to import, and only needed to reduce data or plot
+HEAVY = ('astropy', 'bokeh', 'scipy', 'pandas', 'skimage', 'matplotlib')
+
+# import time budgets, in seconds, well above the measured times (a few ms
+# for the pipelines, ~0.2 s for the reduction scripts) so that a slow test
+# machine does not fail, but well below the seconds these took before the
+# primitives were resolved lazily
+BUDGETS = {
+    'kcwidrp.pipelines.kcwi_pipeline': (0.5, HEAVY),
+    'kcwidrp.pipelines.keck_rti_pipeline': (0.5, HEAVY),
+    'kcwidrp.scripts.reduce_kcwi': (1.5, HEAVY),
+    'kcwidrp.scripts.kcwi_rti': (1.5, HEAVY),
+    'kcwidrp.scripts.modhead': (0.5, HEAVY),
+    # the primitives need astropy and scipy, but not the plotting libraries
+    'kcwidrp.primitives.MakeMasterBias': (5., ('bokeh', 'matplotlib')),
+    'kcwidrp.primitives.SolveArcs': (5., ('bokeh', 'matplotlib')),
+}
+
+
+def import_times(module):
+    """
+    Import a module in a fresh interpreter with -X importtime
+
+    Returns:
+        dict: cumulative import time in seconds of each module imported
+
+    """
+    res = subprocess.run([sys.executable, '-X', 'importtime', '-c',
+                          'import ' + module], capture_output=True,
+                         text=True, env=os.environ.copy())
+    assert res.returncode == 0, res.stderr
+    times = {}
+    for line in res.stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        times[name.strip()] = int(cumulative) * 1.e-6
+    return times
+
+
+@pytest.mark.parametrize('module', sorted(BUDGETS))
+def test_import_budget(module):
+    budget, forbidden = BUDGETS[module]
+    times = import_times(module)
+    loaded = sorted(name for name in times
+                    if name.split('.')[0] in forbidden)
+    assert not loaded, "%s imports %s" % (module, ", ".join(loaded[:5]))
+    assert times[module] < budget
+
+
+def test_pipeline_actions_resolved_on_use():
+    import kcwidrp.pipelines.kcwi_pipeline as pipeline
+    from kcwidrp.primitives.kcwi_file_primitives import ingest_file
+    assert pipeline.ingest_file is ingest_file
+    # the framework also looks for pre_ and post_ conditions
+    assert not hasattr(pipeline, 'pre_ingest_file')
+
+
+def test_lazy_actions():
+    module = types.ModuleType('fake_pipeline')
+    module.__getattr__ = lazy_actions(vars(module),
+                                      {'join': 'os.path'})
+    assert 'join' not in vars(module)
+    assert module.join is os.path.join
+    # cached in the module after the first lookup
+    assert vars(module)['join'] is os.path.join
+    with pytest.raises(AttributeError):
+        module.split
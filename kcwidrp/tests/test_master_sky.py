@@ -0,0 +1,167 @@
+import numpy as np
+import pytest
+from astropy.io import fits
+
+from kcwidrp.core.bspline import Bspline
+from kcwidrp.primitives.MakeMasterSky import read_sky_maps, sky_pixels, \
+    sky_breakpoints, slice_pixels
+
+NY = 400
+SLICE_WIDTH = 10
+POSBUF = 5
+
+
+def write_map(path, data, **keys):
+    hdu = fits.PrimaryHDU(data)
+    hdu.header['CAMERA'] = 'RED'
+    hdu.header['TELESCOP'] = 'Keck II'
+    hdu.header['TAPLINES'] = 4
+    hdu.header['CCDCFG'] = '2211'
+    for key, val in keys.items():
+        hdu.header[key] = val
+    hdu.writeto(path)
+    return str(path)
+
+
+def make_maps(tmp_path, seed=6):
+    """Small geometry with 24 slices, gaps, and a dichroic-sized range"""
+    rng = np.random.default_rng(seed)
+    nx = 24 * SLICE_WIDTH + 6
+    yy, xx = np.mgrid[0:NY, 0:nx].astype(float)
+    xs = xx - 3.
+    slc = np.where((xs >= 0) & (xs < 24 * SLICE_WIDTH),
+                   np.floor(xs / SLICE_WIDTH), -1.)
+    pos = np.where(slc >= 0, (xs % SLICE_WIDTH) * 3., -1.)
+    wave = 5000. + 3. * yy + 0.7 * slc + 0.01 * pos + \
+        rng.uniform(0., 0.2, yy.shape)
+    keys = dict(WAVGOOD0=5100., WAVGOOD1=6000., WAVALL0=5030.,
+                WAVALL1=6150., WAVMID=5600.)
+    paths = (write_map(tmp_path / 'w_wavemap.fits', wave, **keys),
+             write_map(tmp_path / 'w_slicemap.fits', slc),
+             write_map(tmp_path / 'w_posmap.fits', pos))
+    return paths, wave, slc, pos, keys
+
+
+def make_sky(wave, seed=7):
+    rng = np.random.default_rng(seed)
+    sky = 100. + 20. * np.sin(wave / 15.) + \
+        500. * np.exp(-0.5 * ((wave - 5577.) / 2.) ** 2)
+    sky += rng.normal(0., 2., wave.shape)
+    sky[rng.uniform(size=wave.shape) < 0.002] = np.nan
+    return sky
+
+
+def legacy_indices(wave, slc, pos, keys, data, binary_mask, camera, dich):
+    """Reference: the original per-pixel index lists from MakeMasterSky"""
+    posmax = np.nanmax(pos)
+    ny = pos.shape[0]
+    ymap = np.repeat(np.arange(ny, dtype=float)[:, None], pos.shape[1],
+                     axis=1)
+    waveall0 = keys['WAVALL0']
+    waveall1 = keys['WAVALL1']
+    finiteflux = np.isfinite(data.flat)
+    q = []
+    for i, v in enumerate(slc.flat):
+        if not (0 <= v <= 23 and
+                POSBUF < pos.flat[i] < (posmax - POSBUF) and
+                waveall0 <= wave.flat[i] <= waveall1 and
+                finiteflux[i] and not binary_mask.flat[i]):
+            continue
+        if dich and camera == 0 and v > 20 and wave.flat[i] > 5600.:
+            continue
+        if dich and camera == 1 and v > 20 and wave.flat[i] < 5600.:
+            continue
+        if camera == 1 and not 50 <= ymap.flat[i] <= (ny - 50):
+            continue
+        q.append(i)
+    qo = [i for i, v in enumerate(slc.flat)
+          if 0 <= v <= 23 and pos.flat[i] >= 0 and
+          waveall0 <= wave.flat[i] <= waveall1 and finiteflux[i]]
+    return np.array(q), np.array(qo)
+
+
+@pytest.mark.parametrize('camera', [0, 1])
+@pytest.mark.parametrize('dich', [False, True])
+def test_sky_pixels_match_legacy(tmp_path, camera, dich):
+    paths, wave, slc, pos, keys = make_maps(tmp_path)
+    data = make_sky(wave)
+    binary_mask = np.zeros(data.shape, dtype=bool)
+    binary_mask[100:140, 50:90] = True
+
+    q, qo_ref = legacy_indices(wave, slc, pos, keys, data, binary_mask,
+                               camera, dich)
+    maps = read_sky_maps(*paths)
+    qo, fit = sky_pixels(maps, data, binary_mask, POSBUF, camera, dich)
+
+    np.testing.assert_array_equal(np.sort(qo), qo_ref)
+    np.testing.assert_array_equal(np.sort(qo[fit]), q)
+    # output and fit pixels come out in stable wavelength order
+    np.testing.assert_array_equal(
+        qo, qo_ref[np.argsort(wave.flat[qo_ref], kind='stable')])
+    assert np.all(np.diff(maps['wave'][qo]) >= 0.)
+
+
+def test_sky_maps_cached_read_only(tmp_path):
+    paths, wave, slc, pos, keys = make_maps(tmp_path)
+    maps = read_sky_maps(*paths, mtimes=(1., 2., 3.))
+    assert read_sky_maps(*paths, mtimes=(1., 2., 3.)) is maps
+    assert maps['WAVALL0'] == keys['WAVALL0']
+    assert maps['posmax'] == np.nanmax(pos)
+    for key in ('wave', 'slice', 'pos', 'order'):
+        assert not maps[key].flags.writeable
+
+
+def test_slice_pixels_match_legacy(tmp_path):
+    paths, wave, slc, pos, keys = make_maps(tmp_path)
+    data = make_sky(wave)
+    maps = read_sky_maps(*paths)
+    wran = (5500., 5700.)
+    posmax = np.nanmax(pos)
+    for si, (xplt, yplt) in enumerate(slice_pixels(maps, data, POSBUF,
+                                                   wran)):
+        sq = [i for i, v in enumerate(slc.flat) if v == si and
+              wran[0] < wave.flat[i] < wran[1] and
+              POSBUF < pos.flat[i] < (posmax - POSBUF)]
+        np.testing.assert_array_equal(xplt, pos.flat[sq])
+        np.testing.assert_array_equal(yplt, data.flat[sq])
+
+
+def test_sky_model_matches_legacy(tmp_path):
+    paths, wave, slc, pos, keys = make_maps(tmp_path)
+    data = make_sky(wave)
+    binary_mask = np.zeros(data.shape, dtype=bool)
+    nknots = int(NY * 0.5)
+
+    # legacy: sort the fit points, evaluate the fit and output points
+    q, qo_ref = legacy_indices(wave, slc, pos, keys, data, binary_mask, 0,
+                               False)
+    waves = wave.flat[q]
+    fluxes = data.flat[q]
+    s = np.argsort(waves)
+    waves = waves[s]
+    fluxes = fluxes[s]
+    bkpt = np.min(waves) + np.arange(nknots + 1) * \
+        (np.max(waves) - np.min(waves)) / nknots
+    sft0, gmask = Bspline.iterfit(waves, fluxes, fullbkpt=bkpt, upper=1,
+                                  lower=1)
+    yfit1, _ = sft0.value(waves)
+    yfit, _ = sft0.value(wave.flat[qo_ref])
+    ref = np.zeros(data.shape)
+    ref.flat[qo_ref] = yfit
+
+    # new: one sorted evaluation scattered back
+    maps = read_sky_maps(*paths)
+    qo, fit = sky_pixels(maps, data, binary_mask, POSBUF, 0, False)
+    owaves = maps['wave'][qo]
+    nbkpt = sky_breakpoints(owaves[fit], nknots)
+    nsft, ngmask = Bspline.iterfit(owaves[fit], data.ravel()[qo[fit]],
+                                   fullbkpt=nbkpt, upper=1, lower=1)
+    nyfit, _ = nsft.value(owaves)
+    sky = np.zeros(data.shape)
+    sky.ravel()[qo] = nyfit
+
+    np.testing.assert_allclose(nbkpt, bkpt, rtol=1.e-12)
+    assert ngmask.sum() == gmask.sum()
+    np.testing.assert_allclose(np.sort(nyfit[fit]), np.sort(yfit1),
+                               rtol=1.e-8, atol=1.e-8)
+    np.testing.assert_allclose(sky, ref, rtol=1.e-8, atol=1.e-8)
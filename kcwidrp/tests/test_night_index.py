@@ -0,0 +1,201 @@
+import csv
+import json
+import os
+
+import numpy as np
+from astropy.io import fits
+
+from kcwidrp.core import kcwi_headers
+from kcwidrp.core.kcwi_night_index import NightIndex, frame_record, \
+    REPORT_CAL_TYPES, calibration_report, write_report, record_headers
+
+
+def write_frame(path, frameno, imtype, stateid='0123abcd', ccdcfg='2211',
+                ttime=0., groupid='', obj='target'):
+    hdu = fits.PrimaryHDU(np.zeros((16, 16), dtype=np.uint16))
+    hdu.header['CAMERA'] = 'BLUE'
+    hdu.header['TELESCOP'] = 'Keck II'
+    hdu.header['OFNAME'] = os.path.basename(str(path))
+    hdu.header['FRAMENO'] = frameno
+    hdu.header['IMTYPE'] = imtype
+    hdu.header['STATEID'] = stateid
+    hdu.header['CCDCFG'] = ccdcfg
+    hdu.header['TTIME'] = ttime
+    hdu.header['GROUPID'] = groupid
+    hdu.header['MJD'] = 60000. + frameno / 1000.
+    hdu.header['OBJECT'] = obj
+    hdu.header['BGRATNAM'] = 'BL'
+    hdu.header['BCWAVE'] = 4500.
+    hdu.writeto(str(path))
+    return str(path)
+
+
+def make_night(tmp_path):
+    specs = [('BIAS', dict(groupid='b1')), ('BIAS', dict(groupid='b1')),
+             ('BIAS', dict(groupid='b1', ccdcfg='1211')),
+             ('DARK', dict(ttime=300.)), ('DARK', dict(ttime=60.)),
+             ('CONTBARS', {}), ('ARCLAMP', {}),
+             ('ARCLAMP', dict(stateid='ffff0000')),
+             ('FLATLAMP', {}), ('OBJECT', dict(ttime=300., groupid='s1')),
+             ('OBJECT', dict(obj='focus')),
+             ('OBJECT', dict(obj='Clearing ccd'))]
+    return [write_frame(tmp_path / ('kb230925_%05d.fits' % i), i, imtype,
+                        **keys)
+            for i, (imtype, keys) in enumerate(specs, 1)]
+
+
+def test_frame_record():
+    hdr = fits.Header()
+    hdr['CAMERA'] = 'BLUE'
+    hdr['STATEID'] = '0'
+    hdr['CCDCFG'] = '2211'
+    hdr['TARGNAME'] = 'NGC 1068'
+    rec = frame_record(hdr)
+    assert rec['CID'] == 'NONE' and rec['DID'] == 2211
+    assert rec['GRPID'] == 'NONE' and rec['TARGNAME'] == 'NGC1068'
+    assert 'GROUPID' not in hdr
+    hdr['CAMERA'] = 'FPC'
+    assert frame_record(hdr) is None
+
+
+def test_update_is_incremental(tmp_path):
+    paths = make_night(tmp_path)
+    index = NightIndex(str(tmp_path / 'night.db'))
+    assert index.update(paths) == len(paths)
+    assert len(index) == len(paths)
+    assert index.update(paths) == 0
+
+    # only the rewritten frame is read again, even without the header cache
+    os.remove(paths[5])
+    write_frame(paths[5], 6, 'CONTBARS', stateid='ffff0000')
+    os.utime(paths[5], (1.e9, 1.e9))
+    assert index.stale(paths) == [paths[5]]
+    assert index.update(paths) == 1
+    index.close()
+
+    # the index persists between sessions
+    index = NightIndex(str(tmp_path / 'night.db'))
+    assert index.update(paths) == 0
+    assert [r['CID'] for r in index.frames(imtype='CONTBARS')] == ['ffff0000']
+
+
+def test_frames_and_group(tmp_path):
+    paths = make_night(tmp_path)
+    index = NightIndex(':memory:')
+    index.update(paths)
+    objects = index.frames(camera='blue', imtype='OBJECT')
+    assert [r['FRAMENO'] for r in objects] == [10]
+    assert len(index.frames(imtype='OBJECT', skip_objects=())) == 3
+    assert [r['FRAMENO'] for r in index.frames()] == list(range(1, 11))
+    assert [r['FRAMENO'] for r in index.group('b1')] == [1, 2, 3]
+    assert index.frames(camera='RED') == []
+
+
+def test_matching_cals(tmp_path):
+    paths = make_night(tmp_path)
+    index = NightIndex(':memory:')
+    index.update(paths)
+    obj = index.frames(imtype='OBJECT')[0]
+
+    def framenos(cal_type, **kwargs):
+        return [r['FRAMENO'] for r in index.matching_cals(obj, cal_type,
+                                                          **kwargs)]
+
+    assert framenos('BIAS') == [1, 2]
+    assert framenos('BIAS', target_group='b1') == [1, 2]
+    assert framenos('BIAS', target_group='none') == []
+    assert framenos('DARK') == [4]
+    assert framenos('CONTBARS') == [6]
+    assert framenos('ARCLAMP') == [7]
+    assert framenos('FLATLAMP') == [9]
+    assert framenos('OBJECT', target_group='s1') == [10]
+
+
+def test_add_header_skips_unreadable(tmp_path):
+    paths = make_night(tmp_path)[:2]
+    index = NightIndex(':memory:')
+    index.add_headers(paths + [str(tmp_path / 'missing.fits')],
+                      kcwi_headers.scan_headers(paths) + [None])
+    assert len(index) == 2
+    index.add_header(paths[0], fits.getheader(paths[0]))
+    assert len(index) == 2
+
+
+def test_record_headers(tmp_path):
+    paths = make_night(tmp_path)[:2]
+    headers = kcwi_headers.scan_headers(paths)
+    db_path = str(tmp_path / 'night.db')
+    assert record_headers(paths, headers, db_path)
+    index = NightIndex(db_path)
+    assert len(index) == 2
+    index.close()
+    # an index that cannot be created is skipped
+    assert not record_headers(paths, headers,
+                              str(tmp_path / 'nodir' / 'night.db'))
+
+
+def add_synthetic_night(index, nsetups=150, seed=12):
+    """Many setups with random numbers of calibrations, without files"""
+    rng = np.random.default_rng(seed)
+    headers = []
+    for i in range(nsetups):
+        cam = ('BLUE', 'RED')[i % 2]
+        keys = dict(CAMERA=cam, STATEID='s%04d' % i,
+                    CCDCFG=('2211', '1211')[i % 3 == 0])
+        for imtype, nmax in (('OBJECT', 3), ('CONTBARS', 3), ('ARCLAMP', 4),
+                             ('FLATLAMP', 8)):
+            for _ in range(rng.integers(0 if imtype != 'OBJECT' else 1,
+                                        nmax + 1)):
+                headers.append(fits.Header(dict(keys, IMTYPE=imtype)))
+    for i in range(20):
+        headers.append(fits.Header(dict(CAMERA=('BLUE', 'RED')[i % 2],
+                                        STATEID='0', IMTYPE='BIAS',
+                                        CCDCFG=('2211', '1211')[i % 3 == 0])))
+    for i, hdr in enumerate(headers):
+        hdr['FRAMENO'] = i
+        hdr['MJD'] = 60000. + i / 1000.
+    index.add_headers(['frame_%05d.fits' % i for i in range(len(headers))],
+                      headers)
+
+
+def test_calibration_report_matches_queries():
+    index = NightIndex(':memory:')
+    add_synthetic_night(index)
+    minimums = {'BLUE': {'BIAS': 7, 'CONTBARS': 1, 'ARCLAMP': 1,
+                         'FLATLAMP': 6},
+                'RED': {'BIAS': 7, 'CONTBARS': 3, 'ARCLAMP': 3,
+                        'FLATLAMP': 6}}
+
+    # reference: one query per setup and calibration type
+    ref = []
+    for setup in index.setups():
+        found = [len(index.matching_cals(setup, cal_type))
+                 for cal_type, _ in REPORT_CAL_TYPES]
+        ref.append(found)
+    report = calibration_report(index, minimums)
+
+    assert len(report) == 150
+    for row, found in zip(report, ref):
+        assert [row[c + '_FOUND'] for c, _ in REPORT_CAL_TYPES] == found
+        needed = minimums[row['CAM']]
+        assert row['CALS_PASS'] == all(
+            row[c + '_FOUND'] >= needed[c] for c, _ in REPORT_CAL_TYPES)
+    assert any(row['CALS_PASS'] for row in report)
+    assert not all(row['CALS_PASS'] for row in report)
+
+
+def test_write_report(tmp_path):
+    index = NightIndex(':memory:')
+    add_synthetic_night(index, nsetups=5)
+    minimums = {cam: {c: 1 for c, _ in REPORT_CAL_TYPES}
+                for cam in ('BLUE', 'RED')}
+    report = calibration_report(index, minimums)
+    write_report(report, str(tmp_path / 'cals.json'))
+    with open(tmp_path / 'cals.json') as report_file:
+        assert json.load(report_file) == report
+    write_report(report, str(tmp_path / 'cals.csv'))
+    with open(tmp_path / 'cals.csv') as report_file:
+        rows = list(csv.DictReader(report_file))
+    assert [r['CID'] for r in rows] == [r['CID'] for r in report]
+    assert [r['CALS_PASS'] for r in rows] == \
+        [str(r['CALS_PASS']) for r in report]
@@ -0,0 +1,111 @@
+import warnings
+
+import numpy as np
+
+from kcwidrp.core.kcwi_plot_queue import PlotQueue, PlotSpec, \
+    spec_from_bokeh
+from kcwidrp.core.kcwi_plotting import oplot_slices, set_plot_lims
+
+PNG_SIGNATURE = b'\x89PNG\r\n\x1a\n'
+
+
+def bar_plot(nbars=120, seed=0):
+    """Plot like the SolveArcs fit statistics"""
+    values = np.random.default_rng(seed).normal(10., 2., nbars)
+    p = PlotSpec(title="FIT STATS", x_axis_label="Bar #",
+                 y_axis_label="N Lines", plot_width=500, plot_height=300)
+    p.diamond(list(range(nbars)), values, size=8)
+    p.line([-1, nbars], [10., 10.], color='red')
+    p.line([-1, nbars], [8., 8.], color='green', line_dash='dashed')
+    p.xgrid.grid_line_color = None
+    ylim = [0., 20.]
+    oplot_slices(p, ylim)
+    set_plot_lims(p, xlim=[-1, nbars], ylim=ylim)
+    return p
+
+
+def is_png(path):
+    with open(path, 'rb') as f:
+        return f.read(8) == PNG_SIGNATURE
+
+
+def test_plot_spec():
+    spec = bar_plot().to_dict()
+    # diamonds, two lines, and the 23 slice separators
+    assert len(spec['layers']) == 26
+    assert spec['layers'][0]['kind'] == 'scatter'
+    assert spec['layers'][0]['marker'] == 'diamond'
+    assert spec['layers'][2]['dash'] == 'dashed'
+    assert spec['x_range'] == (-1, 120)
+    assert spec['y_range'] == (0., 20.)
+    assert not spec['xgrid'] and spec['ygrid']
+    fig = PlotSpec.from_dict(spec).to_bokeh()
+    assert len(fig.renderers) == 26
+    assert fig.x_range.start == -1 and fig.y_range.end == 20.
+
+
+def test_spec_from_bokeh():
+    from bokeh.plotting import figure
+    from bokeh.layouts import gridplot
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore')
+        p = figure(title='OSCAN', x_axis_label='px', y_axis_label='counts',
+                   plot_width=400, plot_height=300)
+    p.circle([1, 2, 3], [4, 5, 6], legend_label='Data')
+    p.line([1, 2, 3], [4, 5, 6], line_color='red', legend_label='Fit',
+           line_dash='dotdash')
+    p.quad(left=[0, 1], right=[1, 2], top=[3, 4], bottom=0)
+    p.x_range.start = 0
+    p.x_range.end = 4
+    spec = spec_from_bokeh(p)
+    assert spec['title'] == 'OSCAN' and spec['width'] == 400
+    assert [layer['kind'] for layer in spec['layers']] == \
+        ['scatter', 'line', 'quad']
+    assert [layer['label'] for layer in spec['layers']] == \
+        ['Data', 'Fit', None]
+    np.testing.assert_array_equal(spec['layers'][1]['x'], [1, 2, 3])
+    assert spec['layers'][1]['color'] == 'red'
+    assert spec['x_range'] == (0, 4)
+    np.testing.assert_array_equal(spec['layers'][2]['bottom'], [0, 0])
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore')
+        grid = gridplot([p, p, p], ncols=2, plot_width=500,
+                        plot_height=300, toolbar_location=None)
+    spec = spec_from_bokeh(grid)
+    assert spec['ncols'] == 2 and len(spec['grid']) == 3
+
+
+def test_render_inline(tmp_path):
+    queue = PlotQueue(processes=0)
+    queue.submit(bar_plot(), str(tmp_path / 'bars.png'))
+    queue.submit(bar_plot(), str(tmp_path / 'bars.html'))
+    # missing directory
+    queue.submit(bar_plot(), str(tmp_path / 'nodir' / 'bars.png'))
+    assert queue.rendered == 2 and queue.failed == 1
+    assert is_png(tmp_path / 'bars.png')
+    assert '<html' in (tmp_path / 'bars.html').read_text().lower()
+
+
+def test_render_in_worker(tmp_path):
+    nplots = 8
+    plots = [bar_plot(seed=i) for i in range(nplots)]
+
+    queue = PlotQueue(processes=1)
+    for i, p in enumerate(plots):
+        queue.submit(p, str(tmp_path / ('bars_%d.png' % i)))
+    # submit returned before the worker rendered them
+    assert queue.pending > 0
+    queue.close(timeout=120)
+    assert queue.rendered == nplots and queue.failed == 0
+    assert queue.pending == 0
+    for i in range(nplots):
+        assert is_png(tmp_path / ('bars_%d.png' % i))
+
+
+def test_worker_reports_failures(tmp_path):
+    queue = PlotQueue(processes=1)
+    queue.submit(bar_plot(), str(tmp_path / 'nodir' / 'bars.png'))
+    queue.submit(bar_plot(), str(tmp_path / 'bars.png'))
+    queue.close(timeout=120)
+    assert queue.rendered == 1 and queue.failed == 1
+    assert is_png(tmp_path / 'bars.png')
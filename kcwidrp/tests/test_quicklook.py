@@ -0,0 +1,115 @@
+import logging
+import pickle
+from types import SimpleNamespace
+
+import numpy as np
+from skimage import transform as sktf
+from astropy.io import fits
+from keckdrpframework.models.arguments import Arguments
+
+from kcwidrp.core import geometric as tf
+from kcwidrp.primitives.kcwi_file_primitives import KCCDData
+from kcwidrp.primitives.MakeQuickLookCube import quicklook_args, \
+    quicklook_maps, warp_quicklook, median_sky, MakeQuickLookCube
+
+# 2x2 binned geometry: slice input width, output xsize, ysize, ccd rows
+WIDTH, XSIZE, YSIZE, NY = 100, 81, 2000, 2056
+
+
+def make_geom(path, seed=2):
+    """Geometry pickle like SolveGeom's, with 24 slightly tilted slices"""
+    rng = np.random.default_rng(seed)
+    tforms = []
+    for isl in range(24):
+        xw, yw = np.meshgrid(np.linspace(0, XSIZE - 1, 6),
+                             np.linspace(0, YSIZE - 1, 20))
+        xi = 8. + xw * 1.05 + 1.e-3 * yw + rng.normal(0., 0.05, xw.shape)
+        yi = 25. + yw * (NY - 50.) / YSIZE + 2.e-6 * (yw - 1000.) ** 2
+        tforms.append(tf.estimate_transform(
+            'asympolynomial', np.column_stack((xw.ravel(), yw.ravel())),
+            np.column_stack((xi.ravel(), yi.ravel())), order=(2, 4)))
+    geom = {'tform': tforms, 'xsize': XSIZE, 'ysize': YSIZE,
+            'xl0': [isl * WIDTH for isl in range(24)],
+            'xl1': [(isl + 1) * WIDTH for isl in range(24)]}
+    with open(path, 'wb') as ofile:
+        pickle.dump(geom, ofile)
+    return geom
+
+
+def test_quicklook_cube_matches_slice_warps(tmp_path):
+    geom_file = str(tmp_path / 'kb_geom.pkl')
+    geom = make_geom(geom_file)
+    img = np.random.default_rng(3).normal(100., 10., (NY, 24 * WIDTH))
+
+    maps = quicklook_maps(geom_file, 1, 1.)
+    cube = warp_quicklook(img.astype(np.float32), maps)
+    assert cube.shape == (YSIZE, XSIZE, 24) and cube.dtype == np.float32
+    assert quicklook_maps(geom_file, 1, 1.) is maps
+
+    # same as a linear warp of each slice, where the spaxel is on its slice
+    valid = maps['valid'] & (maps['coords'][0] >= 0) & \
+        (maps['coords'][0] <= NY - 1)
+    assert valid.mean() > 0.8
+    for isl in range(24):
+        coords = geom['tform'][isl].warp_coords((YSIZE, XSIZE))
+        ref = sktf.warp(img[:, geom['xl0'][isl]:geom['xl1'][isl]], coords,
+                        order=1, output_shape=(YSIZE, XSIZE))
+        np.testing.assert_allclose(cube[:, :, isl][valid[:, :, isl]],
+                                   ref[valid[:, :, isl]], rtol=1.e-4)
+        assert not cube[:, :, isl][~maps['valid'][:, :, isl]].any()
+
+    # binned in wavelength: sampled at the centers of the bins
+    binned = quicklook_maps(geom_file, 4, 1.)
+    assert binned['coords'].shape == (2, YSIZE // 4, XSIZE, 24)
+    full = maps['coords'].reshape(2, YSIZE // 4, 4, XSIZE, 24).mean(axis=2)
+    inside = binned['valid'] & maps['valid'][::4]
+    np.testing.assert_allclose(binned['coords'][:, inside], full[:, inside],
+                               atol=0.01)
+
+
+def test_median_sky():
+    rng = np.random.default_rng(4)
+    sky = np.linspace(50., 200., 300).astype(np.float32)
+    cube = sky[:, None, None] + rng.normal(0., 1., (300, 40, 24))
+    # a bright object and spaxels off their slice
+    cube[:, 18:22, 10:13] += 500.
+    valid = np.ones(cube.shape, dtype=bool)
+    valid[:, :3, :] = False
+    cube[~valid] = 0.
+    np.testing.assert_allclose(median_sky(cube, valid), sky, atol=0.2)
+    assert not median_sky(cube, np.zeros(cube.shape, dtype=bool)).any()
+
+
+def test_quicklook_args():
+    header = fits.Header({'CAMERA': 'BLUE', 'IMTYPE': 'OBJECT'})
+    ccddata = KCCDData(np.arange(12, dtype=np.uint16).reshape(3, 4),
+                       meta=header, unit='adu')
+    args = Arguments(name='kb230101_00042.fits', ccddata=ccddata,
+                     imtype='OBJECT', new_type='SKY')
+    ql_args = quicklook_args(args)
+    assert ql_args.quicklook and not hasattr(args, 'quicklook')
+    assert ql_args.name == args.name and ql_args.new_type == 'SKY'
+    assert ql_args.ccddata.data.dtype == np.float32
+    np.testing.assert_array_equal(ql_args.ccddata.data, ccddata.data)
+    # the full reduction keeps its own image and header
+    ql_args.ccddata.data -= 5.
+    ql_args.ccddata.header.pop('CAMERA')
+    assert ccddata.data[0, 0] == 0 and ccddata.header['CAMERA'] == 'BLUE'
+
+
+def test_missing_geometry_ends_chain(tmp_path):
+    """Without a geometry the chain stops before the RTI alert"""
+    logger = logging.getLogger('KCWI')
+    config = SimpleNamespace(instrument=SimpleNamespace(
+        cwd=str(tmp_path), output_directory='redux'))
+    for rows in ([], ['kb_arc.fits']):
+        proctab = SimpleNamespace(
+            search_proctab=lambda **kwargs: {'filename': rows} if rows
+            else [])
+        context = SimpleNamespace(pipeline_logger=logger, logger=logger,
+                                  config=config, proctab=proctab)
+        action = SimpleNamespace(args=Arguments(name='kb_00042.fits',
+                                                ccddata=None),
+                                 new_event='quicklook_alert_rti')
+        assert MakeQuickLookCube(action, context).apply() is None
+        assert action.new_event is None
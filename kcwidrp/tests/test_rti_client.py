@@ -0,0 +1,189 @@
+import logging
+import os
+import threading
+import time
+from types import SimpleNamespace
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+import pytest
+
+from astropy.io import fits
+from keckdrpframework.models.arguments import Arguments
+
+from kcwidrp.core.kcwi_rti_client import RTIClient, backoff_delay
+from kcwidrp.primitives.kcwi_file_primitives import KCCDData
+from kcwidrp.primitives.SendHTTP import SendHTTP
+
+
+class StubRTI(ThreadingHTTPServer):
+    """Local stand-in for the RTI endpoint, records the KOAIDs it gets"""
+
+    def __init__(self, fail_first=0, delay=0., port=0):
+        self.koaids = []
+        self.connections = set()
+        self.fail_first = fail_first
+        self.delay = delay
+        self.nrequests = 0
+        self.lock = threading.Lock()
+        super().__init__(('127.0.0.1', port), StubHandler)
+        self.thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self.thread.start()
+
+    @property
+    def url(self):
+        return 'http://127.0.0.1:%d/rti' % self.server_address[1]
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        server = self.server
+        time.sleep(server.delay)
+        with server.lock:
+            server.nrequests += 1
+            fail = server.nrequests <= server.fail_first
+            server.connections.add(self.client_address)
+            if not fail:
+                query = parse_qs(urlparse(self.path).query)
+                server.koaids.extend(query['koaid'])
+        body = b'error' if fail else b'ok'
+        self.send_response(503 if fail else 200)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def stub():
+    server = StubRTI()
+    yield server
+    server.stop()
+
+
+def params(koaid):
+    return {'instrument': 'KCWI', 'koaid': koaid, 'ingesttype': 'lev1'}
+
+
+def test_backoff_delay():
+    assert backoff_delay(1, 5., 300., rand=lambda: 1.) == 5.
+    assert backoff_delay(4, 5., 300., rand=lambda: 1.) == 40.
+    assert backoff_delay(10, 5., 300., rand=lambda: 1.) == 300.
+    assert backoff_delay(5000, 5., 300., rand=lambda: 1.) == 300.
+    assert 0. <= backoff_delay(3, 5., 300.) <= 20.
+
+
+def test_submit_does_not_block(tmp_path, stub):
+    stub.delay = 0.05
+    client = RTIClient(stub.url, auth=('user', 'pw'),
+                       outbox=str(tmp_path / 'outbox'))
+    koaids = ['KB.20230925.%05d.00' % i for i in range(20)]
+    for koaid in koaids:
+        client.submit(params(koaid))
+    # submit returned before the slow endpoint got most of them
+    assert len(client.pending()) > 1
+    assert client.wait(timeout=10.)
+    client.close()
+    assert stub.koaids == koaids
+    # one keep-alive connection for all the requests
+    assert len(stub.connections) == 1
+    assert os.listdir(tmp_path / 'outbox') == []
+
+
+def test_retries_with_backoff(tmp_path, stub):
+    stub.fail_first = 2
+    client = RTIClient(stub.url, outbox=str(tmp_path / 'outbox'),
+                       attempts=5, retry_time=0.05, max_backoff=0.2)
+    client.submit(params('KB.1'))
+    assert client.wait(timeout=10.)
+    client.close()
+    assert stub.nrequests == 3
+    assert stub.koaids == ['KB.1']
+
+
+def test_retries_past_attempts(tmp_path):
+    # nothing listens on this port yet
+    server = StubRTI()
+    port = server.server_address[1]
+    server.stop()
+    client = RTIClient(server.url, outbox=str(tmp_path / 'outbox'),
+                       attempts=2, retry_time=0.01, max_backoff=0.05)
+    client.submit(params('KB.1'))
+    assert not client.wait(timeout=0.5)
+    assert len(client.pending()) == 1
+    assert min(client.failures.values()) > 2
+
+    # still queued, delivered once the endpoint is back
+    server = StubRTI(port=port)
+    try:
+        assert client.wait(timeout=10.)
+        client.close()
+    finally:
+        server.stop()
+    assert server.koaids == ['KB.1']
+    assert client.failures == {}
+
+
+def test_outbox_survives_restart(tmp_path):
+    outbox = str(tmp_path / 'outbox')
+    # nothing listens on this port yet
+    server = StubRTI()
+    url = server.url
+    server.stop()
+    client = RTIClient(url, outbox=outbox, attempts=2, retry_time=0.01)
+    client.submit(params('KB.1'))
+    client.submit(params('KB.2'))
+    assert not client.wait(timeout=0.2)
+    client.close()
+    assert len(os.listdir(outbox)) == 2
+
+    # after a restart the notifications are sent in their original order
+    server = StubRTI()
+    try:
+        client = RTIClient(server.url, outbox=outbox)
+        assert client.wait(timeout=10.)
+        client.close()
+    finally:
+        server.stop()
+    assert server.koaids == ['KB.1', 'KB.2']
+    assert os.listdir(outbox) == []
+
+
+def test_preview_then_full_reduction(tmp_path):
+    """A preview has its own ingest type, the full cube then reingests"""
+    sent = []
+    logger = logging.getLogger('KCWI')
+    rti = SimpleNamespace(rti_user='user', rti_pass='pass',
+                          rti_ingesttype='lev1',
+                          rti_quicklook_ingesttype=None, rti_reingest=False,
+                          rti_testonly=False, rti_dev=True)
+    config = SimpleNamespace(rti=rti, instrument=SimpleNamespace(
+        cwd=str(tmp_path), output_directory='redux'))
+    context = SimpleNamespace(pipeline_logger=logger, logger=logger,
+                              config=config, rti_client=SimpleNamespace(
+                                  submit=sent.append))
+
+    def alert(**kwargs):
+        ccddata = KCCDData([[0.]], meta=fits.Header({'KOAID': 'KB.1'}),
+                           unit='electron')
+        args = Arguments(name='kb_00042.fits', ccddata=ccddata,
+                         ingest_time=0., **kwargs)
+        SendHTTP(SimpleNamespace(args=args), context).apply()
+
+    # no preview was made: not sent
+    alert(quicklook=True)
+    assert not sent
+    alert(quicklook=True, quicklook_directory=str(tmp_path / 'quicklook'))
+    alert()
+    alert()
+    assert [(d['ingesttype'], d['reingest']) for d in sent] == \
+        [('quicklook', False), ('lev1', True), ('lev1', False)]
+    assert sent[0]['datadir'].endswith('quicklook')
@@ -0,0 +1,166 @@
+import os
+import queue
+import threading
+import time
+from types import SimpleNamespace
+
+import pytest
+import requests
+
+from kcwidrp.core.kcwi_submit_server import JobTracker, SubmitServer, \
+    track_framework, submit_files, job_status, stream_events
+
+# a short recipe: event -> (action, next event), the planner queues the
+# reduction itself like the action_planner of the pipelines
+RECIPE = {'next_file': ('ingest_file', 'file_ingested'),
+          'file_ingested': ('action_planner', None),
+          'process_bias': ('ProcessBias', 'bias_make_master'),
+          'bias_make_master': ('MakeMasterBias', None)}
+
+
+class FakeFramework:
+    """Runs the recipe for each queued file in an action thread"""
+
+    def __init__(self, fail=(), reschedule=(), start=True):
+        self.event_queue = queue.Queue()
+        self.event_queue_hi = queue.Queue()
+        self.context = SimpleNamespace(state=None,
+                                       deferred_frames=SimpleNamespace(
+                                           waiting={}),
+                                       push_event=self.push_event)
+        self.fail = fail
+        # files the ingestion reschedules once, with a recurrent event
+        self.reschedule = set(reschedule)
+        self.thread = threading.Thread(target=self.loop, daemon=True)
+        if start:
+            self.thread.start()
+
+    def append_event(self, name, args):
+        self.event_queue.put(SimpleNamespace(name=name, args=args,
+                                             _recurrent=False))
+
+    def push_event(self, name, args):
+        self.event_queue_hi.put(SimpleNamespace(name=name, args=args,
+                                                _recurrent=False))
+
+    def execute(self, action, context):
+        time.sleep(0.01)
+        fname = os.path.basename(action.args.name)
+        if action.name == 'ingest_file' and fname in self.reschedule:
+            self.reschedule.discard(fname)
+            action.event._recurrent = True
+            action.new_event = None
+        if action.name == 'action_planner':
+            context.push_event('process_bias', action.args)
+        context.state = 'stop' if (
+            fname in self.fail and action.name == 'ProcessBias') else None
+        # like the framework, the next event is queued by execute
+        if action.new_event is not None and context.state != 'stop':
+            self.push_event(action.new_event, action.args)
+
+    def step(self):
+        try:
+            event = self.event_queue_hi.get(block=False)
+        except queue.Empty:
+            event = self.event_queue.get()
+        if event.name is None:
+            return False
+        action_name, new_event = RECIPE[event.name]
+        action = SimpleNamespace(name=action_name, args=event.args,
+                                 new_event=new_event, event=event)
+        self.execute(action, self.context)
+        if event._recurrent:
+            event._recurrent = False
+            self.event_queue.put(event)
+        return True
+
+    def loop(self):
+        while self.step():
+            pass
+
+
+@pytest.fixture
+def pipeline():
+    framework = FakeFramework(fail=('kb_00003.fits',))
+    tracker = JobTracker(lambda path: framework.append_event(
+        'next_file', SimpleNamespace(name=path)))
+    track_framework(framework, tracker)
+    server = SubmitServer(tracker, port=0)
+    server.start()
+    yield server
+    server.stop()
+    framework.append_event(None, None)
+
+
+def test_job_lifecycle(tmp_path, pipeline):
+    files = [str(tmp_path / ('kb_%05d.fits' % i)) for i in range(1, 6)]
+    job_id = submit_files(pipeline.url, files)
+    events = list(stream_events(pipeline.url, job_id))
+    assert events[-1] == {'job': job_id, 'status': 'complete'}
+    done = {e['file']: e['status'] for e in events[:-1]}
+    assert done == {f: 'failed' if f.endswith('00003.fits') else 'done'
+                    for f in files}
+
+    job = job_status(pipeline.url, job_id)
+    assert job['status'] == 'complete'
+    stages = [s['stage'] for s in job['files'][files[0]]['stages']]
+    assert stages == ['ingest_file', 'action_planner', 'ProcessBias',
+                      'MakeMasterBias']
+    assert all(s['seconds'] > 0. for s in
+               job['files'][files[0]]['stages'])
+    assert len(job['files'][files[2]]['stages']) == 3
+
+    summary = requests.get(pipeline.url + '/jobs').json()
+    assert summary[0]['files'] == {'done': 4, 'failed': 1}
+    # a completed job streams the events it already had
+    replay = list(stream_events(pipeline.url, job_id))
+    assert replay[-1] == events[-1]
+    assert sorted(replay[:-1], key=lambda e: e['file']) == \
+        sorted(events[:-1], key=lambda e: e['file'])
+
+
+def test_done_when_no_event_is_left(tmp_path):
+    """The planner and a rescheduled ingestion do not end a file"""
+    framework = FakeFramework(reschedule=('kb_00002.fits',), start=False)
+    tracker = JobTracker(lambda path: framework.append_event(
+        'next_file', SimpleNamespace(name=path)))
+    track_framework(framework, tracker)
+    files = [str(tmp_path / ('kb_%05d.fits' % i)) for i in (1, 2)]
+    job_id = tracker.add_job(files)
+    statuses = {f: [] for f in files}
+    while framework.event_queue.qsize() or framework.event_queue_hi.qsize():
+        framework.step()
+        job = tracker.job(job_id)
+        for f in files:
+            stages = job['files'][f]['stages']
+            if len(stages) > len(statuses[f]):
+                statuses[f].append((stages[-1]['stage'],
+                                    job['files'][f]['status']))
+    assert statuses[files[0]] == [
+        ('ingest_file', 'running'), ('action_planner', 'running'),
+        ('ProcessBias', 'running'), ('MakeMasterBias', 'done')]
+    assert statuses[files[1]][:2] == [('ingest_file', 'running'),
+                                      ('ingest_file', 'running')]
+    assert statuses[files[1]][-1] == ('MakeMasterBias', 'done')
+    assert tracker.job(job_id)['status'] == 'complete'
+    assert tracker.events_left(files[0]) == 0
+
+
+def test_batch_is_one_job(tmp_path, pipeline):
+    files = [str(tmp_path / ('kb_%05d.fits' % i)) for i in range(10, 60)]
+    for f in files[:5]:
+        submit_files(pipeline.url, [f])
+    job_id = submit_files(pipeline.url, files)
+    assert len(job_status(pipeline.url, job_id)['files']) == len(files)
+    assert len(requests.get(pipeline.url + '/jobs').json()) == 6
+
+
+def test_bad_requests(pipeline):
+    res = requests.post(pipeline.url + '/jobs', json={'file': 'x'})
+    assert res.status_code == 400
+    res = requests.post(pipeline.url + '/jobs', json={'files': 'x.fits'})
+    assert res.status_code == 400
+    assert requests.get(pipeline.url + '/jobs/nope').status_code == 404
+    assert requests.get(pipeline.url + '/events',
+                        params={'job': 'nope'}).status_code == 404
+    assert requests.get(pipeline.url + '/other').status_code == 404
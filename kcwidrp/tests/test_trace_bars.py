@@ -0,0 +1,117 @@
+import time
+
+import numpy as np
+
+from kcwidrp.core.kcwi_trace import trace_bars
+
+
+def make_bars_image(ny=2056, nx=2048, nbars=120, seed=0):
+    """Synthetic continuum bars image with slightly tilted, curved bars"""
+    rng = np.random.default_rng(seed)
+    yy = np.arange(ny)[:, None]
+    img = rng.normal(10., 1., (ny, nx))
+    mid = 80. + np.arange(nbars) * 15.
+    for ib, x0 in enumerate(mid):
+        xx = np.arange(int(x0) - 8, int(x0) + 9)[None, :]
+        xc = x0 + 0.002 * (yy - ny / 2) + 1.e-6 * (yy - ny / 2) ** 2
+        amp = 500. * (np.abs(yy - ny / 2) < (ny / 2 - 50 - ib))
+        img[:, xx[0]] += amp * np.exp(-0.5 * ((xx - xc) / 1.5) ** 2)
+    return img
+
+
+def legacy_trace_bars(data, middle_centers, middle_row, samp, win, thresh):
+    """Reference: the original per-bar, per-sample loop from TraceBars"""
+    xi, xo, yi, barid, slid = [], [], [], [], []
+    for barn, barx in enumerate(middle_centers):
+        barxi = int(barx + 0.5)
+        xi.append(barx)
+        xo.append(barx)
+        yi.append(middle_row)
+        barid.append(barn)
+        slid.append(int(barn / 5))
+        samy = middle_row + samp
+        done = False
+        while samy < (data.shape[0] - win) and not done:
+            ys = np.median(data[(samy - win):(samy + win + 1),
+                                (barxi - win):(barxi + win + 1)], axis=0)
+            ys = ys - np.nanmin(ys)
+            if np.nanmax(ys) > thresh and np.nansum(ys) > 0:
+                xs = list(range(barxi - win, barxi + win + 1))
+                xc = np.nansum(xs * ys) / np.nansum(ys)
+                xi.append(xc)
+                xo.append(barx)
+                yi.append(samy)
+                barid.append(barn)
+                slid.append(int(barn / 5))
+                barxi = int(xc)
+            else:
+                done = True
+            samy += samp
+        barxi = int(barx + 0.5)
+        samy = middle_row - samp
+        done = False
+        while samy >= win and not done:
+            ys = np.median(data[(samy - win):(samy + win + 1),
+                                (barxi - win):(barxi + win + 1)], axis=0)
+            ys = ys - np.nanmin(ys)
+            if np.nanmax(ys) > thresh and np.nansum(ys) > 0:
+                xs = list(range(barxi - win, barxi + win + 1))
+                xc = np.sum(xs * ys) / np.sum(ys)
+                xi.append(xc)
+                xo.append(barx)
+                yi.append(samy)
+                barid.append(barn)
+                slid.append(int(barn / 5))
+                barxi = int(xc)
+            else:
+                done = True
+            samy -= samp
+    return xi, xo, yi, barid, slid
+
+
+def make_trace_problem():
+    """Bars image, bar centers on the middle row, and tracing parameters"""
+    img = make_bars_image()
+    middle_row = img.shape[0] // 2
+    win = 5
+    samp = 40
+    thresh = 100.
+    mid = np.median(img[middle_row - win:middle_row + win + 1, :], axis=0)
+    centers = []
+    for x0 in 80. + np.arange(120) * 15.:
+        xs = np.arange(int(x0) - win, int(x0) + win + 1)
+        ys = mid[xs] - np.nanmin(mid[xs])
+        centers.append(np.sum(xs * ys) / np.sum(ys))
+    return img, centers, middle_row, samp, win, thresh
+
+
+def test_trace_bars_matches_legacy():
+    problem = make_trace_problem()
+    ref = legacy_trace_bars(*problem)
+    new = trace_bars(*problem)
+
+    # bars are truncated at different rows, so the lengths vary per bar
+    assert len(set(ref[3])) == 120
+    for r, n in zip(ref, new):
+        assert len(r) == len(n)
+        np.testing.assert_allclose(np.asarray(n, dtype=float),
+                                   np.asarray(r, dtype=float),
+                                   rtol=0., atol=1.e-9)
+
+
+def benchmark():
+    """Time the legacy loop and the vectorized tracing"""
+    problem = make_trace_problem()
+    t0 = time.perf_counter()
+    legacy_trace_bars(*problem)
+    t_legacy = time.perf_counter() - t0
+    t0 = time.perf_counter()
+    trace_bars(*problem)
+    t_new = time.perf_counter() - t0
+    print("trace_bars: legacy %.3f s, vectorized %.3f s (%.1fx)" %
+          (t_legacy, t_new, t_legacy / t_new))
+
+
+if __name__ == '__main__':
+    # python -m kcwidrp.tests.test_trace_bars
+    benchmark()
@@ -0,0 +1,104 @@
+import os
+import threading
+import time
+
+import pytest
+
+from kcwidrp.core.kcwi_watcher import DirectoryWatcher, inotify_lib, \
+    parse_inotify_events, IN_EVENT_HEADER, IN_CLOSE_WRITE
+
+
+class Collector:
+    def __init__(self):
+        self.paths = []
+        self.event = threading.Event()
+
+    def __call__(self, path):
+        self.paths.append(path)
+        self.event.set()
+
+    def wait(self, timeout=5.):
+        ok = self.event.wait(timeout)
+        self.event.clear()
+        return ok
+
+
+def write_slowly(path, nchunks=5, delay=0.1):
+    """Write a file in chunks, closing it only at the end"""
+    with open(path, 'wb') as out:
+        for _ in range(nchunks):
+            out.write(b'\0' * 2880)
+            out.flush()
+            time.sleep(delay)
+
+
+def test_parse_inotify_events():
+    name = b'kb230925_00001.fits'
+    padded = name + b'\0' * (32 - len(name))
+    buf = IN_EVENT_HEADER.pack(1, IN_CLOSE_WRITE, 0, len(padded)) + padded
+    buf += IN_EVENT_HEADER.pack(1, 0x100, 0, 0)
+    assert parse_inotify_events(buf) == [(IN_CLOSE_WRITE, name.decode()),
+                                         (0x100, '')]
+
+
+def test_poll_waits_for_settled_files(tmp_path):
+    (tmp_path / 'old.fits').write_bytes(b'x')
+    got = Collector()
+    watcher = DirectoryWatcher(str(tmp_path), got, settle_time=5.,
+                               use_inotify=False)
+    path = tmp_path / 'new.fits'
+    path.write_bytes(b'x')
+    (tmp_path / 'notes.txt').write_bytes(b'x')
+    watcher.poll(now=0.)
+    watcher.poll(now=3.)
+    assert got.paths == []
+    # still being written: the settle time starts again
+    path.write_bytes(b'xx')
+    watcher.poll(now=6.)
+    assert got.paths == []
+    watcher.poll(now=11.)
+    assert got.paths == [str(path)]
+    watcher.poll(now=20.)
+    assert got.paths == [str(path)]
+
+
+@pytest.mark.parametrize('use_inotify', [True, False])
+def test_watcher_reports_complete_files(tmp_path, use_inotify):
+    if use_inotify and inotify_lib() is None:
+        pytest.skip("inotify not available")
+    (tmp_path / 'kb_00001.fits').write_bytes(b'x')
+    got = Collector()
+    watcher = DirectoryWatcher(str(tmp_path), got, poll_interval=0.05,
+                               settle_time=0.3, use_inotify=use_inotify)
+    watcher.start()
+    assert watcher.mode == ('inotify' if use_inotify else 'polling')
+    try:
+        path = str(tmp_path / 'kb_00002.fits')
+        write_slowly(path)
+        assert got.wait()
+        assert got.paths == [path]
+        assert os.path.getsize(path) == 5 * 2880
+
+        # a file moved into the directory is reported too
+        tmp = tmp_path / 'partial.tmp'
+        write_slowly(str(tmp), nchunks=1)
+        os.rename(str(tmp), str(tmp_path / 'kb_00003.fits'))
+        assert got.wait()
+        assert got.paths[-1] == str(tmp_path / 'kb_00003.fits')
+    finally:
+        watcher.stop()
+    assert len(got.paths) == 2
+
+
+def test_watcher_known_files(tmp_path):
+    (tmp_path / 'kb_00001.fits').write_bytes(b'x')
+    (tmp_path / 'kb_00002.fits').write_bytes(b'x')
+    got = Collector()
+    watcher = DirectoryWatcher(str(tmp_path), got, poll_interval=0.05,
+                               settle_time=0.1, known=['kb_00001.fits'])
+    watcher.start()
+    try:
+        assert got.wait()
+    finally:
+        watcher.stop()
+    assert got.paths == [str(tmp_path / 'kb_00002.fits')]